@@ -0,0 +1,316 @@
+"""Record real Bedrock traffic once, then replay it offline.
+
+A cassette is a JSON Lines file with one interaction per line: the operation
+(``converse``, ``converse_stream`` or ``retrieve``), a fingerprint of the
+request, the model or knowledge base id, the pipeline stage that made the
+call, the response, its usage and its latency. Streamed responses keep every
+event with its offset from the start of the call, so replay reproduces time to
+first token as well as total latency.
+
+Record mode wraps real ``bedrock-runtime`` / ``bedrock-agent-runtime`` clients:
+
+    cassette = Cassette('runs/life.cassette.jsonl', mode='record')
+    client = cassette.wrap(boto3.client('bedrock-runtime'))
+
+Replay mode serves recorded responses without any AWS access:
+
+    cassette = Cassette('runs/life.cassette.jsonl', mode='replay', throttle_rate=0.05, seed=7)
+    client = cassette.replayer('bedrock-runtime')
+
+Strands' ``BedrockModel`` builds its own client; ``cassette.attach(model)``
+swaps it for the recording or replaying one. ``pipeline_bench.py --cassette``
+does all of this for every handler.
+
+Requests are matched by fingerprint; image bytes are hashed, not stored.
+Prompts that embed per-run values (job ids, timestamps) will not match
+exactly, so replay falls back to the next unused recording for the same
+operation, stage and model, in recorded order. ``strict=True`` turns such
+misses into errors instead.
+
+Throttle injection makes each replayed attempt fail with
+``ThrottlingException`` at ``throttle_rate``. Like botocore's retry handler,
+the replaying client backs off with jitter and retries up to ``max_attempts``
+before raising, and reports the retries in ``ResponseMetadata.RetryAttempts``.
+The random source is seeded, so a replay is repeatable.
+"""
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from local_aws import ClientMeta
+
+RECORDED_OPERATIONS = {
+    'bedrock-runtime': ('converse', 'converse_stream'),
+    'bedrock-agent-runtime': ('retrieve',),
+}
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot record {type(value).__name__}")
+
+
+def _decode(obj):
+    if set(obj) == {'__bytes__'}:
+        return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+def _normalize(value):
+    """Request params with bytes replaced by their hash, for fingerprinting"""
+    if isinstance(value, (bytes, bytearray)):
+        return {'sha256': hashlib.sha256(value).hexdigest(), 'bytes': len(value)}
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def fingerprint(operation, params):
+    canonical = json.dumps([operation, _normalize(params)], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _resource_id(params):
+    return params.get('modelId') or params.get('knowledgeBaseId')
+
+
+def _without_metadata(response):
+    response = dict(response)
+    metadata = response.pop('ResponseMetadata', None) or {}
+    return response, metadata.get('RetryAttempts', 0)
+
+
+class Cassette:
+    def __init__(self, path, mode='replay', meter=None, latency_scale=1.0, extra_latency_ms=0.0,
+                 throttle_rate=0.0, max_attempts=10, backoff_base_ms=100.0, seed=0, strict=False):
+        if mode not in ('record', 'replay'):
+            raise ValueError("mode must be 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.meter = meter
+        self.latency_scale = latency_scale
+        self.extra_latency_ms = extra_latency_ms
+        self.throttle_rate = throttle_rate
+        self.max_attempts = max_attempts
+        self.backoff_base_ms = backoff_base_ms
+        self.strict = strict
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._by_fingerprint = defaultdict(deque)
+        self._by_slot = defaultdict(deque)
+        self.misses = 0
+        if mode == 'replay':
+            self._load()
+
+    # -- shared --------------------------------------------------------------
+
+    @property
+    def stage(self):
+        return getattr(self.meter, 'stage', None)
+
+    def _count(self, **counts):
+        if self.meter is not None:
+            self.meter.add(**counts)
+
+    def _count_usage(self, operation, response):
+        if operation == 'retrieve':
+            self._count(kbCalls=1)
+            return
+        usage = response.get('usage') or {}
+        self._count(modelCalls=1, inputTokens=usage.get('inputTokens', 0),
+                    outputTokens=usage.get('outputTokens', 0),
+                    cacheReadTokens=usage.get('cacheReadInputTokens', 0))
+
+    def wrap(self, client):
+        """A recording proxy in record mode, a replaying client in replay mode"""
+        if self.mode == 'record':
+            return RecordingClient(self, client)
+        return ReplayClient(self, client.meta.service_name)
+
+    def replayer(self, service_name):
+        return ReplayClient(self, service_name)
+
+    def attach(self, model):
+        """Route a Strands ``BedrockModel`` through this cassette"""
+        model.client = self.wrap(model.client)
+        return model
+
+    # -- record --------------------------------------------------------------
+
+    def _append(self, interaction):
+        line = json.dumps(interaction, default=_encode, separators=(',', ':'))
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    def record(self, operation, params, response, latency_ms, events=None):
+        body, retries = _without_metadata(response)
+        interaction = {
+            'operation': operation,
+            'fingerprint': fingerprint(operation, params),
+            'resource': _resource_id(params),
+            'stage': self.stage,
+            'recordedAt': datetime.now(timezone.utc).isoformat(),
+            'latencyMs': round(latency_ms, 1),
+            'retries': retries,
+            'response': body,
+        }
+        if events is not None:
+            interaction['events'] = events
+        self._append(interaction)
+
+    # -- replay --------------------------------------------------------------
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                interaction = json.loads(line, object_hook=_decode)
+                slot = (interaction['operation'], interaction.get('stage'), interaction.get('resource'))
+                entry = {'interaction': interaction, 'used': False}
+                self._by_fingerprint[interaction['fingerprint']].append(entry)
+                self._by_slot[slot].append(entry)
+
+    @staticmethod
+    def _take(entries):
+        for entry in entries:
+            if not entry['used']:
+                entry['used'] = True
+                return entry['interaction']
+        return None
+
+    def lookup(self, operation, params):
+        with self._lock:
+            exact = self._by_fingerprint.get(fingerprint(operation, params))
+            interaction = self._take(exact) if exact else None
+            if interaction is None and exact:
+                # Everything with this fingerprint is used up: serve the recordings again in order
+                for entry in exact:
+                    entry['used'] = False
+                interaction = self._take(exact)
+            if interaction is not None:
+                return interaction
+            self.misses += 1
+            if self.strict:
+                raise KeyError(f"No recording for {operation} on {_resource_id(params)} (stage {self.stage})")
+            slot = self._by_slot.get((operation, self.stage, _resource_id(params))) or ()
+            interaction = self._take(slot)
+            if interaction is None and slot:
+                for entry in slot:
+                    entry['used'] = False
+                interaction = self._take(slot)
+        if interaction is None:
+            raise KeyError(f"No recording for {operation} on {_resource_id(params)} (stage {self.stage})")
+        self._count(cassetteMisses=1)
+        return interaction
+
+    def sleep(self, milliseconds, extra_ms=0.0):
+        delay = milliseconds * self.latency_scale + extra_ms
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def attempt(self, operation):
+        """Inject throttling; returns the retries it took before an attempt got through"""
+        for attempt in range(self.max_attempts):
+            with self._lock:
+                throttled = self._random.random() < self.throttle_rate
+                jitter = self._random.random()
+            if not throttled:
+                return attempt
+            self._count(throttles=1)
+            if attempt + 1 < self.max_attempts:
+                time.sleep(min(20000.0, self.backoff_base_ms * 2 ** attempt) * jitter / 1000.0)
+        raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded (injected)'},
+                           'ResponseMetadata': {'HTTPStatusCode': 429, 'RetryAttempts': self.max_attempts - 1}},
+                          operation)
+
+
+class RecordingClient:
+    """Proxy to a real client that writes every recorded operation to the cassette"""
+
+    def __init__(self, cassette, client):
+        self._cassette = cassette
+        self._client = client
+        self.meta = client.meta
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in RECORDED_OPERATIONS.get(self.meta.service_name, ()):
+            return attr
+        if name == 'converse_stream':
+            return self._record_stream
+        def call(**params):
+            started = time.perf_counter()
+            response = attr(**params)
+            self._cassette.record(name, params, response, (time.perf_counter() - started) * 1000)
+            self._cassette._count_usage(name, response)
+            return response
+        return call
+
+    def _record_stream(self, **params):
+        started = time.perf_counter()
+        response = self._client.converse_stream(**params)
+        cassette = self._cassette
+
+        def events():
+            recorded = []
+            usage = {}
+            for event in response['stream']:
+                recorded.append({'offsetMs': round((time.perf_counter() - started) * 1000, 1), 'event': event})
+                usage = (event.get('metadata') or {}).get('usage') or usage
+                yield event
+            cassette.record('converse_stream', params, {'usage': usage, 'ResponseMetadata': response.get('ResponseMetadata')},
+                            (time.perf_counter() - started) * 1000, events=recorded)
+            cassette._count_usage('converse_stream', {'usage': usage})
+
+        return {**response, 'stream': events()}
+
+
+class ReplayClient:
+    """Serves recorded responses for one service, with recorded (scaled) latency and injected throttling"""
+
+    def __init__(self, cassette, service_name):
+        self._cassette = cassette
+        self.meta = ClientMeta(service_name)
+
+    def __getattr__(self, name):
+        if name not in RECORDED_OPERATIONS.get(self.meta.service_name, ()):
+            raise NotImplementedError(f"{self.meta.service_name}.{name} is not recorded")
+        if name == 'converse_stream':
+            return self._replay_stream
+        def call(**params):
+            retries = self._cassette.attempt(name)
+            interaction = self._cassette.lookup(name, params)
+            self._cassette.sleep(interaction['latencyMs'], self._cassette.extra_latency_ms)
+            self._cassette._count_usage(name, interaction['response'])
+            return {**interaction['response'],
+                    'ResponseMetadata': {'HTTPStatusCode': 200, 'RetryAttempts': retries}}
+        return call
+
+    def _replay_stream(self, **params):
+        cassette = self._cassette
+        retries = cassette.attempt('converse_stream')
+        interaction = cassette.lookup('converse_stream', params)
+        cassette._count_usage('converse_stream', interaction['response'])
+
+        def events():
+            elapsed, extra_ms = 0.0, cassette.extra_latency_ms
+            for recorded in interaction.get('events') or []:
+                cassette.sleep(recorded['offsetMs'] - elapsed, extra_ms)
+                elapsed, extra_ms = recorded['offsetMs'], 0.0
+                yield recorded['event']
+
+        return {'stream': events(), 'ResponseMetadata': {'HTTPStatusCode': 200, 'RetryAttempts': retries}}
+
@@ -0,0 +1,120 @@
+"""First handler call for ``startup_bench.py --first-call``, run in the child interpreter.
+
+A cold Lambda runs init and then serves a request, so moving work out of init
+only helps when that request does not need it. ``FirstCall`` is created before the
+handler is imported and sets up the event and stand-ins for one function;
+``invoke`` makes the call.
+
+The handler's clients go to the ``local_aws`` stand-ins, but without importing
+boto3 ahead of the handler: an import hook waits for the handler's own
+``import boto3`` (at init or during the call) and installs the stand-ins right
+after it. Real botocore clients are still built and then swapped for the
+stand-ins, so the boto3 import and client construction are timed wherever the
+handler does them. Only stdlib is imported here before that.
+"""
+import contextlib
+import importlib.abc
+import importlib.util
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+DOCUMENT_BUCKET = 'bench-documents'
+RESPONSES = Path(__file__).with_name('canned_responses.json')
+
+
+def _classify(bucket, key, job_id):
+    return {'detail': {'bucket': {'name': bucket}, 'object': {'key': key}}}
+
+
+def _batch_generator(bucket, key, job_id):
+    return {'detail': {'bucket': bucket, 'object': {'key': key}}, 'classification': 'OTHER'}
+
+
+def _extract(bucket, key, job_id):
+    return {'detail': {'bucket': {'name': bucket}, 'object': {'key': key}},
+            'classification': {'classification': 'OTHER', 'jobId': job_id, 'insuranceType': 'life'},
+            'pages': {'start': 1, 'end': 1}}
+
+
+# function directory -> (stage for the canned responses, event builder, whether the call completed)
+FUNCTIONS = {
+    'classify': ('classify', _classify, lambda result: 'ERROR' not in json.dumps(result['classification'])),
+    'batch-generator': ('batch-generator', _batch_generator, lambda result: 'batchRanges' in result),
+    'bedrock-extract': ('extract', _extract, lambda result: 'chunkS3Key' in result),
+}
+
+
+class LambdaContext:
+    def __init__(self, name, timeout_seconds=600):
+        self.function_name = f"ai-underwriting-{name}"
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class _AfterImport(importlib.abc.MetaPathFinder):
+    """Run ``callback`` once ``name`` has been imported, whoever imports it first"""
+
+    def __init__(self, name, callback):
+        self.name = name
+        self.callback = callback
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != self.name:
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        exec_module = spec.loader.exec_module
+
+        def run(module):
+            exec_module(module)
+            self.callback()
+
+        spec.loader.exec_module = run
+        return spec
+
+
+class FirstCall:
+    def __init__(self, directory, document):
+        self.stage, build_event, self.completed = FUNCTIONS[directory]
+        self.document = Path(document)
+        self.job_id = str(uuid.uuid4())
+        self.key = f"uploads/{self.job_id}/{self.document.name}"
+        self.event = build_event(DOCUMENT_BUCKET, self.key, self.job_id)
+        self.aws = None
+        sys.meta_path.insert(0, _AfterImport('boto3', self._install))
+
+    def _install(self):
+        import local_aws
+        meter = local_aws.Meter()
+        meter.stage = self.stage
+        aws = local_aws.LocalAws(meter, json.loads(RESPONSES.read_text()))
+        # Build the real client, as the handler would, then answer from the stand-in
+        for service in ('s3', 'dynamodb', 'bedrock-runtime'):
+            aws.wrappers[service] = lambda _real, stand_in=aws.clients[service]: stand_in
+        aws.s3.put_local_file(DOCUMENT_BUCKET, self.key, self.document)
+        aws.dynamodb.put_item(TableName=os.environ['JOBS_TABLE_NAME'], Item={
+            'jobId': {'S': self.job_id},
+            'status': {'S': 'CREATED'},
+            'originalFilename': {'S': self.document.name},
+            's3Key': {'S': self.key},
+            'insuranceType': {'S': 'life'},
+            'userLanguage': {'S': 'en-US'},
+        })
+        local_aws.install(aws)
+        self.aws = aws
+
+    def invoke(self, handler):
+        """Call the handler once; raises if it did not get through the whole request"""
+        with open(os.devnull, 'w') as log, contextlib.redirect_stdout(log):
+            result = handler(self.event, LambdaContext(self.stage))
+        if self.aws is None or not self.completed(result):
+            raise RuntimeError(f"first call did not complete: {json.dumps(result)[:300]}")
+        return result
+
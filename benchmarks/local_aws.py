@@ -0,0 +1,320 @@
+"""In-process stand-ins for the AWS services the pipeline Lambdas call.
+
+``install()`` patches ``boto3.session.Session.client`` so every client the
+handlers create (module-level ``boto3.client(...)`` calls and the client that
+Strands' ``BedrockModel`` builds) resolves to one of these objects:
+
+- ``LocalS3``: objects kept in memory, ``get_object`` / ``put_object`` /
+  ``download_file`` / ``list_objects_v2``
+- ``LocalDynamoDB``: items in the low-level attribute-value format,
+  ``get_item`` / ``put_item`` / ``update_item`` with plain ``SET`` expressions
+- ``StubBedrockRuntime``: ``converse`` and ``converse_stream`` answering from
+  canned per-stage responses after a configurable latency
+- ``StubAgentRuntime``: ``retrieve`` with no results
+
+Every call is counted against the stage currently set on the shared ``Meter``.
+"""
+import copy
+import json
+import threading
+import time
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Rough Converse accounting: ~4 characters per text token and a flat cost per page image
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1600
+
+
+class Meter:
+    """Per-stage counters; the harness sets ``stage`` before invoking each handler"""
+
+    def __init__(self):
+        self.stage = None
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def add(self, **counts):
+        with self._lock:
+            stage = self._counts.setdefault(self.stage, {})
+            for name, value in counts.items():
+                stage[name] = stage.get(name, 0) + value
+
+    def take(self, stage):
+        """Return and clear the counters recorded for ``stage``"""
+        with self._lock:
+            return self._counts.pop(stage, {})
+
+
+def _client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+def _attr_size(item):
+    return len(json.dumps(item, default=str)) if item else 0
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self, amt=None):
+        data, self._data = (self._data, b'') if amt is None else (self._data[:amt], self._data[amt:])
+        return data
+
+
+class ClientMeta:
+    """Enough of ``client.meta`` for SDKs that inspect the client they are given"""
+
+    class _Events:
+        def register(self, *args, **kwargs):
+            pass
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.region_name = 'us-east-1'
+        self.events = self._Events()
+
+
+class LocalS3:
+    def __init__(self, meter):
+        self.meter = meter
+        self.meta = ClientMeta('s3')
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_local_file(self, bucket, key, path):
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def _get(self, bucket, key, operation):
+        with self._lock:
+            data = self.objects.get((bucket, key))
+        if data is None:
+            raise _client_error('NoSuchKey', f"s3://{bucket}/{key} does not exist", operation)
+        self.meter.add(s3Requests=1, s3BytesIn=len(data))
+        return data
+
+    def get_object(self, Bucket, Key, **kwargs):
+        data = self._get(Bucket, Key, 'GetObject')
+        return {'Body': _Body(data), 'ContentLength': len(data)}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        data = self._get(Bucket, Key, 'HeadObject')
+        with open(Filename, 'wb') as f:
+            f.write(data)
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        data = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            self.objects[(Bucket, Key)] = data
+        self.meter.add(s3Requests=1, s3BytesOut=len(data))
+        return {'ETag': f'"{uuid.uuid4().hex}"'}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        self.meter.add(s3Requests=1)
+        with self._lock:
+            keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+        return {'KeyCount': len(keys),
+                'Contents': [{'Key': k, 'Size': len(self.objects[(Bucket, k)])} for k in keys]}
+
+
+class LocalDynamoDB:
+    """Tables keyed by ``key_attribute``; every pipeline table uses ``jobId``"""
+
+    def __init__(self, meter, key_attribute='jobId'):
+        self.meter = meter
+        self.key_attribute = key_attribute
+        self.meta = ClientMeta('dynamodb')
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(Key):
+        return json.dumps(Key, sort_keys=True)
+
+    def put_item(self, TableName, Item, **kwargs):
+        key = {self.key_attribute: Item[self.key_attribute]}
+        with self._lock:
+            self.tables.setdefault(TableName, {})[self._key(key)] = copy.deepcopy(Item)
+        self.meter.add(dynamodbRequests=1, dynamodbBytesOut=_attr_size(Item))
+        return {}
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        with self._lock:
+            item = copy.deepcopy(self.tables.get(TableName, {}).get(self._key(Key)))
+        if item is not None and ProjectionExpression:
+            names = ExpressionAttributeNames or {}
+            wanted = {names.get(p.strip(), p.strip()) for p in ProjectionExpression.split(',')}
+            item = {k: v for k, v in item.items() if k in wanted}
+        self.meter.add(dynamodbRequests=1, dynamodbBytesIn=_attr_size(item))
+        return {'Item': item} if item is not None else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None, **kwargs):
+        if ConditionExpression:
+            raise NotImplementedError("LocalDynamoDB does not evaluate ConditionExpression")
+        expression = UpdateExpression.strip()
+        if not expression.upper().startswith('SET '):
+            raise NotImplementedError(f"LocalDynamoDB only supports SET updates: {UpdateExpression}")
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        updates = {}
+        for assignment in expression[4:].split(','):
+            target, _, source = (part.strip() for part in assignment.partition('='))
+            if source not in values:
+                raise NotImplementedError(f"LocalDynamoDB only supports 'name = :value' assignments: {assignment}")
+            updates[names.get(target, target)] = values[source]
+        with self._lock:
+            table = self.tables.setdefault(TableName, {})
+            item = table.setdefault(self._key(Key), copy.deepcopy(Key))
+            item.update(copy.deepcopy(updates))
+        self.meter.add(dynamodbRequests=1, dynamodbBytesOut=_attr_size(updates))
+        return {}
+
+
+class StubBedrockRuntime:
+    """Answers Converse calls with the canned response for the current stage.
+
+    ``responses`` maps a stage name (or ``"default"``) to ``{"text": ...}`` or
+    ``{"toolUse": {"name": ..., "input": {...}}}``, optionally with
+    ``"latencyMs"`` and ``"usage"``. Without a per-response latency the call
+    sleeps ``latency_ms + output_tokens * ms_per_output_token``.
+    """
+
+    def __init__(self, meter, responses, latency_ms=0.0, ms_per_output_token=0.0):
+        self.meter = meter
+        self.meta = ClientMeta('bedrock-runtime')
+        self.responses = responses
+        self.latency_ms = latency_ms
+        self.ms_per_output_token = ms_per_output_token
+
+    def _spec(self):
+        spec = self.responses.get(self.meter.stage) or self.responses.get('default')
+        if spec is None:
+            raise KeyError(f"No canned Bedrock response for stage {self.meter.stage!r}")
+        return spec
+
+    @staticmethod
+    def _request_size(messages, system):
+        text_chars = sum(len(block.get('text', '')) for block in system or [])
+        images = image_bytes = other_bytes = 0
+        for message in messages or []:
+            for block in message.get('content') or []:
+                if 'text' in block:
+                    text_chars += len(block['text'])
+                elif 'image' in block:
+                    images += 1
+                    image_bytes += len(block['image'].get('source', {}).get('bytes') or b'')
+                else:
+                    other_bytes += len(json.dumps(block, default=str))
+        return text_chars + other_bytes, images, image_bytes
+
+    def _answer(self, modelId, messages, system, toolConfig):
+        spec = self._spec()
+        text_bytes, images, image_bytes = self._request_size(messages, system)
+        if 'toolUse' in spec:
+            tool = dict(spec['toolUse'])
+            if not tool.get('name'):
+                tool['name'] = (((toolConfig or {}).get('toolChoice') or {}).get('tool') or {}).get('name', 'tool')
+            block = {'toolUse': {'toolUseId': f"tooluse_{uuid.uuid4().hex[:12]}", **tool}}
+            stop_reason = 'tool_use'
+            out_chars = len(json.dumps(tool.get('input', {})))
+        else:
+            block = {'text': spec.get('text', '')}
+            stop_reason = 'end_turn'
+            out_chars = len(block['text'])
+
+        usage = dict(spec.get('usage') or {})
+        usage.setdefault('inputTokens', text_bytes // CHARS_PER_TOKEN + images * IMAGE_TOKENS)
+        usage.setdefault('outputTokens', max(1, out_chars // CHARS_PER_TOKEN))
+        usage['totalTokens'] = usage['inputTokens'] + usage['outputTokens']
+        latency_ms = spec.get('latencyMs')
+        if latency_ms is None:
+            latency_ms = self.latency_ms + usage['outputTokens'] * self.ms_per_output_token
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+
+        self.meter.add(modelCalls=1, inputTokens=usage['inputTokens'], outputTokens=usage['outputTokens'],
+                       modelBytesOut=text_bytes + image_bytes, modelBytesIn=out_chars)
+        return block, stop_reason, usage, latency_ms
+
+    def converse(self, modelId, messages, system=None, toolConfig=None, **kwargs):
+        block, stop_reason, usage, latency_ms = self._answer(modelId, messages, system, toolConfig)
+        return {
+            'output': {'message': {'role': 'assistant', 'content': [block]}},
+            'stopReason': stop_reason,
+            'usage': usage,
+            'metrics': {'latencyMs': int(latency_ms)},
+            'ResponseMetadata': {'HTTPStatusCode': 200, 'RetryAttempts': 0},
+        }
+
+    def converse_stream(self, modelId, messages, system=None, toolConfig=None, **kwargs):
+        block, stop_reason, usage, latency_ms = self._answer(modelId, messages, system, toolConfig)
+        events = [{'messageStart': {'role': 'assistant'}}]
+        if 'toolUse' in block:
+            tool = block['toolUse']
+            events.append({'contentBlockStart': {'start': {'toolUse': {'toolUseId': tool['toolUseId'], 'name': tool['name']}},
+                                                 'contentBlockIndex': 0}})
+            events.append({'contentBlockDelta': {'delta': {'toolUse': {'input': json.dumps(tool.get('input', {}))}},
+                                                 'contentBlockIndex': 0}})
+        else:
+            events.append({'contentBlockDelta': {'delta': {'text': block['text']}, 'contentBlockIndex': 0}})
+        events.append({'contentBlockStop': {'contentBlockIndex': 0}})
+        events.append({'messageStop': {'stopReason': stop_reason}})
+        events.append({'metadata': {'usage': usage, 'metrics': {'latencyMs': int(latency_ms)}}})
+        return {'stream': iter(events), 'ResponseMetadata': {'HTTPStatusCode': 200, 'RetryAttempts': 0}}
+
+
+class StubAgentRuntime:
+    def __init__(self, meter):
+        self.meter = meter
+        self.meta = ClientMeta('bedrock-agent-runtime')
+
+    def retrieve(self, **kwargs):
+        self.meter.add(kbCalls=1)
+        return {'retrievalResults': []}
+
+
+class _Unsupported:
+    def __init__(self, service_name):
+        self.meta = ClientMeta(service_name)
+
+    def __getattr__(self, name):
+        raise NotImplementedError(f"{self.meta.service_name}.{name} has no local stand-in")
+
+
+class LocalAws:
+    """The stand-in clients for one benchmark run, keyed by service name"""
+
+    def __init__(self, meter, responses, latency_ms=0.0, ms_per_output_token=0.0):
+        self.meter = meter
+        self.s3 = LocalS3(meter)
+        self.dynamodb = LocalDynamoDB(meter)
+        self.bedrock = StubBedrockRuntime(meter, responses, latency_ms, ms_per_output_token)
+        # service name -> function wrapping the real client, for services that pass through
+        self.wrappers = {}
+        self.clients = {
+            's3': self.s3,
+            'dynamodb': self.dynamodb,
+            'bedrock-runtime': self.bedrock,
+            'bedrock-agent-runtime': StubAgentRuntime(meter),
+        }
+
+    def client(self, service_name):
+        return self.clients.get(service_name) or _Unsupported(service_name)
+
+
+def install(local_aws):
+    """Route every boto3 client created from now on to ``local_aws``"""
+    real_client = boto3.session.Session.client
+
+    def client(session, service_name=None, *args, **kwargs):
+        if service_name in local_aws.wrappers:
+            return local_aws.wrappers[service_name](real_client(session, service_name, *args, **kwargs))
+        return local_aws.client(service_name)
+
+    boto3.session.Session.client = client
+    boto3.DEFAULT_SESSION = None
@@ -0,0 +1,403 @@
+"""Run the document pipeline end to end on this machine and measure each stage.
+
+The real handlers run in state-machine order (classify, batch-generator,
+extract once per page range, analyze, detect, score, act) with the event
+shapes Step Functions would pass them. S3 and DynamoDB are in-memory
+stand-ins and Bedrock answers from canned responses after a configurable
+latency (see ``local_aws.py``), so a run needs no AWS account. With
+``--cassette`` Bedrock is instead replayed from a recording of real traffic,
+or recorded to one with ``--record`` (see ``cassette.py``).
+
+Per stage it reports wall time, process and child CPU time (poppler runs as a
+subprocess), peak RSS, bytes through S3, DynamoDB, Bedrock and the Step
+Functions state, and model calls and tokens. Import time of every handler is
+reported separately as ``init``; handlers share one process, so for cold-start
+init time use ``startup_bench.py``. Results are written as JSON so runs can be
+diffed over time:
+
+    python benchmarks/pipeline_bench.py --output results.json
+    python benchmarks/pipeline_bench.py sample_documents/life_submission.pdf --latency-ms 800 --repeat 3
+    python benchmarks/pipeline_bench.py --record --cassette runs/samples.jsonl   # needs AWS credentials
+    python benchmarks/pipeline_bench.py --cassette runs/samples.jsonl --throttle-rate 0.1
+
+The handlers' dependencies (boto3, strands-agents, pdf2image with poppler,
+Pillow) must be installed; handler logs go to ``--log`` (default: discarded).
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import local_aws
+from cassette import Cassette
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LAMBDA_ROOT = REPO_ROOT / 'cdk' / 'lambda-functions'
+COMMON_LAYER = REPO_ROOT / 'cdk' / 'lambda-layers' / 'common' / 'python'
+
+DOCUMENT_BUCKET = 'bench-documents'
+EXTRACTION_BUCKET = 'bench-extraction'
+TRACE_BUCKET = 'bench-traces'
+OUTPUT_BUCKET = 'bench-agent-outputs'
+JOBS_TABLE = 'bench-jobs'
+
+# Environment the CDK stack gives the pipeline functions, pointed at the stand-ins
+LAMBDA_ENVIRONMENT = {
+    'JOBS_TABLE_NAME': JOBS_TABLE,
+    'EXTRACTION_BUCKET': EXTRACTION_BUCKET,
+    'CLAIM_CHECK_BUCKET': EXTRACTION_BUCKET,
+    'TRACE_BUCKET': TRACE_BUCKET,
+    'MOCK_OUTPUT_S3_BUCKET': OUTPUT_BUCKET,
+    'BEDROCK_MODEL_ID': 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
+    'BEDROCK_ANALYSIS_MODEL_ID': 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
+    'KNOWLEDGE_BASE_ID': 'bench-knowledge-base',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_REGION': 'us-east-1',
+    # LocalDynamoDB does not evaluate the ledger's conditional nested-map updates
+    'USAGE_LEDGER': 'off',
+}
+
+# (stage, function directory, handler, timeout seconds) in state-machine order
+STAGES = [
+    ('classify', 'classify', 'lambda_handler', 180),
+    ('batch-generator', 'batch-generator', 'handler', 60),
+    ('extract', 'bedrock-extract', 'lambda_handler', 600),
+    ('analyze', 'analyze', 'lambda_handler', 600),
+    ('detect', 'detect-impairments', 'lambda_handler', 300),
+    ('score', 'score', 'lambda_handler', 300),
+    ('act', 'act', 'lambda_handler', 300),
+]
+
+
+class LambdaContext:
+    def __init__(self, name, timeout_seconds):
+        self.function_name = f"ai-underwriting-{name}"
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # No procfs (macOS): fall back to the process high-water mark
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakRss:
+    """Sample resident memory on a background thread while a stage runs"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+        return False
+
+
+@contextlib.contextmanager
+def measured(meter, stage, into):
+    """Time the block and store wall/CPU/RSS and the stand-in counters for ``stage`` in ``into``"""
+    meter.stage = stage
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall, cpu = time.perf_counter(), time.process_time()
+    rss = PeakRss()
+    try:
+        with rss:
+            yield
+    finally:
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        into.update({
+            'wallSeconds': round(time.perf_counter() - wall, 4),
+            'cpuSeconds': round(time.process_time() - cpu, 4),
+            'childCpuSeconds': round(after.ru_utime + after.ru_stime - children.ru_utime - children.ru_stime, 4),
+            'peakRssBytes': rss.peak,
+        })
+        into.update(meter.take(stage))
+        meter.stage = None
+
+
+class Handler:
+    """One Lambda's index module, loaded from its directory like the Lambda runtime would.
+
+    Every function ships its own ``index.py`` and some share helper module
+    names (``compaction``), so each handler keeps its own copies of its local
+    modules and swaps them into ``sys.modules`` while it runs.
+    """
+
+    def __init__(self, stage, directory, handler_name, timeout):
+        self.stage = stage
+        self.path = LAMBDA_ROOT / directory
+        self.handler_name = handler_name
+        self.timeout = timeout
+        self.local_names = {p.stem for p in self.path.glob('*.py')}
+        self.modules = {}
+
+    @contextlib.contextmanager
+    def _activate(self):
+        saved = {name: sys.modules.pop(name) for name in self.local_names if name in sys.modules}
+        sys.modules.update(self.modules)
+        sys.path.insert(0, str(self.path))
+        try:
+            yield
+        finally:
+            sys.path.remove(str(self.path))
+            for name in self.local_names:
+                module = sys.modules.pop(name, None)
+                if module is not None:
+                    self.modules[name] = module
+            sys.modules.update(saved)
+
+    def load(self):
+        with self._activate():
+            spec = importlib.util.spec_from_file_location(f"bench_{self.stage.replace('-', '_')}", self.path / 'index.py')
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        self.function = getattr(module, self.handler_name)
+
+    def __call__(self, event):
+        # Round-trip through JSON as Step Functions does between states
+        payload = json.loads(json.dumps(event))
+        with self._activate():
+            result = self.function(payload, LambdaContext(self.stage, self.timeout))
+        return json.loads(json.dumps(result))
+
+
+def _insurance_type(path, requested):
+    if requested != 'auto':
+        return requested
+    name = path.name.lower()
+    return 'life' if ('life' in name or 'medical' in name) else 'property_casualty'
+
+
+def _seed_job(aws, path, insurance_type, language):
+    """Create the job record and uploaded object the way the API handler does"""
+    job_id = str(uuid.uuid4())
+    key = f"uploads/{job_id}/{path.name}"
+    aws.s3.put_local_file(DOCUMENT_BUCKET, key, path)
+    now = datetime.now(timezone.utc).isoformat()
+    aws.dynamodb.tables.setdefault(JOBS_TABLE, {})[aws.dynamodb._key({'jobId': {'S': job_id}})] = {
+        'jobId': {'S': job_id},
+        'status': {'S': 'CREATED'},
+        'originalFilename': {'S': path.name},
+        's3Key': {'S': key},
+        'insuranceType': {'S': insurance_type},
+        'userLanguage': {'S': language},
+        'uploadTimestamp': {'S': now},
+        'listPartition': {'S': 'JOB'},
+    }
+    return job_id, key
+
+
+def run_document(aws, handlers, path, insurance_type, language):
+    job_id, key = _seed_job(aws, path, insurance_type, language)
+    report = {'document': str(path.relative_to(REPO_ROOT) if path.is_relative_to(REPO_ROOT) else path),
+              'sizeBytes': path.stat().st_size, 'insuranceType': insurance_type, 'jobId': job_id,
+              'stages': []}
+
+    def invoke(stage, event, **labels):
+        entry = {'stage': stage, **labels, 'stateBytesIn': len(json.dumps(event))}
+        report['stages'].append(entry)
+        with measured(aws.meter, stage, entry):
+            result = handlers[stage](event)
+        entry['stateBytesOut'] = len(json.dumps(result))
+        return result
+
+    state = {'detail': {'bucket': {'name': DOCUMENT_BUCKET}, 'object': {'key': key}}, 'classification': 'OTHER'}
+    started = time.perf_counter()
+    try:
+        state['classification'] = invoke('classify', state)
+        state['batches'] = invoke('batch-generator', {
+            'detail': {'bucket': DOCUMENT_BUCKET, 'object': {'key': key}},
+            'classification': state['classification'],
+        })
+        extraction_results = []
+        for pages in state['batches']['batchRanges']:
+            out = invoke('extract', {'detail': state['detail'], 'classification': state['classification'],
+                                     'pages': pages}, pages=pages)
+            if 'chunkS3Key' not in out:
+                # The Map state's resultSelector fails the execution here
+                raise RuntimeError(f"extract returned no chunk for pages {pages}: {out.get('message')}")
+            extraction_results.append({'pages': out['pages'], 'chunkS3Key': out['chunkS3Key']})
+        state['extractionResults'] = extraction_results
+        state['analysisOutput'] = invoke('analyze', state)
+        state['analysisDetection'] = invoke('detect', state)
+        state['scoring'] = invoke('score', {'classification': state['classification'],
+                                            'analysisDetection': state['analysisDetection']})
+        invoke('act', state)
+    except Exception as e:
+        report['error'] = f"{type(e).__name__}: {e}"
+    report['wallSeconds'] = round(time.perf_counter() - started, 4)
+    item = aws.dynamodb.tables[JOBS_TABLE][aws.dynamodb._key({'jobId': {'S': job_id}})]
+    report['finalStatus'] = item.get('status', {}).get('S')
+    report['pages'] = sum(p['end'] - p['start'] + 1 for p in (state.get('batches') or {}).get('batchRanges', []))
+    return report
+
+
+def summarize(documents):
+    """Totals per stage across every document, plus the slowest single invocation"""
+    stages = {}
+    for document in documents:
+        for entry in document['stages']:
+            totals = stages.setdefault(entry['stage'], {'invocations': 0, 'maxWallSeconds': 0.0, 'peakRssBytes': 0})
+            totals['invocations'] += 1
+            totals['maxWallSeconds'] = max(totals['maxWallSeconds'], entry['wallSeconds'])
+            totals['peakRssBytes'] = max(totals['peakRssBytes'], entry['peakRssBytes'])
+            for name, value in entry.items():
+                if name in ('stage', 'pages', 'peakRssBytes') or not isinstance(value, (int, float)):
+                    continue
+                totals[name] = round(totals.get(name, 0) + value, 4)
+    return stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(result, out):
+    print(f"{'stage':<16}{'calls':>6}{'wall s':>10}{'cpu s':>9}{'child s':>9}{'peak MiB':>10}"
+          f"{'S3 in KiB':>11}{'S3 out KiB':>11}{'model':>7}{'tokens in':>11}", file=out)
+    for stage, t in result['stages'].items():
+        print(f"{stage:<16}{t['invocations']:>6}{t['wallSeconds']:>10.2f}{t['cpuSeconds']:>9.2f}"
+              f"{t['childCpuSeconds']:>9.2f}{t['peakRssBytes'] / 2**20:>10.1f}"
+              f"{t.get('s3BytesIn', 0) / 1024:>11.1f}{t.get('s3BytesOut', 0) / 1024:>11.1f}"
+              f"{t.get('modelCalls', 0):>7}{t.get('inputTokens', 0):>11}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('documents', nargs='*', type=Path,
+                        help='PDFs to process (default: every PDF in sample_documents/)')
+    parser.add_argument('--responses', type=Path, default=Path(__file__).with_name('canned_responses.json'),
+                        help='canned Bedrock responses per stage')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='fixed latency added to every model call')
+    parser.add_argument('--cassette', type=Path, help='replay Bedrock from this recording instead of canned responses')
+    parser.add_argument('--record', action='store_true',
+                        help='call real Bedrock and append the traffic to --cassette')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiply replayed latencies (0 replays as fast as possible)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='fraction of replayed model attempts that fail with ThrottlingException')
+    parser.add_argument('--seed', type=int, default=0, help='seed for throttle injection')
+    parser.add_argument('--strict-cassette', action='store_true',
+                        help='fail on requests without an exact recording instead of falling back')
+    parser.add_argument('--ms-per-output-token', type=float, default=0.0,
+                        help='extra latency per generated token, to model decode time')
+    parser.add_argument('--insurance-type', choices=['auto', 'life', 'property_casualty'], default='auto',
+                        help="'auto' picks life for file names containing life/medical")
+    parser.add_argument('--language', default='en-US')
+    parser.add_argument('--repeat', type=int, default=1, help='process the document set this many times')
+    parser.add_argument('--output', default='-', help='where to write the JSON results (default: stdout)')
+    parser.add_argument('--log', default=os.devnull, help='file for handler stdout/stderr')
+    parser.add_argument('--metrics-jsonl', help='also write the handlers\' EMF metric documents to this file')
+    args = parser.parse_args(argv)
+    if args.record and not args.cassette:
+        parser.error('--record needs --cassette')
+
+    documents = [p.resolve() for p in args.documents] or sorted((REPO_ROOT / 'sample_documents').glob('*.pdf'))
+    if not documents:
+        parser.error('no PDFs to process')
+
+    for name, value in LAMBDA_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ['METRICS_SINK'] = 'jsonl' if args.metrics_jsonl else 'off'
+    if args.metrics_jsonl:
+        os.environ['METRICS_JSONL_PATH'] = str(Path(args.metrics_jsonl).resolve())
+    sys.path.insert(0, str(COMMON_LAYER))
+
+    meter = local_aws.Meter()
+    aws = local_aws.LocalAws(meter, json.loads(args.responses.read_text()),
+                             latency_ms=args.latency_ms, ms_per_output_token=args.ms_per_output_token)
+    cassette = None
+    if args.cassette:
+        cassette = Cassette(args.cassette, mode='record' if args.record else 'replay', meter=meter,
+                            latency_scale=args.latency_scale, extra_latency_ms=args.latency_ms,
+                            throttle_rate=args.throttle_rate, seed=args.seed, strict=args.strict_cassette)
+        for service in ('bedrock-runtime', 'bedrock-agent-runtime'):
+            if args.record:
+                aws.wrappers[service] = cassette.wrap
+            else:
+                aws.clients[service] = cassette.replayer(service)
+    local_aws.install(aws)
+
+    result = {
+        'schemaVersion': 1,
+        'startedAt': datetime.now(timezone.utc).isoformat(),
+        'gitCommit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'latencyMs': args.latency_ms, 'msPerOutputToken': args.ms_per_output_token,
+                   'responses': None if cassette else str(args.responses),
+                   'cassette': str(args.cassette) if cassette else None,
+                   'cassetteMode': cassette.mode if cassette else None,
+                   'latencyScale': args.latency_scale, 'throttleRate': args.throttle_rate, 'seed': args.seed,
+                   'repeat': args.repeat, 'language': args.language},
+        'init': {},
+        'documents': [],
+    }
+    handlers = {}
+    with open(args.log, 'a') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        for stage, directory, handler_name, timeout in STAGES:
+            handler = Handler(stage, directory, handler_name, timeout)
+            entry = {}
+            with measured(meter, f"init:{stage}", entry):
+                handler.load()
+            result['init'][stage] = entry
+            handlers[stage] = handler
+        for _ in range(args.repeat):
+            for path in documents:
+                result['documents'].append(run_document(
+                    aws, handlers, path, _insurance_type(path, args.insurance_type), args.language))
+    result['stages'] = summarize(result['documents'])
+    result['wallSeconds'] = round(sum(d['wallSeconds'] for d in result['documents']), 4)
+    if cassette and cassette.mode == 'replay':
+        result['cassetteMisses'] = cassette.misses
+
+    text = json.dumps(result, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        Path(args.output).write_text(text + '\n')
+    _print_table(result, sys.stderr)
+    failed = [d for d in result['documents'] if 'error' in d]
+    for d in failed:
+        print(f"FAILED {d['document']}: {d['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
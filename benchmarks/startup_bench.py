@@ -0,0 +1,272 @@
+"""Measure each pipeline Lambda's init phase and check it against a budget.
+
+Every measurement imports one handler module in a fresh interpreter, the way
+a cold Lambda container does: the function directory and the common layer go
+first on ``sys.path``, the environment mirrors the CDK stack's, and the clock
+covers ``index.py`` from its first import to its last module-level statement.
+Python's own startup is reported separately. ``pipeline_bench.py`` loads all
+handlers into one process, so its ``init`` figures share imports between
+stages and understate a real cold start; use this script for init time.
+
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py classify bedrock-extract --repeat 20 --top 8
+    python benchmarks/startup_bench.py --baseline HEAD~1 --output startup.json
+    python benchmarks/startup_bench.py --first-call --baseline HEAD~1
+
+Init time alone rewards deferring work the handler needs anyway. With
+``--first-call`` each cold import is followed by one handler call against the
+``local_aws`` stand-ins (see ``first_call.py``), and the cold start is init
+plus that call. It covers the PDF stages (classify, batch-generator,
+bedrock-extract), which need poppler on ``PATH``.
+
+``--baseline`` measures the handlers as of another git revision alongside the
+working tree. ``--top`` lists the slowest top-level imports (from
+``python -X importtime``). Layer dependencies (boto3, strands-agents,
+pdf2image, Pillow) come from the running interpreter's site-packages or from
+``--layer-path`` directories. The exit status is 1 when a function's median
+init time is over its budget or its module fails to import.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LAMBDA_ROOT = Path('cdk') / 'lambda-functions'
+BENCHMARKS = Path(__file__).resolve().parent
+COMMON_LAYER = Path('cdk') / 'lambda-layers' / 'common' / 'python'
+
+# (function directory, handler, init budget in ms). The budget applies to the
+# median of this script's fresh-interpreter imports. The PDF stages and analyze
+# use their clients (and pdf2image) on every invocation and build them at init;
+# see --first-call.
+FUNCTIONS = [
+    ('classify', 'lambda_handler', 500),
+    ('batch-generator', 'handler', 500),
+    ('bedrock-extract', 'lambda_handler', 500),
+    ('analyze', 'lambda_handler', 500),
+    ('detect-impairments', 'lambda_handler', 100),
+    ('score', 'lambda_handler', 100),
+    ('act', 'lambda_handler', 100),
+]
+
+LAMBDA_ENVIRONMENT = {
+    'JOBS_TABLE_NAME': 'bench-jobs',
+    'EXTRACTION_BUCKET': 'bench-extraction',
+    'CLAIM_CHECK_BUCKET': 'bench-extraction',
+    'TRACE_BUCKET': 'bench-traces',
+    'MOCK_OUTPUT_S3_BUCKET': 'bench-agent-outputs',
+    'KNOWLEDGE_BASE_ID': 'bench-knowledge-base',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_REGION': 'us-east-1',
+    'METRICS_SINK': 'off',
+}
+
+# Runs in the child interpreter; the import-time marker separates the
+# interpreter's own startup imports from the handler's.
+CHILD = r"""
+import importlib.util, json, resource, sys, time
+first_call = None
+if len(sys.argv) > 3:
+    # Stdlib only until the handler imports boto3
+    from first_call import FirstCall
+    first_call = FirstCall(sys.argv[3], sys.argv[4])
+started = time.perf_counter()
+sys.stderr.write('--- init ---\n')
+sys.stderr.flush()
+before = len(sys.modules)
+spec = importlib.util.spec_from_file_location('index', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+sys.modules['index'] = module
+spec.loader.exec_module(module)
+init_ms = (time.perf_counter() - started) * 1000
+handler = getattr(module, sys.argv[2])
+run = {'initMs': init_ms, 'modules': len(sys.modules) - before}
+if first_call:
+    call_started = time.perf_counter()
+    first_call.invoke(handler)
+    run['firstCallMs'] = (time.perf_counter() - call_started) * 1000
+run['peakRssBytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps(run))
+"""
+
+
+def _import_times(stderr):
+    """Top-level imports made by the handler, as ``(module, cumulative ms)``"""
+    _, _, after = stderr.partition('--- init ---\n')
+    times = []
+    for line in after.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            times.append((name.strip(), int(cumulative) / 1000))
+    return times
+
+
+def measure_once(tree, directory, handler, layer_paths, importtime=False, document=None):
+    function_dir = tree / LAMBDA_ROOT / directory
+    env = {**os.environ, **LAMBDA_ENVIRONMENT,
+           'PYTHONPATH': os.pathsep.join([str(function_dir), str(tree / COMMON_LAYER), *layer_paths,
+                                          str(BENCHMARKS)]),
+           'PYTHONDONTWRITEBYTECODE': '1'}
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', CHILD,
+               str(function_dir / 'index.py'), handler, *([directory, str(document)] if document else [])]
+    started = time.perf_counter()
+    proc = subprocess.run(command, cwd=function_dir, env=env, capture_output=True, text=True)
+    process_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        lines = [l for l in proc.stderr.splitlines() if l and not l.startswith('import time:')]
+        raise RuntimeError(lines[-1] if lines else f"exit status {proc.returncode}")
+    run = json.loads(proc.stdout.strip().splitlines()[-1])
+    run['processMs'] = process_ms
+    if importtime:
+        run['imports'] = _import_times(proc.stderr)
+    return run
+
+
+def _spread(values):
+    values = sorted(values)
+    return {'median': round(statistics.median(values), 1), 'min': round(values[0], 1), 'max': round(values[-1], 1)}
+
+
+def measure(tree, directory, handler, layer_paths, repeat, warmup, top, document=None):
+    """Median and spread of ``repeat`` cold imports (and first calls), after ``warmup`` discarded ones"""
+    try:
+        for _ in range(warmup):
+            measure_once(tree, directory, handler, layer_paths, document=document)
+        runs = [measure_once(tree, directory, handler, layer_paths, document=document) for _ in range(repeat)]
+        slowest = measure_once(tree, directory, handler, layer_paths, importtime=True)['imports'] if top else []
+    except RuntimeError as e:
+        return {'error': str(e)}
+    entry = {'initMs': _spread(r['initMs'] for r in runs)}
+    if document:
+        entry['firstCallMs'] = _spread(r['firstCallMs'] for r in runs)
+        entry['coldMs'] = _spread(r['initMs'] + r['firstCallMs'] for r in runs)
+    return {
+        **entry,
+        'processMs': round(statistics.median(r['processMs'] for r in runs), 1),
+        'modules': runs[-1]['modules'],
+        'peakRssBytes': max(r['peakRssBytes'] for r in runs),
+        'slowestImports': [{'module': m, 'ms': round(ms, 1)}
+                           for m, ms in sorted(slowest, key=lambda i: -i[1])[:top]],
+    }
+
+
+def checkout(revision, into):
+    """Extract the Lambda and common-layer sources at ``revision`` into ``into``"""
+    archive = subprocess.run(['git', 'archive', '--format=tar', revision, str(LAMBDA_ROOT), str(COMMON_LAYER)],
+                             cwd=REPO_ROOT, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(into)
+    return Path(into)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(result, out):
+    baseline = result['config']['baseline']
+    first_call = result['config']['firstCall']
+    # With --first-call the baseline comparison is on the whole cold start
+    compared = 'coldMs' if first_call else 'initMs'
+    header = f"{'function':<20}{'init ms':>10}{'budget':>8}"
+    if first_call:
+        header += f"{'1st call':>10}{'cold ms':>10}"
+    header += f"{'process ms':>12}{'modules':>9}{'rss MB':>8}"
+    if baseline:
+        header += f"{'baseline':>10}{'change':>9}"
+    print(header, file=out)
+    for name, entry in result['functions'].items():
+        if 'error' in entry:
+            print(f"{name:<20}  ERROR {entry['error']}", file=out)
+            continue
+        line = f"{name:<20}{entry['initMs']['median']:>10.1f}{entry['budgetMs']:>8}"
+        if first_call:
+            line += f"{entry['firstCallMs']['median']:>10.1f}{entry['coldMs']['median']:>10.1f}"
+        line += f"{entry['processMs']:>12.1f}{entry['modules']:>9}{entry['peakRssBytes'] / 2**20:>8.1f}"
+        before = entry.get('baseline') or {}
+        if compared in before:
+            change = entry[compared]['median'] - before[compared]['median']
+            line += f"{before[compared]['median']:>10.1f}{change:>+9.1f}"
+        elif before:
+            line += f"{'error':>10}"
+        if not entry['withinBudget']:
+            line += '  OVER BUDGET'
+        print(line, file=out)
+        for item in entry['slowestImports']:
+            print(f"{'':<22}{item['ms']:>8.1f}  {item['module']}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('functions', nargs='*', help='function directories to measure (default: all pipeline functions)')
+    parser.add_argument('--repeat', type=int, default=10, help='cold imports per function')
+    parser.add_argument('--warmup', type=int, default=1, help='discarded imports first, to warm the page cache')
+    parser.add_argument('--top', type=int, default=0, help='list this many of the slowest top-level imports')
+    parser.add_argument('--baseline', help='also measure the handlers at this git revision')
+    parser.add_argument('--layer-path', action='append', default=[],
+                        help='directory with layer dependencies to put on sys.path (repeatable)')
+    parser.add_argument('--first-call', action='store_true',
+                        help='follow each cold import with one handler call and report the cold start')
+    parser.add_argument('--document', type=Path, default=REPO_ROOT / 'sample_documents' / 'life_submission.pdf',
+                        help='PDF the --first-call invocations process')
+    parser.add_argument('--output', help='write the JSON results here')
+    args = parser.parse_args(argv)
+
+    known = {directory for directory, _, _ in FUNCTIONS}
+    if args.first_call:
+        from first_call import FUNCTIONS as CALLABLE
+        known &= set(CALLABLE)
+    unknown = [f for f in args.functions if f not in known]
+    if unknown:
+        parser.error(f"unknown functions: {', '.join(unknown)} (choose from {', '.join(sorted(known))})")
+    selected = [f for f in FUNCTIONS if f[0] in known and (not args.functions or f[0] in args.functions)]
+    layer_paths = [str(Path(p).resolve()) for p in args.layer_path]
+    document = args.document.resolve() if args.first_call else None
+
+    result = {
+        'schemaVersion': 1,
+        'startedAt': datetime.now(timezone.utc).isoformat(),
+        'gitCommit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'repeat': args.repeat, 'warmup': args.warmup, 'baseline': args.baseline,
+                   'layerPaths': layer_paths, 'firstCall': args.first_call,
+                   'document': str(document) if document else None},
+        'functions': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='startup-baseline-') as scratch:
+        baseline_tree = checkout(args.baseline, scratch) if args.baseline else None
+        for directory, handler, budget in selected:
+            entry = measure(REPO_ROOT, directory, handler, layer_paths, args.repeat, args.warmup, args.top,
+                            document)
+            entry['budgetMs'] = budget
+            entry['withinBudget'] = 'initMs' in entry and entry['initMs']['median'] <= budget
+            if baseline_tree is not None:
+                entry['baseline'] = measure(baseline_tree, directory, handler, layer_paths,
+                                            args.repeat, args.warmup, 0, document)
+            result['functions'][directory] = entry
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2) + '\n')
+    _print_table(result, sys.stdout)
+    return 0 if all(e['withinBudget'] for e in result['functions'].values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
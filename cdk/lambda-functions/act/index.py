@@ -2,25 +2,29 @@ import json
 import os
 import time
 import traceback
-import boto3
-from botocore.config import Config
-from strands import Agent, tool
-from strands.models import BedrockModel # Added import
 from datetime import datetime, timezone # ADDED
 
-def log_timing(operation_name, start_time):
-    """Log the duration of an operation"""
-    elapsed = time.time() - start_time
-    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
+import aws_clients
+from claim_check import ClaimCheckLoader, describe_event
+from outbox import Outbox, make_sink
+from triage import triage
+from instrumentation import Metrics, log_timing
+
+metrics = Metrics('act')
 
 # --- Environment Variables --- 
 MOCK_OUTPUT_S3_BUCKET = os.environ.get('MOCK_OUTPUT_S3_BUCKET')
-S3_KEY_PREFIX = "agent_outputs/"
 JOBS_TABLE_NAME_ENV = os.environ.get('JOBS_TABLE_NAME') # ADDED
+# 'hybrid' decides clear-cut cases with rules and only runs the agent on ambiguous ones
+ACT_TRIAGE_MODE = os.environ.get('ACT_TRIAGE_MODE', 'hybrid').lower()
 
 # --- AWS SDK Clients --- 
-s3_client = boto3.client('s3')
-dynamodb_client = boto3.client('dynamodb')
+# Built on first use and reused for the life of the container
+s3_client = aws_clients.lazy('s3')
+dynamodb_client = aws_clients.lazy('dynamodb')
+
+# Per-invocation action buffer; tools append to it and the handler flushes it once
+_outbox: Outbox | None = None
 
 print(f"ActLambda initializing. Target S3 Bucket for outputs: {MOCK_OUTPUT_S3_BUCKET}. Jobs Table: {JOBS_TABLE_NAME_ENV}")
 
@@ -39,8 +43,7 @@ def get_language_instruction(language: str) -> str:
     }
     return language_map.get(language, 'Respond in English.')
 
-# --- Step 1: Define Agent Tools ---
-@tool
+# --- Step 1: Define Agent Tools (wrapped with strands' @tool when the agent is built) ---
 def send_ineligibility_notice_tool(document_identifier: str, reason_for_ineligibility: str) -> str:
     """Records that an application (identified by its document_identifier) has been deemed ineligible.
     Use this tool when an application clearly violates underwriting policy and cannot proceed.
@@ -51,35 +54,29 @@ def send_ineligibility_notice_tool(document_identifier: str, reason_for_ineligib
     Returns:
         str: A confirmation message indicating the action was recorded.
     """
-    if not s3_client or not MOCK_OUTPUT_S3_BUCKET:
-        error_msg = "S3 client or MOCK_OUTPUT_S3_BUCKET not configured for send_ineligibility_notice_tool."
+    return record_ineligibility_notice(document_identifier, reason_for_ineligibility)
+
+
+def record_ineligibility_notice(document_identifier: str, reason_for_ineligibility: str) -> str:
+    """Queue the ineligibility notice (shared by the agent tool and rule-based triage)."""
+    if _outbox is None:
+        error_msg = "Action outbox not initialized for send_ineligibility_notice_tool."
         print(f"ERROR: {error_msg}")
         return error_msg
 
-    safe_identifier = document_identifier.replace("/", "_").replace(":", "_")
-    file_name = f"{S3_KEY_PREFIX}{safe_identifier}_ineligible.txt"
     file_content = (
         f"Document Identifier: {document_identifier}\n"
         f"Status: Ineligible\n"
         f"Reason: {reason_for_ineligibility}"
     )
+    key = _outbox.append('ineligibility_notice', document_identifier, {
+        'reason': reason_for_ineligibility,
+        'content': file_content,
+    })
+    confirmation_message = f"Ineligibility notice for '{document_identifier}' queued in the action outbox ({key})"
+    print(confirmation_message)
+    return confirmation_message
 
-    try:
-        s3_client.put_object(
-            Bucket=MOCK_OUTPUT_S3_BUCKET,
-            Key=file_name,
-            Body=file_content.encode('utf-8'),
-            ContentType='text/plain'
-        )
-        confirmation_message = f"Ineligibility notice for '{document_identifier}' recorded in S3: s3://{MOCK_OUTPUT_S3_BUCKET}/{file_name}"
-        print(confirmation_message)
-        return confirmation_message
-    except Exception as e:
-        error_msg = f"Error writing ineligibility notice to S3 for '{document_identifier}': {str(e)}"
-        print(f"ERROR: {error_msg}")
-        return error_msg
-
-@tool
 def request_supporting_documents_tool(document_identifier: str, recipient_email: str, documents_to_request: list[str], email_body: str) -> str:
     """Records a request for additional supporting documents for an application (identified by its document_identifier).
     Use this tool when an application is not ineligible but requires standard supporting documents to proceed.
@@ -92,35 +89,30 @@ def request_supporting_documents_tool(document_identifier: str, recipient_email:
     Returns:
         str: A confirmation message indicating the document request was recorded.
     """
-    if not s3_client or not MOCK_OUTPUT_S3_BUCKET:
-        error_msg = "S3 client or MOCK_OUTPUT_S3_BUCKET not configured for request_supporting_documents_tool."
+    return record_document_request(document_identifier, recipient_email, documents_to_request, email_body)
+
+
+def record_document_request(document_identifier: str, recipient_email: str, documents_to_request: list[str], email_body: str) -> str:
+    """Queue the supporting-document request (shared by the agent tool and rule-based triage)."""
+    if _outbox is None:
+        error_msg = "Action outbox not initialized for request_supporting_documents_tool."
         print(f"ERROR: {error_msg}")
         return error_msg
 
-    safe_identifier = document_identifier.replace("/", "_").replace(":", "_")
-    file_name = f"{S3_KEY_PREFIX}{safe_identifier}_document_request.txt"
-    
     file_content = (
         f"To: {recipient_email}\n"
         f"From: underwriting-bot@example.com\n"
         f"Subject: Additional Documents Required for Application (Document: {document_identifier})\n\n"
         f"{email_body}"
     )
-
-    try:
-        s3_client.put_object(
-            Bucket=MOCK_OUTPUT_S3_BUCKET,
-            Key=file_name,
-            Body=file_content.encode('utf-8'),
-            ContentType='text/plain'
-        )
-        confirmation_message = f"Document request for '{document_identifier}' (docs: {', '.join(documents_to_request)}) recorded in S3: s3://{MOCK_OUTPUT_S3_BUCKET}/{file_name}"
-        print(confirmation_message)
-        return confirmation_message
-    except Exception as e:
-        error_msg = f"Error writing document request to S3 for '{document_identifier}': {str(e)}"
-        print(f"ERROR: {error_msg}")
-        return error_msg
+    key = _outbox.append('document_request', document_identifier, {
+        'recipient': recipient_email,
+        'documents': list(documents_to_request or []),
+        'content': file_content,
+    })
+    confirmation_message = f"Document request for '{document_identifier}' (docs: {', '.join(documents_to_request)}) queued in the action outbox ({key})"
+    print(confirmation_message)
+    return confirmation_message
 
 # --- Step 2: Configure Strands Agent (System Prompt & Initialization) ---
 SUPPORTING_DOCUMENTS_MAP = {
@@ -180,21 +172,64 @@ docs_life_app_str = "\n- " + "\n- ".join(SUPPORTING_DOCUMENTS_MAP["LIFE_INSURANC
 docs_medical_str = "\n- " + "\n- ".join(SUPPORTING_DOCUMENTS_MAP["MEDICAL_REPORT"])
 docs_default_str = "\n- " + "\n- ".join(SUPPORTING_DOCUMENTS_MAP["DEFAULT_APP_TYPE"])
 
-# --- Step 2: Initialize Reusable Model Client ---
-# The model client is static and can be reused across invocations.
-try:
-    # Configure Bedrock client with adaptive retry settings
-    retrying_cfg = Config(
-        retries={"mode": "adaptive", "max_attempts": 12}
-    )
-    model = BedrockModel(
-        model_id="global.anthropic.claude-haiku-4-5-20251001-v1:0",
-        boto_client_config=retrying_cfg
+ACT_MODEL_ID = "global.anthropic.claude-haiku-4-5-20251001-v1:0"
+
+# --- Step 2: Reusable Model Client ---
+# Strands and the model client load on the first agent build, so containers whose
+# applications are all decided by triage rules never pay for them.
+_model = None
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        model_start = time.time()
+        from botocore.config import Config
+        from strands.models import BedrockModel
+        # Configure Bedrock client with adaptive retry settings
+        retrying_cfg = Config(
+            retries={"mode": "adaptive", "max_attempts": 12}
+        )
+        _model = BedrockModel(
+            model_id=ACT_MODEL_ID,
+            boto_session=aws_clients.session(),
+            boto_client_config=retrying_cfg
+        )
+        log_timing(f"Create BedrockModel {ACT_MODEL_ID}", model_start)
+    return _model
+
+# Warm-container agent cache keyed by (insurance type, language, model id). The
+# system prompt only depends on that key, so each invocation just clears the
+# conversation instead of rebuilding the agent.
+_AGENTS: dict[tuple, object] = {}
+
+
+def _get_agent(insurance_type, language='en-US'):
+    key = (insurance_type, language, ACT_MODEL_ID)
+    agent = _AGENTS.get(key)
+    if agent is not None:
+        agent.messages = []
+        loop_metrics = getattr(agent, 'event_loop_metrics', None)
+        if loop_metrics is not None:
+            agent.event_loop_metrics = type(loop_metrics)()
+        print(f"[act] Reusing warm agent for {key}")
+        return agent
+    build_start = time.time()
+    from strands import Agent, tool
+    agent_system_prompt = get_agent_system_prompt(insurance_type, language)
+    print(f"[act] Agent system prompt size: {len(agent_system_prompt)} bytes")
+    agent = Agent(
+        system_prompt=agent_system_prompt,
+        tools=[
+            tool(send_ineligibility_notice_tool),
+            tool(request_supporting_documents_tool)
+        ],
+        model=_get_model() # Shared across agents and invocations
     )
-    print("BedrockModel initialized successfully with adaptive retry (max_attempts=12).")
-except Exception as e:
-    print(f"CRITICAL: Error initializing BedrockModel: {e}")
-    model = None # Set model to None if initialization fails
+    _AGENTS[key] = agent
+    log_timing(f"Build act agent ({insurance_type}, {language})", build_start)
+    return agent
+
 
 def get_agent_system_prompt(insurance_type, language='en-US'):
     """Get the appropriate agent system prompt based on insurance type"""
@@ -264,22 +299,57 @@ The user message will contain the `document_identifier` and the extracted applic
     return common_intro + "\n\n" + ineligibility_rules + "\n\nIf an application is ineligible:\n- You MUST use the `send_ineligibility_notice_tool`.\n- Provide a clear `reason_for_ineligibility` based *only* on the specific rule that was violated.\n- Ensure the `document_identifier` (from the user message) is passed to the tool.\n\n" + supporting_docs_section + docs_map + "\n\n" + email_instructions
 
 # --- Step 3: Implement Lambda Handler ---
+def _run_triage_agent(document_identifier, document_type, extracted_data, insurance_type, user_language, context):
+    """Ask the Strands agent to triage an application; returns the agent's final message."""
+    print(f"[act] Building agent input, remaining_time={context.get_remaining_time_in_millis()}ms")
+
+    agent_input_message = (
+        f"Triage the following insurance application.\n"
+        f"Document Identifier: {document_identifier}\n"
+        f"Application Type: {document_type}\n"
+        f"Extracted Data: {json.dumps(extracted_data, indent=2)}"
+    )
+    print(f"[act] Agent input message size: {len(agent_input_message)} bytes")
+    
+    # Get a warm agent with the insurance-type specific prompt
+    print(f"[act] Acquiring Strands agent, remaining_time={context.get_remaining_time_in_millis()}ms")
+    uw_agent = _get_agent(insurance_type, user_language)
+    
+    # Call agent - let boto3 handle retries with adaptive mode
+    print(f"[act] Invoking Strands agent, remaining_time={context.get_remaining_time_in_millis()}ms")
+    agent_start = time.time()
+    try:
+        agent_response = uw_agent(agent_input_message)
+        log_timing("Strands act agent invocation", agent_start, metric='AgentInvocation')
+        metrics.record_agent(agent_response)
+    except Exception as agent_error:
+        log_timing("Strands act agent invocation (FAILED)", agent_start)
+        metrics.count('ModelErrors')
+        # Don't reuse an agent left mid-conversation by a failure
+        _AGENTS.pop((insurance_type, user_language, ACT_MODEL_ID), None)
+        print(f"[act] ERROR: Strands agent invocation failed: {type(agent_error).__name__}: {agent_error}")
+        traceback.print_exc()
+        # Check for specific Bedrock errors
+        if hasattr(agent_error, 'response'):
+            print(f"[act] Bedrock error response: {agent_error.response}")
+        raise
+    
+    agent_response_str = str(agent_response)
+    print(f"[act] Agent response size: {len(agent_response_str)} bytes")
+    print(f"[act] Agent response preview (first 500 chars): {agent_response_str[:500]}")
+    return agent_response_str
+
+
+@metrics.handler
 def lambda_handler(event, context):
+    global _outbox
     handler_start = time.time()
     print(f"[act] === ACT LAMBDA START === remaining_time={context.get_remaining_time_in_millis()}ms")
-    print(f"[act] Event keys: {list(event.keys()) if isinstance(event, dict) else 'not a dict'}")
-    print(f"[act] Event size: {len(json.dumps(event))} bytes")
-    print(f"[act] Event preview: {json.dumps(event)[:2000]}")
+    print(f"[act] Event keys: {describe_event(event)}")
 
-    if not s3_client:
-        print("[act] CRITICAL: S3 client not initialized.")
-        return {"statusCode": 500, "body": json.dumps({"error": "S3 client not initialized."})}
     if not MOCK_OUTPUT_S3_BUCKET:
         print("[act] CRITICAL: MOCK_OUTPUT_S3_BUCKET env var not set or empty.")
         return {"statusCode": 500, "body": json.dumps({"error": "MOCK_OUTPUT_S3_BUCKET env var not set."})}
-    if not model:
-        print("[act] CRITICAL: BedrockModel (model) not initialized.")
-        return {"statusCode": 500, "body": json.dumps({"error": "BedrockModel not initialized."})}
 
     try:
         print(f"[act] Step 1: Extracting event data, remaining_time={context.get_remaining_time_in_millis()}ms")
@@ -294,8 +364,26 @@ def lambda_handler(event, context):
         job_id = event.get('classification').get('jobId')
         insurance_type = event.get('classification').get('insuranceType')
         document_type = event.get('classification').get('classification')
-        extracted_data = event.get('extraction', {}).get('data')
+        # Triage reads the full merged extraction from analyze: a knockout field can rank
+        # below detection's token budget and exist only in omitted_records of the compacted view.
+        # The agent gets the compacted view detection already built.
+        loader = ClaimCheckLoader(s3_client)
+        try:
+            full_extraction = loader.resolve_path(event, 'analysisOutput', 'extraction')
+        except Exception as e:
+            print(f"[act] WARNING: Could not resolve extraction claim check: {e}")
+            full_extraction = None
+        try:
+            extracted_data = loader.resolve_path(event, 'analysisDetection', 'compactedExtraction')
+        except Exception as e:
+            print(f"[act] WARNING: Could not resolve compacted extraction claim check: {e}")
+            extracted_data = None
+        if not extracted_data:
+            extracted_data = full_extraction or (event.get('extraction') or {}).get('data')
+        if not isinstance(full_extraction, dict) or not full_extraction:
+            full_extraction = extracted_data
         print(f"[act] job_id={job_id}, document_type={document_type}, insurance_type={insurance_type}")
+        metrics.tag(job_id=job_id, insurance_type=insurance_type, model_id=ACT_MODEL_ID)
         print(f"[act] document_identifier={document_identifier}")
 
         # Read user language preference from DynamoDB
@@ -344,56 +432,44 @@ def lambda_handler(event, context):
             print(f"[act] WARNING: Missing or invalid 'data' within 'extraction' for {document_identifier}. Using empty dict.")
             # We'll allow missing extraction data for now and handle it gracefully.
             extracted_data = {}
+        if not isinstance(full_extraction, dict):
+            full_extraction = extracted_data
         
-        print(f"[act] Step 3: Building agent input, remaining_time={context.get_remaining_time_in_millis()}ms")
+        # One run per Step Functions execution; retries of this invocation share it
+        run_id = event.get('executionId') or context.aws_request_id
+        _outbox = Outbox(make_sink(s3_client, MOCK_OUTPUT_S3_BUCKET), job_id, run_id)
 
-        agent_input_message = (
-            f"Triage the following insurance application.\n"
-            f"Document Identifier: {document_identifier}\n"
-            f"Application Type: {document_type}\n"
-            f"Extracted Data: {json.dumps(extracted_data, indent=2)}"
-        )
-        print(f"[act] Agent input message size: {len(agent_input_message)} bytes")
-        
-        # Get the appropriate agent system prompt based on insurance type
-        agent_system_prompt = get_agent_system_prompt(insurance_type, user_language)
-        print(f"[act] Agent system prompt size: {len(agent_system_prompt)} bytes")
-        
-        # Initialize the agent with the insurance-type specific prompt
-        # The agent is created here because its system_prompt depends on the event payload.
-        print(f"[act] Step 4: Initializing Strands agent, remaining_time={context.get_remaining_time_in_millis()}ms")
-        uw_agent = Agent(
-            system_prompt=agent_system_prompt,
-            tools=[
-                send_ineligibility_notice_tool,
-                request_supporting_documents_tool
-            ],
-            model=model # Use the globally initialized model
-        )
-        
-        # Call agent - let boto3 handle retries with adaptive mode
-        print(f"[act] Step 5: Invoking Strands agent, remaining_time={context.get_remaining_time_in_millis()}ms")
-        agent_start = time.time()
-        try:
-            agent_response = uw_agent(agent_input_message)
-            log_timing("Strands act agent invocation", agent_start)
-        except Exception as agent_error:
-            log_timing("Strands act agent invocation (FAILED)", agent_start)
-            print(f"[act] ERROR: Strands agent invocation failed: {type(agent_error).__name__}: {agent_error}")
-            traceback.print_exc()
-            # Check for specific Bedrock errors
-            if hasattr(agent_error, 'response'):
-                print(f"[act] Bedrock error response: {agent_error.response}")
-            raise
-        
-        agent_response_str = str(agent_response)
-        print(f"[act] Agent response size: {len(agent_response_str)} bytes")
-        print(f"[act] Agent response preview (first 500 chars): {agent_response_str[:500]}")
+        print(f"[act] Step 3: Triage, mode={ACT_TRIAGE_MODE}, remaining_time={context.get_remaining_time_in_millis()}ms")
+        decision = {'path': 'agent', 'reason': 'rule-based triage disabled'}
+        if ACT_TRIAGE_MODE == 'hybrid':
+            triage_start = time.time()
+            decision = triage(document_identifier, document_type, insurance_type, full_extraction,
+                              SUPPORTING_DOCUMENTS_MAP, user_language)
+            log_timing("Rule-based triage", triage_start, metric='RuleTriage')
+
+        if decision['path'] == 'rules' and decision['action'] == 'ineligible':
+            action_confirmation = record_ineligibility_notice(document_identifier, decision['reason_for_ineligibility'])
+        elif decision['path'] == 'rules':
+            action_confirmation = record_document_request(
+                document_identifier, decision['recipient_email'], decision['documents_to_request'], decision['email_body'])
+        else:
+            print(f"[act] Routing to agent: {decision.get('reason')}")
+            action_confirmation = _run_triage_agent(
+                document_identifier, document_type, extracted_data, insurance_type, user_language, context)
+        print(f"[act] Triage path={decision['path']} action={decision.get('action', 'agent')}")
+
+        # Write all queued side effects in one batch, outside the agent loop
+        outbox_start = time.time()
+        outbox_result = _outbox.flush()
+        log_timing("Outbox flush", outbox_start, metric='OutboxFlush')
 
         lambda_output = {
             "document_identifier": document_identifier,
-            "agent_action_confirmation": str(agent_response),
-            "message": "Agent triage process completed."
+            "agent_action_confirmation": action_confirmation,
+            "triage_path": decision['path'],
+            "outbox": outbox_result,
+            "triage_reason": decision.get('reason') or decision.get('reason_for_ineligibility') or decision.get('action'),
+            "message": "Agent triage process completed." if decision['path'] == 'agent' else "Rule-based triage completed."
         }
         # --- Update DynamoDB with Agent Action Output ---
         print(f"[act] Step 6: Persisting agent output to DynamoDB, remaining_time={context.get_remaining_time_in_millis()}ms")
@@ -418,7 +494,7 @@ def lambda_handler(event, context):
                         ':actionTsVal': {'S': timestamp_now}
                     }
                 )
-                log_timing("DynamoDB persist agent output", ddb_start)
+                log_timing("DynamoDB persist agent output", ddb_start, metric='DynamoDB')
                 print(f"[act] Successfully updated job {job_id} in DynamoDB with agent action results.")
             except Exception as ddb_e:
                 print(f"[act] ERROR: Error updating DynamoDB for job {job_id}: {str(ddb_e)}")
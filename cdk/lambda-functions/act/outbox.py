@@ -0,0 +1,182 @@
+"""Per-invocation outbox for act side effects (notices and document requests).
+
+Tools append actions to an in-memory buffer instead of writing to S3 inside the
+agent loop; the handler flushes the buffer once at the end of the invocation.
+
+Idempotency is per run (``{job_id}:{run_id}``, the run being the Step Functions
+execution), not per action: the first flush of a run decides what the run
+wrote, and a redelivered invocation writes the same thing again even if its
+agent chose a different action this time.
+
+- ``S3Sink`` keeps the layout consumers of ``agent_outputs/`` read: one text
+  file per action, ``{document}_ineligible.txt`` or
+  ``{document}_document_request.txt``. The run is claimed first with a
+  conditional put of ``agent_outputs/outbox/{run}.json``; a repeat flush
+  rewrites the files recorded there instead of its own. Writing a run's files
+  removes the other action's file for the same document, so the folder holds
+  the latest run's decision only.
+- ``SQSSink`` sends one message per run; FIFO queues deduplicate on the run key
+- ``FileSink`` appends JSONL lines to a local file, skipping runs already present
+
+The sink is chosen with ``OUTBOX_SINK`` (``s3`` by default).
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+OUTBOX_SINK = os.environ.get('OUTBOX_SINK', 's3').lower()
+OUTPUT_PREFIX = os.environ.get('OUTPUT_PREFIX', 'agent_outputs/')
+OUTBOX_PREFIX = os.environ.get('OUTBOX_PREFIX', 'agent_outputs/outbox/')
+OUTBOX_SQS_QUEUE_URL = os.environ.get('OUTBOX_SQS_QUEUE_URL')
+OUTBOX_FILE_PATH = os.environ.get('OUTBOX_FILE_PATH', '/tmp/act-outbox.jsonl')
+
+# Action -> file name suffix under OUTPUT_PREFIX
+ACTION_FILES = {
+    'ineligibility_notice': 'ineligible',
+    'document_request': 'document_request',
+}
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _error_code(error) -> str | None:
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+class S3Sink:
+    def __init__(self, s3_client, bucket: str, prefix: str = OUTPUT_PREFIX, claim_prefix: str = OUTBOX_PREFIX):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.claim_prefix = claim_prefix
+
+    def output_key(self, document_identifier: str, action: str) -> str:
+        safe_identifier = document_identifier.replace("/", "_").replace(":", "_")
+        return f"{self.prefix}{safe_identifier}_{ACTION_FILES.get(action, action)}.txt"
+
+    def _claim(self, run_key: str, entries: list[dict]) -> list[dict] | None:
+        """Record ``entries`` as the run's output; returns the recorded entries if the run was already claimed"""
+        key = f"{self.claim_prefix}{_digest(run_key)[:32]}.json"
+        body = json.dumps({'runKey': run_key, 'entries': entries}, ensure_ascii=False)
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=body.encode('utf-8'),
+                               ContentType='application/json', IfNoneMatch='*')
+            return None
+        except Exception as e:
+            if _error_code(e) not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+        print(f"[outbox] Run {run_key} already claimed in s3://{self.bucket}/{key}; rewriting its recorded actions")
+        recorded = self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        return json.loads(recorded)['entries']
+
+    def write(self, run_key: str, entries: list[dict]) -> dict:
+        recorded = self._claim(run_key, entries)
+        duplicates = 0
+        if recorded is not None:
+            duplicates, entries = len(entries), recorded
+        written = []
+        for entry in entries:
+            key = self.output_key(entry['documentIdentifier'], entry['action'])
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=entry['payload']['content'].encode('utf-8'),
+                               ContentType='text/plain')
+            written.append(key)
+        for document in {e['documentIdentifier'] for e in entries}:
+            for action in ACTION_FILES:
+                key = self.output_key(document, action)
+                if key not in written:
+                    # A previous run decided differently; its file no longer describes this document
+                    self.s3.delete_object(Bucket=self.bucket, Key=key)
+        return {'location': f"s3://{self.bucket}/{self.prefix}",
+                'written': 0 if duplicates else len(written), 'duplicates': duplicates}
+
+
+class SQSSink:
+    def __init__(self, sqs_client, queue_url: str):
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+        self.fifo = queue_url.endswith('.fifo')
+
+    def write(self, run_key: str, entries: list[dict]) -> dict:
+        params = {'QueueUrl': self.queue_url,
+                  'MessageBody': json.dumps({'runKey': run_key, 'entries': entries}, ensure_ascii=False)}
+        if self.fifo:
+            params['MessageGroupId'] = entries[0]['jobId'] or 'unknown'
+            params['MessageDeduplicationId'] = _digest(run_key)
+        self.sqs.send_message(**params)
+        return {'location': self.queue_url, 'written': len(entries), 'duplicates': 0}
+
+
+class FileSink:
+    def __init__(self, path: str = OUTBOX_FILE_PATH):
+        self.path = path
+
+    def write(self, run_key: str, entries: list[dict]) -> dict:
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        if json.loads(line).get('runKey') == run_key:
+                            return {'location': self.path, 'written': 0, 'duplicates': len(entries)}
+                    except ValueError:
+                        continue
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            for entry in entries:
+                fh.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return {'location': self.path, 'written': len(entries), 'duplicates': 0}
+
+
+class Outbox:
+    """Buffer of side effects for one run, flushed in a single batch."""
+
+    def __init__(self, sink, job_id: str | None, run_id: str):
+        self.sink = sink
+        self.job_id = job_id
+        self.run_id = run_id
+        self._entries: dict[str, dict] = {}
+
+    def append(self, action: str, document_identifier: str, payload: dict) -> str:
+        run_key = f"{self.job_id or document_identifier}:{self.run_id}"
+        key = f"{run_key}:{action}"
+        if key in self._entries:
+            # Same action twice in one invocation (e.g. an agent retrying a tool): keep the latest
+            print(f"[outbox] Replacing buffered entry {key}")
+        self._entries[key] = {
+            'idempotencyKey': key,
+            'runKey': run_key,
+            'jobId': self.job_id,
+            'action': action,
+            'documentIdentifier': document_identifier,
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'payload': payload,
+        }
+        return key
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def flush(self) -> dict | None:
+        if not self._entries:
+            return None
+        entries = list(self._entries.values())
+        result = self.sink.write(entries[0]['runKey'], entries)
+        self._entries.clear()
+        print(f"[outbox] Flushed {len(entries)} entries to {result['location']} "
+              f"(written={result['written']}, duplicates={result['duplicates']})")
+        return result
+
+
+def make_sink(s3_client=None, bucket: str | None = None):
+    """Build the sink selected by ``OUTBOX_SINK``."""
+    if OUTBOX_SINK == 'sqs':
+        if not OUTBOX_SQS_QUEUE_URL:
+            raise ValueError("OUTBOX_SINK=sqs requires OUTBOX_SQS_QUEUE_URL")
+        import aws_clients
+        return SQSSink(aws_clients.client('sqs'), OUTBOX_SQS_QUEUE_URL)
+    if OUTBOX_SINK == 'file':
+        return FileSink()
+    if not (s3_client and bucket):
+        raise ValueError("OUTBOX_SINK=s3 requires an S3 client and bucket")
+    return S3Sink(s3_client, bucket)
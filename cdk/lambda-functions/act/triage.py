@@ -0,0 +1,266 @@
+"""Deterministic triage for the act step.
+
+Most triage decisions are mechanical: a hard knockout in the extracted data
+means the application is ineligible, otherwise the document type maps to a
+fixed list of supporting documents. ``triage`` handles those cases without a
+model call and returns ``path='agent'`` with a reason for anything that needs
+judgement (medical knockouts with time windows, unparseable or conflicting
+values, non-English correspondence). Knockout fields are read from the
+applicant's own paths only; a date on a prior policy or a country on a trip
+does not decide the case.
+
+Document request emails are rendered from
+``templates/requirements_letter.md``, a copy of
+knowledge-base/manual/5-appendices/sample_letters/requirements_letter.md.
+"""
+import os
+import re
+from datetime import date, datetime, timedelta
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+COMPANY_NAME = os.environ.get('COMPANY_NAME', 'AnyCompany Insurance')
+DEFAULT_RECIPIENT = 'underwriting-dept@example.com'
+REQUIREMENTS_DUE_DAYS = 60
+
+SANCTIONED_STATUSES = {'positive', 'matchfound', 'match found', 'match'}
+SANCTIONED_COUNTRIES = {
+    c.strip().lower() for c in os.environ.get(
+        'SANCTIONED_COUNTRIES', 'Cuba,Iran,North Korea,Democratic People\'s Republic of Korea,Syria,Crimea'
+    ).split(',') if c.strip()
+}
+INELIGIBLE_BUSINESS_TYPES = {'nightclub', 'explosives manufacturing'}
+MAX_LIFE_AGE = 85
+
+# Findings whose eligibility depends on dates and clinical judgement stay with the agent
+_MEDICAL_KNOCKOUT_TERMS = re.compile(
+    r'cancer|carcinoma|malignan|lymphoma|leukemia|melanoma|myocardial infarction|heart attack|\bstroke\b|\bcva\b',
+    re.I,
+)
+
+# Knockouts read the applicant's own fields: a country, date or age under one of
+# these path segments belongs to someone or something else (a trip, a prior policy, a relative)
+_OTHER_SCOPE = re.compile(
+    r'family|relative|parent|mother|father|sibling|spouse|child|beneficiar|physician|doctor|provider|'
+    r'owner|payor|payer|trustee|employer|agent|producer|travel|trip|prior|previous|former|existing|'
+    r'replac|otherinsurance|othercoverage|claim|loss'
+)
+_RESIDENCE_KEYS = ('country_of_residence', 'residence_country', 'resident_country')
+_RESIDENCE_SCOPES = {'applicantdetails', 'applicant', 'applicantinformation', 'applicantheader', 'insured',
+                     'proposedinsured', 'address', 'residence', 'residentialaddress', 'homeaddress'}
+_START_DATE_KEYS = ('requested_policy_start_date', 'requested_effective_date', 'requested_start_date')
+_START_DATE_SCOPED_KEYS = ('policy_start_date', 'effective_date')
+
+_TEMPLATE_CACHE: dict = {}
+
+
+def _norm(key) -> str:
+    return re.sub(r'[^a-z0-9]', '', str(key).lower())
+
+
+def _flatten(data, prefix: str = '') -> list[tuple[str, str, object]]:
+    """Return ``(normalized_key, normalized_path, value)`` for every scalar in ``data``."""
+    out = []
+    if isinstance(data, dict):
+        for k, v in data.items():
+            path = f"{prefix}.{_norm(k)}" if prefix else _norm(k)
+            if isinstance(v, dict) and 'value' in v and 'pages' in v:
+                # applicant_header entries: {"value": ..., "pages": [...]}
+                out.append((_norm(k), path, v.get('value')))
+            elif isinstance(v, (dict, list)):
+                out.extend(_flatten(v, path))
+            else:
+                out.append((_norm(k), path, v))
+    elif isinstance(data, list):
+        for v in data:
+            out.extend(_flatten(v, prefix))
+    return out
+
+
+def _applicant_values(fields: list, *keys: str, scopes: set | None = None) -> list:
+    """Values of ``keys`` on the applicant's own paths; ``scopes`` also requires one of those path segments."""
+    wanted = {_norm(k) for k in keys}
+    out = []
+    for k, path, v in fields:
+        if k not in wanted or v in (None, ''):
+            continue
+        parents = path.split('.')[:-1]
+        if any(_OTHER_SCOPE.search(segment) for segment in parents):
+            continue
+        if scopes is not None and not scopes.intersection(parents):
+            continue
+        out.append(v)
+    return out
+
+
+def _distinct(values: list) -> list:
+    return list(dict.fromkeys(str(v).strip() for v in values))
+
+
+def _parse_date(value) -> date | None:
+    text = str(value or '').strip()
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%B %d, %Y', '%b %d, %Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    m = re.search(r'(\d{4})-(\d{2})-(\d{2})', text)
+    if m:
+        try:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError:
+            return None
+    return None
+
+
+def _age(fields: list) -> tuple[float | None, bool]:
+    """Return ``(age, ambiguous)`` from the applicant's explicit age or date of birth."""
+    ages = _distinct(_applicant_values(fields, 'age', 'current_age', 'applicant_age', 'age_nearest_birthday'))
+    if ages:
+        numbers = {float(m.group(0)) if m else None for m in (re.search(r'\d+(?:\.\d+)?', a) for a in ages)}
+        if None in numbers or len(numbers) > 1:
+            return None, True
+        return numbers.pop(), False
+    dobs = {_parse_date(v) for v in _distinct(_applicant_values(fields, 'date_of_birth', 'dob', 'birth_date'))}
+    if dobs:
+        if None in dobs or len(dobs) > 1:
+            return None, True
+        dob = dobs.pop()
+        today = date.today()
+        return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day)), False
+    return None, False
+
+
+def _knockouts(fields: list, insurance_type: str, document_type: str) -> tuple[list[str], list[str]]:
+    """Return ``(ineligibility reasons, ambiguity reasons)``."""
+    reasons, ambiguous = [], []
+
+    for status in _applicant_values(fields, 'sanctioned_entity_status', 'sanctions_status', 'ofac_status'):
+        if str(status).strip().lower() in SANCTIONED_STATUSES:
+            reasons.append('sanctioned entity match')
+            break
+
+    # Residence decides only when every applicant residence field agrees
+    countries = _distinct(_applicant_values(fields, *_RESIDENCE_KEYS)
+                          + _applicant_values(fields, 'country', scopes=_RESIDENCE_SCOPES))
+    sanctioned = [c for c in countries if c.lower() in SANCTIONED_COUNTRIES]
+    if sanctioned and len(sanctioned) == len(countries):
+        reasons.append(f'residence in sanctioned country ({sanctioned[0]})')
+    elif sanctioned:
+        ambiguous.append(f"conflicting applicant countries: {', '.join(countries)}")
+    citizenship = [c for c in _distinct(_applicant_values(fields, 'citizenship'))
+                   if c.lower() in SANCTIONED_COUNTRIES]
+    if citizenship and not sanctioned:
+        ambiguous.append(f"citizenship of a sanctioned country ({citizenship[0]}) needs review")
+
+    starts = _distinct(_applicant_values(fields, *_START_DATE_KEYS)
+                       + _applicant_values(fields, *_START_DATE_SCOPED_KEYS, scopes={'applicationdetails'}))
+    dates = {_parse_date(value) for value in starts}
+    if None in dates:
+        ambiguous.append(f"unparseable requested policy start date: {', '.join(starts)}")
+    elif len(dates) > 1:
+        ambiguous.append(f"conflicting requested policy start dates: {', '.join(starts)}")
+    elif dates and dates.pop() < date.today():
+        reasons.append('past policy start date')
+
+    if insurance_type == 'life':
+        age, age_ambiguous = _age(fields)
+        if age_ambiguous:
+            ambiguous.append('applicant age could not be determined')
+        elif age is not None and age > MAX_LIFE_AGE and document_type == 'LIFE_INSURANCE_APPLICATION':
+            reasons.append('age exceeds maximum limit')
+        medical_text = ' '.join(f"{k} {v}" for k, _p, v in fields if isinstance(v, str))
+        if _MEDICAL_KNOCKOUT_TERMS.search(medical_text):
+            ambiguous.append('possible cancer or cardiac/stroke history needs date review')
+    else:
+        if document_type == 'COMMERCIAL_PROPERTY_APPLICATION':
+            for business in _applicant_values(fields, 'business_type'):
+                if str(business).strip().lower() in INELIGIBLE_BUSINESS_TYPES:
+                    reasons.append(f'ineligible business type: {business}')
+                    break
+            construction = ' '.join(str(v) for v in _applicant_values(fields, 'construction_type')).lower()
+            wildfire = ' '.join(str(v) for v in _applicant_values(fields, 'wildfire_risk_zone', 'wildfire_risk')).lower()
+            if 'wood frame' in construction and re.search(r'\b(high|extreme)\b', wildfire):
+                reasons.append('wood frame construction in a high/extreme wildfire risk zone')
+        for grade in _applicant_values(fields, 'property_crime_grade'):
+            if str(grade).strip().upper() == 'F':
+                reasons.append('Property Crime Grade is F')
+                break
+    return reasons, ambiguous
+
+
+def _requirements_template() -> str:
+    if 'requirements' not in _TEMPLATE_CACHE:
+        with open(os.path.join(TEMPLATE_DIR, 'requirements_letter.md'), encoding='utf-8') as fh:
+            text = fh.read()
+        fence = re.search(r'```\s*\n(.*?)\n```', text, re.S)
+        _TEMPLATE_CACHE['requirements'] = fence.group(1) if fence else text
+    return _TEMPLATE_CACHE['requirements']
+
+
+def render_requirements_letter(applicant_name: str | None, application_ref: str, product_label: str,
+                               documents: list[str]) -> str:
+    """Fill the sample requirements letter; lines left with unknown placeholders are dropped."""
+    template = _requirements_template()
+    today = date.today()
+    due = today + timedelta(days=REQUIREMENTS_DUE_DAYS)
+    # Replace the checkbox menu with the actual requirements
+    template = re.sub(
+        r'\[SELECT ALL THAT APPLY[^\]]*\].*?(?=\n[^\n]*These requirements are necessary)',
+        '\n'.join(f"- {d}" for d in documents) + '\n',
+        template,
+        flags=re.S,
+    )
+    values = {
+        'DATE': today.strftime('%B %d, %Y'),
+        'APPLICANT NAME': applicant_name or 'Applicant',
+        'APPLICATION NUMBER': application_ref,
+        'COMPANY NAME': COMPANY_NAME,
+        'UNDERWRITER NAME': 'Underwriting Department',
+        'TITLE': 'New Business Underwriting',
+    }
+    text = template.replace('Life Insurance Application', f'{product_label} Application')
+    text = text.replace('life insurance', product_label.lower())
+    text = re.sub(r'\[DATE - [^\]]*\]', due.strftime('%B %d, %Y'), text)
+    for placeholder, value in values.items():
+        text = text.replace(f'[{placeholder}]', value)
+    lines = [line for line in text.splitlines() if not re.search(r'\[[A-Z][A-Z /,&\-]*\]', line)]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def triage(document_identifier: str, document_type: str, insurance_type: str, extracted_data: dict,
+           documents_map: dict, language: str = 'en-US') -> dict:
+    """Decide the act outcome deterministically, or explain why the agent must decide."""
+    itype = 'life' if (insurance_type or '').lower() == 'life' else 'property_casualty'
+    if language and not language.lower().startswith('en'):
+        return {'path': 'agent', 'reason': f'correspondence must be written in {language}'}
+
+    fields = _flatten(extracted_data or {})
+    reasons, ambiguous = _knockouts(fields, itype, document_type)
+    if reasons:
+        # A hard knockout decides the case even if other signals are unclear
+        return {
+            'path': 'rules',
+            'action': 'ineligible',
+            'reason_for_ineligibility': '; '.join(dict.fromkeys(reasons)),
+        }
+    if ambiguous:
+        return {'path': 'agent', 'reason': '; '.join(ambiguous)}
+
+    if itype == 'life':
+        known = ('LIFE_INSURANCE_APPLICATION', 'MEDICAL_REPORT')
+    else:
+        known = ('COMMERCIAL_PROPERTY_APPLICATION', 'GENERAL_LIABILITY_APP_V2')
+    documents = documents_map.get(document_type) if document_type in known else None
+    documents = list(documents or documents_map['DEFAULT_APP_TYPE'])
+
+    # The letter goes to the applicant; a physician's or agent's address falls back to the department inbox
+    emails = [str(e) for e in _applicant_values(fields, 'email', 'email_address', 'applicant_email') if '@' in str(e)]
+    names = _applicant_values(fields, 'full_name', 'applicant_name', 'name', 'insured_name', 'business_name')
+    product = 'Life Insurance' if itype == 'life' else 'Insurance'
+    return {
+        'path': 'rules',
+        'action': 'request_documents',
+        'recipient_email': emails[0] if emails else DEFAULT_RECIPIENT,
+        'documents_to_request': documents,
+        'email_body': render_requirements_letter(str(names[0]) if names else None, document_identifier, product, documents),
+    }
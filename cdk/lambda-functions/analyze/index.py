@@ -1,31 +1,32 @@
 import json
-import boto3
 import os
 import re
 import traceback
-from botocore.config import Config
 from botocore.exceptions import ClientError
 from datetime import datetime, timezone # ADDED
 
-# Configure retry settings for Bedrock client only
-bedrock_retry_config = Config(
-    retries={
-        'max_attempts': 10,
-        'mode': 'adaptive'
-    },
-    max_pool_connections=50
-)
+import aws_clients
+from claim_check import describe_event, offload, put_claim
+from record_index import build_index
+from instrumentation import Metrics
 
-# Initialize AWS clients outside the handler for reuse
-bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=bedrock_retry_config)
-dynamodb_client = boto3.client('dynamodb')
+# Every invocation reads its chunks and calls Bedrock, so the clients are built
+# during init. Retry settings apply to the Bedrock client only.
+bedrock_runtime = aws_clients.client(
+    'bedrock-runtime', retries={'max_attempts': 10, 'mode': 'adaptive'}, max_pool_connections=50
+)
+dynamodb_client = aws_clients.client('dynamodb')
+s3_client = aws_clients.client('s3')
 # Environment variables
 DB_TABLE = os.environ.get('JOBS_TABLE_NAME')
 EXTRACTION_BUCKET = os.environ.get('EXTRACTION_BUCKET')
+ANALYSIS_MODEL_ID = os.environ.get('BEDROCK_ANALYSIS_MODEL_ID', 'us.anthropic.claude-3-7-sonnet-20250219-v1:0')
+
+metrics = Metrics('analyze')
 
 # Reuse a single S3 client for fetching chunk files
 def get_s3_client():
-    return boto3.client('s3')
+    return s3_client
 
 
 def get_language_instruction(language: str) -> str:
@@ -88,8 +89,9 @@ def validate_analysis_data(data, schema):
     return is_valid
 
 
+@metrics.handler
 def lambda_handler(event, context):
-    print("[lambda_handler] Received event:", json.dumps(event))
+    print(f"[lambda_handler] Received event keys: {describe_event(event)}")
     
     # Initialize analysis_json for error handling
     analysis_json = {"error": True, "message": "Unknown error occurred"}
@@ -108,8 +110,10 @@ def lambda_handler(event, context):
             continue
         try:
             print(f"[lambda_handler] Fetching S3 object: Bucket={EXTRACTION_BUCKET}, Key={key}")
-            obj = s3.get_object(Bucket=EXTRACTION_BUCKET, Key=key)
-            body = obj['Body'].read()
+            with metrics.span('S3ChunkFetch'):
+                obj = s3.get_object(Bucket=EXTRACTION_BUCKET, Key=key)
+                body = obj['Body'].read()
+            metrics.count('S3BytesIn', len(body))
             chunk_data = json.loads(body.decode('utf-8'))
             print(f"[lambda_handler] Retrieved chunk {idx}, keys={list(chunk_data.keys())}")
         except Exception as e:
@@ -126,6 +130,7 @@ def lambda_handler(event, context):
     classification = event.get('classification', {})
     job_id = classification.get('jobId')
     document_type = classification.get('classification')
+    metrics.tag(job_id=job_id, insurance_type=classification.get('insuranceType'), model_id=ANALYSIS_MODEL_ID)
     
     # Read user language preference from DynamoDB
     user_language = 'en-US'
@@ -147,12 +152,24 @@ def lambda_handler(event, context):
     if job_id and DB_TABLE:
         try:
             ts = datetime.now(timezone.utc).isoformat()
+            update_expression = "SET #dt = :dt, #ed = :ed, #et = :et"
+            names = {'#dt': 'documentType', '#ed': 'extractedDataJsonStr', '#et': 'extractionTimestamp'}
+            values = {':dt': {'S': document_type}, ':ed': {'S': json.dumps(extracted_data)}, ':et': {'S': ts}}
+            # Record index for chat retrieval; chat falls back to the full extraction without it
+            try:
+                record_index = build_index(extracted_data)
+                index_ref = put_claim(job_id, 'record-index', record_index, {'records': len(record_index['records'])})
+                update_expression += ", #ri = :ri"
+                names['#ri'] = 'recordIndexRef'
+                values[':ri'] = {'S': json.dumps(index_ref)}
+            except Exception as e:
+                print(f"[lambda_handler] WARNING: Could not build record index for job {job_id}: {e}")
             dynamodb_client.update_item(
                 TableName=DB_TABLE,
                 Key={'jobId': {'S': job_id}},
-                UpdateExpression="SET #dt = :dt, #ed = :ed, #et = :et",
-                ExpressionAttributeNames={'#dt': 'documentType', '#ed': 'extractedDataJsonStr', '#et': 'extractionTimestamp'},
-                ExpressionAttributeValues={':dt': {'S': document_type}, ':ed': {'S': json.dumps(extracted_data)}, ':et': {'S': ts}}
+                UpdateExpression=update_expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
             )
             print(f"[lambda_handler] Persisted extractedDataJsonStr for job {job_id}")
         except Exception as e:
@@ -196,13 +213,16 @@ def lambda_handler(event, context):
 
     # --- 4) Call Bedrock Converse API ---
     try:
-        response = bedrock_runtime.converse(
-            modelId=os.environ.get('BEDROCK_ANALYSIS_MODEL_ID', 'us.anthropic.claude-3-7-sonnet-20250219-v1:0'),
-            messages=[{"role": "user", "content": [{"text": analysis_prompt_text}]}],
-            inferenceConfig={"maxTokens": 16384, "temperature": 0.05}
-        )
+        with metrics.span('BedrockConverse'):
+            response = bedrock_runtime.converse(
+                modelId=ANALYSIS_MODEL_ID,
+                messages=[{"role": "user", "content": [{"text": analysis_prompt_text}]}],
+                inferenceConfig={"maxTokens": 16384, "temperature": 0.05}
+            )
+        metrics.record_converse(response)
         print("[lambda_handler] Bedrock response received")
     except Exception as e:
+        metrics.count('ModelErrors')
         print(f"[lambda_handler] Bedrock error: {e}")
         analysis_json["message"] = f"Error calling Bedrock: {str(e)}"
         return analysis_json
@@ -247,10 +267,20 @@ def lambda_handler(event, context):
             print(f"[lambda_handler] DynamoDB analysis persist error: {e}")
             traceback.print_exc()
 
-    print("Returning final analysis result:", json.dumps(analysis_json))
-    # --- 8) Return final result ---
+    # --- 8) Return claim-check pointers instead of inline payloads ---
+    risks = analysis_json.get('identified_risks') if isinstance(analysis_json, dict) else None
+    analysis_ref = offload(job_id, 'analysis', analysis_json, {
+        'identifiedRisks': len(risks) if isinstance(risks, list) else 0,
+        'valid': valid,
+    })
+    extraction_ref = offload(job_id, 'extraction', extracted_data, {
+        'sections': len(extracted_data),
+        'pages': sum(len(v or []) for v in extracted_data.values()),
+    })
+    print(f"[lambda_handler] Returning analysis status={status_msg}")
     return {
         "status": status_msg,
         "message": "Analysis completed" if valid else "Analysis completed with warnings",
-        "analysis_data": analysis_json
+        "analysis": analysis_ref,
+        "extraction": extraction_ref
     }
\ No newline at end of file
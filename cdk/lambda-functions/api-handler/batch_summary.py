@@ -0,0 +1,158 @@
+"""Progress summary for one upload batch.
+
+Batch members are found with a Query on the keys-only ``jobsByBatch`` index,
+then read with ``BatchGetItem`` (100 keys per call, chunks fetched in parallel)
+projected down to status, filename and the stage timestamps. A 500-file batch
+costs one or two index pages plus five small batch reads.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+JOBS_BY_BATCH_INDEX = os.environ.get('JOBS_BY_BATCH_INDEX', 'jobsByBatch')
+BATCH_GET_CHUNK = 100
+BATCH_GET_WORKERS = int(os.environ.get('BATCH_GET_WORKERS', '4'))
+BATCH_GET_MAX_RETRIES = 5
+
+# Pipeline order of job statuses; progress is measured against COMPLETE
+STATUS_ORDER = ('CREATED', 'CLASSIFYING', 'EXTRACTING', 'DETECTING', 'SCORING', 'ACTING', 'COMPLETE')
+TERMINAL_STATUSES = ('COMPLETE', 'FAILED')
+STAGE_TIMESTAMPS = (
+    'uploadTimestamp', 'classifyTimestamp', 'extractionStartTimestamp', 'extractionTimestamp',
+    'analysisTimestamp', 'detectionStartTimestamp', 'detectionTimestamp',
+    'scoringStartTimestamp', 'scoringTimestamp', 'actionStartTimestamp', 'actionTimestamp',
+)
+MEMBER_ATTRIBUTES = ('jobId', 'status', 'originalFilename', 'documentType', 'insuranceType') + STAGE_TIMESTAMPS
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def batch_job_ids(dynamodb, table_name, batch_id):
+    """All job ids in a batch, oldest upload first"""
+    job_ids = []
+    params = {
+        'TableName': table_name,
+        'IndexName': JOBS_BY_BATCH_INDEX,
+        'KeyConditionExpression': 'batchId = :b',
+        'ExpressionAttributeValues': {':b': {'S': batch_id}},
+    }
+    while True:
+        response = dynamodb.query(**params)
+        job_ids.extend(item['jobId']['S'] for item in response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            return job_ids
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def _batch_get_chunk(dynamodb, table_name, job_ids):
+    names = {f"#a{i}": name for i, name in enumerate(MEMBER_ATTRIBUTES)}
+    request = {
+        table_name: {
+            'Keys': [{'jobId': {'S': job_id}} for job_id in job_ids],
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names,
+        }
+    }
+    items = []
+    for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+        response = dynamodb.batch_get_item(RequestItems=request)
+        items.extend(response.get('Responses', {}).get(table_name, []))
+        request = response.get('UnprocessedKeys') or {}
+        if not request:
+            return items
+        time.sleep(min(0.05 * (2 ** attempt), 1.0))
+    raise RuntimeError(f"BatchGetItem left {len(request[table_name]['Keys'])} keys unprocessed")
+
+
+def fetch_members(dynamodb, table_name, job_ids):
+    chunks = [job_ids[i:i + BATCH_GET_CHUNK] for i in range(0, len(job_ids), BATCH_GET_CHUNK)]
+    if len(chunks) <= 1:
+        return _batch_get_chunk(dynamodb, table_name, chunks[0]) if chunks else []
+    with ThreadPoolExecutor(max_workers=min(BATCH_GET_WORKERS, len(chunks))) as pool:
+        results = pool.map(lambda chunk: _batch_get_chunk(dynamodb, table_name, chunk), chunks)
+        return [item for items in results for item in items]
+
+
+def _member(item):
+    stages = {name: item[name]['S'] for name in STAGE_TIMESTAMPS if name in item}
+    return {
+        'jobId': item['jobId']['S'],
+        'status': item.get('status', {}).get('S', ''),
+        'originalFilename': item.get('originalFilename', {}).get('S', ''),
+        'documentType': item.get('documentType', {}).get('S', ''),
+        'insuranceType': item.get('insuranceType', {}).get('S', ''),
+        'stages': stages,
+    }
+
+
+def _duration_seconds(member):
+    times = [t for t in (_parse_time(v) for v in member['stages'].values()) if t]
+    start = _parse_time(member['stages'].get('uploadTimestamp'))
+    if not start or not times:
+        return None
+    return (max(times) - start).total_seconds()
+
+
+def _estimate(members, now):
+    """Estimate the batch's remaining time from the average duration of finished jobs.
+
+    Unfinished jobs run in parallel in the state machine, so the batch finishes
+    when its slowest unfinished job does.
+    """
+    finished = [d for d in (_duration_seconds(m) for m in members if m['status'] == 'COMPLETE') if d is not None]
+    pending = [m for m in members if m['status'] not in TERMINAL_STATUSES]
+    if not pending:
+        return {'remainingSeconds': 0, 'estimatedCompletionTime': None, 'basedOnJobs': len(finished)}
+    if not finished:
+        return {'remainingSeconds': None, 'estimatedCompletionTime': None, 'basedOnJobs': 0}
+    average = sum(finished) / len(finished)
+    remaining = 0.0
+    for member in pending:
+        start = _parse_time(member['stages'].get('uploadTimestamp'))
+        elapsed = (now - start).total_seconds() if start else 0.0
+        remaining = max(remaining, average - elapsed)
+    return {
+        'remainingSeconds': round(remaining),
+        'estimatedCompletionTime': datetime.fromtimestamp(now.timestamp() + remaining, timezone.utc).isoformat(),
+        'basedOnJobs': len(finished),
+    }
+
+
+def get_batch_summary(dynamodb, table_name, batch_id):
+    """Aggregate status counts, per-job stage timestamps and a completion estimate.
+
+    Returns ``None`` when the batch has no jobs.
+    """
+    job_ids = batch_job_ids(dynamodb, table_name, batch_id)
+    if not job_ids:
+        return None
+    order = {job_id: idx for idx, job_id in enumerate(job_ids)}
+    members = sorted((_member(item) for item in fetch_members(dynamodb, table_name, job_ids)),
+                     key=lambda m: order.get(m['jobId'], len(order)))
+
+    counts = {}
+    for member in members:
+        counts[member['status']] = counts.get(member['status'], 0) + 1
+    last_step = len(STATUS_ORDER) - 1
+    steps = [last_step if m['status'] in TERMINAL_STATUSES else STATUS_ORDER.index(m['status'])
+             if m['status'] in STATUS_ORDER else 0 for m in members]
+    uploads = [m['stages']['uploadTimestamp'] for m in members if 'uploadTimestamp' in m['stages']]
+
+    return {
+        'batchId': batch_id,
+        'total': len(members),
+        'counts': counts,
+        'completed': counts.get('COMPLETE', 0),
+        'failed': counts.get('FAILED', 0),
+        'inProgress': sum(1 for m in members if m['status'] not in TERMINAL_STATUSES),
+        'progress': round(sum(steps) / (last_step * len(steps)), 3) if steps else 0.0,
+        'startedAt': min(uploads) if uploads else None,
+        'estimate': _estimate(members, datetime.now(timezone.utc)),
+        'jobs': members,
+    }
@@ -0,0 +1,129 @@
+"""Bulk job-record writes for batch uploads.
+
+Job records are written with ``BatchWriteItem`` in 25-item chunks spread over a
+small thread pool; unprocessed items are retried with exponential backoff.
+
+Large batches run asynchronously. The API call stores an upload manifest item
+(``jobId = upload-batch#<batchId>``) listing the planned files and hands the
+writes to an async self-invocation. As each chunk of job records lands, its
+chunk number is appended to the manifest's ``readyChunks`` list. That list is
+append-only, so a client can read it with a simple cursor and start uploading
+each chunk's files as soon as their records exist.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_WRITE_CHUNK = 25
+BATCH_WRITE_WORKERS = int(os.environ.get('BATCH_WRITE_WORKERS', '8'))
+BATCH_WRITE_MAX_RETRIES = 6
+ASYNC_BATCH_THRESHOLD = int(os.environ.get('ASYNC_BATCH_THRESHOLD', '100'))
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', '1000'))
+# Manifests hold the full file list and must stay well under the 400 KB item limit
+MAX_MANIFEST_BYTES = 350_000
+MANIFEST_PREFIX = 'upload-batch#'
+
+
+def manifest_key(batch_id):
+    return {'jobId': {'S': f"{MANIFEST_PREFIX}{batch_id}"}}
+
+
+def chunked(items, size=BATCH_WRITE_CHUNK):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _write_chunk(dynamodb, table_name, items):
+    request = {table_name: [{'PutRequest': {'Item': item}} for item in items]}
+    for attempt in range(BATCH_WRITE_MAX_RETRIES + 1):
+        response = dynamodb.batch_write_item(RequestItems=request)
+        request = response.get('UnprocessedItems') or {}
+        if not request:
+            return
+        time.sleep(min(0.05 * (2 ** attempt), 2.0))
+    raise RuntimeError(f"BatchWriteItem left {len(request[table_name])} items unprocessed")
+
+
+def write_items(dynamodb, table_name, items, on_chunk=None):
+    """Write ``items`` in parallel 25-item chunks; ``on_chunk(chunk_index)`` runs after each chunk lands"""
+    chunks = chunked(items)
+
+    def write(indexed):
+        idx, chunk = indexed
+        _write_chunk(dynamodb, table_name, chunk)
+        if on_chunk:
+            on_chunk(idx)
+
+    if len(chunks) <= 1:
+        for indexed in enumerate(chunks):
+            write(indexed)
+        return
+    with ThreadPoolExecutor(max_workers=min(BATCH_WRITE_WORKERS, len(chunks))) as pool:
+        # list() re-raises the first failed chunk
+        list(pool.map(write, enumerate(chunks)))
+
+
+def put_manifest(dynamodb, table_name, batch_id, plan, timestamp, insurance_type, user_language):
+    files_json = json.dumps([[p['jobId'], p['filename']] for p in plan], separators=(',', ':'))
+    if len(files_json.encode('utf-8')) > MAX_MANIFEST_BYTES:
+        raise ValueError('Batch file list is too large; split it into smaller batches')
+    dynamodb.put_item(
+        TableName=table_name,
+        Item={
+            **manifest_key(batch_id),
+            'recordType': {'S': 'UPLOAD_BATCH'},
+            'uploadBatchId': {'S': batch_id},
+            'status': {'S': 'PENDING'},
+            'expected': {'N': str(len(plan))},
+            'chunkSize': {'N': str(BATCH_WRITE_CHUNK)},
+            'filesJson': {'S': files_json},
+            'uploadTimestamp': {'S': timestamp},
+            'insuranceType': {'S': insurance_type},
+            'userLanguage': {'S': user_language},
+        }
+    )
+
+
+def get_manifest(dynamodb, table_name, batch_id):
+    response = dynamodb.get_item(TableName=table_name, Key=manifest_key(batch_id), ConsistentRead=True)
+    item = response.get('Item')
+    if not item:
+        return None
+    return {
+        'batchId': batch_id,
+        'status': item['status']['S'],
+        'expected': int(item['expected']['N']),
+        'chunkSize': int(item['chunkSize']['N']),
+        'files': json.loads(item['filesJson']['S']),
+        'uploadTimestamp': item['uploadTimestamp']['S'],
+        'insuranceType': item['insuranceType']['S'],
+        'userLanguage': item['userLanguage']['S'],
+        'readyChunks': [int(n['N']) for n in item.get('readyChunks', {}).get('L', [])],
+        'error': item.get('errorMessage', {}).get('S'),
+    }
+
+
+def mark_chunk_ready(dynamodb, table_name, batch_id, chunk_index):
+    dynamodb.update_item(
+        TableName=table_name,
+        Key=manifest_key(batch_id),
+        UpdateExpression='SET readyChunks = list_append(if_not_exists(readyChunks, :empty), :chunk)',
+        ExpressionAttributeValues={':empty': {'L': []}, ':chunk': {'L': [{'N': str(chunk_index)}]}},
+    )
+
+
+def set_manifest_status(dynamodb, table_name, batch_id, status, error=None):
+    names = {'#s': 'status'}
+    values = {':s': {'S': status}}
+    expression = 'SET #s = :s'
+    if error:
+        names['#e'] = 'errorMessage'
+        values[':e'] = {'S': error[:1000]}
+        expression += ', #e = :e'
+    dynamodb.update_item(
+        TableName=table_name,
+        Key=manifest_key(batch_id),
+        UpdateExpression=expression,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
@@ -0,0 +1,83 @@
+"""Content-Encoding negotiation for API responses.
+
+Bodies at or above ``COMPRESSION_MIN_BYTES`` are compressed with the best
+encoding the client accepts: brotli when the ``brotli`` package is importable,
+otherwise gzip. Compressed bodies go back base64 encoded with
+``isBase64Encoded`` set, and API Gateway (``binaryMediaTypes: */*``) decodes
+them to bytes. CPU time spent compressing is logged and returned in a
+``Server-Timing`` header.
+"""
+import base64
+import gzip
+import os
+import time
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '2048'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+
+def _accepted(accept_encoding):
+    """``{encoding: q}`` from an Accept-Encoding header"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        pieces = [p.strip() for p in part.split(';')]
+        if not pieces[0]:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[pieces[0].lower()] = q
+    return accepted
+
+
+def negotiate(accept_encoding):
+    """Pick ``'br'``, ``'gzip'`` or ``None`` for the given Accept-Encoding header"""
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_response(response, accept_encoding):
+    """Compress an API Gateway proxy response in place when it is large enough and the client allows it"""
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded') or not isinstance(body, str):
+        return response
+    raw = body.encode('utf-8')
+    headers = response.setdefault('headers', {})
+    headers['Vary'] = 'Accept-Encoding'
+    if len(raw) < COMPRESSION_MIN_BYTES:
+        return response
+    encoding = negotiate(accept_encoding)
+    if not encoding:
+        return response
+
+    started = time.process_time()
+    if encoding == 'br':
+        compressed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    cpu_ms = (time.process_time() - started) * 1000
+
+    response['body'] = base64.b64encode(compressed).decode('ascii')
+    response['isBase64Encoded'] = True
+    headers['Content-Encoding'] = encoding
+    headers['Server-Timing'] = f'compress;desc="{encoding}";dur={cpu_ms:.1f}'
+    print(f"[compression] {encoding} {len(raw)} -> {len(compressed)} bytes "
+          f"({len(compressed) / len(raw):.1%}) in {cpu_ms:.1f} ms CPU")
+    return response
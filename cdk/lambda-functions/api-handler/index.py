@@ -1,13 +1,23 @@
+import base64
+import hashlib
 import json
 import boto3
 import os
 import uuid
 from datetime import datetime, timezone, timedelta
 
+from batch_summary import get_batch_summary
+from compression import compress_response
+from usage_report import get_job_usage
+import batch_upload
+import job_listing
+import multipart_upload
+
 # Initialize AWS clients
 s3 = boto3.client('s3')
 dynamodb = boto3.client('dynamodb')
 stepfunctions = boto3.client('stepfunctions')
+lambda_client = boto3.client('lambda')
 
 # Environment variables
 DOCUMENT_BUCKET = os.environ.get('DOCUMENT_BUCKET')
@@ -15,6 +25,30 @@ STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN')
 JOBS_TABLE_NAME = os.environ.get('JOBS_TABLE_NAME')
 KB_SOURCE_BUCKET = os.environ.get('KB_SOURCE_BUCKET')
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Multipart jobs still UPLOAD_PENDING this long after their last state change
+# are removed by the table's TTL; the document bucket drops their parts after 2 days
+MULTIPART_PENDING_HOURS = int(os.environ.get('MULTIPART_PENDING_HOURS', '48'))
+
+# Job detail fields that map straight to string attributes
+JOB_STRING_FIELDS = ('jobId', 'status', 'uploadTimestamp', 'originalFilename', 's3Key', 'documentType', 'insuranceType')
+# Job detail fields stored as JSON strings, parsed only when requested
+JOB_JSON_FIELDS = {
+    'extractedData': 'extractedDataJsonStr',
+    'analysisOutput': 'analysisOutputJsonStr',
+    'analysisDetection': 'analysisDetectionJsonStr',
+    'analysisScoring': 'analysisScoringJsonStr',
+    'agentActionOutput': 'agentActionOutputJsonStr',
+}
+# Every pipeline write to a job sets status or one of these timestamps, so together they version the item
+JOB_VERSION_ATTRIBUTES = (
+    'status', 'documentType', 'insuranceType', 'classifyTimestamp',
+    'extractionStartTimestamp', 'extractionTimestamp', 'analysisTimestamp',
+    'detectionStartTimestamp', 'detectionTimestamp', 'scoringStartTimestamp', 'scoringTimestamp',
+    'actionStartTimestamp', 'actionTimestamp',
+)
+
 # Supported languages for multilingual responses
 SUPPORTED_LANGUAGES = ['en-US', 'zh-CN', 'ja-JP', 'es-ES', 'fr-FR', 'fr-CA', 'de-DE', 'it-IT']
 
@@ -31,6 +65,21 @@ def extract_language_from_request(event):
 
 
 def lambda_handler(event, context):
+    # Async self-invocation that writes the job records of a large batch upload
+    if 'uploadBatchWork' in event:
+        return run_batch_upload_work(event['uploadBatchWork']['batchId'])
+
+    # binaryMediaTypes is */* (for compressed responses), so API Gateway passes request bodies base64 encoded
+    if event.get('isBase64Encoded') and event.get('body'):
+        event['body'] = base64.b64decode(event['body']).decode('utf-8')
+        event['isBase64Encoded'] = False
+
+    response = handle_request(event, context)
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return compress_response(response, request_headers.get('accept-encoding'))
+
+
+def handle_request(event, context):
     print(f"Received event: {json.dumps(event)}")
     
     # Extract HTTP method and path from the event
@@ -42,8 +91,9 @@ def lambda_handler(event, context):
     # Set CORS headers for all responses
     headers = {
         'Access-Control-Allow-Origin': '*',  # Allow all origins
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-User-Language',
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-User-Language,If-None-Match',
         'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+        'Access-Control-Expose-Headers': 'ETag,Server-Timing',
         'Content-Type': 'application/json'
     }
     
@@ -58,8 +108,15 @@ def lambda_handler(event, context):
     try:
         # Route based on HTTP method and resource path
         if http_method == 'GET' and resource == '/api/jobs':
-            # List all jobs
-            response = list_jobs()
+            # One page of jobs, newest first
+            try:
+                response = list_jobs(query_params)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)})
+                }
             return {
                 'statusCode': 200,
                 'headers': headers,
@@ -76,7 +133,26 @@ def lambda_handler(event, context):
                     'body': json.dumps({'error': 'Missing jobId parameter'})
                 }
             
-            response = get_job(job_id)
+            request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+            try:
+                fields = parse_job_fields(query_params.get('fields'))
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)})
+                }
+
+            response, etag = get_job(job_id, fields, request_headers.get('if-none-match'))
+            if etag:
+                headers['ETag'] = etag
+                headers['Cache-Control'] = 'no-cache'
+            if response is None:
+                return {
+                    'statusCode': 304,
+                    'headers': headers,
+                    'body': ''
+                }
             return {
                 'statusCode': 200,
                 'headers': headers,
@@ -100,6 +176,52 @@ def lambda_handler(event, context):
                 'body': json.dumps(response)
             }
             
+        elif http_method == 'GET' and resource == '/api/jobs/{jobId}/usage':
+            # Bedrock token usage and estimated cost, per stage and model
+            job_id = path_parameters.get('jobId')
+            if not job_id:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Missing jobId parameter'})
+                }
+
+            response = get_job_usage(dynamodb, JOBS_TABLE_NAME, job_id)
+            if response is None:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': f'Job {job_id} not found'})
+                }
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps(response)
+            }
+
+        elif http_method == 'GET' and resource == '/api/batches/{batchId}':
+            # Progress summary for one upload batch
+            batch_id = path_parameters.get('batchId')
+            if not batch_id:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Missing batchId parameter'})
+                }
+
+            response = get_batch_summary(dynamodb, JOBS_TABLE_NAME, batch_id)
+            if response is None:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': f'Batch {batch_id} not found'})
+                }
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps(response)
+            }
+            
         elif http_method == 'POST' and resource == '/api/documents/upload':
             # Generate presigned URL for document upload
             response = generate_upload_url(event)
@@ -111,13 +233,59 @@ def lambda_handler(event, context):
             
         elif http_method == 'POST' and resource == '/api/documents/batch-upload':
             # Generate presigned URLs for multiple document uploads
-            response = generate_batch_upload_urls(event)
+            try:
+                response = generate_batch_upload_urls(event)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)})
+                }
+            return {
+                'statusCode': 202 if response.get('mode') == 'async' else 200,
+                'headers': headers,
+                'body': json.dumps(response)
+            }
+
+        elif http_method == 'GET' and resource == '/api/documents/batch-upload/{batchId}':
+            # Upload URLs of an async batch whose job records are ready
+            batch_id = path_parameters.get('batchId')
+            try:
+                cursor = int(query_params.get('cursor') or 0)
+            except ValueError:
+                cursor = -1
+            if not batch_id or cursor < 0:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Missing batchId or invalid cursor'})
+                }
+
+            response = get_batch_upload_urls(batch_id, cursor)
+            if response is None:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': f'Upload batch {batch_id} not found'})
+                }
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'body': json.dumps(response)
             }
             
+        elif resource.startswith('/api/documents/multipart'):
+            # Multipart uploads for large files
+            try:
+                status_code, response = handle_multipart(http_method, resource, path_parameters, event)
+            except ValueError as e:
+                status_code, response = 400, {'error': str(e)}
+            return {
+                'statusCode': status_code,
+                'headers': headers,
+                'body': json.dumps(response)
+            }
+            
         elif http_method == 'GET' and resource == '/api/policy':
             # Return presigned URL for markdown by key
             s3_key = query_params.get('key') if isinstance(query_params, dict) else None
@@ -154,118 +322,109 @@ def lambda_handler(event, context):
         }
 
 
-def list_jobs():
-    """List all jobs from DynamoDB, sorted newest first."""
+def _page_size(query_params):
     try:
-        # Initial scan parameters
-        scan_kwargs = {
-            'TableName': JOBS_TABLE_NAME,
-            'ProjectionExpression': "jobId, #s, uploadTimestamp, originalFilename, documentType, insuranceType, batchId",
-            'ExpressionAttributeNames': {'#s': 'status'}
-        }
+        limit = int(query_params.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
 
-        all_items = []
-        while True:
-            response = dynamodb.scan(**scan_kwargs)
-            all_items.extend(response.get('Items', []))
-
-            # If there's more data, keep scanning
-            last_key = response.get('LastEvaluatedKey')
-            if last_key:
-                scan_kwargs['ExclusiveStartKey'] = last_key
-            else:
-                break
-
-        # Transform DynamoDB items into plain dicts
-        jobs = []
-        for item in all_items:
-            jobs.append({
-                'jobId': item.get('jobId', {}).get('S', ''),
-                'status': item.get('status', {}).get('S', ''),
-                'uploadTimestamp': item.get('uploadTimestamp', {}).get('S', ''),
-                'originalFilename': item.get('originalFilename', {}).get('S', ''),
-                'documentType': item.get('documentType', {}).get('S', ''),
-                'insuranceType': item.get('insuranceType', {}).get('S', ''),
-                'batchId': item.get('batchId', {}).get('S', '')
-            })
-        # Sort by uploadTimestamp descending (newest first)
-        jobs.sort(key=lambda x: x.get('uploadTimestamp', ''), reverse=True)
-        
-        return {
-            'jobs': jobs,
-            'count': len(jobs)
-        }
-    
+
+def list_jobs(query_params=None):
+    """List one page of jobs, newest first, from the sharded upload-time index (see ``job_listing``).
+
+    Optional filters (status, insuranceType, batchId) are applied server-side;
+    ``nextToken`` is set while more jobs remain.
+    """
+    query_params = query_params or {}
+    try:
+        # Multipart uploads that never completed are not jobs yet; list them only when asked for by status
+        return job_listing.list_jobs(dynamodb, JOBS_TABLE_NAME, _page_size(query_params),
+                                     filters=query_params, next_token=query_params.get('nextToken'),
+                                     exclude_statuses=() if query_params.get('status') else ('UPLOAD_PENDING',))
     except Exception as e:
         print(f"Error listing jobs: {str(e)}")
         raise
-        
 
-def get_job(job_id):
-    """Get a specific job by ID from DynamoDB"""
+
+def parse_job_fields(fields_param):
+    """Parse the comma-separated ``fields`` query parameter; ``None`` means every field"""
+    if not fields_param:
+        return None
+    fields = [f.strip() for f in fields_param.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in JOB_STRING_FIELDS and f not in JOB_JSON_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _get_job_item(job_id, attributes):
+    # jobId is always projected so an existing job never comes back as an empty item
+    attributes = ['jobId'] + [a for a in dict.fromkeys(attributes) if a != 'jobId']
+    names = {f"#a{i}": name for i, name in enumerate(attributes)}
+    response = dynamodb.get_item(
+        TableName=JOBS_TABLE_NAME,
+        Key={'jobId': {'S': job_id}},
+        ProjectionExpression=', '.join(names),
+        ExpressionAttributeNames=names
+    )
+    return response.get('Item')
+
+
+def job_etag(item, fields):
+    """Strong ETag for one projection of a job, derived from its version attributes"""
+    stamp = '|'.join(item.get(name, {}).get('S', '') for name in JOB_VERSION_ATTRIBUTES)
+    digest = hashlib.sha256(f"{stamp}#{','.join(sorted(fields))}".encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(',')]
+    return '*' in candidates or any(c.removeprefix('W/') == etag for c in candidates)
+
+
+def get_job(job_id, fields=None, if_none_match=None):
+    """Get a job by ID, reading only the requested fields.
+
+    Returns ``(job, etag)``. ``job`` is ``None`` when ``if_none_match`` matches
+    the current ETag; in that case only the version attributes were read.
+    """
+    fields = list(fields or JOB_STRING_FIELDS + tuple(JOB_JSON_FIELDS))
+    attributes = [JOB_JSON_FIELDS.get(f, f) for f in fields]
     try:
-        response = dynamodb.get_item(
-            TableName=JOBS_TABLE_NAME,
-            Key={'jobId': {'S': job_id}}
-        )
-        
-        if 'Item' not in response:
-            return {'error': f'Job {job_id} not found'}
-        
-        item = response['Item']
-        
-        # Extract basic job information
-        job = {
-            'jobId': item.get('jobId', {}).get('S', ''),
-            'status': item.get('status', {}).get('S', ''),
-            'uploadTimestamp': item.get('uploadTimestamp', {}).get('S', ''),
-            'originalFilename': item.get('originalFilename', {}).get('S', ''),
-            's3Key': item.get('s3Key', {}).get('S', ''),
-            'documentType': item.get('documentType', {}).get('S', ''),
-            'insuranceType': item.get('insuranceType', {}).get('S', '')
-        }
-        
-        # Add extracted data if available
-        if 'extractedDataJsonStr' in item:
-            try:
-                extracted_data = json.loads(item['extractedDataJsonStr']['S'])
-                job['extractedData'] = extracted_data
-            except:
-                job['extractedData'] = {}
-        
-        # Add analysis output if available
-        if 'analysisOutputJsonStr' in item:
-            try:
-                analysis_output = json.loads(item['analysisOutputJsonStr']['S'])
-                job['analysisOutput'] = analysis_output
-            except:
-                job['analysisOutput'] = {}
+        wants_blobs = any(f in JOB_JSON_FIELDS for f in fields)
+        if if_none_match and wants_blobs:
+            # Check the version with a tiny projected read before touching the JSON blobs
+            item = _get_job_item(job_id, JOB_VERSION_ATTRIBUTES)
+            if item is None:
+                return {'error': f'Job {job_id} not found'}, None
+            etag = job_etag(item, fields)
+            if _etag_matches(if_none_match, etag):
+                return None, etag
 
-        # Add detection output if available
-        if 'analysisDetectionJsonStr' in item:
-            try:
-                detection_output = json.loads(item['analysisDetectionJsonStr']['S'])
-                job['analysisDetection'] = detection_output
-            except:
-                job['analysisDetection'] = {}
+        item = _get_job_item(job_id, attributes + list(JOB_VERSION_ATTRIBUTES))
+        if item is None:
+            return {'error': f'Job {job_id} not found'}, None
+        etag = job_etag(item, fields)
+        if _etag_matches(if_none_match, etag):
+            return None, etag
 
-        # Add scoring output if available
-        if 'analysisScoringJsonStr' in item:
-            try:
-                scoring_output = json.loads(item['analysisScoringJsonStr']['S'])
-                job['analysisScoring'] = scoring_output
-            except:
-                job['analysisScoring'] = {}
-        
-        # Add agent action output if available
-        if 'agentActionOutputJsonStr' in item:
-            try:
-                agent_output = json.loads(item['agentActionOutputJsonStr']['S'])
-                job['agentActionOutput'] = agent_output
-            except:
-                job['agentActionOutput'] = {}
-        
-        return job
+        job = {}
+        for field in fields:
+            if field in JOB_STRING_FIELDS:
+                job[field] = item.get(field, {}).get('S', '')
+                continue
+            # JSON fields are only included when the pipeline has written them
+            attribute = JOB_JSON_FIELDS[field]
+            if attribute in item:
+                try:
+                    job[field] = json.loads(item[attribute]['S'])
+                except (json.JSONDecodeError, KeyError):
+                    job[field] = {}
+
+        return job, etag
     
     except Exception as e:
         print(f"Error getting job {job_id}: {str(e)}")
@@ -334,30 +493,13 @@ def generate_upload_url(event):
         s3_key = f"uploads/{job_id}/{filename}"
         
         # Generate a presigned URL for uploading the document
-        presigned_url = s3.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': DOCUMENT_BUCKET,
-                'Key': s3_key,
-                'ContentType': 'application/pdf'
-            },
-            ExpiresIn=300  # URL valid for 5 minutes
-        )
+        presigned_url = presign_upload(s3_key)
         
         # Create initial job record in DynamoDB
         timestamp_now = datetime.now(timezone.utc).isoformat()
         dynamodb.put_item(
             TableName=JOBS_TABLE_NAME,
-            Item={
-                'jobId': {'S': job_id},
-                'batchId': {'S': batch_id},
-                'status': {'S': 'CREATED'},
-                'uploadTimestamp': {'S': timestamp_now},
-                'originalFilename': {'S': filename},
-                's3Key': {'S': s3_key},
-                'insuranceType': {'S': insurance_type},
-                'userLanguage': {'S': user_language}
-            }
+            Item=new_job_item(job_id, batch_id, timestamp_now, filename, s3_key, insurance_type, user_language)
         )
         
         return {
@@ -375,8 +517,54 @@ def generate_upload_url(event):
         raise
 
 
+def presign_upload(s3_key):
+    """Presign a PUT for one upload; signing is local and makes no AWS call"""
+    return s3.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': DOCUMENT_BUCKET,
+            'Key': s3_key,
+            'ContentType': 'application/pdf'
+        },
+        ExpiresIn=300  # URL valid for 5 minutes
+    )
+
+
+def new_job_item(job_id, batch_id, timestamp, filename, s3_key, insurance_type, user_language, status='CREATED'):
+    """Initial DynamoDB record for an uploaded document"""
+    return {
+        'jobId': {'S': job_id},
+        'listPartition': {'S': job_listing.list_partition(job_id)},
+        'batchId': {'S': batch_id},
+        'status': {'S': status},
+        'uploadTimestamp': {'S': timestamp},
+        'originalFilename': {'S': filename},
+        's3Key': {'S': s3_key},
+        'insuranceType': {'S': insurance_type},
+        'userLanguage': {'S': user_language},
+        'usageLedger': {'M': {}}
+    }
+
+
+def _upload_url_entry(index, job_id, filename):
+    s3_key = f"uploads/{job_id}/{filename}"
+    return {
+        'fileIndex': index,
+        'jobId': job_id,
+        'filename': filename,
+        'uploadUrl': presign_upload(s3_key),
+        's3Key': s3_key
+    }
+
+
 def generate_batch_upload_urls(event):
-    """Generate presigned URLs for multiple document uploads"""
+    """Create job records and presigned upload URLs for a batch of documents.
+
+    Batches up to ``ASYNC_BATCH_THRESHOLD`` files are written inline with
+    parallel BatchWriteItem calls. Larger batches return immediately with
+    ``mode: 'async'``; their URLs are read from
+    ``GET /api/documents/batch-upload/{batchId}`` as records are written.
+    """
     try:
         # Parse request body for files and insurance type
         body = json.loads(event.get('body', '{}'))
@@ -396,52 +584,36 @@ def generate_batch_upload_urls(event):
         # Generate a batch ID for grouping related uploads
         batch_id = str(uuid.uuid4())
         timestamp_now = datetime.now(timezone.utc).isoformat()
-        
-        upload_urls = []
-        
-        for file_info in files:
-            filename = file_info.get('filename')
-            if not filename:
-                continue
-                
-            # Generate a unique job ID for each file
-            job_id = str(uuid.uuid4())
-            
-            # Create S3 key with path structure
-            s3_key = f"uploads/{job_id}/{filename}"
-            
-            # Generate a presigned URL for uploading the document
-            presigned_url = s3.generate_presigned_url(
-                'put_object',
-                Params={
-                    'Bucket': DOCUMENT_BUCKET,
-                    'Key': s3_key,
-                    'ContentType': 'application/pdf'
-                },
-                ExpiresIn=300  # URL valid for 5 minutes
-            )
-            
-            # Create initial job record in DynamoDB with batch ID
-            dynamodb.put_item(
-                TableName=JOBS_TABLE_NAME,
-                Item={
-                    'jobId': {'S': job_id},
-                    'batchId': {'S': batch_id},
-                    'status': {'S': 'CREATED'},
-                    'uploadTimestamp': {'S': timestamp_now},
-                    'originalFilename': {'S': filename},
-                    's3Key': {'S': s3_key},
-                    'insuranceType': {'S': insurance_type},
-                    'userLanguage': {'S': user_language}
-                }
+
+        filenames = [f.get('filename') for f in files if isinstance(f, dict) and f.get('filename')]
+        if len(filenames) > batch_upload.MAX_BATCH_FILES:
+            raise ValueError(f"A batch can hold at most {batch_upload.MAX_BATCH_FILES} files")
+        plan = [{'jobId': str(uuid.uuid4()), 'filename': name} for name in filenames]
+
+        if len(plan) > batch_upload.ASYNC_BATCH_THRESHOLD:
+            batch_upload.put_manifest(dynamodb, JOBS_TABLE_NAME, batch_id, plan, timestamp_now,
+                                      insurance_type, user_language)
+            lambda_client.invoke(
+                FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+                InvocationType='Event',
+                Payload=json.dumps({'uploadBatchWork': {'batchId': batch_id}}).encode('utf-8')
             )
-            
-            upload_urls.append({
-                'jobId': job_id,
-                'filename': filename,
-                'uploadUrl': presigned_url,
-                's3Key': s3_key
-            })
+            return {
+                'batchId': batch_id,
+                'mode': 'async',
+                'expected': len(plan),
+                'cursor': 0,
+                'insuranceType': insurance_type,
+                'message': f'Preparing {len(plan)} upload URLs'
+            }
+
+        items = [
+            new_job_item(p['jobId'], batch_id, timestamp_now, p['filename'],
+                         f"uploads/{p['jobId']}/{p['filename']}", insurance_type, user_language)
+            for p in plan
+        ]
+        batch_upload.write_items(dynamodb, JOBS_TABLE_NAME, items)
+        upload_urls = [_upload_url_entry(idx, p['jobId'], p['filename']) for idx, p in enumerate(plan)]
         
         return {
             'batchId': batch_id,
@@ -452,4 +624,218 @@ def generate_batch_upload_urls(event):
     
     except Exception as e:
         print(f"Error generating batch upload URLs: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+def run_batch_upload_work(batch_id):
+    """Write the job records of an async batch, publishing each chunk to the manifest as it lands"""
+    manifest = batch_upload.get_manifest(dynamodb, JOBS_TABLE_NAME, batch_id)
+    if manifest is None:
+        print(f"[batch_upload] Manifest for batch {batch_id} not found")
+        return {'status': 'NOT_FOUND'}
+    if manifest['status'] != 'PENDING':
+        # Rewriting records would reset jobs whose files are already uploaded
+        print(f"[batch_upload] Batch {batch_id} is already {manifest['status']}; skipping")
+        return {'status': manifest['status']}
+    try:
+        items = [
+            new_job_item(job_id, batch_id, manifest['uploadTimestamp'], filename,
+                         f"uploads/{job_id}/{filename}", manifest['insuranceType'], manifest['userLanguage'])
+            for job_id, filename in manifest['files']
+        ]
+        batch_upload.write_items(
+            dynamodb, JOBS_TABLE_NAME, items,
+            on_chunk=lambda idx: batch_upload.mark_chunk_ready(dynamodb, JOBS_TABLE_NAME, batch_id, idx)
+        )
+        batch_upload.set_manifest_status(dynamodb, JOBS_TABLE_NAME, batch_id, 'READY')
+        print(f"[batch_upload] Wrote {len(items)} job records for batch {batch_id}")
+        return {'status': 'READY'}
+    except Exception as e:
+        print(f"[batch_upload] Batch {batch_id} failed: {str(e)}")
+        batch_upload.set_manifest_status(dynamodb, JOBS_TABLE_NAME, batch_id, 'FAILED', str(e))
+        return {'status': 'FAILED'}
+
+
+def get_batch_upload_urls(batch_id, cursor=0):
+    """Upload URLs for the chunks that became ready after ``cursor``"""
+    manifest = batch_upload.get_manifest(dynamodb, JOBS_TABLE_NAME, batch_id)
+    if manifest is None:
+        return None
+    size = manifest['chunkSize']
+    ready = list(dict.fromkeys(manifest['readyChunks']))
+    upload_urls = []
+    for chunk_index in ready[cursor:]:
+        for offset, (job_id, filename) in enumerate(manifest['files'][chunk_index * size:(chunk_index + 1) * size]):
+            upload_urls.append(_upload_url_entry(chunk_index * size + offset, job_id, filename))
+    total_chunks = (manifest['expected'] + size - 1) // size
+    return {
+        'batchId': batch_id,
+        'status': manifest['status'],
+        'expected': manifest['expected'],
+        'uploadUrls': upload_urls,
+        'cursor': len(ready),
+        'done': len(ready) >= total_chunks or manifest['status'] == 'FAILED',
+        'error': manifest['error']
+    }
+
+
+def _multipart_job(job_id):
+    response = dynamodb.get_item(
+        TableName=JOBS_TABLE_NAME,
+        Key={'jobId': {'S': job_id}},
+        ProjectionExpression='jobId, #s, s3Key, multipartUploadId, partSize, partCount, fileSize',
+        ExpressionAttributeNames={'#s': 'status'}
+    )
+    item = response.get('Item')
+    if not item or 'multipartUploadId' not in item:
+        return None
+    return {
+        'jobId': job_id,
+        'status': item['status']['S'],
+        's3Key': item['s3Key']['S'],
+        'uploadId': item['multipartUploadId']['S'],
+        'partSize': int(item['partSize']['N']),
+        'partCount': int(item['partCount']['N']),
+        'fileSize': int(item['fileSize']['N'])
+    }
+
+
+def _pending_expiry():
+    """TTL (epoch seconds) for a multipart job that is still waiting for its upload"""
+    return str(int((datetime.now(timezone.utc) + timedelta(hours=MULTIPART_PENDING_HOURS)).timestamp()))
+
+
+def _set_upload_status(job_id, expected, status):
+    """Move a multipart job between states; returns False if it was not in ``expected``.
+
+    Only UPLOAD_PENDING jobs carry ``expiresAt``, so the TTL never removes a job that is processing.
+    """
+    values = {':new': {'S': status}, ':expected': {'S': expected}}
+    if status == 'UPLOAD_PENDING':
+        update = 'SET #s = :new, expiresAt = :exp'
+        values[':exp'] = {'N': _pending_expiry()}
+    else:
+        update = 'SET #s = :new REMOVE expiresAt'
+    try:
+        dynamodb.update_item(
+            TableName=JOBS_TABLE_NAME,
+            Key={'jobId': {'S': job_id}},
+            UpdateExpression=update,
+            ConditionExpression='#s = :expected',
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues=values
+        )
+        return True
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def create_multipart_upload(event):
+    """Start a multipart upload and create its job in UPLOAD_PENDING.
+
+    Processing starts from the S3 Object Created event, which S3 only emits on
+    CompleteMultipartUpload.
+    """
+    body = json.loads(event.get('body') or '{}')
+    filename = body.get('filename')
+    if not filename:
+        raise ValueError('Missing filename in request')
+    try:
+        file_size = int(body.get('fileSize'))
+    except (TypeError, ValueError):
+        raise ValueError('Missing or invalid fileSize in request')
+    part_size = multipart_upload.choose_part_size(file_size)
+    insurance_type = body.get('insuranceType', 'property_casualty')
+    if insurance_type not in ['life', 'property_casualty']:
+        insurance_type = 'property_casualty'
+    # Large files of a batch join the batch created by the batch-upload call
+    batch_id = body.get('batchId') or str(uuid.uuid4())
+    if not isinstance(batch_id, str) or len(batch_id) > 64:
+        raise ValueError('Invalid batchId')
+
+    job_id = str(uuid.uuid4())
+    s3_key = f"uploads/{job_id}/{filename}"
+    upload_id = multipart_upload.create_upload(s3, DOCUMENT_BUCKET, s3_key)
+    parts = multipart_upload.part_count(file_size, part_size)
+
+    item = new_job_item(job_id, batch_id, datetime.now(timezone.utc).isoformat(), filename, s3_key,
+                        insurance_type, extract_language_from_request(event), status='UPLOAD_PENDING')
+    item.update({
+        'multipartUploadId': {'S': upload_id},
+        'partSize': {'N': str(part_size)},
+        'partCount': {'N': str(parts)},
+        'fileSize': {'N': str(file_size)},
+        'expiresAt': {'N': _pending_expiry()}
+    })
+    dynamodb.put_item(TableName=JOBS_TABLE_NAME, Item=item)
+
+    return {
+        'jobId': job_id,
+        'batchId': batch_id,
+        'uploadId': upload_id,
+        's3Key': s3_key,
+        'partSize': part_size,
+        'partCount': parts,
+        'status': 'UPLOAD_PENDING'
+    }
+
+
+def handle_multipart(http_method, resource, path_parameters, event):
+    """Route the multipart upload endpoints; returns ``(status_code, body)``"""
+    if http_method == 'POST' and resource == '/api/documents/multipart':
+        return 200, create_multipart_upload(event)
+
+    job_id = path_parameters.get('jobId')
+    upload = _multipart_job(job_id) if job_id else None
+    if upload is None:
+        return 404, {'error': f'Multipart upload for job {job_id} not found'}
+
+    if http_method == 'GET' and resource == '/api/documents/multipart/{jobId}':
+        # Resume: which parts S3 already has
+        uploaded = []
+        if upload['status'] == 'UPLOAD_PENDING':
+            uploaded = multipart_upload.list_uploaded_parts(s3, DOCUMENT_BUCKET, upload['s3Key'], upload['uploadId'])
+        return 200, {
+            'jobId': job_id,
+            'status': upload['status'],
+            'partSize': upload['partSize'],
+            'partCount': upload['partCount'],
+            'fileSize': upload['fileSize'],
+            'uploadedParts': uploaded
+        }
+
+    if upload['status'] != 'UPLOAD_PENDING':
+        return 409, {'error': f"Upload for job {job_id} is already {upload['status']}"}
+
+    if http_method == 'POST' and resource == '/api/documents/multipart/{jobId}/parts':
+        body = json.loads(event.get('body') or '{}')
+        urls = multipart_upload.presign_parts(s3, DOCUMENT_BUCKET, upload['s3Key'], upload['uploadId'],
+                                              body.get('partNumbers'), upload['partCount'])
+        return 200, {'jobId': job_id, 'parts': urls}
+
+    if http_method == 'POST' and resource == '/api/documents/multipart/{jobId}/complete':
+        # Mark the job CREATED first so the pipeline's own status updates cannot be overwritten afterwards
+        if not _set_upload_status(job_id, 'UPLOAD_PENDING', 'CREATED'):
+            return 409, {'error': f'Upload for job {job_id} is being completed or aborted'}
+        try:
+            multipart_upload.complete_upload(s3, DOCUMENT_BUCKET, upload['s3Key'], upload['uploadId'], upload['partCount'])
+        except Exception:
+            _set_upload_status(job_id, 'CREATED', 'UPLOAD_PENDING')
+            raise
+        return 200, {'jobId': job_id, 'status': 'CREATED', 'message': 'Upload completed; processing will start shortly'}
+
+    if http_method == 'POST' and resource == '/api/documents/multipart/{jobId}/abort':
+        multipart_upload.abort_upload(s3, DOCUMENT_BUCKET, upload['s3Key'], upload['uploadId'])
+        try:
+            dynamodb.delete_item(
+                TableName=JOBS_TABLE_NAME,
+                Key={'jobId': {'S': job_id}},
+                ConditionExpression='#s = :pending',
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={':pending': {'S': 'UPLOAD_PENDING'}}
+            )
+        except dynamodb.exceptions.ConditionalCheckFailedException:
+            pass
+        return 200, {'jobId': job_id, 'status': 'ABORTED'}
+
+    return 404, {'error': 'Not found'}
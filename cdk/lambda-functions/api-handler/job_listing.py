@@ -0,0 +1,123 @@
+"""Newest-first job listing on the ``jobsByUploadTime`` index.
+
+Every job carries a ``listPartition`` of ``JOB#0`` .. ``JOB#{JOB_LIST_SHARDS-1}``
+(a hash of its job id), so status writes spread over several index partitions
+instead of all landing on one. A page queries every shard in parallel and
+merges the results by ``uploadTimestamp``.
+
+``nextToken`` holds one cursor per shard: the key of the last job returned from
+that shard, or ``null`` once the shard is exhausted. Filters run server-side,
+and each shard is queried until it has ``limit`` matches or runs out, so a
+page is short only on the last page.
+
+Changing ``JOB_LIST_SHARDS`` moves jobs between partitions; rerun
+``cdk/scripts/backfill_job_list_partition.py`` afterwards.
+"""
+import base64
+import heapq
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_BY_UPLOAD_INDEX = os.environ.get('JOBS_BY_UPLOAD_INDEX', 'jobsByUploadTime')
+JOB_LIST_SHARDS = int(os.environ.get('JOB_LIST_SHARDS', '4'))
+LIST_ATTRIBUTES = ('jobId', 'status', 'uploadTimestamp', 'originalFilename', 'documentType', 'insuranceType', 'batchId')
+CURSOR_KEYS = ('jobId', 'listPartition', 'uploadTimestamp')
+FILTERS = (('status', 'status'), ('insuranceType', 'insuranceType'), ('batchId', 'batchId'))
+
+
+def list_partition(job_id):
+    """Index partition of a job; stable for a given ``JOB_LIST_SHARDS``"""
+    return f"JOB#{zlib.crc32(job_id.encode('utf-8')) % JOB_LIST_SHARDS}"
+
+
+def encode_cursor(cursors):
+    if all(c is None for c in cursors):
+        return None
+    return base64.urlsafe_b64encode(json.dumps({'s': cursors}, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    try:
+        cursors = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))['s']
+    except (ValueError, UnicodeDecodeError, KeyError, TypeError):
+        raise ValueError('Invalid nextToken')
+    if not isinstance(cursors, list) or len(cursors) != JOB_LIST_SHARDS or not all(
+            c is None or (isinstance(c, dict) and set(c) in (set(), set(CURSOR_KEYS))) for c in cursors):
+        raise ValueError('Invalid nextToken')
+    return cursors
+
+
+def _query_shard(dynamodb, params, shard, start_key, limit):
+    """Up to ``limit`` matching items of one shard, newest first, and the key the Query stopped at"""
+    params = {**params, 'ExpressionAttributeValues': {**params['ExpressionAttributeValues'],
+                                                      ':p': {'S': f"JOB#{shard}"}}}
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    items = []
+    while True:
+        response = dynamodb.query(**params, Limit=limit)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        # A filtered page can come back short (even empty) with more items behind it
+        if len(items) >= limit or not last_key:
+            return items, last_key
+        params['ExclusiveStartKey'] = last_key
+
+
+def _cursor_key(item):
+    return {name: item[name] for name in CURSOR_KEYS}
+
+
+def list_jobs(dynamodb, table_name, limit, filters=None, next_token=None, exclude_statuses=()):
+    """One page of jobs, newest first: ``{jobs, count, nextToken}``"""
+    cursors = decode_cursor(next_token) if next_token else [{}] * JOB_LIST_SHARDS
+    names = {'#s': 'status'}
+    values = {}
+    conditions = []
+    for param, attribute in FILTERS:
+        value = (filters or {}).get(param)
+        if value:
+            names[f"#f_{attribute}"] = attribute
+            values[f":f_{attribute}"] = {'S': value}
+            conditions.append(f"#f_{attribute} = :f_{attribute}")
+    for idx, status in enumerate(exclude_statuses):
+        values[f":x{idx}"] = {'S': status}
+        conditions.append(f"#s <> :x{idx}")
+    params = {
+        'TableName': table_name,
+        'IndexName': JOBS_BY_UPLOAD_INDEX,
+        'KeyConditionExpression': 'listPartition = :p',
+        'ExpressionAttributeValues': values,
+        'ProjectionExpression': ', '.join(name if name != 'status' else '#s' for name in LIST_ATTRIBUTES) + ', listPartition',
+        'ExpressionAttributeNames': names,
+        'ScanIndexForward': False,
+    }
+    if conditions:
+        params['FilterExpression'] = ' AND '.join(conditions)
+
+    live = [shard for shard, cursor in enumerate(cursors) if cursor is not None]
+    with ThreadPoolExecutor(max_workers=max(1, len(live))) as pool:
+        fetched = dict(zip(live, pool.map(
+            lambda shard: _query_shard(dynamodb, params, shard, cursors[shard] or None, limit), live)))
+
+    # Each shard is already newest first; merging keeps what is taken from a shard a prefix of it
+    merged = list(heapq.merge(*([(shard, item) for item in items] for shard, (items, _) in fetched.items()),
+                              key=lambda entry: entry[1]['uploadTimestamp']['S'], reverse=True))[:limit]
+    taken = {}
+    for shard, _item in merged:
+        taken[shard] = taken.get(shard, 0) + 1
+
+    next_cursors = list(cursors)
+    for shard, (items, last_key) in fetched.items():
+        used = taken.get(shard, 0)
+        if used < len(items):
+            # Resume after the last job shown from this shard
+            next_cursors[shard] = _cursor_key(items[used - 1]) if used else cursors[shard]
+        else:
+            # Everything fetched was shown; resume where the Query stopped, or mark the shard done
+            next_cursors[shard] = last_key
+
+    jobs = [{name: item.get(name, {}).get('S', '') for name in LIST_ATTRIBUTES} for _shard, item in merged]
+    return {'jobs': jobs, 'count': len(jobs), 'nextToken': encode_cursor(next_cursors)}
@@ -0,0 +1,87 @@
+"""S3 multipart uploads for large submissions.
+
+The client creates an upload, asks for presigned part URLs in batches, PUTs the
+parts in parallel and completes the upload. ``list_uploaded_parts`` lets an
+interrupted client skip the parts S3 already has. S3 only emits the
+``Object Created`` event that starts the pipeline on CompleteMultipartUpload,
+so processing cannot begin on a partial file.
+"""
+import math
+import os
+
+MiB = 1024 * 1024
+MIN_PART_SIZE = 8 * MiB
+# Keep uploads to at most this many parts; S3 allows 10,000
+TARGET_MAX_PARTS = 1000
+MAX_PARTS_PER_REQUEST = 100
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(5 * 1024 * MiB)))
+PART_URL_EXPIRES = int(os.environ.get('PART_URL_EXPIRES', '3600'))
+
+
+def choose_part_size(file_size):
+    """8 MiB parts, growing in whole MiB so that no upload needs more than ``TARGET_MAX_PARTS`` parts"""
+    if file_size <= 0 or file_size > MAX_UPLOAD_BYTES:
+        raise ValueError(f"fileSize must be between 1 and {MAX_UPLOAD_BYTES} bytes")
+    needed = math.ceil(file_size / TARGET_MAX_PARTS)
+    return max(MIN_PART_SIZE, math.ceil(needed / MiB) * MiB)
+
+
+def part_count(file_size, part_size):
+    return math.ceil(file_size / part_size)
+
+
+def create_upload(s3, bucket, key, content_type='application/pdf'):
+    response = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+    return response['UploadId']
+
+
+def presign_parts(s3, bucket, key, upload_id, part_numbers, total_parts):
+    if not part_numbers or len(part_numbers) > MAX_PARTS_PER_REQUEST:
+        raise ValueError(f"Request between 1 and {MAX_PARTS_PER_REQUEST} part numbers at a time")
+    urls = []
+    for number in part_numbers:
+        if not isinstance(number, int) or not 1 <= number <= total_parts:
+            raise ValueError(f"Part numbers must be integers from 1 to {total_parts}")
+        urls.append({
+            'partNumber': number,
+            'uploadUrl': s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': number},
+                ExpiresIn=PART_URL_EXPIRES
+            )
+        })
+    return urls
+
+
+def list_uploaded_parts(s3, bucket, key, upload_id):
+    parts = []
+    params = {'Bucket': bucket, 'Key': key, 'UploadId': upload_id}
+    while True:
+        response = s3.list_parts(**params)
+        parts.extend({'partNumber': p['PartNumber'], 'etag': p['ETag'], 'size': p['Size']}
+                     for p in response.get('Parts', []))
+        if not response.get('IsTruncated'):
+            return parts
+        params['PartNumberMarker'] = response['NextPartNumberMarker']
+
+
+def complete_upload(s3, bucket, key, upload_id, total_parts):
+    """Complete from the parts S3 reports, so clients never need to read part ETags"""
+    parts = list_uploaded_parts(s3, bucket, key, upload_id)
+    uploaded = {p['partNumber'] for p in parts}
+    missing = [n for n in range(1, total_parts + 1) if n not in uploaded]
+    if missing:
+        raise ValueError(f"Missing parts: {', '.join(str(n) for n in missing[:20])}"
+                         f"{' ...' if len(missing) > 20 else ''}")
+    s3.complete_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': p['partNumber'], 'ETag': p['etag']}
+                                   for p in sorted(parts, key=lambda p: p['partNumber'])
+                                   if p['partNumber'] <= total_parts]}
+    )
+
+
+def abort_upload(s3, bucket, key, upload_id):
+    s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
@@ -0,0 +1,105 @@
+"""Bedrock usage and estimated cost for one job.
+
+The pipeline Lambdas and chat add their model calls to the job's
+``usageLedger`` map (see the common layer's ``usage_ledger``), one entry per
+``"{stage}|{modelId}"``. This module reads just that attribute and rolls it up
+by stage, by model and in total.
+
+Costs are estimates from list on-demand prices per million tokens, matched on
+a substring of the model id so regional and global inference profiles share a
+price. ``MODEL_PRICING_JSON`` overrides or extends the table, e.g.
+``{"claude-haiku-4-5": {"input": 1.0, "output": 5.0}}``. Models without a
+price report ``estimatedCostUsd: null``.
+"""
+import json
+import os
+
+LEDGER_ATTRIBUTE = 'usageLedger'
+STAGE_ORDER = ('classify', 'extract', 'analyze', 'detect', 'score', 'act', 'chat')
+COUNTERS = ('calls', 'inputTokens', 'outputTokens', 'cacheReadTokens', 'cacheWriteTokens',
+            'latencyMs', 'retries', 'invocations')
+
+# USD per million tokens
+MODEL_PRICES = {
+    'claude-haiku-4-5': {'input': 1.0, 'output': 5.0, 'cacheRead': 0.10, 'cacheWrite': 1.25},
+    'claude-3-7-sonnet': {'input': 3.0, 'output': 15.0, 'cacheRead': 0.30, 'cacheWrite': 3.75},
+    'claude-sonnet-4': {'input': 3.0, 'output': 15.0, 'cacheRead': 0.30, 'cacheWrite': 3.75},
+}
+MODEL_PRICES.update(json.loads(os.environ.get('MODEL_PRICING_JSON') or '{}'))
+
+
+def model_price(model_id):
+    """Longest matching price entry for a model id, or ``None``"""
+    matches = [name for name in MODEL_PRICES if name in (model_id or '')]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model_id, counters):
+    price = model_price(model_id)
+    if price is None:
+        return None
+    cost = (counters['inputTokens'] * price.get('input', 0)
+            + counters['outputTokens'] * price.get('output', 0)
+            + counters['cacheReadTokens'] * price.get('cacheRead', 0)
+            + counters['cacheWriteTokens'] * price.get('cacheWrite', 0))
+    return cost / 1_000_000
+
+
+def _empty():
+    return {name: 0 for name in COUNTERS}
+
+
+def _add(totals, counters, cost):
+    for name in COUNTERS:
+        totals[name] += counters[name]
+    if cost is None or totals.get('estimatedCostUsd', 0) is None:
+        totals['estimatedCostUsd'] = None
+    else:
+        totals['estimatedCostUsd'] = totals.get('estimatedCostUsd', 0) + cost
+
+
+def _round_costs(rows):
+    for row in rows:
+        if row.get('estimatedCostUsd') is not None:
+            row['estimatedCostUsd'] = round(row['estimatedCostUsd'], 6)
+    return rows
+
+
+def get_job_usage(dynamodb, table_name, job_id):
+    """Per-stage, per-model and total usage for a job. Returns ``None`` when the job does not exist."""
+    response = dynamodb.get_item(
+        TableName=table_name,
+        Key={'jobId': {'S': job_id}},
+        ProjectionExpression='jobId, #l',
+        ExpressionAttributeNames={'#l': LEDGER_ATTRIBUTE},
+    )
+    item = response.get('Item')
+    if not item:
+        return None
+
+    by_stage, by_model, entries = {}, {}, []
+    totals = _empty()
+    for key, value in (item.get(LEDGER_ATTRIBUTE, {}).get('M') or {}).items():
+        stage, _, model_id = key.partition('|')
+        fields = value.get('M', {})
+        counters = {name: int(fields[name]['N']) if name in fields else 0 for name in COUNTERS}
+        cost = estimate_cost(model_id, counters)
+        entries.append({'stage': stage, 'modelId': model_id, **counters,
+                        'estimatedCostUsd': cost})
+        _add(by_stage.setdefault(stage, {'stage': stage, **_empty()}), counters, cost)
+        _add(by_model.setdefault(model_id, {'modelId': model_id, **_empty()}), counters, cost)
+        _add(totals, counters, cost)
+
+    order = {stage: idx for idx, stage in enumerate(STAGE_ORDER)}
+    stages = sorted(by_stage.values(), key=lambda s: (order.get(s['stage'], len(order)), s['stage']))
+    models = sorted(by_model.values(), key=lambda m: m['modelId'])
+    entries.sort(key=lambda e: (order.get(e['stage'], len(order)), e['stage'], e['modelId']))
+    if not entries:
+        totals['estimatedCostUsd'] = 0
+    return {
+        'jobId': job_id,
+        'byStage': _round_costs(stages),
+        'byModel': _round_costs(models),
+        'entries': _round_costs(entries),
+        'totals': _round_costs([totals])[0],
+    }
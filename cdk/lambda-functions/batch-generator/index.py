@@ -1,25 +1,25 @@
 import json
 import os
-import boto3
 import urllib.parse
 import tempfile
 import time
 import traceback
 from pdf2image import pdfinfo_from_path
 
-s3 = boto3.client('s3')
+import aws_clients
+from instrumentation import Metrics, log_timing
+
+# Used on every invocation, so built during init
+s3 = aws_clients.client('s3')
 BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '1'))
 
-def log_timing(operation_name, start_time):
-    """Log the duration of an operation"""
-    elapsed = time.time() - start_time
-    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
+metrics = Metrics('batch-generator')
 
+@metrics.handler
 def handler(event, context):
     handler_start = time.time()
     print(f"[batch-generator] === BATCH GENERATOR LAMBDA START === remaining_time={context.get_remaining_time_in_millis()}ms")
     print(f"[batch-generator] Event keys: {list(event.keys()) if isinstance(event, dict) else 'not a dict'}")
-    print(f"[batch-generator] Event size: {len(json.dumps(event))} bytes")
     print(f"[batch-generator] BATCH_SIZE={BATCH_SIZE}")
     
     # --- 1) Normalize bucket name ---
@@ -44,6 +44,8 @@ def handler(event, context):
     # URL-decode just in case
     key = urllib.parse.unquote_plus(key)
     print(f"[batch-generator] bucket={bucket}, key={key}")
+    if key.startswith("uploads/") and key.count("/") >= 2:
+        metrics.tag(job_id=key.split("/")[1])
 
     # Use a temp dir that's auto-cleaned at the end of the with-block
     with tempfile.TemporaryDirectory(dir='/tmp') as tmpdir:
@@ -54,8 +56,9 @@ def handler(event, context):
         s3_download_start = time.time()
         try:
             s3.download_file(bucket, key, local_path)
-            log_timing("S3 download", s3_download_start)
+            log_timing("S3 download", s3_download_start, metric='S3Download')
             file_size = os.path.getsize(local_path)
+            metrics.count('S3BytesIn', file_size)
             print(f"[batch-generator] Downloaded PDF, size={file_size} bytes")
         except Exception as e:
             log_timing("S3 download (FAILED)", s3_download_start)
@@ -69,6 +72,7 @@ def handler(event, context):
             info = pdfinfo_from_path(local_path)
             total_pages = int(info.get("Pages", 0))
             print(f"[batch-generator] PDF has {total_pages} total pages")
+            metrics.count('Pages', total_pages)
         except Exception as e:
             print(f"[batch-generator] ERROR reading PDF info: {e}")
             traceback.print_exc()
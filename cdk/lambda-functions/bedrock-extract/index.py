@@ -1,5 +1,4 @@
 import json
-import boto3
 import os
 import io
 import urllib.parse
@@ -7,31 +6,24 @@ import re
 import gc
 import time
 import traceback
-from botocore.config import Config
 from botocore.exceptions import ClientError
 from datetime import datetime, timezone
 from pdf2image import pdfinfo_from_path, convert_from_path
 from PIL import Image, ImageOps
 
-def log_timing(operation_name, start_time):
-    """Log the duration of an operation"""
-    elapsed = time.time() - start_time
-    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
+import aws_clients
+from instrumentation import Metrics, log_timing
 
-# Configure retry settings for AWS clients
-# Configure retry settings for Bedrock client only
-bedrock_retry_config = Config(
-    retries={
-        'max_attempts': 10,
-        'mode': 'adaptive'
-    },
-    max_pool_connections=50
-)
+metrics = Metrics('extract')
 
-# Initialize AWS clients outside the handler for reuse
-s3 = boto3.client('s3')
-bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=bedrock_retry_config)
-dynamodb_client = boto3.client('dynamodb')
+# Each invocation renders its page range and sends it to Bedrock, so the clients
+# are built during init rather than on the first request. Retry settings apply
+# to the Bedrock client only.
+s3 = aws_clients.client('s3')
+bedrock_runtime = aws_clients.client(
+    'bedrock-runtime', retries={'max_attempts': 10, 'mode': 'adaptive'}, max_pool_connections=50
+)
+dynamodb_client = aws_clients.client('dynamodb')
 JOBS_TABLE = os.environ.get('JOBS_TABLE_NAME')
 BATCH_SIZE = 1
 DPI = 150
@@ -133,11 +125,11 @@ def update_job_status(job_id, status, error_message=None):
         print(f"Failed to update job status: {e}")
 
 
+@metrics.handler
 def lambda_handler(event, context):
     handler_start = time.time()
     print(f"[extract] === EXTRACT LAMBDA START === remaining_time={context.get_remaining_time_in_millis()}ms")
     print(f"[extract] Event keys: {list(event.keys()) if isinstance(event, dict) else 'not a dict'}")
-    print(f"[extract] Event size: {len(json.dumps(event))} bytes")
     batch_data = {}        # make sure this exists no matter what
     job_id = None
     
@@ -151,6 +143,7 @@ def lambda_handler(event, context):
         ins_type = event['classification']['insuranceType']
         print(f"[extract] bucket={bucket}, key={key}")
         print(f"[extract] job_id={job_id}, doc_type={doc_type}, ins_type={ins_type}")
+        metrics.tag(job_id=job_id, insurance_type=ins_type, model_id=os.environ.get('BEDROCK_MODEL_ID'))
     except Exception as e:
         error_msg = f"Invalid event format: {e}"
         print(f"[extract] ERROR: {error_msg}")
@@ -197,8 +190,9 @@ def lambda_handler(event, context):
         s3_download_start = time.time()
         try:
             s3.download_file(bucket, key, local_path)
-            log_timing("S3 download", s3_download_start)
+            log_timing("S3 download", s3_download_start, metric='S3Download')
             file_size = os.path.getsize(local_path)
+            metrics.count('S3BytesIn', file_size)
             print(f"[extract] Downloaded PDF, size={file_size} bytes")
         except Exception as e:
             log_timing("S3 download (FAILED)", s3_download_start)
@@ -258,7 +252,8 @@ def lambda_handler(event, context):
                     first_page=first,
                     last_page=last
                 )
-                log_timing(f"PDF to image conversion (pages {first}-{last})", convert_start)
+                log_timing(f"PDF to image conversion (pages {first}-{last})", convert_start, metric='PdfConversion')
+                metrics.count('Pages', len(imgs))
                 print(f"[extract] Converted {len(imgs)} page(s) to images")
             except Exception as e:
                 log_timing(f"PDF to image conversion (FAILED)", convert_start)
@@ -275,20 +270,22 @@ def lambda_handler(event, context):
             messages = [{"text": prompt}]
             total_image_bytes = 0
             for idx, img in enumerate(imgs, start=first):
-                img = img.convert("L")
-                img = ImageOps.crop(img, border=50)
-                w, h = img.size
-                if max(w, h) > MAX_DIMENSION:
-                    scale = MAX_DIMENSION / float(max(w, h))
-                    img = img.resize((int(w*scale), int(h*scale)), Image.LANCZOS)
-                buf = io.BytesIO()
-                img.save(buf, format="JPEG", quality=60, optimize=True)
-                payload_bytes = buf.getvalue()
-                total_image_bytes += len(payload_bytes)
-                buf.close()
+                with metrics.span('PageImagePrep'):
+                    img = img.convert("L")
+                    img = ImageOps.crop(img, border=50)
+                    w, h = img.size
+                    if max(w, h) > MAX_DIMENSION:
+                        scale = MAX_DIMENSION / float(max(w, h))
+                        img = img.resize((int(w*scale), int(h*scale)), Image.LANCZOS)
+                    buf = io.BytesIO()
+                    img.save(buf, format="JPEG", quality=60, optimize=True)
+                    payload_bytes = buf.getvalue()
+                    total_image_bytes += len(payload_bytes)
+                    buf.close()
                 messages.append({"text": f"--- Image for Page {idx} ---"})
                 messages.append({"image": {"format": "jpeg", "source": {"bytes": payload_bytes}}})
             print(f"[extract] Total image payload size: {total_image_bytes} bytes")
+            metrics.count('ImageBytes', total_image_bytes)
 
             # Call Bedrock Converse API
             bedrock_start = time.time()
@@ -300,12 +297,14 @@ def lambda_handler(event, context):
                     messages=[{"role": "user", "content": messages}],
                     inferenceConfig={"maxTokens": 4096, "temperature": 0.0}
                 )
-                log_timing(f"Bedrock Converse API call (pages {first}-{last})", bedrock_start)
+                log_timing(f"Bedrock Converse API call (pages {first}-{last})", bedrock_start, metric='BedrockConverse')
+                metrics.record_converse(resp)
                 # Log usage metrics if available
                 usage = resp.get('usage', {})
                 print(f"[extract] Bedrock usage: inputTokens={usage.get('inputTokens')}, outputTokens={usage.get('outputTokens')}")
             except Exception as e:
                 log_timing(f"Bedrock Converse API call (FAILED)", bedrock_start)
+                metrics.count('ModelErrors')
                 error_msg = f"Bedrock call failed for pages {first}–{last}: {e}"
                 print(f"[extract] ERROR: {error_msg}")
                 traceback.print_exc()
@@ -334,7 +333,7 @@ def lambda_handler(event, context):
             # Cleanup
             del imgs
             gc.collect()
-            log_timing(f"Total batch {batch_idx+1} processing", batch_start)
+            log_timing(f"Total batch {batch_idx+1} processing", batch_start, metric='PageBatch')
 
         # --- 7) Cleanup & return ---
         print(f"[extract] Step 7: Cleanup and return, remaining_time={context.get_remaining_time_in_millis()}ms")
@@ -353,7 +352,8 @@ def lambda_handler(event, context):
             Key=chunk_key,
             Body=batch_data_json,
         )
-        log_timing("S3 upload extraction result", s3_upload_start)
+        log_timing("S3 upload extraction result", s3_upload_start, metric='S3Upload')
+        metrics.count('S3BytesOut', len(batch_data_json))
         
         log_timing("Total EXTRACT lambda execution", handler_start)
         print(f"[extract] === EXTRACT LAMBDA COMPLETE === remaining_time={context.get_remaining_time_in_millis()}ms")
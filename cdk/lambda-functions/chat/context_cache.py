@@ -0,0 +1,139 @@
+"""In-container cache of the per-job chat context.
+
+A chat turn only needs the document type, insurance type, language, the
+analysis output and either the job's record index or, for jobs processed before
+the index existed, the full extracted data. It never needs the growing
+``chatHistory`` or the detection/scoring blobs. ``ChatContextCache.get``:
+
+1. reads only the version attributes of the job (a few short strings)
+2. if the resulting version stamp matches the cached entry, returns the cached
+   parsed context and rendered system prompt without touching the blobs
+3. otherwise reads just the context attributes (skipping ``extractedDataJsonStr``
+   when a record index can be loaded), parses them once, renders the system
+   prompt and caches the result under ``(job_id, version)``
+
+The pipeline sets a new timestamp every time it rewrites a job's extraction or
+analysis, so a re-run changes the stamp and the next turn rebuilds the entry.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+CHAT_CONTEXT_CACHE_SIZE = int(os.environ.get('CHAT_CONTEXT_CACHE_SIZE', '32'))
+
+# Attributes whose values change whenever the pipeline rewrites chat-relevant data
+VERSION_ATTRIBUTES = (
+    'documentType', 'insuranceType', 'userLanguage',
+    'classifyTimestamp', 'extractionTimestamp', 'analysisTimestamp', 'recordIndexRef',
+)
+CONTEXT_ATTRIBUTES = ('extractedDataJsonStr', 'analysisOutputJsonStr')
+
+
+def _projection(attributes) -> tuple[str, dict]:
+    names = {f"#a{i}": name for i, name in enumerate(attributes)}
+    return ', '.join(names), names
+
+
+def _string(item: dict, name: str, default: str | None = None) -> str | None:
+    return (item.get(name) or {}).get('S', default)
+
+
+def version_stamp(item: dict) -> str:
+    return '|'.join(_string(item, name, '') for name in VERSION_ATTRIBUTES)
+
+
+def _parse_json(text: str | None, name: str, job_id: str) -> dict:
+    try:
+        return json.loads(text or '{}')
+    except json.JSONDecodeError as e:
+        print(f"[context_cache] Could not parse {name} for job {job_id}: {e}")
+        return {}
+
+
+class ChatContextCache:
+    """Bounded LRU of chat contexts keyed by job id, validated by version stamp."""
+
+    def __init__(self, dynamodb_client, table_name: str, max_entries: int = CHAT_CONTEXT_CACHE_SIZE, load_index=None):
+        self.dynamodb = dynamodb_client
+        self.table_name = table_name
+        # load_index(record_index_ref_json) -> index object, or None to skip retrieval
+        self.load_index = load_index
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_projected(self, job_id: str, attributes) -> dict | None:
+        expression, names = _projection(attributes)
+        response = self.dynamodb.get_item(
+            TableName=self.table_name,
+            Key={'jobId': {'S': job_id}},
+            ProjectionExpression=expression,
+            ExpressionAttributeNames=names,
+        )
+        return response.get('Item')
+
+    def get(self, job_id: str, render_prompt) -> dict | None:
+        """Return the chat context for ``job_id``, or ``None`` if the job does not exist.
+
+        ``render_prompt(document_type, insurance_type, extracted_data,
+        analysis_output, language, record_index)`` is only called when the
+        entry is rebuilt.
+        """
+        stamp_item = self._get_projected(job_id, VERSION_ATTRIBUTES)
+        if stamp_item is None:
+            self.invalidate(job_id)
+            return None
+        version = version_stamp(stamp_item)
+
+        with self._lock:
+            cached = self._entries.get(job_id)
+            if cached is not None and cached['version'] == version:
+                self._entries.move_to_end(job_id)
+                self.hits += 1
+                return cached
+
+        record_index = None
+        index_ref = _string(stamp_item, 'recordIndexRef')
+        if index_ref and self.load_index:
+            try:
+                record_index = self.load_index(index_ref)
+            except Exception as e:
+                print(f"[context_cache] Could not load record index for job {job_id}, using full extraction: {e}")
+        attributes = ('analysisOutputJsonStr',) if record_index is not None else CONTEXT_ATTRIBUTES
+        item = self._get_projected(job_id, VERSION_ATTRIBUTES + attributes)
+        if item is None:
+            self.invalidate(job_id)
+            return None
+        # Keep the first read's stamp: if the pipeline wrote in between, the next turn simply rebuilds
+        document_type = _string(item, 'documentType', 'Unknown')
+        insurance_type = _string(item, 'insuranceType', 'property_casualty')
+        language = _string(item, 'userLanguage', 'en-US')
+        extracted_data = _parse_json(_string(item, 'extractedDataJsonStr'), 'extractedDataJsonStr', job_id)
+        analysis_output = _parse_json(_string(item, 'analysisOutputJsonStr'), 'analysisOutputJsonStr', job_id)
+        context = {
+            'version': version,
+            'document_type': document_type,
+            'insurance_type': insurance_type,
+            'language': language,
+            'extracted_data': extracted_data,
+            'analysis_output': analysis_output,
+            'record_index': record_index,
+            'system_prompt': render_prompt(document_type, insurance_type, extracted_data, analysis_output, language, record_index),
+        }
+
+        with self._lock:
+            self.misses += 1
+            self._entries[job_id] = context
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        print(f"[context_cache] Built chat context for job {job_id} "
+              f"(prompt {len(context['system_prompt'])} chars, hits={self.hits}, misses={self.misses})")
+        return context
+
+    def invalidate(self, job_id: str) -> None:
+        with self._lock:
+            self._entries.pop(job_id, None)
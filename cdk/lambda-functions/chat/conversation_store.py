@@ -0,0 +1,156 @@
+"""Chat turns stored outside the job item.
+
+Table layout (partition key ``jobId``, sort key ``turnKey``):
+
+- ``turn#{iso_timestamp}#{suffix}``: one item per completed turn
+- ``~summary``: running summary of every turn up to ``summarizedThrough``.
+  ``~`` sorts after ``turn#``, so a single descending query returns the summary
+  followed by the newest turns.
+
+Prompt building reads at most ``CHAT_WINDOW_TURNS + CHAT_SUMMARY_BATCH`` turns
+plus the summary, never the full history. Once more than that many turns are
+unsummarized, the oldest are folded into the summary so the window stays
+bounded.
+"""
+import base64
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+CHAT_WINDOW_TURNS = int(os.environ.get('CHAT_WINDOW_TURNS', '6'))
+CHAT_SUMMARY_BATCH = int(os.environ.get('CHAT_SUMMARY_BATCH', '4'))
+TURN_PREFIX = 'turn#'
+SUMMARY_KEY = '~summary'
+
+
+def _encode_token(key: dict | None) -> str | None:
+    if not key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def _decode_token(token: str | None) -> dict | None:
+    if not token:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid nextToken')
+
+
+def _turn(item: dict) -> dict:
+    sources = (item.get('sources') or {}).get('S')
+    return {
+        'turnKey': item['turnKey']['S'],
+        'timestamp': (item.get('timestamp') or {}).get('S'),
+        'user_message': (item.get('user_message') or {}).get('S', ''),
+        'assistant_response': (item.get('assistant_response') or {}).get('S', ''),
+        'sources': json.loads(sources) if sources else [],
+    }
+
+
+class ConversationStore:
+    def __init__(self, dynamodb_client, table_name: str):
+        self.dynamodb = dynamodb_client
+        self.table_name = table_name
+
+    def append_turn(self, job_id: str, user_message: str, assistant_response: str, sources: list | None = None) -> str:
+        timestamp = datetime.now(timezone.utc).isoformat()
+        turn_key = f"{TURN_PREFIX}{timestamp}#{uuid.uuid4().hex[:8]}"
+        item = {
+            'jobId': {'S': job_id},
+            'turnKey': {'S': turn_key},
+            'timestamp': {'S': timestamp},
+            'user_message': {'S': user_message},
+            'assistant_response': {'S': assistant_response},
+        }
+        if sources:
+            item['sources'] = {'S': json.dumps(sources)}
+        self.dynamodb.put_item(TableName=self.table_name, Item=item)
+        return turn_key
+
+    def recent_turns(self, job_id: str, limit: int = 20, next_token: str | None = None) -> tuple[list[dict], str | None]:
+        """One page of turns, newest page first, each page in chronological order."""
+        params = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': 'jobId = :j AND begins_with(turnKey, :p)',
+            'ExpressionAttributeValues': {':j': {'S': job_id}, ':p': {'S': TURN_PREFIX}},
+            'ScanIndexForward': False,
+            'Limit': limit,
+        }
+        start_key = _decode_token(next_token)
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        response = self.dynamodb.query(**params)
+        turns = [_turn(item) for item in response.get('Items', [])]
+        turns.reverse()
+        return turns, _encode_token(response.get('LastEvaluatedKey'))
+
+    def load_window(self, job_id: str) -> tuple[dict, list[dict]]:
+        """Return ``(summary, unsummarized_turns)`` with a single bounded query."""
+        response = self.dynamodb.query(
+            TableName=self.table_name,
+            KeyConditionExpression='jobId = :j',
+            ExpressionAttributeValues={':j': {'S': job_id}},
+            ScanIndexForward=False,
+            Limit=CHAT_WINDOW_TURNS + CHAT_SUMMARY_BATCH + 1,
+        )
+        summary = {}
+        turns = []
+        for item in response.get('Items', []):
+            key = item['turnKey']['S']
+            if key == SUMMARY_KEY:
+                summary = {
+                    'text': (item.get('summary') or {}).get('S', ''),
+                    'through': (item.get('summarizedThrough') or {}).get('S', ''),
+                    'turns': int((item.get('summarizedTurns') or {}).get('N', '0')),
+                }
+            elif key.startswith(TURN_PREFIX):
+                turns.append(_turn(item))
+        turns.reverse()
+        through = summary.get('through')
+        if through:
+            turns = [t for t in turns if t['turnKey'] > through]
+        return summary, turns
+
+    def summary_due(self, job_id: str) -> bool:
+        """True when ``roll_summary`` would fold turns; one bounded query, no model call."""
+        _summary, turns = self.load_window(job_id)
+        return len(turns) > CHAT_WINDOW_TURNS + CHAT_SUMMARY_BATCH - 1
+
+    def roll_summary(self, job_id: str, summarize) -> bool:
+        """Fold the oldest unsummarized turns into the summary once the window overflows.
+
+        ``summarize(previous_summary_text, turns) -> str``. Returns True if the
+        summary was updated. A concurrent roll is detected by a conditional put
+        and simply skipped.
+        """
+        summary, turns = self.load_window(job_id)
+        if len(turns) <= CHAT_WINDOW_TURNS + CHAT_SUMMARY_BATCH - 1:
+            return False
+        fold = turns[:len(turns) - CHAT_WINDOW_TURNS]
+        text = summarize(summary.get('text', ''), fold)
+        item = {
+            'jobId': {'S': job_id},
+            'turnKey': {'S': SUMMARY_KEY},
+            'summary': {'S': text},
+            'summarizedThrough': {'S': fold[-1]['turnKey']},
+            'summarizedTurns': {'N': str(summary.get('turns', 0) + len(fold))},
+            'updatedAt': {'S': datetime.now(timezone.utc).isoformat()},
+        }
+        params = {'TableName': self.table_name, 'Item': item}
+        if summary.get('through'):
+            params['ConditionExpression'] = 'summarizedThrough = :prev'
+            params['ExpressionAttributeValues'] = {':prev': {'S': summary['through']}}
+        else:
+            params['ConditionExpression'] = 'attribute_not_exists(turnKey)'
+        try:
+            self.dynamodb.put_item(**params)
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                print(f"[conversation_store] Summary for job {job_id} was updated concurrently; skipping")
+                return False
+            raise
+        print(f"[conversation_store] Folded {len(fold)} turns into the summary for job {job_id}")
+        return True
@@ -1,10 +1,18 @@
+import base64
 import json
 import boto3
 import os
 import math
-from datetime import datetime, timezone
 from botocore.config import Config
 
+from claim_check import ClaimCheckLoader
+from context_cache import ChatContextCache
+from quick_answer import QuickAnswerRouter
+from conversation_store import CHAT_WINDOW_TURNS, ConversationStore
+from record_index import RecordIndex, record_text
+from streaming import WebSocketSender, stream_converse
+from instrumentation import Metrics
+
 # Configure retry settings for AWS clients
 # Configure retry settings for Bedrock client only
 bedrock_retry_config = Config(
@@ -17,11 +25,30 @@ bedrock_retry_config = Config(
 
 # Initialize AWS clients
 dynamodb = boto3.client('dynamodb')
+s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=bedrock_retry_config)
 
 # Environment variables
 JOBS_TABLE_NAME = os.environ.get('JOBS_TABLE_NAME')
 BEDROCK_CHAT_MODEL_ID = os.environ.get('BEDROCK_CHAT_MODEL_ID', 'global.anthropic.claude-haiku-4-5-20251001-v1:0')
+CONVERSATIONS_TABLE_NAME = os.environ.get('CONVERSATIONS_TABLE_NAME')
+
+# 'retrieval' sends a fixed job summary plus the top-k records for each question;
+# 'full' embeds the whole extraction in the system prompt
+CHAT_CONTEXT_MODE = os.environ.get('CHAT_CONTEXT_MODE', 'retrieval').lower()
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '8'))
+
+
+def _load_record_index(index_ref):
+    if CHAT_CONTEXT_MODE != 'retrieval':
+        return None
+    return RecordIndex(ClaimCheckLoader(s3_client).resolve(json.loads(index_ref)))
+
+
+# Parsed job context and rendered system prompt, reused across warm invocations
+_context_cache = ChatContextCache(dynamodb, JOBS_TABLE_NAME, load_index=_load_record_index)
+_conversations = ConversationStore(dynamodb, CONVERSATIONS_TABLE_NAME)
 
 
 def get_language_instruction(language: str) -> str:
@@ -38,7 +65,25 @@ def get_language_instruction(language: str) -> str:
     }
     return language_map.get(language, 'Respond in English.')
 
+metrics = Metrics('chat')
+
+
+@metrics.handler
 def lambda_handler(event, context):
+    # Async self-invocation that folds old turns into the summary after a REST reply
+    if 'rollSummary' in event:
+        job_id = event['rollSummary']['jobId']
+        metrics.tag(job_id=job_id, model_id=BEDROCK_CHAT_MODEL_ID)
+        return {'rolled': _conversations.roll_summary(job_id, summarize_turns)}
+
+    if event.get('requestContext', {}).get('connectionId'):
+        return websocket_handler(event)
+
+    # The REST API's binaryMediaTypes is */*, so request bodies arrive base64 encoded
+    if event.get('isBase64Encoded') and event.get('body'):
+        event['body'] = base64.b64decode(event['body']).decode('utf-8')
+        event['isBase64Encoded'] = False
+
     print(f"Received event: {json.dumps(event)}")
     
     http_method = event.get('httpMethod', '')
@@ -48,7 +93,7 @@ def lambda_handler(event, context):
     headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-User-Language',
-        'Access-Control-Allow-Methods': 'POST,OPTIONS',
+        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
         'Content-Type': 'application/json'
     }
     
@@ -74,6 +119,18 @@ def lambda_handler(event, context):
             response = process_chat(job_id, messages)
             return {'statusCode': 200, 'headers': headers, 'body': json.dumps(response)}
             
+        elif http_method == 'GET' and resource == '/api/chat/{jobId}':
+            job_id = path_parameters.get('jobId')
+            if not job_id:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Missing jobId parameter'})}
+            query = event.get('queryStringParameters') or {}
+            try:
+                limit = max(1, min(int(query.get('limit', 20)), 100))
+                turns, next_token = _conversations.recent_turns(job_id, limit, query.get('nextToken'))
+            except ValueError as e:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps({'jobId': job_id, 'turns': turns, 'nextToken': next_token})}
+
         else:
             print(f"Returning 404: Not found for resource {resource} and method {http_method}")
             return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': 'Not found'})}
@@ -82,13 +139,92 @@ def lambda_handler(event, context):
         print(f"Error processing request: {str(e)}")
         return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': f'Internal server error: {str(e)}'})}
 
-def get_chat_system_prompt(document_type, insurance_type, extracted_data, analysis_output, language='en-US'):
+def build_job_summary(analysis_output, record_index):
+    """Fixed-size overview of the job that is always in the prompt when retrieval is used"""
+    lines = []
+    if record_index.header:
+        lines.append("Applicant / policy details:")
+        for field in record_index.header[:20]:
+            lines.append(f"- {field['key']}: {field['value']} (pages {', '.join(str(p) for p in field['pages'][:5])})")
+    if record_index.sections:
+        lines.append("Sections in the submission:")
+        for section, pages in record_index.sections.items():
+            numeric = [p for p in pages if isinstance(p, int)]
+            span = f"pages {min(numeric)}-{max(numeric)}" if numeric else f"{len(pages)} pages"
+            lines.append(f"- {section}: {span}")
+    analysis = analysis_output if isinstance(analysis_output, dict) else {}
+    if analysis.get('overall_summary'):
+        lines.append(f"Analysis summary: {str(analysis['overall_summary'])[:1500]}")
+    risks = analysis.get('identified_risks') or []
+    if risks:
+        lines.append("Identified risks:")
+        for risk in risks[:10]:
+            if isinstance(risk, dict):
+                pages = ', '.join(str(p) for p in risk.get('page_references') or [])
+                lines.append(f"- [{risk.get('severity', 'N/A')}] {str(risk.get('risk_description', ''))[:300]} (pages {pages or 'N/A'})")
+    discrepancies = analysis.get('discrepancies') or []
+    if discrepancies:
+        lines.append("Discrepancies:")
+        for item in discrepancies[:5]:
+            if isinstance(item, dict):
+                lines.append(f"- {str(item.get('discrepancy_description', ''))[:300]}")
+    missing = analysis.get('missing_information') or []
+    if missing:
+        lines.append("Missing information: " + '; '.join(
+            str(m.get('item_description', ''))[:120] for m in missing[:8] if isinstance(m, dict)))
+    if analysis.get('final_recommendation'):
+        lines.append(f"Recommendation: {str(analysis['final_recommendation'])[:1000]}")
+    return '\n'.join(lines)
+
+
+def _latest_question(messages):
+    if messages and messages[-1].get('sender') != 'ai':
+        return messages[-1].get('text', '')
+    return ''
+
+
+def retrieve_records(context, messages):
+    """Top-k records for the latest question. Returns ``(prompt_block, sources)``."""
+    record_index = context.get('record_index')
+    if record_index is None:
+        return None, []
+    user_texts = [m.get('text', '') for m in messages if m.get('sender') != 'ai']
+    # Include the previous question so short follow-ups ("and his BP?") keep their subject
+    query = ' '.join(user_texts[-2:])
+    hits = record_index.search(query, RETRIEVAL_TOP_K)
+    if not hits:
+        return None, []
+    lines = [f"[{record['section']}, page {record['page']}] {record_text(record)}" for _score, record in hits]
+    block = ("Records from the submission relevant to this question (cite the page numbers):\n"
+             + '\n'.join(lines))
+    sources = [{'section': record['section'], 'page': record['page']} for _score, record in hits]
+    return block, sources
+
+
+def get_chat_system_prompt(document_type, insurance_type, extracted_data, analysis_output, language='en-US', record_index=None):
     """Generate a system prompt based on document type and insurance type"""
     
     language_instruction = get_language_instruction(language)
     
-    # Base context with document and analysis data
-    base_context = f"""You are an AI assistant for insurance underwriting.
+    if record_index is not None:
+        # Retrieval mode: a fixed summary here, relevant records arrive with each question
+        base_context = f"""You are an AI assistant for insurance underwriting.
+    
+    You are currently helping with a document of type: {document_type}
+    Insurance type: {insurance_type}
+    
+    Job summary:
+    ```
+    {build_job_summary(analysis_output, record_index)}
+    ```
+    
+    Each question comes with the records from the submission that best match it,
+    labelled with their section and page. Base answers on those records and the summary,
+    cite page numbers, and say so if the provided records do not contain the answer.
+    """
+    else:
+        # Base context with document and analysis data
+        base_context = f"""You are an AI assistant for insurance underwriting.
     
     You are currently helping with a document of type: {document_type}
     Insurance type: {insurance_type}
@@ -164,303 +300,427 @@ def get_chat_system_prompt(document_type, insurance_type, extracted_data, analys
     # Combine all sections for the complete prompt
     return base_context + specialized_context + common_instructions
 
+COMMON_TOOLS = [
+    {
+        "toolSpec": {
+            "name": "calculate_bmi",
+            "description": "Calculate BMI (Body Mass Index) given height and weight",
+            "inputSchema": {"json": {
+                "type": "object",
+                "properties": {
+                    "height_cm": {
+                        "type": "number",
+                        "description": "Height in centimeters"
+                    },
+                    "weight_kg": {
+                        "type": "number",
+                        "description": "Weight in kilograms"
+                    }
+                },
+                "required": ["height_cm", "weight_kg"]
+            }}
+        }
+    }
+]
+
+LIFE_TOOLS = [
+    {
+        "toolSpec": {
+            "name": "calculate_mortality_risk",
+            "description": "Calculate a simplified mortality risk score based on age, gender, and health factors",
+            "inputSchema": {"json": {
+                "type": "object",
+                "properties": {
+                    "age": {
+                        "type": "number",
+                        "description": "Age in years"
+                    },
+                    "gender": {
+                        "type": "string",
+                        "description": "Gender (male or female)"
+                    },
+                    "smoker": {
+                        "type": "boolean",
+                        "description": "Whether the person is a smoker"
+                    },
+                    "bmi": {
+                        "type": "number",
+                        "description": "Body Mass Index"
+                    }
+                },
+                "required": ["age", "gender", "smoker", "bmi"]
+            }}
+        }
+    }
+]
+
+PC_TOOLS = [
+    {
+        "toolSpec": {
+            "name": "calculate_property_premium",
+            "description": "Estimate a simplified property insurance premium based on basic factors",
+            "inputSchema": {"json": {
+                "type": "object",
+                "properties": {
+                    "property_value": {
+                        "type": "number",
+                        "description": "Property value in dollars"
+                    },
+                    "construction_type": {
+                        "type": "string",
+                        "description": "Type of construction (e.g., wood frame, masonry, etc.)"
+                    },
+                    "protection_class": {
+                        "type": "number",
+                        "description": "Fire protection class (1-10, where 1 is best)"
+                    },
+                    "deductible": {
+                        "type": "number",
+                        "description": "Deductible amount in dollars"
+                    }
+                },
+                "required": ["property_value", "construction_type", "protection_class", "deductible"]
+            }}
+        }
+    }
+]
+
+
+def get_chat_tools(insurance_type):
+    if insurance_type == "life":
+        return COMMON_TOOLS + LIFE_TOOLS
+    if insurance_type == "property_casualty":
+        return COMMON_TOOLS + PC_TOOLS
+    return COMMON_TOOLS
+
+
+def format_messages_for_bedrock(messages_from_frontend):
+    bedrock_messages = []
+    for msg in messages_from_frontend:
+        # In Bedrock Converse API, the roles are 'user' and 'assistant'.
+        # Frontend sends 'user' and 'ai'.
+        role = 'assistant' if msg.get('sender') == 'ai' else 'user'
+        content = msg.get('text', '')
+        # Content must be a list of content blocks
+        bedrock_messages.append({'role': role, 'content': [{'text': content}]})
+    return bedrock_messages
+
+
+def conversation_messages(job_id, messages):
+    """Bedrock messages for this turn: running summary, a bounded window of stored turns, the new question."""
+    summary, turns = _conversations.load_window(job_id)
+    if not summary.get('text') and not turns:
+        # Nothing stored yet (new conversation or one from before the conversation table).
+        # Window turns plus the new question; Converse needs the first message to be the user's
+        window = format_messages_for_bedrock(messages[-(2 * CHAT_WINDOW_TURNS + 1):])
+        while len(window) > 1 and window[0]['role'] != 'user':
+            window.pop(0)
+        return window
+    bedrock_messages = []
+    for turn in turns:
+        bedrock_messages.append({'role': 'user', 'content': [{'text': turn['user_message'] or '(empty)'}]})
+        bedrock_messages.append({'role': 'assistant', 'content': [{'text': turn['assistant_response'] or '(empty)'}]})
+    current = format_messages_for_bedrock(messages[-1:])
+    bedrock_messages.extend(current)
+    if summary.get('text'):
+        bedrock_messages[0]['content'].insert(0, {'text': f"Summary of the earlier conversation:\n{summary['text']}"})
+    return bedrock_messages
+
+
+def build_converse_request(context, bedrock_messages, retrieved=None):
+    """Converse / ConverseStream keyword arguments for one chat turn."""
+    if retrieved and bedrock_messages and bedrock_messages[-1]['role'] == 'user':
+        # Retrieved records ride on the current question so the system prompt stays identical across turns
+        bedrock_messages[-1]['content'] = [{'text': retrieved}] + bedrock_messages[-1]['content']
+    return {
+        'modelId': BEDROCK_CHAT_MODEL_ID,
+        'system': [{'text': context['system_prompt']}],
+        'messages': bedrock_messages,
+        'toolConfig': {
+            'tools': get_chat_tools(context['insurance_type']),
+            'toolChoice': {'auto': {}}
+        },
+        'inferenceConfig': {
+            "maxTokens": 2048,
+            "temperature": 0.1
+        }
+    }
+
+
+def execute_tool(tool_name, tool_input):
+    """Run one chat tool. Returns ``(tool_call_record, text_to_append)``."""
+    print(f"Executing tool: {tool_name} with input: {json.dumps(tool_input)}")
+
+    if tool_name == 'calculate_bmi':
+        try:
+            height_cm = tool_input.get('height_cm', 0)
+            weight_kg = tool_input.get('weight_kg', 0)
+            bmi = weight_kg / ((height_cm/100) ** 2)
+            bmi_rounded = round(bmi, 1)
+
+            bmi_interpretation = "Unknown"
+            if bmi < 18.5: bmi_interpretation = "Underweight"
+            elif 18.5 <= bmi < 25: bmi_interpretation = "Normal weight"
+            elif 25 <= bmi < 30: bmi_interpretation = "Overweight"
+            elif bmi >= 30: bmi_interpretation = "Obese"
+
+            tool_result = {'name': 'calculate_bmi', 'input': tool_input, 'output': {'bmi': bmi_rounded, 'interpretation': bmi_interpretation}}
+            return tool_result, f"\n\nBMI Calculation: {bmi_rounded} ({bmi_interpretation})"
+        except Exception as e:
+            print(f"Error processing BMI calculation: {str(e)}")
+            return {'name': 'calculate_bmi', 'error': str(e)}, ""
+
+    elif tool_name == 'calculate_mortality_risk':
+        try:
+            age = tool_input.get('age', 0)
+            gender = tool_input.get('gender', '').lower()
+            smoker = tool_input.get('smoker', False)
+            bmi = tool_input.get('bmi', 0)
+
+            base_risk = age / 100.0
+            gender_factor = 1.0 if gender == 'male' else 0.85
+            smoking_factor = 1.8 if smoker else 1.0
+            bmi_factor = 1.0
+            if bmi < 18.5: bmi_factor = 1.2
+            elif 25 <= bmi < 30: bmi_factor = 1.1
+            elif 30 <= bmi < 35: bmi_factor = 1.3
+            elif bmi >= 35: bmi_factor = 1.6
+
+            risk_score = min(10, base_risk * gender_factor * smoking_factor * bmi_factor * 10)
+            risk_score_rounded = round(risk_score, 1)
+
+            if risk_score < 3: risk_interpretation = "Low risk"
+            elif risk_score < 6: risk_interpretation = "Moderate risk"
+            elif risk_score < 8: risk_interpretation = "High risk"
+            else: risk_interpretation = "Very high risk"
+
+            tool_result = {'name': 'calculate_mortality_risk', 'input': tool_input, 'output': {'risk_score': risk_score_rounded, 'interpretation': risk_interpretation}}
+            return tool_result, f"\n\nMortality Risk Assessment: {risk_score_rounded}/10 ({risk_interpretation})"
+        except Exception as e:
+            print(f"Error processing mortality risk calculation: {str(e)}")
+            return {'name': 'calculate_mortality_risk', 'error': str(e)}, ""
+
+    elif tool_name == 'calculate_property_premium':
+        try:
+            property_value = tool_input.get('property_value', 0)
+            construction_type = tool_input.get('construction_type', '').lower()
+            protection_class = tool_input.get('protection_class', 5)
+            deductible = tool_input.get('deductible', 1000)
+
+            base_rate = 3.5
+            construction_factors = {'wood frame': 1.2, 'masonry': 0.9, 'fire resistive': 0.7, 'mixed': 1.0}
+            construction_factor = construction_factors.get(construction_type, 1.0)
+            protection_factor = 0.7 + (protection_class - 1) * 0.1
+            deductible_factor = 1.0 - (math.log(deductible/500) * 0.05)
+
+            annual_premium = property_value / 1000 * base_rate * construction_factor * protection_factor * deductible_factor
+            annual_premium_rounded = round(annual_premium, 2)
+
+            tool_result = {'name': 'calculate_property_premium', 'input': tool_input, 'output': {'annual_premium': annual_premium_rounded}}
+            return tool_result, f"\n\nEstimated Annual Premium: ${annual_premium_rounded:.2f}"
+        except Exception as e:
+            print(f"Error processing property premium calculation: {str(e)}")
+            return {'name': 'calculate_property_premium', 'error': str(e)}, ""
+
+    return {'name': tool_name, 'error': f'Unknown tool: {tool_name}'}, ""
+
+
+# Answers lookups and calculator questions from the job's fields without a model call
+_quick_answers = QuickAnswerRouter(execute_tool)
+
+
+def summarize_turns(previous_summary, turns):
+    """Fold older turns into the running conversation summary"""
+    transcript = '\n\n'.join(
+        f"Underwriter: {t['user_message']}\nAssistant: {t['assistant_response']}" for t in turns
+    )
+    prompt = f"""Update the running summary of an underwriting chat about one insurance submission.
+Keep facts, figures, page references, open questions and conclusions. Drop pleasantries.
+Write at most 200 words.
+
+Current summary:
+{previous_summary or '(none)'}
+
+New turns:
+{transcript}
+
+Return only the updated summary."""
+    response = bedrock_runtime.converse(
+        modelId=BEDROCK_CHAT_MODEL_ID,
+        messages=[{'role': 'user', 'content': [{'text': prompt}]}],
+        inferenceConfig={"maxTokens": 512, "temperature": 0.0}
+    )
+    metrics.record_converse(response)
+    content = response.get('output', {}).get('message', {}).get('content', [])
+    return ''.join(block.get('text', '') for block in content).strip()
+
+
+def persist_chat_turn(job_id, messages, assistant_response, sources=None, summarize=True):
+    """Store the finished turn and roll old turns into the summary. Failures are logged, not raised.
+
+    With ``summarize=False`` (the REST path, where the client is still waiting)
+    a due summary is handed to an async invocation of this function instead.
+    """
+    try:
+        # Get the last user message for logging
+        last_user_message = ""
+        if messages and messages[-1].get('sender') == 'user':
+            last_user_message = messages[-1].get('text', '')
+
+        _conversations.append_turn(job_id, last_user_message, assistant_response, sources)
+        if summarize:
+            _conversations.roll_summary(job_id, summarize_turns)
+        elif _conversations.summary_due(job_id):
+            lambda_client.invoke(
+                FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+                InvocationType='Event',
+                Payload=json.dumps({'rollSummary': {'jobId': job_id}}).encode('utf-8')
+            )
+    except Exception as e:
+        print(f"Error logging chat interaction: {str(e)}")
+
+
 def process_chat(job_id, messages):
     """
     Process a chat message for a specific job.
-    Retrieves job data from DynamoDB and uses it to provide context for the LLM.
+    Job context comes from the in-container cache, which re-reads DynamoDB only when the job changed.
     """
+    metrics.tag(job_id=job_id, model_id=BEDROCK_CHAT_MODEL_ID)
     try:
-        # Retrieve the job data from DynamoDB
-        response = dynamodb.get_item(
-            TableName=JOBS_TABLE_NAME,
-            Key={'jobId': {'S': job_id}}
-        )
-        
-        if 'Item' not in response:
+        # Projected, version-checked read; the blobs are only fetched and parsed when the job changed
+        context = _context_cache.get(job_id, get_chat_system_prompt)
+        if context is None:
             return {'error': f'Job {job_id} not found'}
-        
-        item = response['Item']
-        
-        # Extract job details for context
-        document_type = item.get('documentType', {}).get('S', 'Unknown')
-        insurance_type = item.get('insuranceType', {}).get('S', 'property_casualty')  # Default to P&C if not specified
-        user_language = item.get('userLanguage', {}).get('S', 'en-US')  # Get user language preference
-        
-        # Extract structured data if available
-        extracted_data_json = item.get('extractedDataJsonStr', {}).get('S', '{}')
-        analysis_output_json = item.get('analysisOutputJsonStr', {}).get('S', '{}')
-        
-        try:
-            extracted_data = json.loads(extracted_data_json)
-            analysis_output = json.loads(analysis_output_json)
-        except json.JSONDecodeError:
-            extracted_data = {}
-            analysis_output = {}
-        
-        # Define common tools for all insurance types, now with the correct toolSpec structure
-        common_tools = [
-            {
-                "toolSpec": {
-                    "name": "calculate_bmi",
-                    "description": "Calculate BMI (Body Mass Index) given height and weight",
-                    "inputSchema": {"json": {
-                        "type": "object",
-                        "properties": {
-                            "height_cm": {
-                                "type": "number",
-                                "description": "Height in centimeters"
-                            },
-                            "weight_kg": {
-                                "type": "number",
-                                "description": "Weight in kilograms"
-                            }
-                        },
-                        "required": ["height_cm", "weight_kg"]
-                    }}
-                }
-            }
-        ]
-        
-        # Add insurance-type specific tools
-        if insurance_type == "life":
-            life_tools = [
-                {
-                    "toolSpec": {
-                        "name": "calculate_mortality_risk",
-                        "description": "Calculate a simplified mortality risk score based on age, gender, and health factors",
-                        "inputSchema": {"json": {
-                            "type": "object",
-                            "properties": {
-                                "age": {
-                                    "type": "number",
-                                    "description": "Age in years"
-                                },
-                                "gender": {
-                                    "type": "string",
-                                    "description": "Gender (male or female)"
-                                },
-                                "smoker": {
-                                    "type": "boolean",
-                                    "description": "Whether the person is a smoker"
-                                },
-                                "bmi": {
-                                    "type": "number",
-                                    "description": "Body Mass Index"
-                                }
-                            },
-                            "required": ["age", "gender", "smoker", "bmi"]
-                        }}
-                    }
-                }
-            ]
-            tools = common_tools + life_tools
-        elif insurance_type == "property_casualty":
-            pc_tools = [
-                {
-                    "toolSpec": {
-                        "name": "calculate_property_premium",
-                        "description": "Estimate a simplified property insurance premium based on basic factors",
-                        "inputSchema": {"json": {
-                            "type": "object",
-                            "properties": {
-                                "property_value": {
-                                    "type": "number",
-                                    "description": "Property value in dollars"
-                                },
-                                "construction_type": {
-                                    "type": "string",
-                                    "description": "Type of construction (e.g., wood frame, masonry, etc.)"
-                                },
-                                "protection_class": {
-                                    "type": "number",
-                                    "description": "Fire protection class (1-10, where 1 is best)"
-                                },
-                                "deductible": {
-                                    "type": "number",
-                                    "description": "Deductible amount in dollars"
-                                }
-                            },
-                            "required": ["property_value", "construction_type", "protection_class", "deductible"]
-                        }}
-                    }
-                }
-            ]
-            tools = common_tools + pc_tools
-        else:
-            tools = common_tools
-        
-        # Create the system prompt with context
-        system_prompt = get_chat_system_prompt(document_type, insurance_type, extracted_data, analysis_output, user_language)
-        
-        # Prepare the conversation for Claude, converting frontend format to Bedrock format
-        def format_messages_for_bedrock(messages_from_frontend):
-            bedrock_messages = []
-            for msg in messages_from_frontend:
-                # In Bedrock Converse API, the roles are 'user' and 'assistant'.
-                # Frontend sends 'user' and 'ai'.
-                role = 'assistant' if msg.get('sender') == 'ai' else 'user'
-                content = msg.get('text', '')
-                # Content must be a list of content blocks
-                bedrock_messages.append({'role': role, 'content': [{'text': content}]})
-            return bedrock_messages
-
-        messages_for_bedrock = format_messages_for_bedrock(messages)
-
-        print(f"Sending messages to Bedrock: {json.dumps(messages_for_bedrock)}")
-        
-        # Call Claude via Bedrock with corrected structure
-        response = bedrock_runtime.converse(
-            modelId=BEDROCK_CHAT_MODEL_ID,
-            system=[{'text': system_prompt}],  # Pass system prompt here
-            messages=messages_for_bedrock,     # Pass just user/assistant messages here
-            toolConfig={
-                'tools': tools,                # Pass tools inside toolConfig
-                'toolChoice': {'auto': {}}     # Pass toolChoice as a dict
-            },
-            inferenceConfig={
-                "maxTokens": 2048,
-                "temperature": 0.1
+
+        quick = _quick_answers.answer(context, _latest_question(messages))
+        if quick:
+            sources = [{'page': p} for p in quick['pages']]
+            persist_chat_turn(job_id, messages, quick['response'], sources, summarize=False)
+            return {
+                'jobId': job_id,
+                'response': quick['response'],
+                'toolCalls': quick['toolCalls'],
+                'sources': sources,
+                'answeredBy': 'quick_answer'
             }
-        )
-        
-        print(f"Bedrock response: {json.dumps(response)}")
+
+        retrieved, sources = retrieve_records(context, messages)
+        request = build_converse_request(context, conversation_messages(job_id, messages), retrieved)
+        print(f"Sending {len(request['messages'])} messages to Bedrock (system prompt {len(context['system_prompt'])} chars)")
+
+        response = bedrock_runtime.converse(**request)
+        metrics.record_converse(response)
+
+        print(f"Bedrock response: stopReason={response.get('stopReason')}, usage={response.get('usage')}")
 
         # Process the response
         output_message = response.get('output', {}).get('message', {})
         content_blocks = output_message.get('content', [])
         assistant_response = ""
         tool_calls = []
-        
+
         for block in content_blocks:
             if 'text' in block:
                 assistant_response += block.get('text', '')
-            
+
             elif 'toolUse' in block:
                 tool_use_block = block['toolUse']
-                tool_name = tool_use_block.get('name')
-                tool_input = tool_use_block.get('input', {})
-                print(f"Executing tool: {tool_name} with input: {json.dumps(tool_input)}")
-
-                if tool_name == 'calculate_bmi':
-                    try:
-                        height_cm = tool_input.get('height_cm', 0)
-                        weight_kg = tool_input.get('weight_kg', 0)
-                        bmi = weight_kg / ((height_cm/100) ** 2)
-                        bmi_rounded = round(bmi, 1)
-                        
-                        bmi_interpretation = "Unknown"
-                        if bmi < 18.5: bmi_interpretation = "Underweight"
-                        elif 18.5 <= bmi < 25: bmi_interpretation = "Normal weight"
-                        elif 25 <= bmi < 30: bmi_interpretation = "Overweight"
-                        elif bmi >= 30: bmi_interpretation = "Obese"
-                        
-                        tool_result = {'name': 'calculate_bmi', 'input': tool_input, 'output': {'bmi': bmi_rounded, 'interpretation': bmi_interpretation}}
-                        tool_calls.append(tool_result)
-                        
-                        assistant_response += f"\n\nBMI Calculation: {bmi_rounded} ({bmi_interpretation})"
-                    except Exception as e:
-                        print(f"Error processing BMI calculation: {str(e)}")
-                        tool_calls.append({'name': 'calculate_bmi', 'error': str(e)})
-                
-                elif tool_name == 'calculate_mortality_risk':
-                    try:
-                        age = tool_input.get('age', 0)
-                        gender = tool_input.get('gender', '').lower()
-                        smoker = tool_input.get('smoker', False)
-                        bmi = tool_input.get('bmi', 0)
-                        
-                        base_risk = age / 100.0
-                        gender_factor = 1.0 if gender == 'male' else 0.85
-                        smoking_factor = 1.8 if smoker else 1.0
-                        bmi_factor = 1.0
-                        if bmi < 18.5: bmi_factor = 1.2
-                        elif 25 <= bmi < 30: bmi_factor = 1.1
-                        elif 30 <= bmi < 35: bmi_factor = 1.3
-                        elif bmi >= 35: bmi_factor = 1.6
-                        
-                        risk_score = min(10, base_risk * gender_factor * smoking_factor * bmi_factor * 10)
-                        risk_score_rounded = round(risk_score, 1)
-                        
-                        if risk_score < 3: risk_interpretation = "Low risk"
-                        elif risk_score < 6: risk_interpretation = "Moderate risk"
-                        elif risk_score < 8: risk_interpretation = "High risk"
-                        else: risk_interpretation = "Very high risk"
-                        
-                        tool_result = {'name': 'calculate_mortality_risk', 'input': tool_input, 'output': {'risk_score': risk_score_rounded, 'interpretation': risk_interpretation}}
-                        tool_calls.append(tool_result)
-                        
-                        assistant_response += f"\n\nMortality Risk Assessment: {risk_score_rounded}/10 ({risk_interpretation})"
-                    except Exception as e:
-                        print(f"Error processing mortality risk calculation: {str(e)}")
-                        tool_calls.append({'name': 'calculate_mortality_risk', 'error': str(e)})
-                        
-                elif tool_name == 'calculate_property_premium':
-                    try:
-                        property_value = tool_input.get('property_value', 0)
-                        construction_type = tool_input.get('construction_type', '').lower()
-                        protection_class = tool_input.get('protection_class', 5)
-                        deductible = tool_input.get('deductible', 1000)
-                        
-                        base_rate = 3.5
-                        construction_factors = {'wood frame': 1.2, 'masonry': 0.9, 'fire resistive': 0.7, 'mixed': 1.0}
-                        construction_factor = construction_factors.get(construction_type, 1.0)
-                        protection_factor = 0.7 + (protection_class - 1) * 0.1
-                        deductible_factor = 1.0 - (math.log(deductible/500) * 0.05)
-                        
-                        annual_premium = property_value / 1000 * base_rate * construction_factor * protection_factor * deductible_factor
-                        annual_premium_rounded = round(annual_premium, 2)
-                        
-                        tool_result = {'name': 'calculate_property_premium', 'input': tool_input, 'output': {'annual_premium': annual_premium_rounded}}
-                        tool_calls.append(tool_result)
-                        
-                        assistant_response += f"\n\nEstimated Annual Premium: ${annual_premium_rounded:.2f}"
-                    except Exception as e:
-                        print(f"Error processing property premium calculation: {str(e)}")
-                        tool_calls.append({'name': 'calculate_property_premium', 'error': str(e)})
-
-        # Log the interaction in DynamoDB
-        try:
-            timestamp_now = datetime.now(timezone.utc).isoformat()
-            
-            # Get the last user message for logging
-            last_user_message = ""
-            if messages and messages[-1].get('sender') == 'user':
-                last_user_message = messages[-1].get('text', '')
-
-            chat_interaction = {
-                'timestamp': timestamp_now,
-                'user_message': last_user_message,
-                'assistant_response': assistant_response
-            }
-            
-            # Update the job with the chat interaction
-            # Note: This is a simple append; in production you'd need a more 
-            # sophisticated approach to handle chat history
-            dynamodb.update_item(
-                TableName=JOBS_TABLE_NAME,
-                Key={'jobId': {'S': job_id}},
-                UpdateExpression="SET #chat = list_append(if_not_exists(#chat, :empty_list), :interaction)",
-                ExpressionAttributeNames={
-                    '#chat': 'chatHistory'
-                },
-                ExpressionAttributeValues={
-                    ':empty_list': {'L': []},
-                    ':interaction': {'L': [{'M': {
-                        'timestamp': {'S': timestamp_now},
-                        'user_message': {'S': last_user_message},
-                        'assistant_response': {'S': assistant_response}
-                    }}]}
-                }
-            )
-        except Exception as e:
-            print(f"Error logging chat interaction: {str(e)}")
-        
+                tool_result, text = execute_tool(tool_use_block.get('name'), tool_use_block.get('input', {}))
+                tool_calls.append(tool_result)
+                assistant_response += text
+
+        persist_chat_turn(job_id, messages, assistant_response, sources, summarize=False)
+
         return {
             'jobId': job_id,
             'response': assistant_response,
-            'toolCalls': tool_calls
+            'toolCalls': tool_calls,
+            'sources': sources,
+            'answeredBy': 'model'
         }
-    
+
     except Exception as e:
         print(f"Error in chat process for job {job_id}: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+def stream_chat(job_id, messages, emit, bedrock_client=None):
+    """
+    Streaming variant of ``process_chat``: sends ``start``, ``sources``, ``text``,
+    ``tool_call``, ``tool_result`` and ``done`` events through ``emit`` as the model generates,
+    then persists the turn. ``bedrock_client`` can be any object with a
+    ``converse_stream`` method, so the handler runs locally against a stub.
+    """
+    metrics.tag(job_id=job_id, model_id=BEDROCK_CHAT_MODEL_ID)
+    emit({'type': 'start', 'jobId': job_id})
+    context = _context_cache.get(job_id, get_chat_system_prompt)
+    if context is None:
+        emit({'type': 'error', 'error': f'Job {job_id} not found'})
+        return {'error': f'Job {job_id} not found'}
+
+    quick = _quick_answers.answer(context, _latest_question(messages))
+    if quick:
+        sources = [{'page': p} for p in quick['pages']]
+        if sources:
+            emit({'type': 'sources', 'sources': sources})
+        for record in quick['toolCalls']:
+            emit({'type': 'tool_result', 'toolCall': record})
+        emit({'type': 'text', 'delta': quick['response']})
+        done = {'jobId': job_id, 'response': quick['response'], 'toolCalls': quick['toolCalls'],
+                'sources': sources, 'answeredBy': 'quick_answer'}
+        emit({'type': 'done', **done})
+        persist_chat_turn(job_id, messages, quick['response'], sources)
+        return done
+
+    retrieved, sources = retrieve_records(context, messages)
+    if sources:
+        emit({'type': 'sources', 'sources': sources})
+    request = build_converse_request(context, conversation_messages(job_id, messages), retrieved)
+    result = stream_converse(bedrock_client or bedrock_runtime, request, emit, execute_tool)
+    metrics.record_converse(result)
+    print(f"Streamed response: stopReason={result['stopReason']}, usage={result['usage']}")
+
+    done = {'jobId': job_id, 'response': result['response'], 'toolCalls': result['toolCalls'],
+            'sources': sources, 'answeredBy': 'model'}
+    emit({'type': 'done', **done})
+    # Persist (and possibly summarize) after the client already has the full answer
+    persist_chat_turn(job_id, messages, result['response'], sources)
+    return done
+
+
+def websocket_handler(event, sender=None, bedrock_client=None):
+    """Handle the WebSocket API routes ($connect, $disconnect and the ``chat`` action)."""
+    request_context = event.get('requestContext', {})
+    route_key = request_context.get('routeKey')
+    connection_id = request_context.get('connectionId')
+
+    if route_key in ('$connect', '$disconnect'):
+        print(f"WebSocket {route_key} for connection {connection_id}")
+        return {'statusCode': 200}
+
+    sender = sender or WebSocketSender(
+        f"https://{request_context.get('domainName')}/{request_context.get('stage')}", connection_id
+    )
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        body = {}
+    job_id = body.get('jobId')
+    messages = body.get('messages')
+    request_id = body.get('requestId')
+    # Every frame carries the client's requestId so overlapping turns can be told apart
+    emit = (lambda evt: sender.send({**evt, 'requestId': request_id})) if request_id else sender.send
+
+    if route_key != 'chat' or not job_id or not messages or not isinstance(messages, list):
+        emit({'type': 'error', 'error': 'Expected {"action": "chat", "jobId": ..., "messages": [...]}'})
+        sender.flush()
+        return {'statusCode': 400}
+
+    try:
+        stream_chat(job_id, messages, emit, bedrock_client)
+    except Exception as e:
+        print(f"Error in streaming chat for job {job_id}: {str(e)}")
+        emit({'type': 'error', 'error': f'Internal server error: {str(e)}'})
+    finally:
+        sender.flush()
+    return {'statusCode': 200}
@@ -0,0 +1,328 @@
+"""Deterministic answers for factual chat questions.
+
+Questions that are plain lookups ("what's the DOB?", "year built?") or one of
+the built-in calculators (BMI, mortality risk, property premium) are answered
+from the job's extracted fields without a model call, with page citations.
+Anything analytical, ambiguous, or whose lookup finds conflicting values falls
+back to the LLM. Single-valued lookups and calculator inputs only read the
+applicant's own fields: an ``age`` under ``family_history`` or a ``name``
+under ``beneficiaries`` (or on an attending physician statement page) is never
+the answer to "how old is the applicant". Questions about someone else ("the
+father's age", "the attending physician's name") or about a point in time
+("age at diagnosis") also go to the model.
+
+Every routing decision is logged as a CloudWatch embedded-metric line
+(``QuickAnswerHit`` 0/1 by ``Intent``), so the hit rate can be charted and the
+intent table tuned.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+from record_index import build_records
+
+QUICK_ANSWER_MODE = os.environ.get('QUICK_ANSWER_MODE', 'on').lower()
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'UnderwritingWorkbench')
+MAX_QUESTION_WORDS = 14
+
+# Questions asking for judgement always go to the model
+_ANALYTICAL = re.compile(
+    r'\b(why|should|explain|recommend|assess|evaluate|compare|impact|affect|risk(s|y)?|concern|'
+    r'summar|decision|eligible|insurable|rate|rating|approve|decline|discrepanc|think|opinion|'
+    r'how (does|do|would|will|could)|what if|if the)\b',
+    re.I,
+)
+
+# intent -> (question pattern, field keys (normalized leaf names), label, single-valued)
+LOOKUP_INTENTS = {
+    'dob': (r'\b(dob|date of birth|birth ?date|born)\b', {'dateofbirth', 'dob', 'birthdate'}, 'Date of birth', True),
+    'age': (r'\bage\b|\bhow old\b', {'age', 'currentage', 'applicantage', 'agenearestbirthday'}, 'Age', True),
+    'name': (r'\b(name|who is the (applicant|insured))\b', {'name', 'fullname', 'applicantname', 'insuredname', 'proposedinsured', 'businessname'}, 'Name', True),
+    'gender': (r'\b(gender|sex)\b', {'gender', 'sex'}, 'Gender', True),
+    'coverage': (r'\b(policy amount|coverage( amount)?|face amount|sum (insured|assured)|death benefit|amount of insurance|insurance amount)\b',
+                 {'coverageamount', 'faceamount', 'policyamount', 'suminsured', 'sumassured', 'deathbenefit', 'amountofinsurance', 'requestedcoverage'}, 'Coverage amount', True),
+    'medications': (r'\b(medications?|meds|prescriptions?|rx|drugs? (taken|prescribed))\b', {'medication', 'medications', 'currentmedications', 'prescription', 'prescriptions', 'rx', 'drugname'}, 'Medications', False),
+    'blood_pressure': (r'\b(bp|blood pressure)\b', {'bloodpressure', 'bp', 'bpreading', 'systolic', 'diastolic'}, 'Blood pressure', False),
+    'height': (r'\b(height|how tall)\b', {'height', 'heightcm', 'heightin', 'heightinches'}, 'Height', True),
+    'weight': (r'\b(weight|how heavy)\b', {'weight', 'weightkg', 'weightlbs', 'weightlb'}, 'Weight', True),
+    'smoker': (r'\b(smok\w*|tobacco|nicotine)\b', {'smoker', 'smokingstatus', 'tobaccouse', 'nicotineuse', 'tobacco'}, 'Tobacco use', True),
+    'occupation': (r'\b(occupation|job title|profession|employment)\b', {'occupation', 'jobtitle', 'profession'}, 'Occupation', True),
+    'address': (r'\b(address|where does .* live|location of the property|property location)\b', {'address', 'streetaddress', 'propertyaddress', 'mailingaddress'}, 'Address', True),
+    'construction': (r'\bconstruction( type)?\b', {'constructiontype', 'construction', 'constructionclass'}, 'Construction type', True),
+    'year_built': (r'\b(year built|built in|when was .* built|age of (the )?building)\b', {'yearbuilt', 'constructionyear', 'yearofconstruction'}, 'Year built', True),
+    'square_footage': (r'\b(square (feet|footage)|sq\.? ?ft|sqft|floor area)\b', {'squarefootage', 'squarefeet', 'totalsquarefootage', 'floorarea', 'sqft'}, 'Square footage', True),
+    'property_value': (r'\b(property value|building value|replacement cost|insured value)\b', {'propertyvalue', 'buildingvalue', 'replacementcost', 'insuredvalue', 'totalinsuredvalue'}, 'Property value', True),
+    'protection_class': (r'\bprotection class\b', {'protectionclass', 'fireprotectionclass', 'ppc'}, 'Protection class', True),
+    'deductible': (r'\bdeductible\b', {'deductible', 'deductibleamount'}, 'Deductible', True),
+}
+CALCULATOR_INTENTS = {
+    'calculate_bmi': r'\b(bmi|body mass index)\b',
+    'calculate_mortality_risk': r'\bmortality (risk|score)\b',
+    'calculate_property_premium': r'\b(estimated? |annual )?premium\b',
+}
+
+# Path segments that put a field on someone other than the applicant (or on a past policy)
+_OTHER_PARTY = re.compile(
+    r'family|relative|parent|mother|father|sibling|spouse|child|beneficiar|physician|doctor|provider|'
+    r'owner|payor|payer|trustee|employer|agent|producer|witness|emergencycontact|prior|previous|former'
+)
+# Sections whose top-level fields describe someone else (the APS ``name`` is often the physician's)
+_OTHER_SECTION = re.compile(_OTHER_PARTY.pattern + r'|^aps$|attending')
+# Questions about someone other than the applicant, or about the applicant at another time
+_OTHER_SUBJECT = re.compile(
+    r'(' + _OTHER_PARTY.pattern + r'|husband|wife|\bsons?\b|daughter|brother|sister|grand|aunt|uncle|'
+    r'nurse|examiner|broker|insurer|underwriter)'
+    r'|\b(at|when|before|after|since) (the )?(time of )?(diagnos|death|died|onset|surgery|treatment|'
+    r'issue|hospitali|admission|exam|application|first|last)',
+    re.I,
+)
+
+_COMPILED_LOOKUPS = {k: (re.compile(v[0], re.I), v[1], v[2], v[3]) for k, v in LOOKUP_INTENTS.items()}
+_COMPILED_CALCULATORS = {k: re.compile(v, re.I) for k, v in CALCULATOR_INTENTS.items()}
+
+
+def _norm_key(key: str) -> str:
+    leaf = re.sub(r'\[\d+\]', '', str(key)).rsplit('.', 1)[-1]
+    return re.sub(r'[^a-z0-9]', '', leaf.lower())
+
+
+def _norm_value(value: str) -> str:
+    return re.sub(r'\s+', ' ', str(value)).strip().lower()
+
+
+def _applicant_path(key: str, section: str = '') -> bool:
+    """False when the section or a parent segment of ``key`` belongs to another party (``family_history[0].age``)"""
+    if section and _OTHER_SECTION.search(re.sub(r'[^a-z0-9]', '', str(section).lower())):
+        return False
+    parents = re.sub(r'\[\d+\]', '', str(key)).split('.')[:-1]
+    return not any(_OTHER_PARTY.search(re.sub(r'[^a-z0-9]', '', p.lower())) for p in parents)
+
+
+def build_field_index(records: list[dict]) -> dict[str, list[dict]]:
+    """``{normalized_leaf_key: [{key, value, pages, applicant}]}`` with identical values merged."""
+    fields: dict[str, dict[tuple, dict]] = {}
+    for record in records:
+        for key, value in record['fields']:
+            variants = fields.setdefault(_norm_key(key), {})
+            applicant = _applicant_path(key, record.get('section') or '')
+            entry = variants.setdefault((_norm_value(value), applicant),
+                                        {'key': key, 'value': value, 'pages': [], 'applicant': applicant})
+            if record.get('page') is not None and record['page'] not in entry['pages']:
+                entry['pages'].append(record['page'])
+    return {k: list(v.values()) for k, v in fields.items()}
+
+
+def _lookup(field_index: dict, keys: set, applicant_only: bool = False) -> list[dict]:
+    found = []
+    for key in keys:
+        found.extend(f for f in field_index.get(key, []) if f['applicant'] or not applicant_only)
+    return found
+
+
+def _cite(pages: list) -> str:
+    if not pages:
+        return 'page not recorded'
+    pages = sorted(set(pages), key=lambda p: (not isinstance(p, int), p if isinstance(p, int) else str(p)))
+    label = 'page' if len(pages) == 1 else 'pages'
+    return f"{label} {', '.join(str(p) for p in pages[:6])}{'…' if len(pages) > 6 else ''}"
+
+
+def _number(text) -> float | None:
+    m = re.search(r'-?\d+(?:,\d{3})*(?:\.\d+)?', str(text))
+    return float(m.group(0).replace(',', '')) if m else None
+
+
+def _height_cm(text) -> float | None:
+    text = str(text).lower()
+    m = re.search(r'(\d)\s*(?:\'|ft|feet|foot)\s*(\d{1,2}(?:\.\d+)?)?', text)
+    if m:
+        return (int(m.group(1)) * 12 + float(m.group(2) or 0)) * 2.54
+    value = _number(text)
+    if value is None:
+        return None
+    if 'cm' in text:
+        return value
+    if re.search(r'\bm\b|meter|metre', text) and value < 3:
+        return value * 100
+    if re.search(r'\bin\b|inch|"', text) or 48 <= value <= 96:
+        return value * 2.54
+    return value if 120 <= value <= 230 else None
+
+
+def _weight_kg(text) -> float | None:
+    text = str(text).lower()
+    value = _number(text)
+    if value is None:
+        return None
+    if re.search(r'lb|pound', text):
+        return value * 0.45359237
+    if 'kg' in text or 'kilo' in text:
+        return value
+    return None
+
+
+def _bool(text) -> bool | None:
+    text = _norm_value(text)
+    if re.search(r'\b(yes|true|current|smoker|daily|former smoker within)\b', text) and 'non' not in text and 'never' not in text:
+        return True
+    if re.search(r'\b(no|false|never|non-?smoker|none)\b', text):
+        return False
+    return None
+
+
+class QuickAnswerRouter:
+    """Answer factual questions from a job's fields; count hits for tuning."""
+
+    def __init__(self, execute_tool):
+        # execute_tool(name, input) -> (tool_call_record, text), shared with the model tool path
+        self.execute_tool = execute_tool
+        self._lock = threading.Lock()
+        self.questions = 0
+        self.hits = 0
+
+    def _field_index(self, context: dict) -> dict:
+        if 'field_index' not in context:
+            record_index = context.get('record_index')
+            records = record_index.records if record_index is not None else build_records(context.get('extracted_data') or {})
+            # Stored on the cached context, so it is built once per job version
+            context['field_index'] = build_field_index(records)
+        return context['field_index']
+
+    def _single(self, field_index: dict, intent: str) -> tuple[dict | None, str]:
+        _pattern, keys, _label, _single_valued = _COMPILED_LOOKUPS[intent]
+        found = _lookup(field_index, keys, applicant_only=True)
+        if not found:
+            return None, f'no {intent} field'
+        if len({_norm_value(f['value']) for f in found}) > 1:
+            return None, f'conflicting {intent} values'
+        return found[0], ''
+
+    def _calculator_input(self, tool: str, question: str, field_index: dict) -> tuple[dict | None, list, str]:
+        """Resolve calculator inputs from the question or the job's fields. Returns ``(input, pages, reason)``."""
+        pages = []
+
+        def field(intent):
+            entry, reason = self._single(field_index, intent)
+            if entry:
+                pages.extend(entry['pages'])
+            return entry['value'] if entry else None
+
+        def bmi():
+            height = re.search(r'\d+(?:\.\d+)?\s*(cm|m\b|in\b|inch|ft|feet|\')[^,;]*', question, re.I)
+            weight = re.search(r'\d+(?:\.\d+)?\s*(kg|lbs?|pounds?)', question, re.I)
+            h = _height_cm(height.group(0)) if height else _height_cm(field('height') or '')
+            w = _weight_kg(weight.group(0)) if weight else _weight_kg(field('weight') or '')
+            return (round(h, 1), round(w, 1)) if h and w else (None, None)
+
+        if tool == 'calculate_bmi':
+            h, w = bmi()
+            if not h:
+                return None, pages, 'height/weight not resolvable'
+            return {'height_cm': h, 'weight_kg': w}, pages, ''
+
+        if tool == 'calculate_mortality_risk':
+            age = _number(field('age') or '')
+            gender = _norm_value(field('gender') or '')
+            smoker = _bool(field('smoker') or '')
+            h, w = bmi()
+            if age is None or gender not in ('male', 'female', 'm', 'f') or smoker is None or not h:
+                return None, pages, 'mortality inputs not resolvable'
+            return {'age': age, 'gender': 'male' if gender.startswith('m') else 'female', 'smoker': smoker,
+                    'bmi': round(w / ((h / 100) ** 2), 1)}, pages, ''
+
+        if tool == 'calculate_property_premium':
+            value = _number(field('property_value') or '')
+            construction = _norm_value(field('construction') or '')
+            protection = _number(field('protection_class') or '')
+            deductible = _number(field('deductible') or '')
+            if not (value and construction and protection and deductible):
+                return None, pages, 'premium inputs not resolvable'
+            return {'property_value': value, 'construction_type': construction,
+                    'protection_class': protection, 'deductible': deductible}, pages, ''
+        return None, pages, f'unknown calculator {tool}'
+
+    def _route(self, context: dict, question: str) -> tuple[dict | None, str, str]:
+        """Return ``(answer_or_None, intent, reason)``."""
+        if context.get('language', 'en-US') and not context.get('language', 'en-US').lower().startswith('en'):
+            return None, 'none', 'non-English session'
+        if len(question.split()) > MAX_QUESTION_WORDS:
+            return None, 'none', 'question too long'
+        calculators = [t for t, p in _COMPILED_CALCULATORS.items() if p.search(question)]
+        # Calculator names ("mortality risk") are not themselves a sign of an analytical question
+        residual = question
+        for tool in calculators:
+            residual = _COMPILED_CALCULATORS[tool].sub(' ', residual)
+        if _ANALYTICAL.search(residual):
+            return None, 'none', 'analytical question'
+        if _OTHER_SUBJECT.search(question):
+            return None, 'none', 'question is not about the applicant now'
+        field_index = self._field_index(context)
+
+        lookups = [i for i, (p, *_rest) in _COMPILED_LOOKUPS.items() if p.search(question)]
+        if calculators:
+            if len(calculators) > 1:
+                return None, 'multiple', 'several calculators matched'
+            tool = calculators[0]
+            tool_input, pages, reason = self._calculator_input(tool, question, field_index)
+            if tool_input is None:
+                return None, tool, reason
+            record, text = self.execute_tool(tool, tool_input)
+            if 'error' in record:
+                return None, tool, 'calculator error'
+            pages = list(dict.fromkeys(pages))
+            return {'response': f"{text.strip()}\n\nInputs: {json.dumps(tool_input)} ({_cite(pages)}).",
+                    'toolCalls': [record], 'pages': pages}, tool, ''
+
+        if len(lookups) != 1:
+            return None, 'multiple' if lookups else 'none', 'no single lookup intent'
+        intent = lookups[0]
+        _pattern, keys, label, single_valued = _COMPILED_LOOKUPS[intent]
+        found = _lookup(field_index, keys, applicant_only=single_valued)
+        if not found:
+            return None, intent, 'field not found'
+        if single_valued and len({_norm_value(f['value']) for f in found}) > 1:
+            return None, intent, 'conflicting values'
+        if single_valued:
+            entry = found[0]
+            return {'response': f"{label}: {entry['value']} ({_cite(entry['pages'])}).", 'toolCalls': [],
+                    'pages': entry['pages']}, intent, ''
+        lines = [f"- {f['value']} ({_cite(f['pages'])})" for f in found[:15]]
+        more = f"\n- …and {len(found) - 15} more" if len(found) > 15 else ''
+        pages = sorted({p for f in found for p in f['pages'] if isinstance(p, int)})
+        return {'response': f"{label}:\n" + '\n'.join(lines) + more, 'toolCalls': [], 'pages': pages}, intent, ''
+
+    def answer(self, context: dict, question: str) -> dict | None:
+        """Answer ``question`` deterministically, or return ``None`` to use the model."""
+        if QUICK_ANSWER_MODE != 'on' or not question or not question.strip():
+            return None
+        started = time.time()
+        try:
+            result, intent, reason = self._route(context, question.strip())
+        except Exception as e:
+            print(f"[quick_answer] Router error, falling back to the model: {e}")
+            result, intent, reason = None, 'error', str(e)
+        with self._lock:
+            self.questions += 1
+            self.hits += 1 if result else 0
+            hit_rate = self.hits / self.questions
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Intent']],
+                    'Metrics': [{'Name': 'QuickAnswerHit', 'Unit': 'Count'},
+                                {'Name': 'QuickAnswerLatency', 'Unit': 'Milliseconds'}],
+                }],
+            },
+            'Intent': intent,
+            'QuickAnswerHit': 1 if result else 0,
+            'QuickAnswerLatency': round((time.time() - started) * 1000, 2),
+            'fallbackReason': reason or None,
+            'containerHitRate': round(hit_rate, 3),
+        }))
+        if result:
+            result['intent'] = intent
+        return result
@@ -0,0 +1,162 @@
+"""Streaming chat over the Bedrock ConverseStream API and an API Gateway WebSocket.
+
+``stream_converse`` consumes the ``converse_stream`` event stream and turns it
+into small client events:
+
+    {"type": "text", "delta": "..."}
+    {"type": "tool_call", "toolUseId": ..., "name": ..., "input": {...}}
+    {"type": "tool_result", "toolCall": {...}}
+
+It only needs an object with a ``converse_stream(**request)`` method returning
+``{"stream": iterable_of_events}``, so it can be driven by a stub locally.
+
+``WebSocketSender`` posts events back to the connection. Text deltas are
+coalesced into frames of at least ``STREAM_FLUSH_CHARS`` characters or
+``STREAM_FLUSH_MS`` milliseconds, except the first one, which goes out
+immediately.
+"""
+import json
+import os
+import time
+
+import boto3
+
+STREAM_FLUSH_CHARS = int(os.environ.get('STREAM_FLUSH_CHARS', '48'))
+STREAM_FLUSH_MS = int(os.environ.get('STREAM_FLUSH_MS', '60'))
+
+_STREAM_ERRORS = (
+    'internalServerException', 'modelStreamErrorException', 'validationException',
+    'throttlingException', 'serviceUnavailableException',
+)
+
+_management_clients: dict = {}
+
+
+def stream_converse(client, request: dict, emit, execute_tool) -> dict:
+    """Run one ConverseStream call, emitting events as they arrive.
+
+    ``execute_tool(name, input)`` returns ``(tool_call_record, text_to_append)``,
+    as in the non-streaming path. Returns the final response text, tool calls,
+    stop reason, usage and the service-reported latency (``metrics``).
+    """
+    started = time.time()
+    first_token_at = None
+    response_text = ''
+    tool_calls = []
+    tool_blocks: dict[int, dict] = {}
+    stop_reason = None
+    usage = {}
+    stream_metrics = {}
+
+    stream = client.converse_stream(**request).get('stream', [])
+    for event in stream:
+        for error_key in _STREAM_ERRORS:
+            if error_key in event:
+                raise RuntimeError(f"{error_key}: {event[error_key].get('message', '')}")
+
+        if 'contentBlockStart' in event:
+            block = event['contentBlockStart']
+            tool_use = block.get('start', {}).get('toolUse')
+            if tool_use:
+                tool_blocks[block.get('contentBlockIndex', 0)] = {
+                    'toolUseId': tool_use.get('toolUseId'), 'name': tool_use.get('name'), 'input': '',
+                }
+
+        elif 'contentBlockDelta' in event:
+            block = event['contentBlockDelta']
+            delta = block.get('delta', {})
+            if 'text' in delta:
+                if first_token_at is None:
+                    first_token_at = time.time()
+                response_text += delta['text']
+                emit({'type': 'text', 'delta': delta['text']})
+            elif 'toolUse' in delta:
+                pending = tool_blocks.setdefault(block.get('contentBlockIndex', 0), {'input': ''})
+                pending['input'] += delta['toolUse'].get('input', '')
+
+        elif 'contentBlockStop' in event:
+            pending = tool_blocks.pop(event['contentBlockStop'].get('contentBlockIndex', 0), None)
+            if pending is not None:
+                try:
+                    tool_input = json.loads(pending['input'] or '{}')
+                except json.JSONDecodeError:
+                    tool_input = {}
+                emit({'type': 'tool_call', 'toolUseId': pending.get('toolUseId'),
+                      'name': pending.get('name'), 'input': tool_input})
+                record, text = execute_tool(pending.get('name'), tool_input)
+                tool_calls.append(record)
+                emit({'type': 'tool_result', 'toolCall': record})
+                if text:
+                    response_text += text
+                    emit({'type': 'text', 'delta': text})
+
+        elif 'messageStop' in event:
+            stop_reason = event['messageStop'].get('stopReason')
+
+        elif 'metadata' in event:
+            usage = event['metadata'].get('usage', {})
+            stream_metrics = event['metadata'].get('metrics', {})
+
+    if first_token_at is not None:
+        print(f"[streaming] First token after {first_token_at - started:.3f}s, "
+              f"stream completed in {time.time() - started:.3f}s")
+    return {'response': response_text, 'toolCalls': tool_calls, 'stopReason': stop_reason, 'usage': usage,
+            'metrics': stream_metrics}
+
+
+def _management_client(endpoint_url: str):
+    if endpoint_url not in _management_clients:
+        _management_clients[endpoint_url] = boto3.client('apigatewaymanagementapi', endpoint_url=endpoint_url)
+    return _management_clients[endpoint_url]
+
+
+class WebSocketSender:
+    """Post events to one WebSocket connection, coalescing text deltas."""
+
+    def __init__(self, endpoint_url: str, connection_id: str, client=None):
+        self.client = client or _management_client(endpoint_url)
+        self.connection_id = connection_id
+        self.gone = False
+        self._text = ''
+        self._text_frame: dict = {}
+        self._last_flush = 0.0
+        self._sent_text = False
+
+    def _post(self, payload: dict) -> None:
+        if self.gone:
+            return
+        try:
+            self.client.post_to_connection(
+                ConnectionId=self.connection_id,
+                Data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            )
+        except Exception as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code == 'GoneException':
+                # Client went away; keep generating so the turn is still persisted
+                print(f"[streaming] Connection {self.connection_id} is gone; dropping further events")
+                self.gone = True
+                return
+            raise
+
+    def _flush_text(self) -> None:
+        if self._text:
+            self._post({**self._text_frame, 'delta': self._text})
+            self._text = ''
+            self._last_flush = time.time()
+            self._sent_text = True
+
+    def send(self, event: dict) -> None:
+        if event.get('type') == 'text':
+            self._text += event.get('delta', '')
+            self._text_frame = {k: v for k, v in event.items() if k != 'delta'}
+            due = (time.time() - self._last_flush) * 1000 >= STREAM_FLUSH_MS
+            if not self._sent_text or due or len(self._text) >= STREAM_FLUSH_CHARS:
+                self._flush_text()
+            return
+        # Any other event flushes pending text first so the client sees events in order
+        self._flush_text()
+        self._post(event)
+
+    def flush(self) -> None:
+        self._flush_text()
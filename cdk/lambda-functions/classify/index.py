@@ -1,34 +1,26 @@
 import json
-import boto3
 import os
 import base64
 import io
 import urllib.parse
 import time
 import traceback
-from pdf2image import convert_from_path
 from datetime import datetime, timezone
-from botocore.config import Config
+from pdf2image import convert_from_path
 
-def log_timing(operation_name, start_time):
-    """Log the duration of an operation"""
-    elapsed = time.time() - start_time
-    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
+import aws_clients
+from instrumentation import Metrics, log_timing
 
-# Configure retry settings for AWS clients
-# Configure retry settings for Bedrock client only
-bedrock_retry_config = Config(
-    retries={
-        'max_attempts': 10,
-        'mode': 'adaptive'
-    },
-    max_pool_connections=50
-)
+metrics = Metrics('classify')
 
-# Initialize AWS clients outside the handler for reuse
-s3 = boto3.client('s3')
-bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=bedrock_retry_config)
-dynamodb_client = boto3.client('dynamodb')
+# Every invocation downloads the PDF, renders its first page and calls Bedrock,
+# so the clients and pdf2image load during init rather than on the first
+# request. Retry settings apply to the Bedrock client only.
+s3 = aws_clients.client('s3')
+bedrock_runtime = aws_clients.client(
+    'bedrock-runtime', retries={'max_attempts': 10, 'mode': 'adaptive'}, max_pool_connections=50
+)
+dynamodb_client = aws_clients.client('dynamodb')
 
 def get_classification_prompt(insurance_type):
     """Get the appropriate classification prompt based on insurance type"""
@@ -114,11 +106,11 @@ def get_classification_prompt(insurance_type):
         Example Output: {"document_type": "ACORD_FORM"}
         """
 
+@metrics.handler
 def lambda_handler(event, context):
     handler_start = time.time()
     print(f"[classify] === CLASSIFY LAMBDA START === remaining_time={context.get_remaining_time_in_millis()}ms")
     print(f"[classify] Event keys: {list(event.keys()) if isinstance(event, dict) else 'not a dict'}")
-    print(f"[classify] Event size: {len(json.dumps(event))} bytes")
 
     bucket = None
     key = None
@@ -150,6 +142,7 @@ def lambda_handler(event, context):
             parts = key.split("/")
             job_id_parsed = parts[1]
             print(f"[classify] Parsed Job ID: {job_id_parsed}")
+            metrics.tag(job_id=job_id_parsed)
         else:
             print(f"[classify] WARNING: Could not parse Job ID from S3 key: {key}. DynamoDB update will be skipped.")
 
@@ -191,7 +184,8 @@ def lambda_handler(event, context):
                         ':classifyTsVal': {'S': timestamp_now}
                     }
                 )
-                log_timing("DynamoDB operations", ddb_start)
+                log_timing("DynamoDB operations", ddb_start, metric='DynamoDB')
+                metrics.tag(insurance_type=insurance_type)
                 print(f"[classify] Updated job {job_id_parsed} status to CLASSIFYING")
             except Exception as ddb_e:
                 print(f"[classify] WARNING: Error with DynamoDB operations for job {job_id_parsed}: {str(ddb_e)}")
@@ -203,8 +197,9 @@ def lambda_handler(event, context):
         try:
             # Use the decoded key for S3 download
             s3.download_file(bucket, key, download_path)
-            log_timing("S3 download", s3_download_start)
+            log_timing("S3 download", s3_download_start, metric='S3Download')
             file_size = os.path.getsize(download_path)
+            metrics.count('S3BytesIn', file_size)
             print(f"[classify] Successfully downloaded to {download_path}, size={file_size} bytes")
         except Exception as e:
             log_timing("S3 download (FAILED)", s3_download_start)
@@ -230,7 +225,7 @@ def lambda_handler(event, context):
         convert_start = time.time()
         try:
             images = convert_from_path(download_path, first_page=1, last_page=1)
-            log_timing("PDF to image conversion", convert_start)
+            log_timing("PDF to image conversion", convert_start, metric='PdfConversion')
             if images:
                 first_page_image = images[0]
                 print(f"[classify] First page image size: {first_page_image.size}")
@@ -239,6 +234,8 @@ def lambda_handler(event, context):
                 image_bytes = buffer.getvalue()
                 base64_image_data = base64.b64encode(image_bytes).decode('utf-8')
                 print(f"[classify] Successfully converted first page to PNG, image size={len(image_bytes)} bytes")
+                metrics.count('Pages')
+                metrics.count('ImageBytes', len(image_bytes))
             else:
                 print(f"[classify] WARNING: pdf2image returned no images for {download_path}")
         except Exception as e:
@@ -258,6 +255,7 @@ def lambda_handler(event, context):
                 # Use Claude 3 Sonnet v2 by default, but can be configured via environment variable
                 model_id = os.environ.get('BEDROCK_MODEL_ID', 'global.anthropic.claude-haiku-4-5-20251001-v1:0')
                 print(f"[classify] Using model: {model_id}")
+                metrics.tag(model_id=model_id)
                 
                 # Define the prompt for document classification based on insurance type
                 prompt_text = get_classification_prompt(insurance_type)
@@ -319,7 +317,8 @@ def lambda_handler(event, context):
                     toolConfig=tool_config,
                     inferenceConfig=inference_config
                 )
-                log_timing("Bedrock Converse API call", bedrock_start)
+                log_timing("Bedrock Converse API call", bedrock_start, metric='BedrockConverse')
+                metrics.record_converse(response)
                 print(f"[classify] Bedrock converse call successful, remaining_time={context.get_remaining_time_in_millis()}ms")
                 
                 # Log usage metrics if available
@@ -345,6 +344,7 @@ def lambda_handler(event, context):
 
             except Exception as bedrock_e:
                 log_timing("Bedrock Converse API call (FAILED)", bedrock_start)
+                metrics.count('ModelErrors')
                 print(f"[classify] ERROR during Bedrock interaction: {bedrock_e}")
                 traceback.print_exc()
                 classification_result = 'ERROR_BEDROCK_API' # Store the string directly
@@ -0,0 +1,209 @@
+"""Relevance compaction of merged extraction data before it is sent to the detection agent.
+
+The merged extraction is ``{sub_document_type: [page_object, ...]}`` where every
+page object carries a ``page_number``. Compaction keeps that shape readable for
+the agent while removing what does not help it find impairments:
+
+- blank pages (``{"page_number": n, "status": "No information found"}``) are dropped
+- the applicant's demographics repeated across pages are collapsed into one
+  ``applicant_header``; generic fields such as ``name`` or ``age`` only count
+  on the applicant's own forms, so a physician's or relative's values stay put
+- identical key/value pairs within a sub-document are stored once, grouped into
+  records that list every page they came from (``"pages": [...]``)
+- records are ranked by underwriting relevance and kept until the token budget
+  is spent; the pages of anything left out are listed under ``omitted_records``.
+  Values are never truncated, so clinical narrative reaches the agent whole
+
+Page references are preserved on every record so evidence citations still work.
+"""
+import json
+import re
+
+from extraction_fields import is_applicant_field, is_blank_status, norm_key as _norm_key
+
+# Rough chars-per-token ratio used for budgeting and savings logs
+CHARS_PER_TOKEN = 4
+
+_BOILERPLATE = re.compile(r'authori[sz]ation|signature|signed|consent|disclaimer|hipaa|acknowledg|fraud|notice|witness|agent_?(name|code|number)|producer', re.I)
+
+_RELEVANT_SECTION = re.compile(r'medical|lab|prescription|\brx\b|pharmacy|mib|physician|aps|attending|paramed|exam|history|hospital|questionnaire|health|diagnos|driving|mvr|claim|loss|inspection|cope|property', re.I)
+
+_RELEVANT_TERMS = re.compile(
+    r'diagnos|condition|disease|disorder|medication|prescri|\brx\b|dosage|mg\b|lab|result|a1c|glucose|'
+    r'cholesterol|ldl|hdl|triglycer|blood pressure|\bbp\b|systolic|diastolic|bmi|weight|height|'
+    r'smok|tobacco|nicotine|alcohol|drug|substance|hospital|surgery|treatment|therapy|cancer|tumou?r|'
+    r'heart|cardiac|stroke|diabet|hypertens|kidney|renal|liver|hepat|asthma|copd|depress|anxiety|'
+    r'bipolar|psych|mib|dui|dwi|violation|accident|avocation|aviation|scuba|claim|loss|fire|sprinkler|'
+    r'construction|hazard|flood|roof|vacan|occupan',
+    re.I,
+)
+
+
+def estimate_tokens(obj) -> int:
+    text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _value_key(value) -> str:
+    if isinstance(value, str):
+        return re.sub(r'\s+', ' ', value).strip().lower()
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def _page_number(value):
+    """Page numbers arrive as ints or strings depending on the extractor; use ints where possible"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return value
+
+
+def _page_key(page) -> tuple:
+    """Sort key that orders numeric pages first and never compares an int with a str"""
+    return (0, page, '') if isinstance(page, int) else (1, 0, str(page))
+
+
+def _is_blank_page(page: dict) -> bool:
+    fields = {k: v for k, v in page.items() if k != 'page_number'}
+    if not fields:
+        return True
+    if set(fields) <= {'status', 'note', 'notes'}:
+        return all(is_blank_status(v) for v in fields.values())
+    return False
+
+
+def _is_empty_value(value) -> bool:
+    return value is None or value == '' or value == [] or value == {}
+
+
+def _record_score(section: str, record: dict) -> float:
+    score = 2.0 if _RELEVANT_SECTION.search(section) else 0.0
+    if _BOILERPLATE.search(section):
+        score -= 3.0
+    for key, value in record.items():
+        if key == 'pages':
+            continue
+        text = f"{key} {value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)}"
+        hits = len(_RELEVANT_TERMS.findall(text))
+        score += min(hits, 5)
+        if _BOILERPLATE.search(str(key)):
+            score -= 2.0
+        if re.search(r'\d', text):
+            score += 0.25
+    return score
+
+
+def _collapse_demographics(data: dict) -> tuple[dict, dict]:
+    """Pull the applicant's repeated demographic fields into one header. Conflicting values stay on their pages."""
+    seen: dict[str, dict[str, dict]] = {}
+    for section, pages in data.items():
+        for page in pages:
+            for key, value in page.items():
+                nk = _norm_key(key)
+                if is_applicant_field(section, key) and not _is_empty_value(value):
+                    entry = seen.setdefault(nk, {}).setdefault(_value_key(value), {'key': key, 'value': value, 'pages': set()})
+                    entry['pages'].add(page.get('page_number'))
+    header = {}
+    header_values = {}
+    for nk, variants in seen.items():
+        # The most widely repeated value becomes the header value
+        best = max(variants.values(), key=lambda v: len(v['pages']))
+        header[best['key']] = {'value': best['value'], 'pages': sorted((p for p in best['pages'] if p is not None), key=_page_key)}
+        header_values[nk] = _value_key(best['value'])
+    stripped = {}
+    for section, pages in data.items():
+        stripped[section] = [
+            {k: v for k, v in page.items()
+             if not is_applicant_field(section, k) or header_values.get(_norm_key(k)) != _value_key(v)}
+            for page in pages
+        ]
+    return header, stripped
+
+
+def _group_section(pages: list[dict]) -> list[dict]:
+    """Store each distinct key/value once and group pairs that occur on the same set of pages."""
+    pairs: dict[tuple, dict] = {}
+    for page in pages:
+        page_number = page.get('page_number')
+        for key, value in page.items():
+            if key == 'page_number' or _is_empty_value(value):
+                continue
+            entry = pairs.setdefault((key, _value_key(value)), {'key': key, 'value': value, 'pages': []})
+            if page_number not in entry['pages']:
+                entry['pages'].append(page_number)
+    records: dict[tuple, dict] = {}
+    for entry in pairs.values():
+        page_set = tuple(sorted((p for p in entry['pages'] if p is not None), key=_page_key))
+        record = records.setdefault(page_set, {'pages': list(page_set)})
+        key = entry['key']
+        # Same key with a different value on the same pages: keep both
+        while key in record:
+            key = f"{key}_"
+        record[key] = entry['value']
+    return sorted(records.values(), key=lambda r: ([_page_key(p) for p in r['pages'][:1]], len(r['pages'])))
+
+
+def compact_extraction(extracted_data: dict, token_budget: int) -> tuple[dict, dict]:
+    """Return ``(compacted, stats)`` for the merged extraction data."""
+    before_tokens = estimate_tokens(extracted_data)
+    stats = {'tokens_before': before_tokens, 'blank_pages_dropped': 0, 'records_omitted': 0}
+    if not isinstance(extracted_data, dict):
+        stats['tokens_after'] = before_tokens
+        return extracted_data, stats
+
+    data = {}
+    for section, pages in extracted_data.items():
+        kept = [{**page, 'page_number': _page_number(page.get('page_number'))}
+                for page in pages or [] if isinstance(page, dict)]
+        if kept:
+            data[section] = kept
+
+    # Blank pages are judged after the header fields are stripped, so a page
+    # that only repeats the applicant's name next to "No information found" goes too
+    header, stripped = _collapse_demographics(data)
+    data = {}
+    for section, pages in stripped.items():
+        kept = []
+        for page in pages:
+            if _is_blank_page(page):
+                stats['blank_pages_dropped'] += 1
+                continue
+            kept.append(page)
+        if kept:
+            data[section] = kept
+
+    candidates = []
+    for order, (section, pages) in enumerate(data.items()):
+        for idx, record in enumerate(_group_section(pages)):
+            if len(record) <= 1:
+                continue
+            candidates.append((_record_score(section, record), order, idx, section, record))
+
+    compacted: dict = {}
+    if header:
+        compacted['applicant_header'] = header
+    used = estimate_tokens(compacted)
+    selected = []
+    omitted: dict[str, list] = {}
+    for score, order, idx, section, record in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+        cost = estimate_tokens(record)
+        if used + cost > token_budget and selected:
+            pages = omitted.setdefault(section, [])
+            pages.extend(p for p in record['pages'] if p not in pages)
+            stats['records_omitted'] += 1
+            continue
+        used += cost
+        selected.append((order, idx, section, record))
+
+    # Restore document order so the agent reads pages in sequence
+    for order, idx, section, record in sorted(selected, key=lambda s: (s[0], s[1])):
+        compacted.setdefault(section, []).append(record)
+    if omitted:
+        compacted['omitted_records'] = {s: sorted(p, key=_page_key) for s, p in omitted.items()}
+
+    stats['tokens_after'] = estimate_tokens(compacted)
+    stats['tokens_saved'] = before_tokens - stats['tokens_after']
+    return compacted, stats
@@ -1,46 +1,37 @@
 import json
-import boto3
 import os
 import re
+import threading
 import traceback
 import time
-from botocore.config import Config
 from botocore.exceptions import ClientError
 from datetime import datetime, timezone
-from strands import Agent, tool
-from strands.models import BedrockModel
-from botocore.config import Config as BotoConfig
-
-def log_timing(operation_name, start_time):
-    """Log the duration of an operation"""
-    elapsed = time.time() - start_time
-    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
-
-
-# Configure retry settings for Bedrock client only
-bedrock_retry_config = Config(
-    retries={
-        'max_attempts': 10,
-        'mode': 'adaptive'
-    },
-    max_pool_connections=50
-)
-
-# Initialize AWS clients outside the handler for reuse
-bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=bedrock_retry_config)
-kb_runtime = boto3.client('bedrock-agent-runtime')
-dynamodb_client = boto3.client('dynamodb')
-s3_client = boto3.client('s3')
+
+import aws_clients
+from claim_check import ClaimCheckLoader, describe_event, offload
+from compaction import compact_extraction
+from instrumentation import Metrics, log_timing
+
+metrics = Metrics('detect')
+
+
+# AWS clients are built on first use and reused for the life of the container.
+# Strands (and the agent's Bedrock client) loads on the first agent build.
+kb_runtime = aws_clients.lazy('bedrock-agent-runtime')
+dynamodb_client = aws_clients.lazy('dynamodb')
+s3_client = aws_clients.lazy('s3')
 # Environment variables
 DB_TABLE = os.environ.get('JOBS_TABLE_NAME')
 EXTRACTION_BUCKET = os.environ.get('EXTRACTION_BUCKET')
 KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
 DETECTION_TOP_K = int(os.environ.get('DETECTION_TOP_K', '3'))
 TRACE_BUCKET = os.environ.get('TRACE_BUCKET')
+# Approximate input token budget for the compacted extraction (0 disables compaction)
+DETECTION_TOKEN_BUDGET = int(os.environ.get('DETECTION_TOKEN_BUDGET', '60000'))
 
 # Reuse a single S3 client for fetching chunk files
 def get_s3_client():
-    return boto3.client('s3')
+    return aws_clients.client('s3')
 
 
 def get_language_instruction(language: str) -> str:
@@ -93,58 +84,51 @@ def _write_trace(job_id: str, trace_obj: dict) -> str | None:
     return key
 
 
-def _build_agent(insurance_type: str, language: str = 'en-US') -> object:
-    """Construct the Strands Agent with prompts/tools based on insurance type.
-
-    - life: use life underwriting prompt and Bedrock KB tool
-    - property_casualty: use P&C underwriting prompt and DO NOT attach KB tool
-    """
-    model_id = os.environ.get('BEDROCK_DETECTION_MODEL_ID', 'global.anthropic.claude-haiku-4-5-20251001-v1:0')
-    language_instruction = get_language_instruction(language)
+# Agent tools; wrapped with strands' @tool when the agent is built
+def scratch_fixed(action: str, key: str, value=None, agent=None):
+    """Tool for temporary storage during agent execution - uses agent.state properly"""
+    scratch_data = agent.state.get('scratch_pad') or {}
+    if action == 'append':
+        if key not in scratch_data:
+            scratch_data[key] = []
+        scratch_data[key].append(value)
+    elif action == 'set':
+        scratch_data[key] = value
+    elif action == 'get':
+        return scratch_data.get(key)
+    agent.state.set('scratch_pad', scratch_data)
+    return 'ok'
+
+def kb_search(canonical_term: str):
+    print(f"[kb_search] Searching for {canonical_term}")
+    """Return markdown for the top KB hit from Bedrock Knowledge Base."""
+    kb_id = os.environ.get('KNOWLEDGE_BASE_ID')
+    if not kb_id:
+        return "Knowledge base not configured."
+    try:
+        resp = kb_runtime.retrieve(
+            knowledgeBaseId=kb_id,
+            retrievalQuery={'text': canonical_term},
+            retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 1}}
+        )
+        results = resp.get('retrievalResults') or []
+        if not results:
+            return "No matching documents found."
+        content = results[0].get('content').get('text') or {}
+        location = results[0].get('location').get('s3Location').get('uri') or {}
+        print(f"[kb_search] Found {canonical_term} in {location}")
+        # Bedrock returns {'text': '...'} per docs
+        return f"""
+        knowledgebase_location: {location}
+        text_content: {content}
+        """
+    except Exception as e:
+        return f"KB retrieval error: {e}"
 
-    @tool
-    def scratch_fixed(action: str, key: str, value=None, agent=None):
-        """Tool for temporary storage during agent execution - uses agent.state properly"""
-        scratch_data = agent.state.get('scratch_pad') or {}
-        if action == 'append':
-            if key not in scratch_data:
-                scratch_data[key] = []
-            scratch_data[key].append(value)
-        elif action == 'set':
-            scratch_data[key] = value
-        elif action == 'get':
-            return scratch_data.get(key)
-        agent.state.set('scratch_pad', scratch_data)
-        return 'ok'
-
-    @tool
-    def kb_search(canonical_term: str):
-        print(f"[kb_search] Searching for {canonical_term}")
-        """Return markdown for the top KB hit from Bedrock Knowledge Base."""
-        kb_id = os.environ.get('KNOWLEDGE_BASE_ID')
-        if not kb_id:
-            return "Knowledge base not configured."
-        try:
-            resp = kb_runtime.retrieve(
-                knowledgeBaseId=kb_id,
-                retrievalQuery={'text': canonical_term},
-                retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 1}}
-            )
-            results = resp.get('retrievalResults') or []
-            if not results:
-                return "No matching documents found."
-            content = results[0].get('content').get('text') or {}
-            location = results[0].get('location').get('s3Location').get('uri') or {}
-            print(f"[kb_search] Found {canonical_term} in {location}")
-            # Bedrock returns {'text': '...'} per docs
-            return f"""
-            knowledgebase_location: {location}
-            text_content: {content}
-            """
-        except Exception as e:
-            return f"KB retrieval error: {e}"
 
-    LIFE_PROMPT = """You are a senior life insurance underwriter. Your job is to analyze the data stream for an application and identify impairments, 
+# Prompt bodies are split around the language instruction so they are only
+# formatted once per (insurance type, language) when an agent is built.
+LIFE_PROMPT_HEAD = """You are a senior life insurance underwriter. Your job is to analyze the data stream for an application and identify impairments, 
 scoring factors (based on the knowledge base), and evidences for those impairments. 
 1. Scan the extracted data for impairment evidence and write out an initial list of impairments.
 Then for each impairment in your scratch pad, do the following:
@@ -188,11 +172,12 @@ Explanation of the JSON output:
 - discrepancies: A list of discrepancies for the impairment.
 - narrative: A high level summary of the analysis of all the impairments. Should include references to the knowledge base entries for the impairments that were used to generate the analysis. One paragraph maximum. 
 
-IMPORTANT: """ + language_instruction + """ All text content in the JSON (evidence descriptions, narratives, discrepancies) must be in this language.
+IMPORTANT: """
+LIFE_PROMPT_TAIL = """ All text content in the JSON (evidence descriptions, narratives, discrepancies) must be in this language.
    
 """
 
-    PC_PROMPT = """You are a senior property and casualty insurance underwriter. Analyze the extracted data for risk drivers and underwriting concerns relevant to P&C (not life).
+PC_PROMPT_HEAD = """You are a senior property and casualty insurance underwriter. Analyze the extracted data for risk drivers and underwriting concerns relevant to P&C (not life).
 
 Your goals:
 1. Identify a list of P&C risk drivers (call them "impairments" for consistency), such as: prior losses, construction type and quality, occupancy and operations, fire protection and sprinklers, alarms, location crime/flood/wildfire exposure, values and COPE details, hazardous materials or processes, and clear compliance issues.
@@ -217,43 +202,169 @@ Return a single JSON object in this format:
 }
 ```
 
-IMPORTANT: """ + language_instruction + """ All text content in the JSON (evidence descriptions, narratives) must be in this language.
+IMPORTANT: """
+PC_PROMPT_TAIL = """ All text content in the JSON (evidence descriptions, narratives) must be in this language.
 """
 
-    # Configure BedrockModel with adaptive retry
-    retrying_cfg = BotoConfig(
-        retries={"mode": "adaptive", "max_attempts": 12}
-    )
-    model = BedrockModel(
-        model_id=model_id,
-        boto_client_config=retrying_cfg
-    )
-    print(f"[_build_agent] Created BedrockModel with adaptive retry (max_attempts=12)")
 
+# Warm-container caches: one BedrockModel per model id and a free list of prebuilt
+# agents per (insurance type, language, model id).
+_MODELS: dict = {}
+_AGENT_POOL: dict[tuple, list] = {}
+_POOL_LOCK = threading.Lock()
+
+
+def _get_model(model_id: str) -> object:
+    with _POOL_LOCK:
+        model = _MODELS.get(model_id)
+        if model is None:
+            model_start = time.time()
+            from botocore.config import Config
+            from strands.models import BedrockModel
+            # Configure BedrockModel with adaptive retry
+            retrying_cfg = Config(
+                retries={"mode": "adaptive", "max_attempts": 12}
+            )
+            model = BedrockModel(
+                model_id=model_id,
+                boto_session=aws_clients.session(),
+                boto_client_config=retrying_cfg
+            )
+            _MODELS[model_id] = model
+            log_timing(f"Create BedrockModel {model_id}", model_start)
+    return model
+
+
+def _detection_model_id() -> str:
+    return os.environ.get('BEDROCK_DETECTION_MODEL_ID', 'global.anthropic.claude-haiku-4-5-20251001-v1:0')
+
+
+def _build_agent(insurance_type: str, language: str = 'en-US') -> object:
+    """Construct the Strands Agent with prompts/tools based on insurance type.
+
+    - life: use life underwriting prompt and Bedrock KB tool
+    - property_casualty: use P&C underwriting prompt and DO NOT attach KB tool
+    """
+    build_start = time.time()
+    from strands import Agent, tool
+    model = _get_model(_detection_model_id())
+    language_instruction = get_language_instruction(language)
     if (insurance_type or "").lower() == "life":
-        return Agent(system_prompt=LIFE_PROMPT, tools=[kb_search, scratch_fixed], model=model)
+        agent = Agent(system_prompt=LIFE_PROMPT_HEAD + language_instruction + LIFE_PROMPT_TAIL, tools=[tool(kb_search), tool(scratch_fixed)], model=model)
     else:
         # property_casualty: exclude knowledge base tool
-        return Agent(system_prompt=PC_PROMPT, tools=[scratch_fixed], model=model)
+        agent = Agent(system_prompt=PC_PROMPT_HEAD + language_instruction + PC_PROMPT_TAIL, tools=[tool(scratch_fixed)], model=model)
+    log_timing(f"Build detection agent ({insurance_type}, {language})", build_start)
+    return agent
+
+
+def _acquire_agent(insurance_type: str, language: str = 'en-US') -> tuple[tuple, object]:
+    """Check out a warm agent for this key, building one only when the free list is empty."""
+    itype = 'life' if (insurance_type or '').lower() == 'life' else 'property_casualty'
+    key = (itype, language, _detection_model_id())
+    with _POOL_LOCK:
+        free = _AGENT_POOL.setdefault(key, [])
+        agent = free.pop() if free else None
+    if agent is not None:
+        print(f"[_acquire_agent] Reusing warm agent for {key}")
+        return key, agent
+    return key, _build_agent(insurance_type, language)
+
+
+def _release_agent(key: tuple, agent: object) -> None:
+    """Reset conversation and scratch pad state and return the agent to the free list."""
+    try:
+        agent.messages = []
+        agent.state.set('scratch_pad', {})
+        loop_metrics = getattr(agent, 'event_loop_metrics', None)
+        if loop_metrics is not None:
+            agent.event_loop_metrics = type(loop_metrics)()
+    except Exception as e:
+        print(f"[_release_agent] WARNING: Could not reset agent, discarding it: {e}")
+        return
+    with _POOL_LOCK:
+        _AGENT_POOL.setdefault(key, []).append(agent)
+
+
+
+
+def _compact_for_agent(extracted_data: dict) -> tuple[dict, bool]:
+    """Return the extraction view sent to the agent and whether it was compacted."""
+    if DETECTION_TOKEN_BUDGET <= 0:
+        return extracted_data, False
+    compact_start = time.time()
+    try:
+        compacted, stats = compact_extraction(extracted_data, DETECTION_TOKEN_BUDGET)
+    except Exception as e:
+        # Compaction only saves tokens; the raw extraction is always a valid input
+        print(f"[_compact_for_agent] WARNING: Compaction failed, sending raw extraction: {e}")
+        traceback.print_exc()
+        return extracted_data, False
+    log_timing("Extraction compaction", compact_start)
+    saved_pct = 100.0 * stats.get('tokens_saved', 0) / max(1, stats['tokens_before'])
+    print(f"[_compact_for_agent] Compaction: ~{stats['tokens_before']} -> ~{stats['tokens_after']} input tokens "
+          f"(saved ~{stats.get('tokens_saved', 0)}, {saved_pct:.0f}%), blank pages dropped={stats['blank_pages_dropped']}, "
+          f"records omitted={stats['records_omitted']}")
+    return compacted, True
+
+
+def _build_detection_message(agent_input: dict, compacted: bool) -> str:
+    if not compacted:
+        # Feed the raw JSON string directly to the agent
+        return json.dumps(agent_input, ensure_ascii=False)
+    return (
+        "Extracted data (compacted). Each record lists the page numbers it appears on in \"pages\"; "
+        "applicant_header holds demographics repeated across pages; omitted_records lists pages left out "
+        "for length.\n\n" + json.dumps(agent_input, ensure_ascii=False)
+    )
 
 
+def _merge_extraction_chunks(raw_results: list) -> dict:
+    """Fetch & merge the per-batch extraction chunks written by the extract step."""
+    merged_data = {}
+    print(f"[_merge_extraction_chunks] Number of extraction chunks to process: {len(raw_results)}")
+    s3 = get_s3_client()
+    for idx, chunk_meta in enumerate(raw_results):
+        chunk_start = time.time()
+        pages = chunk_meta.get('pages')
+        key = chunk_meta.get('chunkS3Key')
+        print(f"[_merge_extraction_chunks] Processing chunk {idx+1}/{len(raw_results)}: pages={pages}, chunkS3Key={key}")
+        if not key:
+            print(f"[_merge_extraction_chunks] Skipping chunk {idx} because no chunkS3Key provided")
+            continue
+        try:
+            obj = s3.get_object(Bucket=EXTRACTION_BUCKET, Key=key)
+            body = obj['Body'].read()
+            chunk_data = json.loads(body.decode('utf-8'))
+            print(f"[_merge_extraction_chunks] Retrieved chunk {idx}, size={len(body)} bytes, keys={list(chunk_data.keys())}")
+            log_timing(f"S3 fetch chunk {idx}", chunk_start, metric='S3ChunkFetch')
+            metrics.count('S3BytesIn', len(body))
+        except Exception as e:
+            print(f"[_merge_extraction_chunks] ERROR fetching/parsing S3 chunk {idx} (Bucket={EXTRACTION_BUCKET}, Key={key}): {e}")
+            traceback.print_exc()
+            continue
+        for subdoc, pages_list in chunk_data.items():
+            merged_data.setdefault(subdoc, []).extend(pages_list or [])
+    return merged_data
 
 
-def _run_agent_detection(extracted_data: dict, insurance_type: str, language: str = 'en-US') -> dict:
+def _run_agent_detection(extracted_data: dict, insurance_type: str, language: str = 'en-US', compacted: bool = False) -> dict:
     """Run the Strands Agent and return parsed JSON result."""
     agent_start = time.time()
-    print(f"[_run_agent_detection] Building agent for insurance_type={insurance_type}, language={language}")
-    agent = _build_agent(insurance_type, language)
-    # Feed the raw JSON string directly to the agent (simpler and more faithful)
-    message_str = json.dumps(extracted_data, ensure_ascii=False)
+    print(f"[_run_agent_detection] Acquiring agent for insurance_type={insurance_type}, language={language}")
+    agent_key, agent = _acquire_agent(insurance_type, language)
+    message_str = _build_detection_message(extracted_data, compacted)
     print(f"[_run_agent_detection] Agent input message size: {len(message_str)} bytes")
     print(f"[_run_agent_detection] Invoking Strands agent...")
     invoke_start = time.time()
     try:
         res = agent(message_str)
-        log_timing("Strands agent invocation", invoke_start)
+        log_timing("Strands agent invocation", invoke_start, metric='AgentInvocation')
+        metrics.record_agent(res)
+        _release_agent(agent_key, agent)
     except Exception as agent_error:
         log_timing("Strands agent invocation (FAILED)", invoke_start)
+        metrics.count('ModelErrors')
         print(f"[_run_agent_detection] ERROR: Strands agent invocation failed: {type(agent_error).__name__}: {agent_error}")
         traceback.print_exc()
         # Check for specific Bedrock errors
@@ -290,48 +401,30 @@ def _run_agent_detection(extracted_data: dict, insurance_type: str, language: st
 
 
 
+@metrics.handler
 def lambda_handler(event, context):
     handler_start = time.time()
     print(f"[lambda_handler] === DETECT IMPAIRMENTS LAMBDA START === remaining_time={context.get_remaining_time_in_millis()}ms")
-    print(f"[lambda_handler] Event keys: {list(event.keys()) if isinstance(event, dict) else 'not a dict'}")
-    print(f"[lambda_handler] Event size: {len(json.dumps(event))} bytes")
+    print(f"[lambda_handler] Event keys: {describe_event(event)}")
     
     # Initialize analysis_json for error handling
     analysis_json = {"error": True, "message": "Unknown error occurred"}
 
-    # --- 1) Fetch & merge all S3-backed chunks ---
+    # --- 1) Resolve the merged extraction (claim check from analyze, else merge chunks) ---
     s3_fetch_start = time.time()
-    print(f"[lambda_handler] Step 1: Merging extractionResults via S3 pointers, remaining_time={context.get_remaining_time_in_millis()}ms")
-    merged_data = {}
-    raw_results = event.get('extractionResults') or []
-    print(f"[lambda_handler] Number of extraction chunks to process: {len(raw_results)}")
-    s3 = get_s3_client()
-    for idx, chunk_meta in enumerate(raw_results):
-        chunk_start = time.time()
-        pages = chunk_meta.get('pages')
-        key = chunk_meta.get('chunkS3Key')
-        print(f"[lambda_handler] Processing chunk {idx+1}/{len(raw_results)}: pages={pages}, chunkS3Key={key}")
-        if not key:
-            print(f"[lambda_handler] Skipping chunk {idx} because no chunkS3Key provided")
-            continue
-        try:
-            print(f"[lambda_handler] Fetching S3 object: Bucket={EXTRACTION_BUCKET}, Key={key}")
-            obj = s3.get_object(Bucket=EXTRACTION_BUCKET, Key=key)
-            body = obj['Body'].read()
-            chunk_data = json.loads(body.decode('utf-8'))
-            print(f"[lambda_handler] Retrieved chunk {idx}, size={len(body)} bytes, keys={list(chunk_data.keys())}")
-            log_timing(f"S3 fetch chunk {idx}", chunk_start)
-        except Exception as e:
-            print(f"[lambda_handler] ERROR fetching/parsing S3 chunk {idx} (Bucket={EXTRACTION_BUCKET}, Key={key}): {e}")
-            traceback.print_exc()
-            # Optionally fail fast or continue merging
-            continue
-        for subdoc, pages_list in chunk_data.items():
-            merged_data.setdefault(subdoc, []).extend(pages_list or [])
-    log_timing("Total S3 chunk fetching", s3_fetch_start)
-    print(f"[lambda_handler] Merged extracted data keys: {list(merged_data.keys())}")
-    extracted_data = merged_data
-    print(f"[lambda_handler] Total merged data size: {len(json.dumps(extracted_data))} bytes")
+    print(f"[lambda_handler] Step 1: Loading extracted data, remaining_time={context.get_remaining_time_in_millis()}ms")
+    loader = ClaimCheckLoader(get_s3_client())
+    extracted_data = None
+    try:
+        extracted_data = loader.resolve_path(event, 'analysisOutput', 'extraction')
+    except Exception as e:
+        print(f"[lambda_handler] WARNING: Could not resolve extraction claim check: {e}")
+    if isinstance(extracted_data, dict) and extracted_data:
+        print(f"[lambda_handler] Using merged extraction from analyze claim check")
+    else:
+        extracted_data = _merge_extraction_chunks(event.get('extractionResults') or [])
+    log_timing("Load extracted data", s3_fetch_start, metric='LoadExtraction')
+    print(f"[lambda_handler] Merged extracted data keys: {list(extracted_data.keys())}")
 
     # --- 2) Update status and get insurance type ---
     print(f"[lambda_handler] Step 2: Updating status to DETECTING, remaining_time={context.get_remaining_time_in_millis()}ms")
@@ -340,6 +433,7 @@ def lambda_handler(event, context):
     document_type = classification.get('classification')
     insurance_type = classification.get('insuranceType') or 'property_casualty'
     print(f"[lambda_handler] job_id={job_id}, document_type={document_type}, insurance_type={insurance_type}")
+    metrics.tag(job_id=job_id, insurance_type=insurance_type, model_id=_detection_model_id())
     if job_id and DB_TABLE:
         # Mark status as DETECTING (impairments) prior to analysis
         try:
@@ -385,9 +479,10 @@ def lambda_handler(event, context):
     # --- 3) Detect impairments using Strands Agent (Bedrock KB) ---
     print(f"[lambda_handler] Step 3: Running Strands agent for impairment detection, remaining_time={context.get_remaining_time_in_millis()}ms")
     agent_raw = {}
+    agent_input, compacted = _compact_for_agent(extracted_data)
     agent_start = time.time()
     try:
-        agent_raw = _run_agent_detection(extracted_data, insurance_type, user_language)
+        agent_raw = _run_agent_detection(agent_input, insurance_type, user_language, compacted)
         log_timing("Agent detection", agent_start)
         print(f"[lambda_handler] Agent detection completed, impairments found: {len(agent_raw.get('impairments', []))}")
     except Exception as e:
@@ -425,7 +520,7 @@ def lambda_handler(event, context):
                 ExpressionAttributeNames={'#ad': 'analysisDetectionJsonStr', '#dt': 'detectionTimestamp'},
                 ExpressionAttributeValues={':ad': {'S': detection_json}, ':dt': {'S': ts2}}
             )
-            log_timing("DynamoDB persist detection", ddb_start)
+            log_timing("DynamoDB persist detection", ddb_start, metric='DynamoDB')
             print(f"[lambda_handler] Persisted analysisDetectionJsonStr for job {job_id}")
         except Exception as e:
             print(f"[lambda_handler] ERROR: DynamoDB detection persist error: {e}")
@@ -433,11 +528,17 @@ def lambda_handler(event, context):
 
     log_timing("Total DETECT IMPAIRMENTS lambda execution", handler_start)
     print(f"[lambda_handler] === DETECT IMPAIRMENTS LAMBDA COMPLETE === remaining_time={context.get_remaining_time_in_millis()}ms")
+    impairments = detection.get('impairments') if isinstance(detection, dict) else None
+    impairments = impairments if isinstance(impairments, list) else []
     result = {
         'status': 'SUCCESS',
         'message': 'Detection completed',
-        'analysisDetection': detection
+        'analysisDetection': offload(job_id, 'detection', detection, {
+            'impairments': len(impairments),
+            'impairmentIds': [i.get('impairment_id') for i in impairments[:20] if isinstance(i, dict)],
+        }),
+        # Downstream stages (act) read the compacted view rather than the full extraction
+        'compactedExtraction': offload(job_id, 'extraction-compacted', agent_input, {'compacted': compacted}),
     }
-    print(f"[lambda_handler] Returning result, size={len(json.dumps(result))} bytes")
     return result
 
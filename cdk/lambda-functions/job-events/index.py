@@ -0,0 +1,229 @@
+"""Push job status changes to WebSocket subscribers.
+
+Two kinds of events arrive here:
+
+- WebSocket ``subscribe`` / ``unsubscribe`` actions on the shared WebSocket API.
+  ``{"action": "subscribe", "jobIds": [...], "batchIds": [...], "allJobs": true}``
+  stores one item per (topic, connection) in the subscriptions table.
+- DynamoDB Stream batches from the jobs table. Each INSERT/MODIFY whose status
+  or stage timestamps changed becomes a compact delta (job id, batch id,
+  status, changed stage and its timestamp, progress). Deltas are grouped per
+  connection so every subscriber gets at most one frame per stream batch.
+
+Subscriptions expire after ``SUBSCRIPTION_TTL_SECONDS``; connections that are
+gone are removed the first time a post to them fails.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+dynamodb = boto3.client('dynamodb')
+
+SUBSCRIPTIONS_TABLE_NAME = os.environ.get('SUBSCRIPTIONS_TABLE_NAME')
+WEBSOCKET_ENDPOINT = os.environ.get('WEBSOCKET_ENDPOINT')
+SUBSCRIPTION_TTL_SECONDS = int(os.environ.get('SUBSCRIPTION_TTL_SECONDS', '7200'))
+MAX_TOPICS_PER_SUBSCRIBE = 25
+PUBLISH_WORKERS = 8
+
+ALL_JOBS_TOPIC = 'jobs'
+STATUS_ORDER = ('CREATED', 'CLASSIFYING', 'EXTRACTING', 'DETECTING', 'SCORING', 'ACTING', 'COMPLETE')
+STAGE_TIMESTAMPS = (
+    'uploadTimestamp', 'classifyTimestamp', 'extractionStartTimestamp', 'extractionTimestamp',
+    'analysisTimestamp', 'detectionStartTimestamp', 'detectionTimestamp',
+    'scoringStartTimestamp', 'scoringTimestamp', 'actionStartTimestamp', 'actionTimestamp',
+)
+
+_management_clients = {}
+
+
+def _management_client(endpoint):
+    if endpoint not in _management_clients:
+        _management_clients[endpoint] = boto3.client('apigatewaymanagementapi', endpoint_url=endpoint)
+    return _management_clients[endpoint]
+
+
+def _string(image, name):
+    return (image.get(name) or {}).get('S')
+
+
+def status_delta(record):
+    """Compact delta for one stream record, or None if nothing a client shows has changed"""
+    if record.get('eventName') not in ('INSERT', 'MODIFY'):
+        return None
+    new = record.get('dynamodb', {}).get('NewImage') or {}
+    old = record.get('dynamodb', {}).get('OldImage') or {}
+    # Upload manifests and other non-job items carry a recordType
+    if not _string(new, 'jobId') or 'recordType' in new:
+        return None
+    changed = [name for name in STAGE_TIMESTAMPS if _string(new, name) != _string(old, name)]
+    status = _string(new, 'status') or ''
+    if status == _string(old, 'status') and not changed:
+        return None
+    stage = changed[-1] if changed else None
+    if status == 'COMPLETE' or status == 'FAILED':
+        progress = 1.0
+    elif status in STATUS_ORDER:
+        progress = round(STATUS_ORDER.index(status) / (len(STATUS_ORDER) - 1), 3)
+    else:
+        progress = None
+    return {
+        'jobId': _string(new, 'jobId'),
+        'batchId': _string(new, 'batchId'),
+        'status': status,
+        'stage': stage,
+        'stageTimestamp': _string(new, stage) if stage else None,
+        'progress': progress,
+    }
+
+
+def _topics_for(delta):
+    topics = [ALL_JOBS_TOPIC, f"job#{delta['jobId']}"]
+    if delta.get('batchId'):
+        topics.append(f"batch#{delta['batchId']}")
+    return topics
+
+
+def _subscribers(topic):
+    connections = []
+    params = {
+        'TableName': SUBSCRIPTIONS_TABLE_NAME,
+        'KeyConditionExpression': 'topic = :t',
+        'ExpressionAttributeValues': {':t': {'S': topic}},
+        'ProjectionExpression': 'connectionId, expiresAt',
+    }
+    now = int(time.time())
+    while True:
+        response = dynamodb.query(**params)
+        for item in response.get('Items', []):
+            # TTL deletion is lazy, so skip expired subscriptions ourselves
+            if int(item.get('expiresAt', {}).get('N', '0')) > now:
+                connections.append(item['connectionId']['S'])
+        if not response.get('LastEvaluatedKey'):
+            return connections
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def _delete_subscriptions(connection_id, topics):
+    for topic in topics:
+        dynamodb.delete_item(
+            TableName=SUBSCRIPTIONS_TABLE_NAME,
+            Key={'topic': {'S': topic}, 'connectionId': {'S': connection_id}}
+        )
+
+
+def _post(endpoint, connection_id, payload):
+    """Send one frame; returns 'sent', 'gone' or 'failed'.
+
+    A failed post (throttling, a client error, a timeout) is logged and skipped:
+    raising would fail the stream batch, and its retry would re-push every frame
+    to every connection that already got it.
+    """
+    client = _management_client(endpoint)
+    try:
+        client.post_to_connection(ConnectionId=connection_id, Data=json.dumps(payload).encode('utf-8'))
+        return 'sent'
+    except client.exceptions.GoneException:
+        return 'gone'
+    except Exception as e:
+        print(f"[job_events] WARNING: post to connection {connection_id} failed: {type(e).__name__}: {e}")
+        return 'failed'
+
+
+def publish(records, endpoint=None):
+    """Fan the deltas of one stream batch out to their subscribers. Returns the number of frames sent."""
+    endpoint = endpoint or WEBSOCKET_ENDPOINT
+    # Several writes to the same job in one batch collapse into its latest state
+    deltas = {}
+    for record in records:
+        delta = status_delta(record)
+        if delta:
+            deltas[delta['jobId']] = delta
+    if not deltas:
+        return 0
+
+    topic_deltas = {}
+    for delta in deltas.values():
+        for topic in _topics_for(delta):
+            topic_deltas.setdefault(topic, []).append(delta)
+
+    per_connection = {}
+    connection_topics = {}
+    for topic, updates in topic_deltas.items():
+        for connection_id in _subscribers(topic):
+            bucket = per_connection.setdefault(connection_id, {})
+            for delta in updates:
+                bucket[delta['jobId']] = delta
+            connection_topics.setdefault(connection_id, []).append(topic)
+    if not per_connection:
+        return 0
+
+    def send(connection_id):
+        payload = {'type': 'job_status', 'updates': list(per_connection[connection_id].values())}
+        outcome = _post(endpoint, connection_id, payload)
+        if outcome == 'gone':
+            print(f"[job_events] Connection {connection_id} is gone; dropping its subscriptions")
+            try:
+                _delete_subscriptions(connection_id, connection_topics[connection_id])
+            except Exception as e:
+                # The subscriptions expire anyway; keep publishing to everyone else
+                print(f"[job_events] WARNING: could not drop subscriptions of {connection_id}: {e}")
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=min(PUBLISH_WORKERS, len(per_connection))) as pool:
+        outcomes = list(pool.map(send, per_connection))
+    sent = outcomes.count('sent')
+    print(f"[job_events] Published {len(deltas)} job updates to {sent} connections "
+          f"(gone={outcomes.count('gone')}, failed={outcomes.count('failed')})")
+    return sent
+
+
+def _requested_topics(body):
+    topics = []
+    if body.get('allJobs'):
+        topics.append(ALL_JOBS_TOPIC)
+    topics.extend(f"job#{job_id}" for job_id in body.get('jobIds') or [] if isinstance(job_id, str) and job_id)
+    topics.extend(f"batch#{batch_id}" for batch_id in body.get('batchIds') or [] if isinstance(batch_id, str) and batch_id)
+    return list(dict.fromkeys(topics))[:MAX_TOPICS_PER_SUBSCRIBE]
+
+
+def websocket_handler(event):
+    request_context = event.get('requestContext', {})
+    route_key = request_context.get('routeKey')
+    connection_id = request_context.get('connectionId')
+    endpoint = f"https://{request_context.get('domainName')}/{request_context.get('stage')}"
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        body = {}
+    topics = _requested_topics(body)
+
+    if route_key == 'unsubscribe':
+        _delete_subscriptions(connection_id, topics)
+        return {'statusCode': 200}
+
+    if not topics:
+        _post(endpoint, connection_id, {'type': 'error', 'error': 'Expected {"action": "subscribe", "jobIds": [...], "batchIds": [...], "allJobs": true}'})
+        return {'statusCode': 400}
+
+    expires_at = str(int(time.time()) + SUBSCRIPTION_TTL_SECONDS)
+    for topic in topics:
+        dynamodb.put_item(
+            TableName=SUBSCRIPTIONS_TABLE_NAME,
+            Item={
+                'topic': {'S': topic},
+                'connectionId': {'S': connection_id},
+                'expiresAt': {'N': expires_at},
+            }
+        )
+    _post(endpoint, connection_id, {'type': 'subscribed', 'topics': topics})
+    return {'statusCode': 200}
+
+
+def lambda_handler(event, context):
+    if 'Records' in event:
+        publish(event['Records'])
+        return {'statusCode': 200}
+    return websocket_handler(event)
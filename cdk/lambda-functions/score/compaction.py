@@ -0,0 +1,155 @@
+"""Token-budgeted compaction of the impairments payload sent to the scoring agent.
+
+Replaces fixed-count truncation (first 20 impairments, 10 evidence strings,
+30 factors) with a budget fill:
+
+1. impairments are ranked by severity signals so the most serious are filled first
+2. near-identical evidence strings are deduplicated
+3. every impairment first gets a core entry (id, manual location, the scoring
+   factors its rating tables are keyed on, its strongest evidence)
+4. remaining budget is spent round-robin on further evidence and factors
+
+Impairments whose core entry no longer fits are still listed by id with a note,
+so nothing is dropped silently.
+"""
+import json
+import re
+
+CHARS_PER_TOKEN = 4
+MAX_EVIDENCE_CHARS = 500
+MAX_FACTOR_CHARS = 400
+CORE_EVIDENCE = 2
+
+_SEVERITY_TERMS = re.compile(
+    r'declin|postpon|uninsurable|cancer|malignan|metasta|carcinoma|lymphoma|leukemia|myocardial|\bmi\b|'
+    r'infarct|stroke|\btia\b|heart failure|cardiomyopathy|aneurysm|dialysis|transplant|cirrhosis|'
+    r'hiv|suicid|overdose|substance|dui|dwi|insulin|amputat|retinopathy|nephropathy|neuropathy|'
+    r'hospitali[sz]|surgery|uncontrolled|severe|stage\s*[3-4iv]|total loss|fire loss|lawsuit|litigation',
+    re.I,
+)
+_WORDS = re.compile(r'[a-z0-9]+')
+
+
+def estimate_tokens(obj) -> int:
+    text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False, indent=2)
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _evidence_text(ev) -> str | None:
+    if isinstance(ev, str):
+        return ev
+    if isinstance(ev, dict) and 'text' in ev:
+        return str(ev.get('text'))
+    return None
+
+
+def _dedupe_evidence(evidence: list) -> list[str]:
+    """Drop evidence strings whose word set is (nearly) contained in one already kept."""
+    kept: list[tuple[str, set]] = []
+    for ev in evidence or []:
+        text = _evidence_text(ev)
+        if not text:
+            continue
+        words = set(_WORDS.findall(text.lower()))
+        duplicate = False
+        for idx, (other, other_words) in enumerate(kept):
+            overlap = len(words & other_words) / max(1, min(len(words), len(other_words)))
+            if overlap >= 0.9:
+                duplicate = True
+                if len(text) > len(other):
+                    kept[idx] = (text, words)
+                break
+        if not duplicate:
+            kept.append((text, words))
+    return [t[:MAX_EVIDENCE_CHARS] for t, _ in kept]
+
+
+def _severity(item: dict, evidence: list[str]) -> float:
+    parts = [str(item.get('impairment_id') or '')] + evidence
+    factors = item.get('scoring_factors')
+    if isinstance(factors, dict):
+        parts.extend(f"{k} {v}" for k, v in factors.items())
+    text = ' '.join(parts)
+    score = 3.0 * len(set(m.lower() for m in _SEVERITY_TERMS.findall(text)))
+    score += 2.0 * len(item.get('discrepancies') or [])
+    score += 0.2 * min(len(evidence), 10)
+    return score
+
+
+def compact_impairments(payload: list[dict], token_budget: int, required_for=None) -> tuple[list[dict], dict]:
+    """Return ``(compacted_payload, stats)``.
+
+    ``required_for(item)`` returns the factor keys the manual needs for that
+    impairment.
+    """
+    prepared = []
+    for order, item in enumerate(payload or []):
+        if not isinstance(item, dict):
+            continue
+        evidence = _dedupe_evidence(item.get('evidence') or [])
+        factors = item.get('scoring_factors') if isinstance(item.get('scoring_factors'), dict) else {}
+        required_keys = set(required_for(item)) if required_for else set()
+        ordered = [k for k in factors if k in required_keys] + [k for k in factors if k not in required_keys]
+        prepared.append({
+            'order': order,
+            'item': item,
+            'evidence': evidence,
+            'factor_keys': ordered,
+            'n_required': sum(1 for k in ordered if k in required_keys),
+            'severity': _severity(item, evidence),
+        })
+    prepared.sort(key=lambda p: (-p['severity'], p['order']))
+
+    def _value(v):
+        return v[:MAX_FACTOR_CHARS] if isinstance(v, str) else v
+
+    entries = []
+    used = 0
+    stats = {'impairments': len(prepared), 'stubbed': 0, 'evidence_dropped': 0, 'factors_dropped': 0}
+    for p in prepared:
+        item = p['item']
+        entry = {k: v for k, v in item.items() if k not in ('evidence', 'scoring_factors')}
+        core_factors = p['factor_keys'][:max(p['n_required'], 1)]
+        entry['scoring_factors'] = {k: _value(item['scoring_factors'][k]) for k in core_factors}
+        entry['evidence'] = p['evidence'][:CORE_EVIDENCE]
+        cost = estimate_tokens(entry)
+        if used + cost > token_budget and entries:
+            stub = {'impairment_id': item.get('impairment_id'), 'note': 'details omitted for length; score from manual defaults'}
+            if item.get('knowledgebase_location'):
+                stub['knowledgebase_location'] = item['knowledgebase_location']
+            entries.append((p, stub, False))
+            used += estimate_tokens(stub)
+            stats['stubbed'] += 1
+            continue
+        used += cost
+        entries.append((p, entry, True))
+
+    # Round-robin the remaining budget over evidence and factors, most severe first
+    progress = True
+    while progress:
+        progress = False
+        for p, entry, full in entries:
+            if not full:
+                continue
+            next_factor = next((k for k in p['factor_keys'] if k not in entry['scoring_factors']), None)
+            if next_factor is not None:
+                value = _value(p['item']['scoring_factors'][next_factor])
+                cost = estimate_tokens({next_factor: value})
+                if used + cost <= token_budget:
+                    entry['scoring_factors'][next_factor] = value
+                    used += cost
+                    progress = True
+            if len(entry['evidence']) < len(p['evidence']):
+                ev = p['evidence'][len(entry['evidence'])]
+                cost = estimate_tokens(ev)
+                if used + cost <= token_budget:
+                    entry['evidence'].append(ev)
+                    used += cost
+                    progress = True
+
+    for p, entry, full in entries:
+        if full:
+            stats['evidence_dropped'] += len(p['evidence']) - len(entry['evidence'])
+            stats['factors_dropped'] += len(p['factor_keys']) - len(entry['scoring_factors'])
+    stats['tokens'] = used
+    return [entry for _p, entry, _full in entries], stats
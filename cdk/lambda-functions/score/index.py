@@ -1,48 +1,39 @@
 import json
 import os
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
-import boto3
-from botocore.config import Config
+import aws_clients
+from claim_check import ClaimCheckLoader, describe_event, offload
+from compaction import compact_impairments
+from instrumentation import Metrics, log_timing
 
-def log_timing(operation_name, start_time):
-    """Log the duration of an operation"""
-    elapsed = time.time() - start_time
-    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
-
-# Strands Agent imports (layer provided by CDK)
-try:
-    from strands import Agent, tool
-    from strands.models import BedrockModel
-except Exception:
-    Agent = None  # type: ignore
-    BedrockModel = None  # type: ignore
-    def tool(fn):  # type: ignore
-        return fn
-
-
-# Retry-friendly Bedrock runtime config
-bedrock_retry_config = Config(
-    retries={
-        'max_attempts': 10,
-        'mode': 'standard'
-    },
-    max_pool_connections=50
-)
+metrics = Metrics('score')
 
-
-bedrock_runtime = boto3.client('bedrock-runtime', config=bedrock_retry_config)
-kb_runtime = boto3.client('bedrock-agent-runtime')
-dynamodb = boto3.client('dynamodb')
-s3 = boto3.client('s3')
+# AWS clients are built on first use and reused for the life of the container.
+# Strands (layer provided by CDK) loads on the first agent build, so invocations
+# the rating engine scores on its own never import it.
+kb_runtime = aws_clients.lazy('bedrock-agent-runtime')
+dynamodb = aws_clients.lazy('dynamodb')
+s3 = aws_clients.lazy('s3')
 
 
 JOBS_TABLE_NAME = os.environ.get('JOBS_TABLE_NAME')
 KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
 TRACE_BUCKET = os.environ.get('TRACE_BUCKET')
 MODEL_ID = os.environ.get('BEDROCK_SCORING_MODEL_ID', 'global.anthropic.claude-haiku-4-5-20251001-v1:0')
+# 'hybrid' scores life impairments from the compiled manual rules and only sends
+# the leftovers to the agent; 'agent' sends everything to the agent.
+RATING_ENGINE_MODE = os.environ.get('RATING_ENGINE_MODE', 'hybrid').lower()
+# 'single' scores all impairments in one agent conversation; 'fanout' gives each
+# impairment its own agent call on a bounded worker pool.
+SCORING_STRATEGY = os.environ.get('SCORING_STRATEGY', 'single').lower()
+SCORING_MAX_WORKERS = int(os.environ.get('SCORING_MAX_WORKERS', '4'))
+# Approximate token budget for the impairments payload in each agent message
+SCORING_TOKEN_BUDGET = int(os.environ.get('SCORING_TOKEN_BUDGET', '12000'))
 
 
 def get_language_instruction(language: str) -> str:
@@ -71,7 +62,7 @@ def _extract_job_id(event: dict) -> str | None:
     return event.get('jobId')
 
 
-def _get_impairments_payload(event: dict) -> list[dict]:
+def _get_impairments_payload(event: dict, loader: ClaimCheckLoader) -> list[dict]:
     if not isinstance(event, dict):
         return []
     """Prefer prior detection output; fallback to minimal stubs from legacy analysis.
@@ -81,10 +72,11 @@ def _get_impairments_payload(event: dict) -> list[dict]:
       - scoring_factors: object (may be empty; agent must still proceed)
       - evidence: list of strings (optional)
     """
-    detection_wrapper = event.get('analysisDetection')
+    detection_wrapper = loader.resolve(event.get('analysisDetection'))
     if isinstance(detection_wrapper, dict):
         # Handle nested analyze response: { status, message, analysisDetection: { impairments: [...] } }
-        inner_detection = detection_wrapper.get('analysisDetection')
+        # where the inner detection is usually a claim-check pointer
+        inner_detection = loader.resolve(detection_wrapper.get('analysisDetection'))
         candidate = inner_detection if isinstance(inner_detection, dict) else detection_wrapper
         imps = candidate.get('impairments')
         if isinstance(imps, list) and imps:
@@ -107,8 +99,7 @@ def _get_impairments_payload(event: dict) -> list[dict]:
     return payload
 
 
-# --- Tools (Bedrock KB only) ---
-@tool
+# --- Tools (Bedrock KB only); wrapped with strands' @tool when the agent is built ---
 def kb_search(canonical_term: str):
     """Return markdown for the top KB hit from Bedrock knowledge base."""
     kb_id = KNOWLEDGE_BASE_ID
@@ -130,7 +121,6 @@ def kb_search(canonical_term: str):
         return f"KB retrieval error: {e}"
 
 
-@tool
 def calculator(values: list[float]):
     """Calculates the sum of a list of numbers. Use this for adding up credits (negative numbers) and debits (positive numbers)."""
     try:
@@ -215,74 +205,126 @@ Finally, return a single JSON object exactly like this:
 """
 
 
+# Warm-container caches: one BedrockModel per model id and a free list of prebuilt
+# agents per (insurance type, language, model id). Agents are not safe for
+# concurrent use, so fan-out workers each check out their own.
+_MODELS: dict = {}
+_AGENT_POOL: dict[tuple, list] = {}
+_POOL_LOCK = threading.Lock()
+
+
+def _get_model(model_id: str) -> object:
+    with _POOL_LOCK:
+        model = _MODELS.get(model_id)
+        if model is None:
+            model_start = time.time()
+            from botocore.config import Config
+            from strands.models import BedrockModel
+            # Configure BedrockModel with adaptive retry
+            retrying_cfg = Config(
+                retries={"mode": "adaptive", "max_attempts": 12}
+            )
+            model = BedrockModel(
+                model_id=model_id,
+                boto_session=aws_clients.session(),
+                boto_client_config=retrying_cfg
+            )
+            _MODELS[model_id] = model
+            log_timing(f"Create BedrockModel {model_id}", model_start)
+    return model
+
+
 def _build_agent(insurance_type: str | None, language: str = 'en-US') -> object:
-    # Configure BedrockModel with adaptive retry
-    retrying_cfg = Config(
-        retries={"mode": "adaptive", "max_attempts": 12}
-    )
-    model = BedrockModel(
-        model_id=MODEL_ID,
-        boto_client_config=retrying_cfg
-    )
-    print(f"[_build_agent] Created BedrockModel with adaptive retry (max_attempts=12), language={language}")
-    
+    build_start = time.time()
+    from strands import Agent, tool
+    model = _get_model(MODEL_ID)
     itype = (insurance_type or '').lower()
     if itype == 'life':
-        return Agent(
+        agent = Agent(
             system_prompt=_get_life_prompt(language),
-            tools=[kb_search, calculator],
+            tools=[tool(kb_search), tool(calculator)],
             model=model,
         )
     else:
         # property_casualty: exclude KB tool
-        return Agent(
+        agent = Agent(
             system_prompt=_get_pc_prompt(language),
-            tools=[calculator],
+            tools=[tool(calculator)],
             model=model,
         )
+    log_timing(f"Build scoring agent ({itype or 'property_casualty'}, {language})", build_start)
+    return agent
+
+
+def _agent_key(insurance_type: str | None, language: str) -> tuple:
+    itype = 'life' if (insurance_type or '').lower() == 'life' else 'property_casualty'
+    return (itype, language, MODEL_ID)
+
+
+def _acquire_agent(insurance_type: str | None, language: str = 'en-US') -> tuple[tuple, object]:
+    """Check out a warm agent for this key, building one only when the free list is empty."""
+    key = _agent_key(insurance_type, language)
+    with _POOL_LOCK:
+        free = _AGENT_POOL.setdefault(key, [])
+        agent = free.pop() if free else None
+    if agent is not None:
+        print(f"[_acquire_agent] Reusing warm agent for {key}")
+        return key, agent
+    return key, _build_agent(insurance_type, language)
+
+
+def _release_agent(key: tuple, agent: object) -> None:
+    """Reset conversation state and return the agent to the free list."""
+    try:
+        agent.messages = []
+        loop_metrics = getattr(agent, 'event_loop_metrics', None)
+        if loop_metrics is not None:
+            agent.event_loop_metrics = type(loop_metrics)()
+    except Exception as e:
+        print(f"[_release_agent] WARNING: Could not reset agent, discarding it: {e}")
+        return
+    with _POOL_LOCK:
+        _AGENT_POOL.setdefault(key, []).append(agent)
+
+
+def _required_factor_keys(item: dict) -> list[str]:
+    """Scoring factor keys that the impairment's manual rating tables are keyed on."""
+    factors = item.get('scoring_factors')
+    if not isinstance(factors, dict):
+        return []
+    try:
+        import rating_engine
+        required = rating_engine.required_factors(item, rating_engine.load_rules())
+        return [k for k in factors if rating_engine.is_required_factor(k, required)]
+    except Exception as e:
+        print(f"[_required_factor_keys] WARNING: Could not read rating rules: {e}")
+        return []
 
 
 def _to_agent_message(payload: list[dict]) -> str:
-    # Truncate oversize evidence strings for resilience
-    safe_payload: list[dict] = []
-    for item in (payload or [])[:20]:
-        obj = dict(item)
-        ev = obj.get('evidence') or []
-        if isinstance(ev, list):
-            trimmed = []
-            for s in ev[:10]:
-                if isinstance(s, str):
-                    trimmed.append(s[:500])
-                elif isinstance(s, dict) and 'text' in s:
-                    trimmed.append(str(s.get('text'))[:500])
-            obj['evidence'] = trimmed
-        # prevent very large scoring factor values
-        factors = obj.get('scoring_factors') or {}
-        if isinstance(factors, dict):
-            limited = {}
-            for k, v in list(factors.items())[:30]:
-                if isinstance(v, str):
-                    limited[k] = v[:400]
-                else:
-                    limited[k] = v
-            obj['scoring_factors'] = limited
-        safe_payload.append(obj)
+    # Fill a token budget, most severe impairments first, instead of fixed-count truncation
+    safe_payload, stats = compact_impairments(payload, SCORING_TOKEN_BUDGET, required_for=_required_factor_keys)
+    print(f"[_to_agent_message] Compacted {stats['impairments']} impairments to ~{stats['tokens']} tokens "
+          f"(stubbed={stats['stubbed']}, evidence dropped={stats['evidence_dropped']}, factors dropped={stats['factors_dropped']})")
     return "Here is the JSON payload of impairments to score:\n\n" + json.dumps(safe_payload, indent=2)
 
 
 def _run_agent_scoring(payload: list[dict], insurance_type: str | None, language: str = 'en-US') -> dict:
     agent_start = time.time()
-    print(f"[_run_agent_scoring] Building agent for insurance_type={insurance_type}, language={language}")
-    agent = _build_agent(insurance_type, language)
+    print(f"[_run_agent_scoring] Acquiring agent for insurance_type={insurance_type}, language={language}")
+    agent_key, agent = _acquire_agent(insurance_type, language)
     message = _to_agent_message(payload)
     print(f"[_run_agent_scoring] Agent input message size: {len(message)} bytes")
     print(f"[_run_agent_scoring] Invoking Strands agent...")
     invoke_start = time.time()
     try:
         res = agent(message)
-        log_timing("Strands scoring agent invocation", invoke_start)
+        log_timing("Strands scoring agent invocation", invoke_start, metric='AgentInvocation')
+        metrics.record_agent(res)
+        _release_agent(agent_key, agent)
     except Exception as agent_error:
         log_timing("Strands scoring agent invocation (FAILED)", invoke_start)
+        metrics.count('ModelErrors')
         print(f"[_run_agent_scoring] ERROR: Strands agent invocation failed: {type(agent_error).__name__}: {agent_error}")
         import traceback
         traceback.print_exc()
@@ -319,6 +361,130 @@ def _run_agent_scoring(payload: list[dict], insurance_type: str | None, language
         return {"total_score": 0, "impairment_scores": []}
 
 
+def _sum_sub_totals(impairment_scores: list[dict]) -> int | float:
+    total = 0.0
+    for s in impairment_scores:
+        try:
+            total += float(s.get('sub_total') or 0)
+        except (TypeError, ValueError):
+            continue
+    return int(total) if total.is_integer() else total
+
+
+def _missing_score(impairment_id) -> dict:
+    return {'impairment_id': impairment_id, 'sub_total': 0, 'reason': 'Scoring agent did not return a result for this impairment.'}
+
+
+def _norm_id(impairment_id) -> str:
+    return str(impairment_id or '').strip().lower()
+
+
+def _score_one_impairment(item: dict, insurance_type: str | None, language: str) -> list[dict]:
+    impairment_id = item.get('impairment_id') if isinstance(item, dict) else None
+    try:
+        result = _run_agent_scoring([item], insurance_type, language)
+        scores = [s for s in result.get('impairment_scores') or [] if isinstance(s, dict)]
+    except Exception as e:
+        print(f"[_score_one_impairment] ERROR: Scoring failed for {impairment_id!r}: {e}")
+        scores = []
+    if not scores:
+        return [_missing_score(impairment_id)]
+    # A single-impairment call should yield one score; keep the id we asked about
+    scores = scores[:1]
+    scores[0]['impairment_id'] = scores[0].get('impairment_id') or impairment_id
+    return scores
+
+
+def _run_agent_scoring_fanout(payload: list[dict], insurance_type: str | None, language: str = 'en-US') -> dict:
+    """Score each impairment in its own agent call and aggregate deterministically."""
+    fanout_start = time.time()
+    items = [item for item in payload or [] if isinstance(item, dict)]
+    if not items:
+        return {"total_score": 0, "impairment_scores": []}
+    workers = max(1, min(SCORING_MAX_WORKERS, len(items)))
+    print(f"[_run_agent_scoring_fanout] Scoring {len(items)} impairments with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() preserves payload order, so the aggregate is independent of completion order
+        per_item = list(pool.map(lambda item: _score_one_impairment(item, insurance_type, language), items))
+    impairment_scores = [s for scores in per_item for s in scores]
+    total = _sum_sub_totals(impairment_scores)
+    log_timing("Fan-out agent scoring", fanout_start, metric='AgentFanOut')
+    return {
+        'total_score': total,
+        'impairment_scores': impairment_scores,
+    }
+
+
+def _run_agent(payload: list[dict], insurance_type: str | None, language: str = 'en-US') -> dict:
+    if SCORING_STRATEGY == 'fanout':
+        return _run_agent_scoring_fanout(payload, insurance_type, language)
+    return _run_agent_scoring(payload, insurance_type, language)
+
+
+def _score_with_rules(payload: list[dict], insurance_type: str | None) -> tuple[list[dict], list[dict]]:
+    """Score what the compiled manual rules can resolve; return (rule scores, remaining payload)."""
+    if RATING_ENGINE_MODE != 'hybrid' or (insurance_type or '').lower() != 'life' or not payload:
+        return [], payload
+    rules_start = time.time()
+    try:
+        import rating_engine
+        scored, remaining = rating_engine.score_impairments(payload)
+    except Exception as e:
+        print(f"[_score_with_rules] WARNING: Rating engine failed, falling back to agent: {e}")
+        return [], payload
+    log_timing("Rule-based scoring", rules_start, metric='RuleScoring')
+    print(f"[_score_with_rules] Resolved {len(scored)} of {len(payload)} impairments from manual rules")
+    return scored, remaining
+
+
+def _score_impairments(payload: list[dict], insurance_type: str | None, language: str = 'en-US') -> dict:
+    """Hybrid scoring: deterministic rules first, agent only for unresolved impairments."""
+    rule_scores, remaining = _score_with_rules(payload, insurance_type)
+    if not rule_scores:
+        result = _run_agent(payload, insurance_type, language)
+        result.setdefault('scoring_method', 'agent')
+        return result
+
+    agent_scores: list[dict] = []
+    if remaining:
+        try:
+            agent_result = _run_agent(remaining, insurance_type, language)
+            agent_scores = [s for s in agent_result.get('impairment_scores') or [] if isinstance(s, dict)]
+        except Exception as e:
+            # Keep the rule scores; every remaining impairment gets a placeholder below
+            print(f"[_score_impairments] ERROR: Agent scoring of unresolved impairments failed: {e}")
+        for s in agent_scores:
+            s.setdefault('method', 'agent')
+        # An impairment the agent skipped must not silently drop out of the scores and the total
+        returned = {_norm_id(s.get('impairment_id')) for s in agent_scores}
+        for item in remaining:
+            impairment_id = item.get('impairment_id') if isinstance(item, dict) else None
+            if _norm_id(impairment_id) not in returned:
+                agent_scores.append({**_missing_score(impairment_id), 'method': 'agent'})
+
+    impairment_scores = []
+    for s in rule_scores:
+        entry = {
+            'impairment_id': s['impairment_id'],
+            'sub_total': s['sub_total'],
+            'reason': s['reason'],
+            'method': 'rules',
+            'components': s['components'],
+        }
+        for key in ('flat_extras', 'unrated_factors'):
+            if key in s:
+                entry[key] = s[key]
+        impairment_scores.append(entry)
+    impairment_scores.extend(agent_scores)
+
+    total = _sum_sub_totals(impairment_scores)
+    return {
+        'total_score': total,
+        'impairment_scores': impairment_scores,
+        'scoring_method': 'hybrid' if agent_scores or remaining else 'rules',
+    }
+
+
 def _write_trace(job_id: str, trace_obj: dict) -> str | None:
     if not (TRACE_BUCKET and job_id):
         return None
@@ -327,6 +493,7 @@ def _write_trace(job_id: str, trace_obj: dict) -> str | None:
     return key
 
 
+@metrics.handler
 def lambda_handler(event, context):
     handler_start = time.time()
     print(f"[score] === SCORE LAMBDA START === remaining_time={context.get_remaining_time_in_millis()}ms")
@@ -337,9 +504,7 @@ def lambda_handler(event, context):
             print(f"[score] Parsed event from JSON string")
         except Exception as e:
             print(f"[score] WARNING: Could not parse event as JSON: {e}")
-    print(f"[score] Event keys: {list(event.keys()) if isinstance(event, dict) else 'not a dict'}")
-    print(f"[score] Event size: {len(json.dumps(event))} bytes")
-    print(f"[score] Event preview: {json.dumps(event)[:2000]}")
+    print(f"[score] Event keys: {describe_event(event)}")
     job_id = _extract_job_id(event)
     print(f"[score] Extracted job_id: {job_id}")
 
@@ -361,7 +526,8 @@ def lambda_handler(event, context):
 
     # Build payload for the scoring agent
     print(f"[score] Step 2: Building impairments payload, remaining_time={context.get_remaining_time_in_millis()}ms")
-    impairments_payload = _get_impairments_payload(event)
+    loader = ClaimCheckLoader(s3)
+    impairments_payload = _get_impairments_payload(event, loader)
     print(f"[score] Impairments payload count: {len(impairments_payload)}")
     if impairments_payload:
         print(f"[score] Impairments payload preview: {json.dumps(impairments_payload[:2])[:1000]}")
@@ -383,6 +549,7 @@ def lambda_handler(event, context):
         print(f"[score] WARNING: Error getting insurance type: {e}")
         insurance_type = insurance_type or 'property_casualty'
     print(f"[score] Final insurance_type: {insurance_type}")
+    metrics.tag(job_id=job_id, insurance_type=insurance_type, model_id=MODEL_ID)
 
     # Read user language preference from DynamoDB
     user_language = 'en-US'
@@ -399,12 +566,12 @@ def lambda_handler(event, context):
         except Exception as e:
             print(f"[score] Error reading userLanguage: {e}")
 
-    # Run the Strands scoring agent; preserve raw output
-    print(f"[score] Step 4: Running Strands scoring agent, remaining_time={context.get_remaining_time_in_millis()}ms")
+    # Score from the manual rules where possible, Strands agent for the rest; preserve raw output
+    print(f"[score] Step 4: Scoring impairments (mode={RATING_ENGINE_MODE}, strategy={SCORING_STRATEGY}), remaining_time={context.get_remaining_time_in_millis()}ms")
     agent_raw: dict
     agent_start = time.time()
     try:
-        agent_raw = _run_agent_scoring(impairments_payload, insurance_type, user_language)
+        agent_raw = _score_impairments(impairments_payload, insurance_type, user_language)
         log_timing("Agent scoring", agent_start)
         print(f"[score] Agent scoring completed, total_score={agent_raw.get('total_score')}")
     except Exception as e:
@@ -443,7 +610,7 @@ def lambda_handler(event, context):
                 ExpressionAttributeNames={'#as': 'analysisScoringJsonStr', '#st': 'scoringTimestamp'},
                 ExpressionAttributeValues={':as': {'S': scoring_json}, ':st': {'S': ts}}
             )
-            log_timing("DynamoDB persist scoring", ddb_start)
+            log_timing("DynamoDB persist scoring", ddb_start, metric='DynamoDB')
             print(f"[score] Persisted analysisScoringJsonStr for job {job_id}")
         except Exception as e:
             print(f"[score] ERROR: DynamoDB update error: {e}")
@@ -452,12 +619,15 @@ def lambda_handler(event, context):
 
     log_timing("Total SCORE lambda execution", handler_start)
     print(f"[score] === SCORE LAMBDA COMPLETE === remaining_time={context.get_remaining_time_in_millis()}ms")
+    scores = agent_raw.get('impairment_scores') if isinstance(agent_raw, dict) else None
     result = {
         'status': 'SUCCESS',
         'message': 'Scoring completed',
-        'scoring': agent_raw
+        'scoring': offload(job_id, 'scoring', agent_raw, {
+            'total_score': agent_raw.get('total_score'),
+            'impairments': len(scores) if isinstance(scores, list) else 0,
+        })
     }
-    print(f"[score] Returning result, size={len(json.dumps(result))} bytes")
     return result
 
 
@@ -0,0 +1,857 @@
+"""Deterministic rating engine for the life underwriting manual.
+
+The manual's impairment pages (knowledge-base/manual/3-medical-impairments/**)
+describe ratings as markdown tables. This module has two halves:
+
+- ``compile_manual`` parses those tables into structured rule sets (factor
+  conditions -> debits/credits, decline/postpone outcomes) and is run offline
+  to produce ``rating_rules.json`` shipped with the score Lambda:
+
+      python rating_engine.py ../../../knowledge-base/manual rating_rules.json
+
+- ``score_impairment`` evaluates one detection payload item against the
+  compiled rules in-process. Items the rules cannot resolve are reported as
+  unresolved so the caller can hand only those to the scoring agent.
+"""
+import json
+import os
+import re
+import sys
+from datetime import date, datetime
+
+RULES_VERSION = 1
+
+# Manual convention (1-foundations/risk_classes_nomenclature.md): Table N = +25*N points
+POINTS_PER_TABLE = 25
+
+_OUTCOME_HEADERS = {
+    'points', 'rating', 'rating adjustment', 'additional rating',
+    'points adjustment', 'rating impact',
+}
+
+_STOPWORDS = {
+    'a', 'an', 'and', 'or', 'the', 'of', 'with', 'without', 'for', 'in', 'on',
+    'to', 'at', 'by', 'from', 'as', 'is', 'are', 'any', 'history', 'status',
+    'mmhg', 'kg', 'm2', 'mg', 'dl', 'ml', 'min', 'level', 'levels',
+}
+
+_NEGATIVE_VALUES = {
+    'no', 'none', 'false', 'negative', 'denies', 'denied', 'absent', 'never',
+    'n/a', 'na', 'unknown', 'none evident', 'not present', 'not applicable',
+    'none reported', 'none noted', 'not evident', 'nil',
+}
+
+# Phrase -> canonical token. Applied to both manual headers and scoring factor keys.
+_FACTOR_ALIASES = [
+    ('average blood pressure', 'bp'),
+    ('blood pressure', 'bp'),
+    ('average bp', 'bp'),
+    ('hemoglobin a1c', 'a1c'),
+    ('glycated hemoglobin', 'a1c'),
+    ('hba1c', 'a1c'),
+    ('body mass index', 'bmi'),
+    ('estimated gfr', 'gfr'),
+    ('egfr', 'gfr'),
+    ('gfr category', 'gfr'),
+    ('left ventricular ejection fraction', 'ef'),
+    ('ejection fraction', 'ef'),
+    ('lvef', 'ef'),
+    ('time since diagnosis', 'duration'),
+    ('years since diagnosis', 'duration'),
+    ('duration of diabetes', 'duration'),
+    ('disease duration', 'duration'),
+    ('current age', 'age'),
+    ('applicant age', 'age'),
+]
+
+_UNRESOLVED_OUTCOME_MARKERS = (
+    'individual consideration', 'rate for both', 'rate as', 'rate for',
+    'refer', 'case by case', 'case-by-case', 'depends', 'minimal additional',
+    'best possible', 'from standard',
+)
+
+_NUM = r'[+-]?\d+(?:\.\d+)?'
+
+
+# ---------------------------------------------------------------------------
+# Text helpers
+# ---------------------------------------------------------------------------
+
+def _clean_cell(text: str) -> str:
+    return re.sub(r'\*+', '', text or '').strip()
+
+
+def _strip_parens(text: str) -> str:
+    return re.sub(r'\([^)]*\)', ' ', text or '')
+
+
+def _compact_key(text: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', (text or '').lower())
+
+
+def _tokens(text: str) -> list[str]:
+    words = re.findall(r'[a-z0-9]+(?:\.[0-9]+)?', (text or '').lower())
+    return [w for w in words if w not in _STOPWORDS]
+
+
+def _label_tokens(text: str) -> list[str]:
+    """Significant words of a row/bullet label, ignoring numbers and parentheticals."""
+    return [t for t in _tokens(_strip_parens(text)) if not re.match(r'^\d', t)]
+
+
+def _canonical_factor(text: str) -> frozenset:
+    """Canonical token set used to match manual headers against scoring factor keys."""
+    lowered = ' ' + re.sub(r'[_\-/]+', ' ', _strip_parens(text).lower()) + ' '
+    for phrase, canon in _FACTOR_ALIASES:
+        lowered = re.sub(r'\b' + re.escape(phrase) + r'\b', f' {canon} ', lowered)
+    tokens = [t for t in _tokens(lowered) if not re.match(r'^\d', t) and t not in ('average', 'mean', 'current')]
+    return frozenset(tokens)
+
+
+def _factor_names_match(header: frozenset, key: frozenset) -> bool:
+    if not header or not key:
+        return False
+    return header == key or header <= key or key <= header
+
+
+def _is_negative(value) -> bool:
+    if value is None or value is False:
+        return True
+    if isinstance(value, (int, float)):
+        return False
+    text = str(value).strip().lower().rstrip('.')
+    if text in _NEGATIVE_VALUES:
+        return True
+    return bool(re.match(r'^(no|none|denies|negative|not)\b', text))
+
+
+def _factor_text(key, value) -> str:
+    if value is True:
+        return str(key)
+    if isinstance(value, (list, tuple)):
+        value = ' '.join(str(v) for v in value)
+    elif isinstance(value, dict):
+        value = ' '.join(f'{k} {v}' for k, v in value.items())
+    return f'{key} {value}'
+
+
+# ---------------------------------------------------------------------------
+# Conditions and outcomes
+# ---------------------------------------------------------------------------
+
+def _unit_scale(text: str) -> float | None:
+    """Return the factor that converts a temporal quantity to years (None if not temporal)."""
+    t = text.lower()
+    if re.search(r'\bmonths?\b|\bmos?\b', t):
+        return 1.0 / 12
+    if re.search(r'\bweeks?\b|\bwks?\b', t):
+        return 1.0 / 52
+    if re.search(r'\bdays?\b', t):
+        return 1.0 / 365
+    if re.search(r'\byears?\b|\byrs?\b', t):
+        return 1.0
+    return None
+
+
+def _decimals(num: str) -> int:
+    return len(num.split('.')[1]) if '.' in num else 0
+
+
+def _parse_range(part: str, scale: float) -> list | None:
+    """Parse one numeric condition into [low, high, low_inclusive, high_inclusive]."""
+    p = part.strip().replace('≤', '<=').replace('≥', '>=').replace('–', '-').replace('—', '-')
+    p = p.replace(',', '')
+    m = re.match(r'^(<=|>=|<|>)\s*(\d+(?:\.\d+)?)', p)
+    if m:
+        op, num = m.group(1), float(m.group(2)) * scale
+        if op == '<':
+            return [None, num, False, False]
+        if op == '<=':
+            return [None, num, False, True]
+        if op == '>':
+            return [num, None, False, False]
+        return [num, None, True, False]
+    m = re.match(r'^(\d+(?:\.\d+)?)\s*(?:-|to)\s*(\d+(?:\.\d+)?)', p)
+    if m:
+        low, high = float(m.group(1)), float(m.group(2))
+        # Close the gap to the next row ("6.6-7.0" then "7.1-7.5")
+        step = 10 ** -_decimals(m.group(2))
+        return [low * scale, (high + step) * scale, True, False]
+    m = re.match(r'^(\d+(?:\.\d+)?)\s*\+', p)
+    if m:
+        return [float(m.group(1)) * scale, None, True, False]
+    m = re.match(r'^(\d+(?:\.\d+)?)\s*(%|years?|months?|weeks?|days?)?\s*$', p)
+    if m:
+        num = float(m.group(1))
+        step = 10 ** -_decimals(m.group(1))
+        return [num * scale, (num + step) * scale, True, False]
+    return None
+
+
+def parse_condition(text: str) -> dict:
+    """Turn a table cell or header fragment into a matchable condition."""
+    raw = _clean_cell(text)
+    scale = _unit_scale(raw)
+    ranges = []
+    # Numeric conditions may live in the cell itself ("141-150/91-95") or in a
+    # parenthetical ("G3a (45-59)", "Mild (<50% stenosis)").
+    # A leading comparison applies to every part of a compound value ("≤140/90", ">180/110").
+    candidates = [_strip_parens(raw)] + re.findall(r'\(([^)]*)\)', raw)
+    for cand in candidates:
+        cand = cand.strip()
+        parts = [c for c in re.split(r'\s*/\s*', cand) if c]
+        op = re.match(r'^(<=|>=|[<>≤≥])\s*\d', parts[0]) if parts else None
+        if op and len(parts) > 1:
+            parts = [parts[0]] + [op.group(1) + c if re.match(r'^\d', c) else c for c in parts[1:]]
+        parsed = [_parse_range(c, scale or 1.0) for c in parts]
+        if parsed and all(parsed):
+            ranges = parsed
+            break
+    tokens = _label_tokens(raw)
+    wildcard = raw.lower() in ('', 'any', 'all', 'n/a', '-', '—')
+    return {
+        'text': raw,
+        'tokens': tokens,
+        'ranges': ranges,
+        'temporal': scale is not None,
+        'wildcard': wildcard,
+    }
+
+
+def parse_outcome(text: str) -> dict:
+    """Parse a points/rating cell into debits/credits and decline/postpone actions."""
+    raw = _clean_cell(text)
+    t = raw.lower().replace('–', '-').replace('—', '-')
+    outcome = {'text': raw, 'low': None, 'high': None, 'action': None, 'alt_action': None, 'flat_extra': None}
+
+    flat = re.search(r'\$\s*\d+(?:\.\d+)?\s*/\s*1000[^,;]*', t)
+    if flat:
+        outcome['flat_extra'] = raw[flat.start():flat.end()].strip()
+        t = (t[:flat.start()] + t[flat.end():]).strip().rstrip('+').strip()
+
+    if re.search(r'\bor\s+decline\b', t):
+        outcome['alt_action'] = 'decline'
+    elif re.search(r'\bor\s+postpone\b', t):
+        outcome['alt_action'] = 'postpone'
+
+    if re.match(r'^(decline|uninsurable)', t):
+        outcome['action'] = 'decline'
+        return outcome
+    if re.match(r'^postpone', t):
+        outcome['action'] = 'postpone'
+        return outcome
+    if any(marker in t for marker in _UNRESOLVED_OUTCOME_MARKERS):
+        return outcome
+
+    if re.match(r'^(no adjustment|no additional|no rating)', t):
+        outcome['low'] = outcome['high'] = 0.0
+        return outcome
+    if re.match(r'^(standard|preferred)', t):
+        outcome['low'] = outcome['high'] = 0.0
+        m = re.search(r'\bto\s+table\s+(\d+)', t)
+        if m:
+            outcome['high'] = float(m.group(1)) * POINTS_PER_TABLE
+        m = re.search(r'\bto\s+\+?(\d+)\s*points?', t)
+        if m:
+            outcome['high'] = float(m.group(1))
+        return outcome
+
+    if 'table' in t:
+        m = (re.search(r'table\s+(\d+)\s*-\s*(\d+)', t)
+             or re.search(r'([+-]?\d+)\s*(?:to|-)\s*\+?(\d+)\s*tables?', t))
+        if m:
+            sign = -1 if m.group(1).startswith('-') else 1
+            outcome['low'] = sign * abs(float(m.group(1))) * POINTS_PER_TABLE
+            outcome['high'] = sign * abs(float(m.group(2))) * POINTS_PER_TABLE
+            return outcome
+        m = re.search(r'table\s+(\d+)\s*\+', t)
+        if m:
+            outcome['low'] = float(m.group(1)) * POINTS_PER_TABLE
+            return outcome
+        m = re.search(r'table\s+(\d+)', t) or re.search(r'([+-]?\d+)\s*tables?', t)
+        if m:
+            outcome['low'] = outcome['high'] = float(m.group(1)) * POINTS_PER_TABLE
+            return outcome
+        return outcome
+
+    m = re.search(rf'({_NUM})\s*(?:points?\s*)?(?:to|-)\s*({_NUM})', t)
+    if m:
+        low, high = float(m.group(1)), float(m.group(2))
+        if m.group(1).startswith('-') and not m.group(2).startswith(('+', '-')):
+            high = -high
+        outcome['low'], outcome['high'] = low, high
+        return outcome
+    m = re.search(rf'({_NUM})\s*(?:points?)?', t)
+    if m:
+        outcome['low'] = outcome['high'] = float(m.group(1))
+    return outcome
+
+
+def _outcome_points(outcome: dict) -> float | None:
+    """Debit/credit to apply: the lower bound per manual guidance ("use the lower number")."""
+    return outcome.get('low')
+
+
+# ---------------------------------------------------------------------------
+# Markdown parsing
+# ---------------------------------------------------------------------------
+
+def _split_row(line: str) -> list[str]:
+    body = line.strip()
+    if body.startswith('|'):
+        body = body[1:]
+    if body.endswith('|'):
+        body = body[:-1]
+    return [c.strip() for c in body.split('|')]
+
+
+def _iter_blocks(markdown: str):
+    """Yield ('heading', level, text), ('table', rows) and ('bullet', text) blocks in order."""
+    lines = markdown.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        heading = re.match(r'^(#{1,6})\s+(.*)$', line)
+        if heading:
+            yield ('heading', len(heading.group(1)), heading.group(2).strip())
+            i += 1
+            continue
+        if line.strip().startswith('|'):
+            rows = []
+            while i < len(lines) and lines[i].strip().startswith('|'):
+                rows.append(_split_row(lines[i]))
+                i += 1
+            yield ('table', rows)
+            continue
+        bullet = re.match(r'^\s*(?:[-*]|\d+\.)\s+(.*)$', line)
+        if bullet:
+            yield ('bullet', bullet.group(1).strip())
+        i += 1
+
+
+def _grid_columns(headers: list[str]) -> tuple[str, list[str]] | None:
+    """Detect 'Factor <cond>' column groups like 'Age <40 | Age 40-60 | Age >60'."""
+    for start in range(1, len(headers) - 1):
+        tail = headers[start:]
+        words = [h.split() for h in tail]
+        if any(len(w) < 2 for w in words):
+            continue
+        prefix = words[0][0]
+        if all(w[0].lower() == prefix.lower() for w in words):
+            return prefix, [' '.join(w[1:]) for w in words]
+    return None
+
+
+def _compile_table(rows: list[list[str]], title: str, section: str) -> dict | None:
+    if len(rows) < 3:
+        return None
+    headers = [_clean_cell(h) for h in rows[0]]
+    body = [r for r in rows[1:] if not all(re.match(r'^:?-{2,}:?$', c) for c in r if c)]
+    if not body:
+        return None
+
+    grid = _grid_columns(headers)
+    last_header = headers[-1].lower()
+    if grid:
+        grid_factor, grid_conditions = grid
+        n_lead = len(headers) - len(grid_conditions)
+        lead_headers = headers[:n_lead]
+        kind = 'grid'
+    elif last_header in _OUTCOME_HEADERS:
+        lead_headers = headers[:-1]
+        kind = 'points'
+    else:
+        return None
+
+    dimensions = [{'factor': h, 'canonical': sorted(_canonical_factor(h))} for h in lead_headers]
+    if kind == 'grid':
+        dimensions.append({'factor': grid_factor, 'canonical': sorted(_canonical_factor(grid_factor))})
+
+    compiled_rows = []
+    previous_lead = [''] * len(lead_headers)
+    for row in body:
+        cells = (row + [''] * len(headers))[:len(headers)]
+        lead = []
+        for idx in range(len(lead_headers)):
+            cell = _clean_cell(cells[idx])
+            # Blank lead cells continue the group above (markdown has no rowspan)
+            lead.append(cell if cell else previous_lead[idx])
+        previous_lead = lead
+        lead_conditions = [parse_condition(c) for c in lead]
+        if kind == 'grid':
+            for offset, grid_cond in enumerate(grid_conditions):
+                outcome = parse_outcome(cells[n_lead + offset])
+                compiled_rows.append({
+                    'label': ' / '.join([c for c in lead if c] + [f'{grid_factor} {grid_cond}']),
+                    'conditions': lead_conditions + [parse_condition(grid_cond)],
+                    'outcome': outcome,
+                })
+        else:
+            compiled_rows.append({
+                'label': ' / '.join(c for c in lead if c),
+                'conditions': lead_conditions,
+                'outcome': parse_outcome(cells[-1]),
+            })
+
+    in_rating_section = 'rating' in section.lower()
+    numeric_dims = any(r['conditions'][i]['ranges'] for r in compiled_rows for i in range(len(dimensions)))
+    role = 'primary' if in_rating_section and (len(dimensions) > 1 or numeric_dims) else 'adjustment'
+    return {
+        'title': title,
+        'section': section,
+        'kind': kind,
+        'role': role,
+        'dimensions': dimensions,
+        'rows': compiled_rows,
+    }
+
+
+def _compile_bullet(text: str) -> dict | None:
+    m = re.match(r'^(?:\*\*)?([^:]{3,120}?)(?:\*\*)?:\s*(.+)$', text)
+    if not m:
+        return None
+    label, outcome_text = _clean_cell(m.group(1)), m.group(2)
+    if not re.match(r'^\s*[+-]\s*\d|^\s*(?:add\s+)?[+-]?\d+\s*(?:to\s+[+-]?\d+\s*)?(?:points?|tables?)', outcome_text.lower()):
+        return None
+    outcome = parse_outcome(outcome_text)
+    if outcome['low'] is None and not outcome['action']:
+        return None
+    condition = parse_condition(label)
+    name = re.sub(r'\s*(?:<=|>=|[<>≤≥])\s*\d.*$', '', _strip_parens(label)).strip()
+    return {
+        'label': label,
+        'name': name,
+        'canonical': sorted(_canonical_factor(name)),
+        'condition': condition,
+        'tokens': _label_tokens(label),
+        'outcome': outcome,
+    }
+
+
+def compile_markdown(markdown: str, rel_path: str) -> dict | None:
+    """Compile one impairment page into a rule set."""
+    title = ''
+    h2 = ''
+    h3 = ''
+    tables = []
+    modifiers = []
+    criteria = {'postpone': [], 'decline': []}
+    criteria_mode = None
+    for block in _iter_blocks(markdown):
+        if block[0] == 'heading':
+            level, text = block[1], block[2]
+            if level == 1 and not title:
+                title = text
+            elif level == 2:
+                h2, h3 = text, ''
+                criteria_mode = None
+            elif level >= 3:
+                h3 = text
+                lowered = text.lower()
+                if 'postpone' in h2.lower() or 'decline' in h2.lower():
+                    criteria_mode = 'decline' if 'decline' in lowered else 'postpone' if 'postpone' in lowered else None
+        elif block[0] == 'table':
+            table = _compile_table(block[1], h3 or h2, h2)
+            if table:
+                tables.append(table)
+        elif block[0] == 'bullet':
+            text = block[1]
+            if criteria_mode and not text.startswith('-'):
+                criteria[criteria_mode].append(_clean_cell(text))
+                continue
+            modifier = _compile_bullet(text)
+            if modifier:
+                modifier['section'] = h3 or h2
+                modifiers.append(modifier)
+    if not tables and not modifiers:
+        return None
+
+    stem = os.path.splitext(os.path.basename(rel_path))[0]
+    aliases = {_compact_key(stem), _compact_key(title), _compact_key(_strip_parens(title))}
+    aliases.update(_compact_key(a) for a in re.findall(r'\(([^)]*)\)', title))
+    aliases.add(_compact_key(re.sub(r'\bmellitus\b', '', title, flags=re.I)))
+    return {
+        'title': title or stem,
+        'path': rel_path,
+        'aliases': sorted(a for a in aliases if a),
+        'tables': tables,
+        'modifiers': modifiers,
+        'criteria': {k: [{'text': c, 'tokens': _label_tokens(c)} for c in v] for k, v in criteria.items()},
+    }
+
+
+def compile_manual(manual_root: str) -> dict:
+    """Compile every impairment page under ``<manual_root>/3-medical-impairments``."""
+    impairments_root = os.path.join(manual_root, '3-medical-impairments')
+    rule_sets = {}
+    for dirpath, _dirnames, filenames in os.walk(impairments_root):
+        for filename in sorted(filenames):
+            if not filename.endswith('.md') or filename.lower() == 'readme.md':
+                continue
+            full = os.path.join(dirpath, filename)
+            rel = os.path.relpath(full, manual_root).replace(os.sep, '/')
+            with open(full, encoding='utf-8') as fh:
+                compiled = compile_markdown(fh.read(), rel)
+            if compiled:
+                rule_sets[os.path.splitext(filename)[0]] = compiled
+    return {'version': RULES_VERSION, 'pointsPerTable': POINTS_PER_TABLE, 'ruleSets': dict(sorted(rule_sets.items()))}
+
+
+# ---------------------------------------------------------------------------
+# Evaluation
+# ---------------------------------------------------------------------------
+
+_RULES_CACHE: dict = {}
+
+
+def load_rules(path: str | None = None) -> dict:
+    """Load (and cache for the container lifetime) the compiled rules JSON."""
+    path = path or os.environ.get('RATING_RULES_PATH') or os.path.join(os.path.dirname(__file__), 'rating_rules.json')
+    cached = _RULES_CACHE.get(path)
+    if cached is None:
+        with open(path, encoding='utf-8') as fh:
+            cached = json.load(fh)
+        alias_index = {}
+        for stem, rule_set in cached.get('ruleSets', {}).items():
+            for alias in rule_set.get('aliases', []):
+                alias_index.setdefault(alias, stem)
+        cached['_aliasIndex'] = alias_index
+        _RULES_CACHE[path] = cached
+    return cached
+
+
+def find_rule_set(impairment: dict, rules: dict) -> tuple[str, dict] | tuple[None, None]:
+    rule_sets = rules.get('ruleSets', {})
+    location = impairment.get('knowledgebase_location') or ''
+    if location:
+        stem = os.path.splitext(os.path.basename(location.rstrip('/')))[0]
+        if stem in rule_sets:
+            return stem, rule_sets[stem]
+    key = _compact_key(impairment.get('impairment_id') or '')
+    stem = rules.get('_aliasIndex', {}).get(key)
+    if stem:
+        return stem, rule_sets[stem]
+    return None, None
+
+
+def _parse_years(value) -> float | None:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value or '').lower()
+    m = re.search(r'(\d{4})-(\d{2})(?:-(\d{2}))?', text)
+    if m:
+        try:
+            since = date(int(m.group(1)), int(m.group(2)), int(m.group(3) or 1))
+            return max(0.0, (date.today() - since).days / 365.25)
+        except ValueError:
+            return None
+    m = re.search(r'(\d+(?:\.\d+)?)\s*(years?|yrs?|months?|mos?|weeks?|wks?|days?)?', text)
+    if not m:
+        return None
+    scale = _unit_scale(m.group(2) or 'years') or 1.0
+    return float(m.group(1)) * scale
+
+
+def _parse_numbers(value) -> list[float]:
+    if isinstance(value, bool):
+        return []
+    if isinstance(value, (int, float)):
+        return [float(value)]
+    text = str(value or '')
+    # Keep "128/92" pairs together and ignore dates
+    text = re.sub(r'\d{4}-\d{2}(?:-\d{2})?', ' ', text)
+    m = re.search(r'(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)', text)
+    if m:
+        return [float(m.group(1)), float(m.group(2))]
+    m = re.search(r'\d+(?:\.\d+)?', text)
+    return [float(m.group(0))] if m else []
+
+
+def _in_range(value: float, rng: list) -> bool:
+    low, high, low_inc, high_inc = rng
+    if low is not None and (value < low or (value == low and not low_inc)):
+        return False
+    if high is not None and (value > high or (value == high and not high_inc)):
+        return False
+    return True
+
+
+def _match_condition(condition: dict, value, component: int | None = None) -> tuple[bool, float] | None:
+    """Return (matched, specificity) or None when the value cannot be evaluated.
+
+    ``component`` selects one part of a compound value ("145/108"): only that
+    part is compared, against the row's range for the same position.
+    """
+    if condition.get('wildcard'):
+        return True, 0.0
+    ranges = condition.get('ranges') or []
+    if ranges:
+        if condition.get('temporal'):
+            years = _parse_years(value)
+            numbers = [years] if years is not None else []
+        else:
+            numbers = _parse_numbers(value)
+        if numbers:
+            if component is not None and len(ranges) > 1 and len(numbers) >= len(ranges):
+                if component >= len(ranges):
+                    return False, 0.0
+                rng = ranges[component]
+                number = numbers[component]
+            else:
+                rng, number = ranges[0], numbers[0]
+            if not _in_range(number, rng):
+                return False, 0.0
+            return True, rng[0] or 0.0
+    tokens = condition.get('tokens') or []
+    if not tokens:
+        return None
+    if _is_negative(value) and value is not False:
+        return False, 0.0
+    value_tokens = set(_tokens(_factor_text('', value)))
+    if value is False:
+        return False, 0.0
+    return set(tokens) <= value_tokens, 0.0
+
+
+def _bind_dimensions(dimensions: list[dict], factors: dict) -> list | None:
+    keys = [(k, frozenset(_canonical_factor(str(k)))) for k in factors]
+    bound = []
+    for dim in dimensions:
+        header = frozenset(dim.get('canonical') or [])
+        match = next((k for k, canon in keys if _factor_names_match(header, canon)), None)
+        if match is None:
+            return None
+        bound.append(match)
+    return bound
+
+
+def _severity(outcome: dict) -> float:
+    if outcome.get('action') == 'decline':
+        return float('inf')
+    if outcome.get('action') == 'postpone':
+        return 1e9
+    points = _outcome_points(outcome)
+    return points if points is not None else -1e9
+
+
+def _compound_width(table: dict, bound: list, factors: dict) -> tuple[int, int] | None:
+    """(dimension index, parts) of a compound dimension such as systolic/diastolic BP"""
+    for idx, key in enumerate(bound):
+        width = max((len(row['conditions'][idx].get('ranges') or []) for row in table['rows']), default=0)
+        if width > 1 and not table['rows'][0]['conditions'][idx].get('temporal') \
+                and len(_parse_numbers(factors.get(key))) >= width:
+            return idx, width
+    return None
+
+
+def _evaluate_table(table: dict, factors: dict) -> dict | None:
+    """Best matching row. A compound value is rated one part at a time, each on its
+    own row, and the more severe outcome wins ("145/108" rates on the diastolic row)."""
+    bound = _bind_dimensions(table['dimensions'], factors)
+    if bound is None:
+        return None
+    compound = _compound_width(table, bound, factors)
+    if compound is None:
+        return _evaluate_rows(table, factors, bound)
+    idx, width = compound
+    results = [r for r in (_evaluate_rows(table, factors, bound, (idx, part)) for part in range(width)) if r]
+    if not results:
+        return None
+    return max(results, key=lambda r: _severity(r['outcome']))
+
+
+def _evaluate_rows(table: dict, factors: dict, bound: list, component: tuple[int, int] | None = None) -> dict | None:
+    best = None
+    for row in table['rows']:
+        specificity = 0.0
+        matched = True
+        for idx, (cond, key) in enumerate(zip(row['conditions'], bound)):
+            part = component[1] if component and component[0] == idx else None
+            result = _match_condition(cond, factors.get(key), part)
+            if result is None or not result[0]:
+                matched = False
+                break
+            specificity += result[1]
+        if not matched:
+            continue
+        rank = (specificity, _severity(row['outcome']))
+        if best is None or rank > best[0]:
+            best = (rank, row)
+    if best is None:
+        return None
+    return {'table': table['title'], 'row': best[1]['label'], 'outcome': best[1]['outcome'], 'factors': bound}
+
+
+def _positive_factor_texts(factors: dict) -> list[tuple[str, set]]:
+    texts = []
+    for key, value in factors.items():
+        if _is_negative(value):
+            continue
+        texts.append((key, set(_tokens(_factor_text(key, value)))))
+    return texts
+
+
+def _match_label(tokens: list[str], positive_texts: list[tuple[str, set]]) -> str | None:
+    if not tokens:
+        return None
+    wanted = set(tokens)
+    for key, text_tokens in positive_texts:
+        if wanted <= text_tokens:
+            return key
+    return None
+
+
+def _evaluate_modifier(modifier: dict, factors: dict, positive_texts: list) -> str | None:
+    canon = frozenset(modifier.get('canonical') or [])
+    condition = modifier.get('condition') or {}
+    if condition.get('ranges'):
+        # Numeric modifiers ("Age at diagnosis >50") need a factor that names them
+        for key, value in factors.items():
+            if canon and frozenset(_canonical_factor(str(key))) == canon:
+                result = _match_condition({**condition, 'tokens': []}, value)
+                return key if result and result[0] else None
+        return None
+    return _match_label(modifier.get('tokens') or [], positive_texts)
+
+
+def score_impairment(impairment: dict, rules: dict) -> dict:
+    """Score one detected impairment. ``resolved`` is False when the agent must decide."""
+    impairment_id = impairment.get('impairment_id') or ''
+    factors = impairment.get('scoring_factors') or {}
+    if not isinstance(factors, dict):
+        factors = {}
+    stem, rule_set = find_rule_set(impairment, rules)
+    result = {'impairment_id': impairment_id, 'resolved': False, 'rule_set': stem}
+    if not rule_set:
+        result['unresolved_reason'] = 'no rule set in manual'
+        return result
+
+    positive_texts = _positive_factor_texts(factors)
+    consumed = set()
+
+    base = None
+    for table in rule_set['tables']:
+        if table['role'] != 'primary':
+            continue
+        base = _evaluate_table(table, factors)
+        if base:
+            break
+    if base is None:
+        result['unresolved_reason'] = 'no rating table row matched the scoring factors'
+        return result
+    if base['outcome']['low'] is None and not base['outcome']['action']:
+        result['unresolved_reason'] = f"rating table row needs judgement: {base['outcome']['text']}"
+        return result
+    consumed.update(base['factors'])
+
+    flagged = []
+    for kind in ('decline', 'postpone'):
+        for criterion in rule_set['criteria'].get(kind, []):
+            if len(criterion['tokens']) >= 2 and _match_label(criterion['tokens'], positive_texts):
+                flagged.append(f"{kind}: {criterion['text']}")
+    if flagged:
+        result['unresolved_reason'] = 'matches manual criteria: ' + '; '.join(flagged)
+        return result
+
+    components = [{'source': base['table'], 'label': base['row'], 'outcome': base['outcome']}]
+    for table in rule_set['tables']:
+        if table['role'] != 'adjustment' or len(table['dimensions']) != 1:
+            continue
+        for row in table['rows']:
+            key = _match_label(row['conditions'][0].get('tokens') or [], positive_texts)
+            if key and (row['outcome']['low'] is not None or row['outcome']['action']):
+                consumed.add(key)
+                components.append({'source': table['title'], 'label': row['label'], 'outcome': row['outcome']})
+    seen_labels = {c['label'].lower() for c in components}
+    for modifier in rule_set['modifiers']:
+        if modifier['label'].lower() in seen_labels:
+            continue
+        key = _evaluate_modifier(modifier, factors, positive_texts)
+        if key:
+            consumed.add(key)
+            seen_labels.add(modifier['label'].lower())
+            components.append({'source': modifier['section'], 'label': modifier['label'], 'outcome': modifier['outcome']})
+
+    # Postpone/decline is a case decision, not a debit; the agent makes it
+    actions = [c for c in components if c['outcome'].get('action')]
+    if actions:
+        result['unresolved_reason'] = 'manual rating is an action: ' + '; '.join(
+            f"{c['label']} ({c['outcome']['action']})" for c in actions)
+        return result
+
+    sub_total = 0.0
+    reasons = []
+    flat_extras = []
+    for comp in components:
+        outcome = comp['outcome']
+        points = _outcome_points(outcome)
+        if points is None:
+            continue
+        sub_total += points
+        if outcome.get('flat_extra'):
+            flat_extras.append(outcome['flat_extra'])
+        reasons.append(f"{comp['label']} ({comp['source']}): {points:+g} [{outcome['text']}]")
+
+    unrated = sorted(k for k, _ in positive_texts if k not in consumed)
+    reason = f"Rated from the underwriting manual entry for {rule_set['title']}. " + '. '.join(reasons) + '.'
+    if unrated:
+        reason += f" Factors without a manual rating rule: {', '.join(str(u) for u in unrated)}."
+    result.update({
+        'resolved': True,
+        'sub_total': int(sub_total) if float(sub_total).is_integer() else sub_total,
+        'reason': reason,
+        'components': [{'source': c['source'], 'label': c['label'], 'rating': c['outcome']['text']} for c in components],
+    })
+    if flat_extras:
+        result['flat_extras'] = flat_extras
+    if unrated:
+        result['unrated_factors'] = unrated
+    return result
+
+
+def required_factors(impairment: dict, rules: dict) -> list[str]:
+    """Factor names the impairment's rating tables and modifiers are keyed on."""
+    _stem, rule_set = find_rule_set(impairment, rules)
+    if not rule_set:
+        return []
+    names = []
+    for table in rule_set['tables']:
+        for dim in table['dimensions']:
+            if dim['factor'] not in names:
+                names.append(dim['factor'])
+    for modifier in rule_set['modifiers']:
+        if modifier['name'] and modifier['name'] not in names:
+            names.append(modifier['name'])
+    return names
+
+
+def is_required_factor(key: str, required: list[str]) -> bool:
+    canon = _canonical_factor(str(key))
+    return any(_factor_names_match(_canonical_factor(name), canon) for name in required)
+
+
+def score_impairments(impairments: list[dict], rules: dict | None = None) -> tuple[list[dict], list[dict]]:
+    """Split impairments into rule-scored results and the raw items left for the agent."""
+    rules = rules or load_rules()
+    scored, unresolved = [], []
+    for item in impairments or []:
+        if not isinstance(item, dict):
+            continue
+        result = score_impairment(item, rules)
+        if result['resolved']:
+            scored.append(result)
+        else:
+            print(f"[rating_engine] Unresolved {result['impairment_id']!r}: {result.get('unresolved_reason')}")
+            unresolved.append(item)
+    return scored, unresolved
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python rating_engine.py <manual_root> <output.json>')
+        sys.exit(2)
+    compiled = compile_manual(sys.argv[1])
+    compiled['compiledAt'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+    with open(sys.argv[2], 'w', encoding='utf-8') as fh:
+        json.dump(compiled, fh, ensure_ascii=False, separators=(',', ':'))
+    print(f"Compiled {len(compiled['ruleSets'])} rule sets into {sys.argv[2]}")
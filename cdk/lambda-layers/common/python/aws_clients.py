@@ -0,0 +1,69 @@
+"""Boto3 clients created on first use and shared across the container.
+
+Importing boto3 and building the first client (endpoint data plus the service
+model) is the bulk of a pipeline Lambda's init phase; later clients from the
+same session reuse its loader cache and cost a fraction of that. Handlers
+declare their clients at module level with ``lazy`` and keep calling them as
+before:
+
+    bedrock_runtime = aws_clients.lazy('bedrock-runtime', retries={'max_attempts': 10, 'mode': 'adaptive'})
+    ...
+    bedrock_runtime.converse(...)   # client built here, once per container
+
+Laziness only pays off for clients some invocations never use: a client every
+invocation needs just moves its cost from init into the first request. Build
+those at module level with ``client`` instead.
+
+Clients are keyed by service and config, so ``claim_check`` and the handler
+share one S3 client. Strands models take ``session()`` so their Bedrock client
+reuses the same loader cache.
+"""
+import json
+import threading
+
+_session = None
+_clients = {}
+_lock = threading.RLock()
+
+
+def session():
+    """The container's shared boto3 session; boto3 is imported on the first call"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+    return _session
+
+
+def client(service_name, **config):
+    """Shared client for ``service_name``; keyword arguments are botocore ``Config`` options"""
+    key = (service_name, json.dumps(config, sort_keys=True, default=str))
+    found = _clients.get(key)
+    if found is None:
+        with _lock:
+            found = _clients.get(key)
+            if found is None:
+                from botocore.config import Config
+                found = session().client(service_name, config=Config(**config) if config else None)
+                _clients[key] = found
+    return found
+
+
+class LazyClient:
+    """Module-level stand-in for a client that is only built when first used"""
+
+    def __init__(self, service_name, **config):
+        self._service_name = service_name
+        self._config = config
+
+    def __getattr__(self, name):
+        return getattr(client(self._service_name, **self._config), name)
+
+    def __repr__(self):
+        return f"LazyClient({self._service_name!r})"
+
+
+def lazy(service_name, **config):
+    return LazyClient(service_name, **config)
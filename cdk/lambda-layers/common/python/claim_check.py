@@ -0,0 +1,98 @@
+"""Claim-check helpers for passing stage outputs through the Step Functions state.
+
+Each stage writes its full output to S3 and returns a small pointer instead of
+the payload itself, keeping the execution state well under the 256 KB limit:
+
+    {"claimCheck": {"bucket": ..., "key": ..., "sha256": ..., "bytes": ...},
+     "summary": {...}}
+
+Downstream stages resolve pointers through a ``ClaimCheckLoader`` created once
+per invocation, which fetches each object lazily, verifies its hash and caches
+the parsed result so repeated lookups in the same invocation are free.
+"""
+import hashlib
+import json
+import os
+
+import aws_clients
+
+CLAIM_CHECK_BUCKET = os.environ.get('CLAIM_CHECK_BUCKET') or os.environ.get('EXTRACTION_BUCKET')
+CLAIM_CHECK_PREFIX = 'claim-checks/'
+
+def _s3():
+    return aws_clients.client('s3')
+
+
+def is_claim_check(obj) -> bool:
+    return isinstance(obj, dict) and isinstance(obj.get('claimCheck'), dict) and 'key' in obj['claimCheck']
+
+
+def put_claim(job_id: str, stage: str, payload, summary: dict | None = None, bucket: str | None = None) -> dict:
+    """Write ``payload`` to ``claim-checks/{job_id}/{stage}.json`` and return its pointer."""
+    bucket = bucket or CLAIM_CHECK_BUCKET
+    if not bucket:
+        raise ValueError("No claim-check bucket configured (CLAIM_CHECK_BUCKET / EXTRACTION_BUCKET)")
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()
+    key = f"{CLAIM_CHECK_PREFIX}{job_id or 'unknown'}/{stage}.json"
+    _s3().put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/json')
+    print(f"[claim_check] Wrote {stage} for job {job_id}: s3://{bucket}/{key} ({len(body)} bytes)")
+    return {
+        'claimCheck': {'bucket': bucket, 'key': key, 'sha256': digest, 'bytes': len(body)},
+        'summary': summary or {},
+    }
+
+
+def offload(job_id: str, stage: str, payload, summary: dict | None = None):
+    """Like ``put_claim`` but falls back to returning ``payload`` inline if the write fails."""
+    try:
+        return put_claim(job_id, stage, payload, summary)
+    except Exception as e:
+        print(f"[claim_check] WARNING: Could not offload {stage} for job {job_id}, passing inline: {e}")
+        return payload
+
+
+class ClaimCheckLoader:
+    """Resolve claim-check pointers lazily, caching parsed payloads for one invocation."""
+
+    def __init__(self, s3_client=None):
+        self._client = s3_client
+        self._cache: dict[tuple, object] = {}
+
+    def resolve(self, obj, default=None):
+        """Return the payload behind ``obj`` if it is a pointer, ``obj`` itself otherwise."""
+        if obj is None:
+            return default
+        if not is_claim_check(obj):
+            return obj
+        ref = obj['claimCheck']
+        cache_key = (ref.get('bucket'), ref['key'], ref.get('sha256'))
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+        client = self._client or _s3()
+        resp = client.get_object(Bucket=ref.get('bucket') or CLAIM_CHECK_BUCKET, Key=ref['key'])
+        body = resp['Body'].read()
+        expected = ref.get('sha256')
+        if expected and hashlib.sha256(body).hexdigest() != expected:
+            raise ValueError(f"Claim-check hash mismatch for {ref['key']}")
+        payload = json.loads(body.decode('utf-8'))
+        self._cache[cache_key] = payload
+        return payload
+
+    def resolve_path(self, event: dict, *path, default=None):
+        """Walk ``path`` through ``event``, resolving pointers at every level."""
+        current = event
+        for part in path:
+            current = self.resolve(current)
+            if not isinstance(current, dict):
+                return default
+            current = current.get(part)
+        resolved = self.resolve(current)
+        return default if resolved is None else resolved
+
+
+def describe_event(event) -> str:
+    """Cheap event description for logs (top-level keys only, no serialization)."""
+    if not isinstance(event, dict):
+        return type(event).__name__
+    return ', '.join(f"{k}{'*' if is_claim_check(v) else ''}" for k, v in event.items())
@@ -0,0 +1,55 @@
+"""Field conventions of the merged extraction, shared by the steps that read it.
+
+The merged extraction is ``{sub_document_type: [page_object, ...]}``. Detection
+compaction (``applicant_header``) and the chat record index (``header``) both
+pull the applicant's demographics out of it and both skip blank pages, so they
+use these definitions to agree on what counts as either.
+"""
+import re
+
+# Status text the extractor writes on pages with nothing on them
+BLANK_STATUS = re.compile(r'^\s*(no (information|data|extractable information) found|blank( page)?|empty)\s*\.?\s*$', re.I)
+
+# Keys that name the applicant or the case wherever they appear
+APPLICANT_KEYS = frozenset({
+    'applicantname', 'insuredname', 'proposedinsured', 'patientname', 'businessname',
+    'policynumber', 'applicationnumber', 'caseid', 'casenumber',
+    'coverageamount', 'faceamount', 'policytype',
+})
+
+# Keys that could describe anyone; the applicant's only on the applicant's own forms
+DEMOGRAPHIC_KEYS = frozenset({
+    'name', 'fullname', 'firstname', 'lastname', 'middlename', 'dateofbirth', 'dob', 'birthdate', 'age',
+    'gender', 'sex', 'address', 'streetaddress', 'city', 'state', 'zip', 'zipcode',
+    'postalcode', 'phone', 'phonenumber', 'email', 'ssn', 'socialsecuritynumber',
+})
+
+_APPLICANT_SECTION = re.compile(r'applica|insured|enrol|paramed')
+
+_OTHER_PARTY = re.compile(
+    r'family|relative|parent|spouse|child|beneficiar|physician|doctor|provider|attending|^aps$|'
+    r'owner|payor|payer|trustee|employer|agent|producer|witness|emergency'
+)
+
+
+def norm_key(key) -> str:
+    return re.sub(r'[^a-z0-9]', '', str(key).lower())
+
+
+def is_blank_status(value) -> bool:
+    return isinstance(value, str) and (not value.strip() or bool(BLANK_STATUS.match(value)))
+
+
+def is_applicant_field(section: str, key_path: str) -> bool:
+    """True when ``key_path`` (``a.b[0].name``) in ``section`` is one of the applicant's demographics"""
+    segments = [norm_key(s) for s in re.split(r'[.\[\]]+', str(key_path)) if s and not s.isdigit()]
+    if not segments or any(_OTHER_PARTY.search(s) for s in segments[:-1]):
+        return False
+    leaf = segments[-1]
+    if leaf in APPLICANT_KEYS:
+        return True
+    if leaf not in DEMOGRAPHIC_KEYS:
+        return False
+    parts = [p for p in re.split(r'[^a-z0-9]+', str(section).lower()) if p]
+    return (_APPLICANT_SECTION.search(' '.join(parts)) is not None
+            and not any(_OTHER_PARTY.search(p) for p in parts))
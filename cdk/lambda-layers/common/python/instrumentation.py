@@ -0,0 +1,259 @@
+"""Per-stage metrics for the pipeline Lambdas.
+
+Each Lambda owns one ``Metrics`` object for its stage and wraps its handler
+with ``@metrics.handler``. During an invocation the code tags the job
+(``metrics.tag(job_id=..., model_id=..., insurance_type=...)``), times work
+with ``with metrics.span('BedrockConverse'):`` or the shared ``log_timing``
+helper, and adds counters (``metrics.count('ImageBytes', n)``,
+``metrics.record_converse(response)`` / ``metrics.record_agent(result)`` for
+tokens and retries).
+
+Recording only appends to in-memory lists and dicts; nothing is written until
+the handler returns, when one CloudWatch Embedded Metric Format document is
+emitted for the whole invocation. That keeps the per-call cost to a
+``perf_counter`` pair, so spans are safe inside per-page loops.
+
+Dimensions are ``Stage``, ``Stage x ModelId`` and ``Stage x InsuranceType``;
+the job id is a property, not a dimension, to keep metric cardinality flat.
+Span metrics are named ``<name>Latency`` (milliseconds) and carry every
+sample, so CloudWatch can chart percentiles. When a ``Pages`` counter is set,
+per-page ratios for tokens and bytes are added.
+
+Model calls are also summed per model id (tokens including prompt-cache
+reads and writes, latency, retries) and, when the invocation is tagged with a
+job id, added to the job's usage ledger in one write at the end (see
+``usage_ledger``).
+
+Sinks: ``METRICS_SINK=emf`` (default) prints the document to stdout for the
+CloudWatch agent; ``METRICS_SINK=jsonl`` appends it to ``METRICS_JSONL_PATH``;
+``METRICS_SINK=off`` drops it.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'UnderwritingWorkbench')
+METRICS_SINK = os.environ.get('METRICS_SINK', 'emf').lower()
+METRICS_JSONL_PATH = os.environ.get('METRICS_JSONL_PATH', '/tmp/metrics.jsonl')
+# EMF accepts at most 100 values per metric per document
+MAX_SAMPLES = 100
+
+COUNTER_UNITS = {
+    'InputTokens': 'Count',
+    'OutputTokens': 'Count',
+    'CacheReadTokens': 'Count',
+    'CacheWriteTokens': 'Count',
+    'ModelCalls': 'Count',
+    'Retries': 'Count',
+    'Pages': 'Count',
+    'ImageBytes': 'Bytes',
+    'S3BytesIn': 'Bytes',
+    'S3BytesOut': 'Bytes',
+}
+PER_PAGE = ('InputTokens', 'OutputTokens', 'ImageBytes', 'S3BytesIn')
+
+_TAG_PROPERTIES = {'job_id': 'JobId', 'model_id': 'ModelId', 'insurance_type': 'InsuranceType'}
+_active = None
+
+
+class StdoutSink:
+    def write(self, document):
+        print(json.dumps(document, separators=(',', ':')))
+
+
+class JsonlSink:
+    """Append one JSON document per line; used by local runs and tests"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, document):
+        line = json.dumps(document, separators=(',', ':'))
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class NullSink:
+    def write(self, document):
+        pass
+
+
+def default_sink():
+    if METRICS_SINK == 'jsonl':
+        return JsonlSink(METRICS_JSONL_PATH)
+    if METRICS_SINK == 'off':
+        return NullSink()
+    return StdoutSink()
+
+
+class Metrics:
+    def __init__(self, stage, sink=None, namespace=METRICS_NAMESPACE):
+        self.stage = stage
+        self.sink = sink or default_sink()
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.begin()
+
+    def begin(self, **tags):
+        """Start a fresh invocation and make this the target of ``log_timing``"""
+        global _active
+        with self._lock:
+            self.tags = {}
+            self.counters = {}
+            self.samples = {}
+            self.properties = {}
+            self.usage = {}
+        self.tag(**tags)
+        self._started = time.perf_counter()
+        _active = self
+
+    def tag(self, **tags):
+        for name, value in tags.items():
+            if value is not None:
+                self.tags[_TAG_PROPERTIES.get(name, name)] = str(value)
+
+    def count(self, name, value=1):
+        if not value:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def timing(self, name, milliseconds):
+        with self._lock:
+            samples = self.samples.setdefault(name, [])
+            if len(samples) < MAX_SAMPLES:
+                samples.append(round(milliseconds, 2))
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def record_converse(self, response, model_id=None):
+        """Count a Bedrock Converse call: tokens from ``usage``, latency and SDK retries"""
+        retries = (response.get('ResponseMetadata') or {}).get('RetryAttempts', 0)
+        latency_ms = (response.get('metrics') or {}).get('latencyMs', 0)
+        self._record_usage(model_id, 1, response.get('usage'), latency_ms, retries)
+
+    def record_agent(self, result, model_id=None):
+        """Count a Strands agent run: model calls are its event-loop cycles"""
+        loop_metrics = getattr(result, 'metrics', None)
+        if loop_metrics is None:
+            return
+        latency_ms = (getattr(loop_metrics, 'accumulated_metrics', None) or {}).get('latencyMs', 0)
+        self._record_usage(model_id, getattr(loop_metrics, 'cycle_count', 0),
+                           getattr(loop_metrics, 'accumulated_usage', None), latency_ms, 0)
+
+    def _record_usage(self, model_id, calls, usage, latency_ms, retries):
+        usage = usage or {}
+        counters = {
+            'calls': calls,
+            'inputTokens': usage.get('inputTokens', 0),
+            'outputTokens': usage.get('outputTokens', 0),
+            'cacheReadTokens': usage.get('cacheReadInputTokens', 0),
+            'cacheWriteTokens': usage.get('cacheWriteInputTokens', 0),
+            'latencyMs': latency_ms,
+            'retries': retries,
+        }
+        self.count('ModelCalls', calls)
+        self.count('InputTokens', counters['inputTokens'])
+        self.count('OutputTokens', counters['outputTokens'])
+        self.count('CacheReadTokens', counters['cacheReadTokens'])
+        self.count('CacheWriteTokens', counters['cacheWriteTokens'])
+        self.count('Retries', retries)
+        model_id = model_id or self.tags.get('ModelId')
+        with self._lock:
+            totals = self.usage.setdefault(model_id, {'invocations': 1})
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + (value or 0)
+
+    def document(self):
+        with self._lock:
+            counters = dict(self.counters)
+            samples = {f"{name}Latency": list(values) for name, values in self.samples.items()}
+        samples['InvocationLatency'] = [round((time.perf_counter() - self._started) * 1000, 2)]
+        pages = counters.get('Pages')
+        derived = {}
+        if pages:
+            for name in PER_PAGE:
+                if name in counters:
+                    derived[f"{name}PerPage"] = round(counters[name] / pages, 2)
+
+        dimensions = [['Stage']]
+        for name in ('ModelId', 'InsuranceType'):
+            if name in self.tags:
+                dimensions.append(['Stage', name])
+        definitions = (
+            [{'Name': name, 'Unit': COUNTER_UNITS.get(name, 'Count')} for name in counters]
+            + [{'Name': name, 'Unit': 'Bytes' if 'Bytes' in name else 'Count'} for name in derived]
+            + [{'Name': name, 'Unit': 'Milliseconds'} for name in samples]
+        )
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': dimensions,
+                    'Metrics': definitions,
+                }],
+            },
+            'Stage': self.stage,
+            **self.tags,
+            **self.properties,
+            **counters,
+            **derived,
+            **samples,
+        }
+
+    def flush(self):
+        try:
+            self.sink.write(self.document())
+        except Exception as e:
+            # Metrics must never fail an invocation
+            print(f"[instrumentation] Could not write metrics: {e}")
+        job_id = self.tags.get('JobId')
+        if self.usage and job_id:
+            try:
+                import usage_ledger
+                usage_ledger.write(job_id, self.stage, self.usage)
+            except Exception as e:
+                print(f"[instrumentation] Could not write usage ledger for job {job_id}: {e}")
+
+    def handler(self, fn):
+        """Decorate a Lambda handler: reset before the call, emit one document after it"""
+        @functools.wraps(fn)
+        def wrapper(event, context):
+            self.begin()
+            try:
+                return fn(event, context)
+            finally:
+                self.flush()
+        return wrapper
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.timing(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def log_timing(operation_name, start_time, metric=None):
+    """Log the duration of an operation; with ``metric``, also record it as a span sample"""
+    elapsed = time.time() - start_time
+    print(f"[TIMING] {operation_name} completed in {elapsed:.2f}s")
+    if metric and _active is not None:
+        _active.timing(metric, elapsed * 1000)
@@ -0,0 +1,242 @@
+"""Per-job record index used to retrieve extracted data for chat.
+
+The analyze step builds the index from the merged extraction
+(``{sub_document_type: [page_object, ...]}``) and stores it as a claim check.
+Each record is a small group of ``key: value`` fields from one page of one
+sub-document, so every retrieved snippet carries its page number.
+
+Retrieval is lexical (BM25 over field keys and values) with an optional second
+signal from hashed feature vectors (word and character trigram features hashed
+into ``VECTOR_DIMS`` signed buckets). The vectors need no model and catch
+partial matches like "hypertensive" for "hypertension". They are stored
+int8-quantized and base64 encoded; set ``RECORD_INDEX_VECTORS=none`` to build
+lexical-only indexes.
+"""
+import base64
+import hashlib
+import math
+import os
+import re
+from array import array
+
+from extraction_fields import BLANK_STATUS, is_applicant_field, norm_key as _norm_key
+
+RECORD_INDEX_VECTORS = os.environ.get('RECORD_INDEX_VECTORS', 'hashed').lower()
+INDEX_VERSION = 1
+VECTOR_DIMS = 256
+VECTOR_WEIGHT = 0.5
+MAX_RECORD_CHARS = 600
+MAX_VALUE_CHARS = 400
+MIN_SCORE = 0.1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r'[a-z0-9]+(?:\.[0-9]+)?')
+_STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'does', 'for', 'from', 'has', 'have',
+    'he', 'her', 'his', 'how', 'i', 'in', 'is', 'it', 'its', 'me', 'of', 'on', 'or', 'she', 'tell',
+    'that', 'the', 'their', 'there', 'this', 'to', 'was', 'were', 'what', 'when', 'where', 'which',
+    'who', 'why', 'with', 'you', 'any', 'applicant', 'please',
+}
+# Common underwriting abbreviations in questions, expanded to the words used in field names
+_QUERY_SYNONYMS = {
+    'dob': ['date', 'birth'], 'bp': ['blood', 'pressure'], 'meds': ['medications'], 'rx': ['prescription', 'medications'],
+    'bmi': ['bmi', 'height', 'weight'], 'ht': ['height'], 'wt': ['weight'], 'a1c': ['a1c', 'hba1c'],
+    'smoker': ['smoker', 'tobacco', 'nicotine'], 'dui': ['dui', 'violation'], 'sqft': ['square', 'footage'],
+}
+def tokenize(text: str) -> list[str]:
+    # Split snake_case / camelCase keys into words before matching
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', str(text)).replace('_', ' ').lower()
+    return [t for t in _TOKEN.findall(text) if t not in _STOPWORDS]
+
+
+def _scalar(value) -> str:
+    text = value if isinstance(value, str) else str(value)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text[:MAX_VALUE_CHARS] + ' …' if len(text) > MAX_VALUE_CHARS else text
+
+
+def _flatten(value, prefix: str = '') -> list[list[str]]:
+    """Return ``[key_path, value]`` pairs for every non-empty scalar in ``value``."""
+    out = []
+    if isinstance(value, dict):
+        for k, v in value.items():
+            out.extend(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(value, list):
+        if value and all(not isinstance(v, (dict, list)) for v in value):
+            out.append([prefix, _scalar(', '.join(str(v) for v in value if v not in (None, '')))])
+        else:
+            for idx, v in enumerate(value):
+                out.extend(_flatten(v, f"{prefix}[{idx}]"))
+    elif value not in (None, ''):
+        out.append([prefix, _scalar(value)])
+    return [pair for pair in out if pair[1]]
+
+
+def _is_blank(fields: list[list[str]]) -> bool:
+    if not fields:
+        return True
+    return all(_norm_key(k) in ('status', 'note', 'notes') and BLANK_STATUS.match(v) for k, v in fields)
+
+
+def build_records(extracted_data: dict) -> list[dict]:
+    records = []
+    for section, pages in (extracted_data or {}).items():
+        for page in pages or []:
+            if not isinstance(page, dict):
+                continue
+            fields = _flatten({k: v for k, v in page.items() if k != 'page_number'})
+            if _is_blank(fields):
+                continue
+            chunk, size = [], 0
+            for pair in fields:
+                cost = len(pair[0]) + len(pair[1]) + 2
+                if chunk and size + cost > MAX_RECORD_CHARS:
+                    records.append({'section': section, 'page': page.get('page_number'), 'fields': chunk})
+                    chunk, size = [], 0
+                chunk.append(pair)
+                size += cost
+            if chunk:
+                records.append({'section': section, 'page': page.get('page_number'), 'fields': chunk})
+    for idx, record in enumerate(records):
+        record['id'] = idx
+    return records
+
+
+def record_text(record: dict) -> str:
+    return '; '.join(f"{k}: {v}" for k, v in record['fields'])
+
+
+def _features(text: str) -> list[str]:
+    features = []
+    for token in tokenize(text):
+        features.append(f"w:{token}")
+        padded = f"#{token}#"
+        features.extend(f"c:{padded[i:i + 3]}" for i in range(max(1, len(padded) - 2)))
+    return features
+
+
+def hashed_vector(text: str, dims: int = VECTOR_DIMS) -> list[float]:
+    vec = [0.0] * dims
+    for feature in _features(text):
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], 'little') % dims
+        vec[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec))
+    return [v / norm for v in vec] if norm else vec
+
+
+def _encode_vector(vec: list[float]) -> str:
+    scale = max((abs(v) for v in vec), default=0.0) or 1.0
+    quantized = array('b', (int(round(v / scale * 127)) for v in vec))
+    return base64.b64encode(quantized.tobytes()).decode('ascii')
+
+
+def _decode_vector(data: str) -> list[float]:
+    values = array('b')
+    values.frombytes(base64.b64decode(data))
+    norm = math.sqrt(sum(v * v for v in values))
+    return [v / norm for v in values] if norm else [0.0] * len(values)
+
+
+def _header(records: list[dict]) -> list[dict]:
+    """First occurrence of each of the applicant's demographic fields, with the pages it appears on."""
+    header: dict[str, dict] = {}
+    for record in records:
+        for key, value in record['fields']:
+            if not is_applicant_field(record['section'], key):
+                continue
+            leaf = _norm_key(key.rsplit('.', 1)[-1])
+            entry = header.setdefault(leaf, {'key': key, 'value': value, 'pages': []})
+            if entry['value'] == value and record['page'] not in entry['pages']:
+                entry['pages'].append(record['page'])
+    return list(header.values())
+
+
+def build_index(extracted_data: dict, vectors: str = RECORD_INDEX_VECTORS) -> dict:
+    """Build the serializable index for one job's merged extraction."""
+    records = build_records(extracted_data)
+    index = {
+        'version': INDEX_VERSION,
+        'records': records,
+        'header': _header(records),
+        'sections': {},
+        'vectors': None,
+    }
+    for record in records:
+        pages = index['sections'].setdefault(record['section'], [])
+        if record['page'] is not None and record['page'] not in pages:
+            pages.append(record['page'])
+    if vectors == 'hashed':
+        index['vectors'] = {
+            'kind': 'hashed',
+            'dims': VECTOR_DIMS,
+            'data': [_encode_vector(hashed_vector(f"{r['section']} {record_text(r)}")) for r in records],
+        }
+    return index
+
+
+class RecordIndex:
+    """Query side of the index. Term statistics are computed once on load."""
+
+    def __init__(self, data: dict):
+        self.records = data.get('records') or []
+        self.header = data.get('header') or []
+        self.sections = data.get('sections') or {}
+        vectors = data.get('vectors') or {}
+        self._vector_data = vectors.get('data') if vectors.get('kind') == 'hashed' else None
+        self._vectors = None
+        self._tf: list[dict[str, int]] = []
+        self._lengths: list[int] = []
+        self._df: dict[str, int] = {}
+        for record in self.records:
+            counts: dict[str, int] = {}
+            for token in tokenize(f"{record['section']} {record_text(record)}"):
+                counts[token] = counts.get(token, 0) + 1
+            self._tf.append(counts)
+            self._lengths.append(sum(counts.values()))
+            for token in counts:
+                self._df[token] = self._df.get(token, 0) + 1
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _bm25(self, terms: list[str]) -> list[float]:
+        n = len(self.records)
+        scores = [0.0] * n
+        for term in set(terms):
+            df = self._df.get(term)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for idx, counts in enumerate(self._tf):
+                tf = counts.get(term)
+                if tf:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[idx] / (self._avg_length or 1))
+                    scores[idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _cosine(self, query: str) -> list[float] | None:
+        if not self._vector_data:
+            return None
+        if self._vectors is None:
+            self._vectors = [_decode_vector(v) for v in self._vector_data]
+        q = hashed_vector(query, len(self._vectors[0]) if self._vectors else VECTOR_DIMS)
+        return [max(0.0, sum(a * b for a, b in zip(q, vec))) for vec in self._vectors]
+
+    def search(self, query: str, k: int = 8) -> list[tuple[float, dict]]:
+        """Return up to ``k`` ``(score, record)`` pairs, best first."""
+        if not self.records or not query.strip():
+            return []
+        terms = []
+        for token in tokenize(query):
+            terms.extend(_QUERY_SYNONYMS.get(token, [token]))
+        scores = self._bm25(terms)
+        top = max(scores) or 1.0
+        scores = [s / top for s in scores]
+        cosine = self._cosine(query)
+        if cosine is not None:
+            scores = [s + VECTOR_WEIGHT * c for s, c in zip(scores, cosine)]
+        ranked = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+        return [(scores[i], self.records[i]) for i in ranked[:k] if scores[i] >= MIN_SCORE]
@@ -0,0 +1,92 @@
+"""Per-job Bedrock usage ledger on the job record.
+
+Every model call a stage makes is summed in memory (see ``instrumentation``)
+and written once per invocation into the job's ``usageLedger`` map, one entry
+per ``"{stage}|{modelId}"``:
+
+    {"calls": 3, "inputTokens": 5120, "outputTokens": 840, "cacheReadTokens": 0,
+     "cacheWriteTokens": 0, "latencyMs": 9120, "retries": 1, "invocations": 1}
+
+Counters are added with ``if_not_exists(...) + :n``, so parallel invocations of
+the same stage (the extraction Map) accumulate instead of overwriting each
+other. The common case is a single UpdateItem; the first write for a stage
+also creates the entry. Set ``USAGE_LEDGER=off`` to skip the write.
+"""
+import os
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+JOBS_TABLE_NAME = os.environ.get('JOBS_TABLE_NAME')
+USAGE_LEDGER = os.environ.get('USAGE_LEDGER', 'on').lower()
+LEDGER_ATTRIBUTE = 'usageLedger'
+COUNTERS = ('calls', 'inputTokens', 'outputTokens', 'cacheReadTokens', 'cacheWriteTokens',
+            'latencyMs', 'retries', 'invocations')
+
+def _client():
+    return aws_clients.client('dynamodb')
+
+
+def entry_key(stage, model_id):
+    return f"{stage}|{model_id or 'unknown'}"
+
+
+def write(job_id, stage, usage_by_model, table_name=None):
+    """Add ``{model_id: {counter: n}}`` to the job's ledger under ``stage``"""
+    table_name = table_name or JOBS_TABLE_NAME
+    if USAGE_LEDGER == 'off' or not (job_id and table_name and usage_by_model):
+        return
+    key = {'jobId': {'S': job_id}}
+    names = {'#l': LEDGER_ATTRIBUTE}
+    values = {':zero': {'N': '0'}}
+    assignments, entries = [], []
+    for i, (model_id, counters) in enumerate(sorted(usage_by_model.items(), key=lambda kv: str(kv[0]))):
+        entry = f'#e{i}'
+        names[entry] = entry_key(stage, model_id)
+        entries.append(entry)
+        for name in COUNTERS:
+            names[f'#{name}'] = name
+            value = f':{name}{i}'
+            values[value] = {'N': str(int(round(counters.get(name, 0))))}
+            assignments.append(f'#l.{entry}.#{name} = if_not_exists(#l.{entry}.#{name}, :zero) + {value}')
+    add = {
+        'TableName': table_name,
+        'Key': key,
+        'UpdateExpression': 'SET ' + ', '.join(assignments),
+        'ConditionExpression': ' AND '.join(f'attribute_exists(#l.{e})' for e in entries),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+    }
+    try:
+        _client().update_item(**add)
+        return
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('ConditionalCheckFailedException', 'ValidationException'):
+            raise
+
+    # First write for this stage/model: create the map and entries, then add
+    try:
+        _client().update_item(
+            TableName=table_name,
+            Key=key,
+            UpdateExpression='SET #l = if_not_exists(#l, :empty)',
+            ConditionExpression='attribute_exists(jobId)',
+            ExpressionAttributeNames={'#l': LEDGER_ATTRIBUTE},
+            ExpressionAttributeValues={':empty': {'M': {}}},
+        )
+        _client().update_item(
+            TableName=table_name,
+            Key=key,
+            UpdateExpression='SET ' + ', '.join(f'#l.{e} = if_not_exists(#l.{e}, :empty)' for e in entries),
+            ConditionExpression='attribute_exists(jobId)',
+            ExpressionAttributeNames={'#l': LEDGER_ATTRIBUTE, **{e: names[e] for e in entries}},
+            ExpressionAttributeValues={':empty': {'M': {}}},
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            print(f"[usage_ledger] Job {job_id} not found; usage for {stage} not recorded")
+            return
+        raise
+    del add['ConditionExpression']
+    _client().update_item(**add)
@@ -8,7 +8,10 @@ import * as origins from 'aws-cdk-lib/aws-cloudfront-origins';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as apigateway from 'aws-cdk-lib/aws-apigateway';
+import * as apigatewayv2 from 'aws-cdk-lib/aws-apigatewayv2';
+import * as apigatewayv2Integrations from 'aws-cdk-lib/aws-apigatewayv2-integrations';
 import * as stepfunctions from 'aws-cdk-lib/aws-stepfunctions';
 import * as stepfunctionsTasks from 'aws-cdk-lib/aws-stepfunctions-tasks';
 import * as events from 'aws-cdk-lib/aws-events';
@@ -306,6 +309,52 @@ export class CdkStack extends cdk.Stack {
     const jobsTable = new dynamodb.Table(this, 'JobsTable', {
       partitionKey: { name: 'jobId', type: dynamodb.AttributeType.STRING },
       billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      // Feeds the job-events publisher that pushes status changes to WebSocket clients
+      stream: dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+      // Set only on multipart jobs still in UPLOAD_PENDING, so abandoned uploads expire
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY, // For development - change for production
+    });
+
+    // CloudFormation adds at most one GSI per table update. A stack deployed before
+    // these indexes existed is upgraded in two deploys (see README, "Upgrading an
+    // existing stack"): `cdk deploy -c jobIndexes=upload` first, then `cdk deploy`.
+    const jobIndexes = this.node.tryGetContext('jobIndexes') ?? 'all';
+
+    // Newest-first job listing: listPartition is one of JOB#0..JOB#{JOB_LIST_SHARDS-1},
+    // so status writes spread over several index partitions; a page queries each shard and merges
+    jobsTable.addGlobalSecondaryIndex({
+      indexName: 'jobsByUploadTime',
+      partitionKey: { name: 'listPartition', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'uploadTimestamp', type: dynamodb.AttributeType.STRING },
+      projectionType: dynamodb.ProjectionType.INCLUDE,
+      nonKeyAttributes: ['status', 'originalFilename', 'documentType', 'insuranceType', 'batchId'],
+    });
+
+    // Batch members by upload order; keys only, details come from BatchGetItem on the table
+    if (jobIndexes !== 'upload') {
+      jobsTable.addGlobalSecondaryIndex({
+        indexName: 'jobsByBatch',
+        partitionKey: { name: 'batchId', type: dynamodb.AttributeType.STRING },
+        sortKey: { name: 'uploadTimestamp', type: dynamodb.AttributeType.STRING },
+        projectionType: dynamodb.ProjectionType.KEYS_ONLY,
+      });
+    }
+
+    // Chat turns live in their own table so the job item does not grow with the conversation
+    const conversationsTable = new dynamodb.Table(this, 'ConversationsTable', {
+      partitionKey: { name: 'jobId', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'turnKey', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY, // For development - change for production
+    });
+
+    // WebSocket subscriptions to job status changes, one item per (topic, connection)
+    const jobSubscriptionsTable = new dynamodb.Table(this, 'JobSubscriptionsTable', {
+      partitionKey: { name: 'topic', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'connectionId', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expiresAt',
       removalPolicy: cdk.RemovalPolicy.DESTROY, // For development - change for production
     });
 
@@ -335,6 +384,7 @@ export class CdkStack extends cdk.Stack {
       lifecycleRules: [
         {
           expiration: cdk.Duration.days(30), // Auto-delete files after 30 days
+          abortIncompleteMultipartUploadAfter: cdk.Duration.days(2), // Drop parts of abandoned multipart uploads
         },
       ],
     });
@@ -416,6 +466,12 @@ export class CdkStack extends cdk.Stack {
       description: 'Strands Agents SDK and dependencies',
     });
 
+    const commonLayer = new lambda.LayerVersion(this, 'CommonLayer', {
+      code: lambda.Code.fromAsset('lambda-layers/common'),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_12],
+      description: 'Shared helpers for the workflow Lambdas (claim-check payload passing, stage metrics, usage ledger, lazily created AWS clients)',
+    });
+
     // Create common IAM policy statements for Lambda functions
     const bedrockPolicyStatement = new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
@@ -491,6 +547,15 @@ export class CdkStack extends cdk.Stack {
         EXTRACTION_BUCKET: extractionBucket.bucketName,
         JOBS_TABLE_NAME: jobsTable.tableName,
         KB_SOURCE_BUCKET: knowledgeBaseSourceBucket.bucketName,
+        JOBS_BY_UPLOAD_INDEX: 'jobsByUploadTime',
+        JOB_LIST_SHARDS: '4',
+        JOBS_BY_BATCH_INDEX: 'jobsByBatch',
+        ASYNC_BATCH_THRESHOLD: '100',
+        MAX_BATCH_FILES: '1000',
+        BATCH_WRITE_WORKERS: '8',
+        COMPRESSION_MIN_BYTES: '2048',
+        MAX_UPLOAD_BYTES: String(5 * 1024 * 1024 * 1024),
+        PART_URL_EXPIRES: '3600',
         // STATE_MACHINE_ARN will be added later
       },
       layers: [boto3Layer],
@@ -508,7 +573,7 @@ export class CdkStack extends cdk.Stack {
         BEDROCK_MODEL_ID: 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
         JOBS_TABLE_NAME: jobsTable.tableName,
       },
-      layers: [pdfProcessingLayer, boto3Layer],
+      layers: [pdfProcessingLayer, boto3Layer, commonLayer],
     });
 
     // 3. Batch Page Lambda
@@ -519,7 +584,7 @@ export class CdkStack extends cdk.Stack {
       handler: 'index.handler',
       timeout: cdk.Duration.minutes(1),
       memorySize: 1024,
-      layers: [pdfProcessingLayer],
+      layers: [pdfProcessingLayer, commonLayer],
       environment: {
         BATCH_SIZE: '1',
       },
@@ -539,7 +604,7 @@ export class CdkStack extends cdk.Stack {
         MAX_PAGES_FOR_EXTRACTION: '5',
         EXTRACTION_BUCKET: extractionBucket.bucketName
       },
-      layers: [pillowLayer, pdfProcessingLayer, boto3Layer],
+      layers: [pillowLayer, pdfProcessingLayer, boto3Layer, commonLayer],
     });
 
     // 5. Analyze Lambda (comprehensive analysis - risks, discrepancies, recommendations)
@@ -553,12 +618,14 @@ export class CdkStack extends cdk.Stack {
       ephemeralStorageSize: cdk.Size.gibibytes(2),
       memorySize: 512,
       environment: {
+        CLAIM_CHECK_BUCKET: extractionBucket.bucketName,
         BEDROCK_ANALYSIS_MODEL_ID: 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
         JOBS_TABLE_NAME: jobsTable.tableName,
         EXTRACTION_BUCKET: extractionBucket.bucketName,
         TRACE_BUCKET: analysisTracesBucket.bucketName,
+        RECORD_INDEX_VECTORS: 'hashed',
       },
-      layers: [strandsSDKLayer, boto3Layer],
+      layers: [strandsSDKLayer, boto3Layer, commonLayer],
     });
 
     // 5b. Detect Impairments Lambda (Strands Agent with KB for impairment detection)
@@ -571,14 +638,16 @@ export class CdkStack extends cdk.Stack {
       ephemeralStorageSize: cdk.Size.gibibytes(2),
       memorySize: 512,
       environment: {
+        CLAIM_CHECK_BUCKET: extractionBucket.bucketName,
         BEDROCK_DETECTION_MODEL_ID: 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
         JOBS_TABLE_NAME: jobsTable.tableName,
         EXTRACTION_BUCKET: extractionBucket.bucketName,
         KNOWLEDGE_BASE_ID: knowledgeBase.attrKnowledgeBaseId,
         DETECTION_TOP_K: '3',
+        DETECTION_TOKEN_BUDGET: '60000',
         TRACE_BUCKET: analysisTracesBucket.bucketName
       },
-      layers: [strandsSDKLayer, boto3Layer],
+      layers: [strandsSDKLayer, boto3Layer, commonLayer],
     });
 
     // 6. Act Lambda
@@ -592,8 +661,10 @@ export class CdkStack extends cdk.Stack {
       environment: {
         MOCK_OUTPUT_S3_BUCKET: mockOutputBucket.bucketName,
         JOBS_TABLE_NAME: jobsTable.tableName,
+        ACT_TRIAGE_MODE: 'hybrid',
+        OUTBOX_SINK: 's3',
       },
-      layers: [strandsSDKLayer, boto3Layer],
+      layers: [strandsSDKLayer, boto3Layer, commonLayer],
     });
 
     // 7. Score Lambda (new)
@@ -605,13 +676,18 @@ export class CdkStack extends cdk.Stack {
       timeout: cdk.Duration.minutes(5),
       memorySize: 512,
       environment: {
+        CLAIM_CHECK_BUCKET: extractionBucket.bucketName,
         BEDROCK_SCORING_MODEL_ID: 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
         JOBS_TABLE_NAME: jobsTable.tableName,
         KNOWLEDGE_BASE_ID: knowledgeBase.attrKnowledgeBaseId,
+        RATING_ENGINE_MODE: 'hybrid',
+        SCORING_MAX_WORKERS: '4',
+        SCORING_STRATEGY: 'fanout',
+        SCORING_TOKEN_BUDGET: '12000',
         SCORING_TOP_K: '5',
         TRACE_BUCKET: analysisTracesBucket.bucketName,
       },
-      layers: [strandsSDKLayer, boto3Layer],
+      layers: [strandsSDKLayer, boto3Layer, commonLayer],
     });
 
     // 8. Chat Lambda
@@ -625,13 +701,63 @@ export class CdkStack extends cdk.Stack {
       environment: {
         BEDROCK_CHAT_MODEL_ID: 'global.anthropic.claude-haiku-4-5-20251001-v1:0',
         JOBS_TABLE_NAME: jobsTable.tableName,
+        CONVERSATIONS_TABLE_NAME: conversationsTable.tableName,
+        CHAT_WINDOW_TURNS: '6',
+        CHAT_SUMMARY_BATCH: '4',
+        CHAT_CONTEXT_CACHE_SIZE: '32',
+        CHAT_CONTEXT_MODE: 'retrieval',
+        QUICK_ANSWER_MODE: 'on',
+        RETRIEVAL_TOP_K: '8',
+        CLAIM_CHECK_BUCKET: extractionBucket.bucketName,
+        STREAM_FLUSH_CHARS: '48',
+        STREAM_FLUSH_MS: '60',
+      },
+      layers: [boto3Layer, commonLayer],
+    });
+
+    // Job events Lambda: WebSocket subscriptions and DynamoDB Stream publisher
+    const jobEventsLambda = new lambda.Function(this, 'JobEventsLambda', {
+      functionName: 'ai-underwriting-job-events',
+      runtime: lambda.Runtime.PYTHON_3_12,
+      code: lambda.Code.fromAsset('lambda-functions/job-events'),
+      handler: 'index.lambda_handler',
+      timeout: cdk.Duration.seconds(30),
+      memorySize: 256,
+      environment: {
+        SUBSCRIPTIONS_TABLE_NAME: jobSubscriptionsTable.tableName,
+        SUBSCRIPTION_TTL_SECONDS: '7200',
+        // WEBSOCKET_ENDPOINT will be added once the WebSocket stage exists
       },
       layers: [boto3Layer],
     });
+    jobEventsLambda.addEventSource(new lambdaEventSources.DynamoEventSource(jobsTable, {
+      startingPosition: lambda.StartingPosition.LATEST,
+      batchSize: 100,
+      maxBatchingWindow: cdk.Duration.seconds(1),
+      retryAttempts: 2,
+      bisectBatchOnError: true,
+      filters: [
+        lambda.FilterCriteria.filter({ eventName: lambda.FilterRule.isEqual('INSERT') }),
+        lambda.FilterCriteria.filter({ eventName: lambda.FilterRule.isEqual('MODIFY') }),
+      ],
+    }));
 
     // Add permissions to Lambda functions
     apiHandlerLambda.addToRolePolicy(dynamodbPolicyStatement);
     apiHandlerLambda.addToRolePolicy(s3PolicyStatement);
+    // Large batch uploads write their job records in an async self-invocation.
+    // The ARN is built from the fixed function name to avoid a role <-> function cycle.
+    apiHandlerLambda.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: ['lambda:InvokeFunction'],
+      resources: [`arn:aws:lambda:${this.region}:${this.account}:function:ai-underwriting-api-handler`],
+    }));
+    // Multipart uploads: CreateMultipartUpload/UploadPart/Complete are covered by s3:PutObject
+    apiHandlerLambda.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: ['s3:AbortMultipartUpload', 's3:ListMultipartUploadParts'],
+      resources: [documentBucket.arnForObjects('uploads/*')],
+    }));
 
     classifyLambda.addToRolePolicy(bedrockPolicyStatement);
     classifyLambda.addToRolePolicy(dynamodbPolicyStatement);
@@ -665,6 +791,18 @@ export class CdkStack extends cdk.Stack {
 
     chatLambda.addToRolePolicy(bedrockPolicyStatement);
     chatLambda.addToRolePolicy(dynamodbPolicyStatement);
+    chatLambda.addToRolePolicy(s3PolicyStatement);
+    chatLambda.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      resources: [conversationsTable.tableArn],
+      actions: ['dynamodb:PutItem', 'dynamodb:Query'],
+    }));
+    // REST chat replies hand the conversation summary to an async self-invocation
+    chatLambda.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: ['lambda:InvokeFunction'],
+      resources: [`arn:aws:lambda:${this.region}:${this.account}:function:ai-underwriting-chat`],
+    }));
 
     // Create Step Functions State Machine
     const classifyStep = new stepfunctionsTasks.LambdaInvoke(this, 'ClassifyDocument', {
@@ -738,6 +876,15 @@ export class CdkStack extends cdk.Stack {
 
     const actStep = new stepfunctionsTasks.LambdaInvoke(this, 'TakeAction', {
       lambdaFunction: actLambda,
+      // executionId keys the act outbox, so a retried invocation writes the same actions once
+      payload: stepfunctions.TaskInput.fromObject({
+        'detail.$': '$.detail',
+        'classification.$': '$.classification',
+        'analysisOutput.$': '$.analysisOutput',
+        'analysisDetection.$': '$.analysisDetection',
+        'scoring.$': '$.scoring',
+        'executionId.$': '$$.Execution.Id',
+      }),
       payloadResponseOnly: true,
     });
 
@@ -828,11 +975,13 @@ export class CdkStack extends cdk.Stack {
       restApiName: 'ai-underwriting-api',
       description: 'API for the AI Underwriting Assistant',
       endpointTypes: [apigateway.EndpointType.REGIONAL],
+      // Lets the API handler return gzip/brotli bodies (base64 + isBase64Encoded) as raw bytes
+      binaryMediaTypes: ['*/*'],
       // Configure CORS at the API level
       defaultCorsPreflightOptions: {
         allowOrigins: apigateway.Cors.ALL_ORIGINS,
         allowMethods: apigateway.Cors.ALL_METHODS,
-        allowHeaders: ['Content-Type', 'X-Amz-Date', 'Authorization', 'X-Api-Key', 'X-Amz-Security-Token', 'X-User-Language'],
+        allowHeaders: ['Content-Type', 'X-Amz-Date', 'Authorization', 'X-Api-Key', 'X-Amz-Security-Token', 'X-User-Language', 'If-None-Match'],
         maxAge: cdk.Duration.days(1),
       },
       // Enable request validation
@@ -850,6 +999,12 @@ export class CdkStack extends cdk.Stack {
     const documentsResource = apiResource.addResource('documents');
     const uploadResource = documentsResource.addResource('upload');
     const batchUploadResource = documentsResource.addResource('batch-upload');
+    const batchUploadByIdResource = batchUploadResource.addResource('{batchId}');
+    const multipartResource = documentsResource.addResource('multipart');
+    const multipartByJobIdResource = multipartResource.addResource('{jobId}');
+    const multipartPartsResource = multipartByJobIdResource.addResource('parts');
+    const multipartCompleteResource = multipartByJobIdResource.addResource('complete');
+    const multipartAbortResource = multipartByJobIdResource.addResource('abort');
     const statusParentResource = documentsResource.addResource('status');
     const statusResource = statusParentResource.addResource('{executionArn}');
     
@@ -857,12 +1012,17 @@ export class CdkStack extends cdk.Stack {
     const jobsResource = apiResource.addResource('jobs');
     const jobByIdResource = jobsResource.addResource('{jobId}');
     const documentUrlResource = jobByIdResource.addResource('document-url');
+    const jobUsageResource = jobByIdResource.addResource('usage');
     
     // Chat resources
     const chatResource = apiResource.addResource('chat');
     const chatByJobIdResource = chatResource.addResource('{jobId}');
     const policyResource = apiResource.addResource('policy');
 
+    // Batch resources
+    const batchesResource = apiResource.addResource('batches');
+    const batchByIdResource = batchesResource.addResource('{batchId}');
+
     // Add methods to resources
     const apiHandlerIntegration = new apigateway.LambdaIntegration(apiHandlerLambda);
     const chatLambdaIntegration = new apigateway.LambdaIntegration(chatLambda);
@@ -870,13 +1030,60 @@ export class CdkStack extends cdk.Stack {
     // Jobs and upload endpoints
     jobsResource.addMethod('GET', apiHandlerIntegration);
     jobByIdResource.addMethod('GET', apiHandlerIntegration);
+    batchByIdResource.addMethod('GET', apiHandlerIntegration);
     documentUrlResource.addMethod('GET', apiHandlerIntegration);
+    jobUsageResource.addMethod('GET', apiHandlerIntegration);
     uploadResource.addMethod('POST', apiHandlerIntegration);
     batchUploadResource.addMethod('POST', apiHandlerIntegration);
+    batchUploadByIdResource.addMethod('GET', apiHandlerIntegration);
+    multipartResource.addMethod('POST', apiHandlerIntegration);
+    multipartByJobIdResource.addMethod('GET', apiHandlerIntegration);
+    multipartPartsResource.addMethod('POST', apiHandlerIntegration);
+    multipartCompleteResource.addMethod('POST', apiHandlerIntegration);
+    multipartAbortResource.addMethod('POST', apiHandlerIntegration);
     statusResource.addMethod('GET', apiHandlerIntegration);
     chatByJobIdResource.addMethod('POST', chatLambdaIntegration);
+    chatByJobIdResource.addMethod('GET', chatLambdaIntegration);
     policyResource.addMethod('GET', apiHandlerIntegration);
 
+    // With binaryMediaTypes '*/*' every request is binary, so API Gateway would pass the
+    // preflight through without the MOCK integration's JSON request template and OPTIONS
+    // fails. Converting the preflight request to text applies the template again. Keep this
+    // after the last addResource so every preflight method is covered.
+    api.methods
+      .filter((method) => method.httpMethod === 'OPTIONS')
+      .forEach((method) => (method.node.defaultChild as apigateway.CfnMethod)
+        .addPropertyOverride('Integration.ContentHandling', 'CONVERT_TO_TEXT'));
+
+    // WebSocket API for streaming chat: the client sends {"action": "chat", ...}
+    // and receives text deltas and tool events as the model generates
+    const chatWebSocketIntegration = new apigatewayv2Integrations.WebSocketLambdaIntegration('ChatWebSocketIntegration', chatLambda);
+    const chatWebSocketApi = new apigatewayv2.WebSocketApi(this, 'ChatWebSocketApi', {
+      apiName: 'ai-underwriting-chat-ws',
+      connectRouteOptions: { integration: chatWebSocketIntegration },
+      disconnectRouteOptions: { integration: chatWebSocketIntegration },
+    });
+    chatWebSocketApi.addRoute('chat', { integration: chatWebSocketIntegration });
+    const chatWebSocketStage = new apigatewayv2.WebSocketStage(this, 'ChatWebSocketStage', {
+      webSocketApi: chatWebSocketApi,
+      // Served through CloudFront at /ws so the frontend can connect on its own origin
+      stageName: 'ws',
+      autoDeploy: true,
+    });
+    chatWebSocketApi.grantManageConnections(chatLambda);
+
+    // Job status push: clients send {"action": "subscribe", "jobIds": [...]} on the same socket
+    const jobEventsWebSocketIntegration = new apigatewayv2Integrations.WebSocketLambdaIntegration('JobEventsWebSocketIntegration', jobEventsLambda);
+    chatWebSocketApi.addRoute('subscribe', { integration: jobEventsWebSocketIntegration });
+    chatWebSocketApi.addRoute('unsubscribe', { integration: jobEventsWebSocketIntegration });
+    chatWebSocketApi.grantManageConnections(jobEventsLambda);
+    jobEventsLambda.addEnvironment('WEBSOCKET_ENDPOINT', chatWebSocketStage.callbackUrl);
+    jobEventsLambda.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      resources: [jobSubscriptionsTable.tableArn],
+      actions: ['dynamodb:PutItem', 'dynamodb:DeleteItem', 'dynamodb:Query'],
+    }));
+
     // Create S3 bucket for frontend
     const websiteBucket = new s3.Bucket(this, 'WebsiteBucket', {
       encryption: s3.BucketEncryption.S3_MANAGED,
@@ -948,6 +1155,12 @@ export class CdkStack extends cdk.Stack {
           cachePolicy: cloudfront.CachePolicy.CACHING_DISABLED,
           originRequestPolicy: cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
         },
+        '/ws': {
+          origin: new origins.HttpOrigin(`${chatWebSocketApi.apiId}.execute-api.${this.region}.amazonaws.com`),
+          viewerProtocolPolicy: cloudfront.ViewerProtocolPolicy.HTTPS_ONLY,
+          cachePolicy: cloudfront.CachePolicy.CACHING_DISABLED,
+          originRequestPolicy: cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+        },
       },
       defaultRootObject: 'index.html',
       errorResponses: [
@@ -999,6 +1212,11 @@ export class CdkStack extends cdk.Stack {
       description: 'Frontend URL',
     });
 
+    new cdk.CfnOutput(this, 'ChatWebSocketURL', {
+      value: chatWebSocketStage.url,
+      description: 'Direct WebSocket URL for streaming chat (the frontend uses /ws on the CloudFront domain)',
+    });
+
     new cdk.CfnOutput(this, 'KnowledgeBaseId', {
       value: knowledgeBase.attrKnowledgeBaseId,
       description: 'Bedrock Knowledge Base ID',
@@ -0,0 +1,67 @@
+"""Set ``listPartition`` on jobs so they appear in the sharded job listing.
+
+Jobs created before the ``jobsByUploadTime`` index have no ``listPartition``,
+and jobs from its first release carry the unsharded ``JOB``. Neither is in a
+shard the API queries, so the dashboard does not show them. This script scans
+the jobs table once and writes the shard each job belongs to (the same hash the
+API uses). It is idempotent; rerun it after changing ``JOB_LIST_SHARDS``.
+
+    python cdk/scripts/backfill_job_list_partition.py --table <JobsTable name>
+    python cdk/scripts/backfill_job_list_partition.py --table <JobsTable name> --shards 4 --dry-run
+
+Needs boto3 and credentials allowed to Scan and UpdateItem on the table.
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+API_HANDLER = Path(__file__).resolve().parent.parent / 'lambda-functions' / 'api-handler'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--table', required=True, help='jobs table name (the JobsTable resource of the stack)')
+    parser.add_argument('--shards', type=int, default=4, help="the api-handler's JOB_LIST_SHARDS")
+    parser.add_argument('--region', help='AWS region (default: the configured one)')
+    parser.add_argument('--dry-run', action='store_true', help='count the jobs to update without writing')
+    args = parser.parse_args(argv)
+
+    # job_listing reads the shard count at import
+    os.environ['JOB_LIST_SHARDS'] = str(args.shards)
+    sys.path.insert(0, str(API_HANDLER))
+    import boto3
+    import job_listing
+
+    dynamodb = boto3.client('dynamodb', region_name=args.region)
+    scanned = updated = 0
+    params = {'TableName': args.table, 'ProjectionExpression': 'jobId, listPartition, uploadTimestamp, recordType'}
+    while True:
+        response = dynamodb.scan(**params)
+        for item in response.get('Items', []):
+            scanned += 1
+            job_id = item['jobId']['S']
+            if 'recordType' in item or 'uploadTimestamp' not in item:
+                # Upload batch manifests and other non-job items stay out of the listing
+                continue
+            partition = job_listing.list_partition(job_id)
+            if item.get('listPartition', {}).get('S') == partition:
+                continue
+            updated += 1
+            if not args.dry_run:
+                dynamodb.update_item(
+                    TableName=args.table,
+                    Key={'jobId': {'S': job_id}},
+                    UpdateExpression='SET listPartition = :p',
+                    ConditionExpression='attribute_exists(jobId)',
+                    ExpressionAttributeValues={':p': {'S': partition}},
+                )
+        if not response.get('LastEvaluatedKey'):
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    print(f"Scanned {scanned} items; {'would update' if args.dry_run else 'updated'} {updated} jobs")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
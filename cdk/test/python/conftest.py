@@ -0,0 +1,42 @@
+"""Load Lambda modules by function directory.
+
+Every function ships modules with the same names (``index``, ``compaction``),
+so tests import them from a path instead of ``sys.path``. The common layer is
+on the path as it is in Lambda.
+"""
+import importlib.util
+import sys
+from pathlib import Path
+
+CDK_ROOT = Path(__file__).resolve().parents[2]
+FUNCTIONS = CDK_ROOT / 'lambda-functions'
+sys.path.insert(0, str(CDK_ROOT / 'lambda-layers' / 'common' / 'python'))
+
+
+def load(function, module):
+    """Import ``lambda-functions/<function>/<module>.py`` under a unique name.
+
+    Sibling imports (``from compaction import ...``) resolve inside the same
+    function directory and are removed from ``sys.modules`` afterwards, so the
+    next function's ``compaction`` is not shadowed.
+    """
+    name = f"{function.replace('-', '_')}_{module}"
+    if name in sys.modules:
+        return sys.modules[name]
+    directory = FUNCTIONS / function
+    spec = importlib.util.spec_from_file_location(name, directory / f"{module}.py")
+    loaded = importlib.util.module_from_spec(spec)
+    before = set(sys.modules)
+    sys.modules[name] = loaded
+    sys.path.insert(0, str(directory))
+    try:
+        spec.loader.exec_module(loaded)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    finally:
+        sys.path.remove(str(directory))
+        for added in set(sys.modules) - before - {name}:
+            if str(getattr(sys.modules[added], '__file__', '') or '').startswith(str(directory)):
+                del sys.modules[added]
+    return loaded
@@ -0,0 +1,57 @@
+import io
+
+from conftest import load
+
+outbox = load('act', 'outbox')
+
+
+class PreconditionFailed(Exception):
+    response = {'Error': {'Code': 'PreconditionFailed'}}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType, IfNoneMatch=None):
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise PreconditionFailed()
+        self.objects[Key] = Body.decode('utf-8')
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key].encode('utf-8'))}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+def outputs(s3):
+    return {k: v for k, v in s3.objects.items() if not k.startswith('agent_outputs/outbox/')}
+
+
+def flush(s3, run_id, action):
+    box = outbox.Outbox(outbox.S3Sink(s3, 'bucket'), 'job-1', run_id)
+    box.append(action, 'uploads/job-1/app.pdf', {'content': f"{action} for run {run_id}"})
+    return box.flush()
+
+
+def test_s3_sink_writes_one_text_file_per_action_in_the_original_layout():
+    s3 = FakeS3()
+    result = flush(s3, 'run-1', 'ineligibility_notice')
+    assert outputs(s3) == {'agent_outputs/uploads_job-1_app.pdf_ineligible.txt': 'ineligibility_notice for run run-1'}
+    assert result['written'] == 1
+
+
+def test_retried_run_rewrites_its_first_decision_instead_of_adding_another():
+    s3 = FakeS3()
+    flush(s3, 'run-1', 'ineligibility_notice')
+    result = flush(s3, 'run-1', 'document_request')
+    assert outputs(s3) == {'agent_outputs/uploads_job-1_app.pdf_ineligible.txt': 'ineligibility_notice for run run-1'}
+    assert result == {'location': 's3://bucket/agent_outputs/', 'written': 0, 'duplicates': 1}
+
+
+def test_new_run_replaces_the_previous_decision():
+    s3 = FakeS3()
+    flush(s3, 'run-1', 'ineligibility_notice')
+    flush(s3, 'run-2', 'document_request')
+    assert outputs(s3) == {'agent_outputs/uploads_job-1_app.pdf_document_request.txt': 'document_request for run run-2'}
@@ -0,0 +1,64 @@
+from conftest import load
+
+compaction = load('detect-impairments', 'compaction')
+
+
+def test_mixed_int_and_string_page_numbers():
+    data = {
+        'lab_report': [
+            {'page_number': 2, 'a1c': '7.1%'},
+            {'page_number': '10', 'a1c': '7.1%'},
+            {'page_number': 'iii', 'a1c': '7.1%'},
+            {'page_number': '1', 'glucose': '130 mg/dL'},
+        ],
+    }
+    compacted, _ = compaction.compact_extraction(data, token_budget=10_000)
+    pages = [record['pages'] for record in compacted['lab_report']]
+    assert pages == [[1], [2, 10, 'iii']]
+
+
+def test_mixed_page_numbers_in_omitted_records():
+    data = {'notes': [{'page_number': p, 'text': f"diagnosis {i} " * 40} for i, p in enumerate([3, '1', 'A'])]}
+    compacted, stats = compaction.compact_extraction(data, token_budget=50)
+    assert stats['records_omitted'] == 2
+    assert compacted['omitted_records'] == {'notes': [3, 'A']}
+
+
+def test_page_with_only_header_fields_and_blank_status_is_dropped():
+    data = {
+        'application': [
+            {'page_number': 1, 'name': 'Jane Doe', 'dob': '1980-02-01', 'smoker': 'No'},
+            {'page_number': 2, 'name': 'Jane Doe', 'dob': '1980-02-01', 'status': 'No information found'},
+        ],
+    }
+    compacted, stats = compaction.compact_extraction(data, token_budget=10_000)
+    assert stats['blank_pages_dropped'] == 1
+    assert compacted['applicant_header']['name']['pages'] == [1, 2]
+    assert compacted['application'] == [{'pages': [1], 'smoker': 'No'}]
+
+
+def test_generic_demographics_collapse_only_from_applicant_forms():
+    data = {
+        'LIFE_INSURANCE_APPLICATION': [
+            {'page_number': 1, 'name': 'Jane Doe', 'state': 'OH', 'smoker': 'No'},
+            {'page_number': 2, 'name': 'Jane Doe', 'state': 'OH', 'occupation': 'Teacher'},
+        ],
+        'ATTENDING_PHYSICIAN_STATEMENT': [
+            {'page_number': 3, 'patient_name': 'Jane Doe', 'name': 'Dr. Alan Smith', 'state': 'PA',
+             'diagnosis': 'Type 2 diabetes'},
+        ],
+    }
+    compacted, _ = compaction.compact_extraction(data, token_budget=10_000)
+    header = compacted['applicant_header']
+    assert header['name'] == {'value': 'Jane Doe', 'pages': [1, 2]}
+    assert header['state'] == {'value': 'OH', 'pages': [1, 2]}
+    assert header['patient_name']['pages'] == [3]
+    assert compacted['ATTENDING_PHYSICIAN_STATEMENT'] == [
+        {'pages': [3], 'name': 'Dr. Alan Smith', 'state': 'PA', 'diagnosis': 'Type 2 diabetes'}]
+
+
+def test_long_narrative_is_not_truncated():
+    narrative = 'Patient reports chest pain on exertion. ' * 200
+    data = {'medical_report': [{'page_number': 1, 'history': narrative}]}
+    compacted, _ = compaction.compact_extraction(data, token_budget=100_000)
+    assert compacted['medical_report'][0]['history'] == narrative
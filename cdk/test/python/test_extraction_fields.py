@@ -0,0 +1,24 @@
+import extraction_fields
+import record_index
+
+
+def test_generic_keys_belong_to_the_applicant_only_on_applicant_forms():
+    assert extraction_fields.is_applicant_field('LIFE_INSURANCE_APPLICATION', 'name')
+    assert extraction_fields.is_applicant_field('life_insurance_application', 'applicant.address.state')
+    assert not extraction_fields.is_applicant_field('ATTENDING_PHYSICIAN_STATEMENT', 'name')
+    assert not extraction_fields.is_applicant_field('MEDICAL_REPORT', 'age')
+    assert not extraction_fields.is_applicant_field('life_insurance_application', 'beneficiaries[0].name')
+    assert extraction_fields.is_applicant_field('ATTENDING_PHYSICIAN_STATEMENT', 'patient_name')
+
+
+def test_record_index_header_skips_other_parties():
+    data = {
+        'life_insurance_application': [{'page_number': 1, 'name': 'Jane Doe', 'family_history': [
+            {'relation': 'mother', 'age': 71, 'name': 'Mary Doe'}]}],
+        'attending_physician_statement': [{'page_number': 4, 'name': 'Dr. Alan Smith', 'patient_name': 'Jane Doe'},
+                                          {'page_number': 5, 'status': 'No information found'}],
+    }
+    header = record_index.build_index(data, vectors='none')['header']
+    assert [(field['key'], field['value'], field['pages']) for field in header] == [
+        ('name', 'Jane Doe', [1]), ('patient_name', 'Jane Doe', [4])]
+    assert {record['page'] for record in record_index.build_records(data)} == {1, 4}
@@ -0,0 +1,66 @@
+import os
+
+from conftest import load
+
+os.environ['JOB_LIST_SHARDS'] = '4'
+job_listing = load('api-handler', 'job_listing')
+
+
+class FakeIndex:
+    """Query on a listPartition/uploadTimestamp index: Limit counts items evaluated before the filter"""
+
+    def __init__(self, jobs):
+        self.items = [{'jobId': {'S': j}, 'listPartition': {'S': job_listing.list_partition(j)},
+                       'uploadTimestamp': {'S': ts}, 'status': {'S': status}} for j, ts, status in jobs]
+        self.calls = 0
+
+    def query(self, **params):
+        self.calls += 1
+        partition = params['ExpressionAttributeValues'][':p']['S']
+        rows = sorted((i for i in self.items if i['listPartition']['S'] == partition),
+                      key=lambda i: i['uploadTimestamp']['S'], reverse=True)
+        start = params.get('ExclusiveStartKey')
+        if start:
+            rows = rows[[r['jobId'] for r in rows].index(start['jobId']) + 1:]
+        page, rest = rows[:params['Limit']], rows[params['Limit']:]
+        wanted = params['ExpressionAttributeValues'].get(':f_status')
+        excluded = params['ExpressionAttributeValues'].get(':x0')
+        items = [i for i in page if (not wanted or i['status'] == wanted) and i['status'] != excluded]
+        response = {'Items': items}
+        if rest and page:
+            response['LastEvaluatedKey'] = {k: page[-1][k] for k in ('jobId', 'listPartition', 'uploadTimestamp')}
+        return response
+
+
+def all_pages(index, limit, **kwargs):
+    pages, token = [], None
+    while True:
+        page = job_listing.list_jobs(index, 'jobs', limit, next_token=token, **kwargs)
+        pages.append([j['jobId'] for j in page['jobs']])
+        token = page['nextToken']
+        if not token:
+            return pages
+
+
+JOBS = [(f"job-{n:02d}", f"2026-01-01T00:00:{n:02d}", 'COMPLETE' if n % 3 else 'FAILED') for n in range(30)]
+
+
+def test_pages_are_newest_first_across_shards_without_gaps():
+    pages = all_pages(FakeIndex(JOBS), 7)
+    assert [len(p) for p in pages] == [7, 7, 7, 7, 2]
+    assert sum(pages, []) == [j for j, _ts, _s in reversed(JOBS)]
+
+
+def test_filtered_pages_are_filled_before_returning():
+    pages = all_pages(FakeIndex(JOBS), 4, filters={'status': 'FAILED'})
+    assert [len(p) for p in pages[:-1]] == [4] * (len(pages) - 1)
+    assert sum(pages, []) == [j for j, _ts, s in reversed(JOBS) if s == 'FAILED']
+
+
+def test_excluded_statuses_are_left_out():
+    pages = all_pages(FakeIndex(JOBS), 50, exclude_statuses=('FAILED',))
+    assert len(pages) == 1 and len(pages[0]) == 20
+
+
+def test_jobs_spread_over_every_shard():
+    assert {job_listing.list_partition(j) for j, _ts, _s in JOBS} == {f"JOB#{n}" for n in range(4)}
@@ -0,0 +1,61 @@
+import pytest
+
+from conftest import load
+
+quick_answer = load('chat', 'quick_answer')
+
+
+def calculator(name, tool_input):
+    return {'toolName': name, 'input': tool_input}, f"{name} ok"
+
+
+def ask(data, question):
+    router = quick_answer.QuickAnswerRouter(calculator)
+    return router.answer({'extracted_data': data, 'language': 'en-US'}, question)
+
+
+APPLICATION = {'life_insurance_application': [{
+    'page_number': 1,
+    'applicant_details': {'full_name': 'Jane Doe', 'age': 52, 'gender': 'Female', 'smoker': 'No',
+                          'height': '5 ft 6 in', 'weight': '150 lbs'},
+    'family_history': [{'relation': 'Father', 'age': 82, 'gender': 'Male'}],
+    'beneficiaries': [{'name': 'John Doe', 'relationship': 'Spouse'}],
+}]}
+
+
+def test_age_comes_from_the_applicant_not_family_history():
+    result = ask(APPLICATION, 'how old is the applicant?')
+    assert result['response'].startswith('Age: 52 ')
+
+
+def test_only_other_party_values_fall_back_to_the_model():
+    data = {'aps': [{'page_number': 3, 'family_history': [{'relation': 'Mother', 'age': 79}]}]}
+    assert ask(data, 'how old is the applicant?') is None
+
+
+def test_mortality_inputs_ignore_relatives():
+    result = ask(APPLICATION, 'mortality score?')
+    assert result['toolCalls'][0]['input']['age'] == 52
+    assert result['toolCalls'][0]['input']['gender'] == 'female'
+
+
+APPLICATION_AND_APS = {
+    'life_insurance_application': [{'page_number': 1, 'name': 'Jane Doe', 'age': 45}],
+    'attending_physician_statement': [{'page_number': 7, 'name': 'Dr. Alan Smith', 'age': 61,
+                                       'diagnosis': 'Type 2 diabetes'}],
+}
+
+
+def test_aps_section_fields_are_not_the_applicants():
+    assert ask(APPLICATION_AND_APS, 'what is the name?')['response'] == 'Name: Jane Doe (page 1).'
+
+
+@pytest.mark.parametrize('question', [
+    'What is the name of the attending physician?',
+    'How old is the spouse?',
+    "What is the father's age?",
+    "the applicant's age at diagnosis",
+    'age when diagnosed with diabetes?',
+])
+def test_questions_about_someone_else_go_to_the_model(question):
+    assert ask(APPLICATION_AND_APS, question) is None
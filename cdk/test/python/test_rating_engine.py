@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import load
+
+rating_engine = load('score', 'rating_engine')
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return rating_engine.load_rules()
+
+
+def hypertension(bp, age):
+    return {'impairment_id': 'hypertension', 'scoring_factors': {'average_bp': bp, 'age': age}}
+
+
+def test_controlled_row_parses_as_compound_upper_bound():
+    condition = rating_engine.parse_condition('≤140/90 (controlled)')
+    assert condition['ranges'] == [[None, 140.0, False, True], [None, 90.0, False, True]]
+
+
+def test_leading_operator_applies_to_every_component():
+    condition = rating_engine.parse_condition('>180/110')
+    assert condition['ranges'] == [[180.0, None, False, False], [110.0, None, False, False]]
+
+
+@pytest.mark.parametrize('bp, points', [
+    ('145/108', 75),   # systolic 141-150 is +0, diastolic 106-110 is +75
+    ('120/108', 75),
+    ('165/88', 50),
+    ('130/85', 0),     # controlled
+])
+def test_compound_bp_takes_the_more_severe_component(rules, bp, points):
+    result = rating_engine.score_impairment(hypertension(bp, 45), rules)
+    assert result['resolved'] is True
+    assert result['sub_total'] == points
+
+
+def test_postpone_row_is_left_to_the_agent(rules):
+    result = rating_engine.score_impairment(hypertension('185/115', 50), rules)
+    assert result['resolved'] is False
+    assert 'postpone' in result['unresolved_reason'].lower()
+    assert 'sub_total' not in result
@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import load
+
+
+@pytest.fixture
+def score(monkeypatch):
+    module = load('score', 'index')
+    rule_score = {'impairment_id': 'hypertension', 'sub_total': 50, 'reason': 'rules', 'components': []}
+    monkeypatch.setattr(module, '_score_with_rules', lambda payload, _type: (
+        [rule_score], [p for p in payload if p['impairment_id'] != 'hypertension']))
+    return module
+
+
+PAYLOAD = [{'impairment_id': 'hypertension'}, {'impairment_id': 'asthma'}, {'impairment_id': 'depression'}]
+
+
+def test_impairments_the_agent_skips_get_a_placeholder(score, monkeypatch):
+    monkeypatch.setattr(score, '_run_agent', lambda payload, *_args: {
+        'impairment_scores': [{'impairment_id': 'Asthma', 'sub_total': 25, 'reason': 'mild'}]})
+    result = score._score_impairments(PAYLOAD, 'life')
+    assert [s['impairment_id'] for s in result['impairment_scores']] == ['hypertension', 'Asthma', 'depression']
+    assert 'did not return a result' in result['impairment_scores'][2]['reason']
+    assert result['total_score'] == 75
+
+
+def test_agent_failure_keeps_rule_scores(score, monkeypatch):
+    def fail(*_args):
+        raise RuntimeError('throttled')
+    monkeypatch.setattr(score, '_run_agent', fail)
+    result = score._score_impairments(PAYLOAD, 'life')
+    assert len(result['impairment_scores']) == 3
+    assert result['total_score'] == 50
@@ -0,0 +1,109 @@
+from conftest import load
+
+triage = load('act', 'triage')
+
+DOCUMENTS = {'DEFAULT_APP_TYPE': ['Photo ID']}
+
+
+def run(data, insurance_type='life', document_type='LIFE_INSURANCE_APPLICATION'):
+    return triage.triage('APP-1', document_type, insurance_type, data, DOCUMENTS)
+
+
+def test_prior_policy_effective_date_is_not_the_requested_start_date():
+    data = {'commercial_property_application': [{
+        'page_number': 1,
+        'application_details': {'requested_policy_start_date': '2027-03-01'},
+        'prior_policy': {'effective_date': '2019-01-01'},
+    }]}
+    decision = run(data, 'property_casualty', 'COMMERCIAL_PROPERTY_APPLICATION')
+    assert decision['action'] == 'request_documents'
+
+
+def test_past_requested_start_date_is_a_knockout():
+    data = {'application': [{'application_details': {'requested_policy_start_date': '2020-01-01'}}]}
+    decision = run(data, 'property_casualty', 'COMMERCIAL_PROPERTY_APPLICATION')
+    assert decision == {'path': 'rules', 'action': 'ineligible', 'reason_for_ineligibility': 'past policy start date'}
+
+
+def test_conflicting_start_dates_go_to_the_agent():
+    data = {'application': [
+        {'page_number': 1, 'application_details': {'requested_policy_start_date': '2020-01-01'}},
+        {'page_number': 2, 'application_details': {'requested_policy_start_date': '2027-01-01'}},
+    ]}
+    decision = run(data, 'property_casualty', 'COMMERCIAL_PROPERTY_APPLICATION')
+    assert decision['path'] == 'agent'
+    assert 'conflicting requested policy start dates' in decision['reason']
+
+
+def test_travel_destination_is_not_residence():
+    data = {'life_insurance_application': [{
+        'applicant_details': {'country_of_residence': 'United States', 'age': 45},
+        'travel': [{'country': 'Iran', 'purpose': 'family visit'}],
+    }]}
+    assert run(data)['action'] == 'request_documents'
+
+
+def test_sanctioned_residence_is_a_knockout():
+    data = {'life_insurance_application': [{
+        'applicant_details': {'age': 45, 'address': {'city': 'Havana', 'country': 'Cuba'}},
+    }]}
+    decision = run(data)
+    assert decision['action'] == 'ineligible'
+    assert 'sanctioned country (Cuba)' in decision['reason_for_ineligibility']
+
+
+def test_conflicting_residence_goes_to_the_agent():
+    data = {'life_insurance_application': [
+        {'page_number': 1, 'applicant_details': {'country_of_residence': 'Syria', 'age': 45}},
+        {'page_number': 2, 'applicant_details': {'country_of_residence': 'Canada'}},
+    ]}
+    decision = run(data)
+    assert decision['path'] == 'agent'
+    assert 'conflicting applicant countries' in decision['reason']
+
+
+def test_relative_age_does_not_decide_applicant_age():
+    data = {'life_insurance_application': [{
+        'applicant_details': {'age': 52},
+        'family_history': [{'relation': 'father', 'age': 91}],
+    }]}
+    assert run(data)['action'] == 'request_documents'
+
+
+def test_hard_knockout_wins_over_an_ambiguous_field():
+    data = {'life_insurance_application': [
+        {'page_number': 1, 'applicant_details': {'sanctioned_entity_status': 'Positive', 'age': 45}},
+        {'page_number': 2, 'applicant_details': {'age': 47}},
+    ]}
+    assert run(data)['reason_for_ineligibility'] == 'sanctioned entity match'
+
+
+def test_requirements_letter_goes_to_the_applicant_not_the_physician():
+    data = {'life_insurance_application': [{
+        'applicant_details': {'full_name': 'Jane Doe', 'age': 45, 'email': 'jane@example.com'},
+        'attending_physician': {'name': 'Dr. Smith', 'email': 'smith@clinic.example.com'},
+    }]}
+    decision = run(data)
+    assert decision['recipient_email'] == 'jane@example.com'
+    assert 'Jane Doe' in decision['email_body']
+
+
+def test_only_other_party_emails_fall_back_to_the_department_inbox():
+    data = {'life_insurance_application': [{
+        'applicant_details': {'age': 45},
+        'agent_details': {'name': 'Bob Agent', 'email': 'bob@agency.example.com'},
+        'employer': {'email': 'hr@employer.example.com'},
+    }]}
+    decision = run(data)
+    assert decision['recipient_email'] == triage.DEFAULT_RECIPIENT
+    assert 'Bob Agent' not in decision['email_body']
+
+
+def test_prior_location_crime_grade_is_not_a_knockout():
+    data = {'commercial_property_application': [{
+        'application_details': {'requested_policy_start_date': '2027-03-01'},
+        'prior_location': {'property_crime_grade': 'F'},
+        'crime_report_data': {'property_crime_grade': 'B'},
+    }]}
+    decision = run(data, 'property_casualty', 'COMMERCIAL_PROPERTY_APPLICATION')
+    assert decision['action'] == 'request_documents'
@@ -1,9 +1,11 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { BrowserRouter as Router, Routes, Route, useNavigate, useParams, Navigate, useLocation } from 'react-router-dom'
 import { useTranslation } from 'react-i18next'
 import ManualPage from './components/ManualPage'
 import { LanguageSelector } from './components/LanguageSelector'
 import { apiClient } from './utils/apiClient'
+import { subscribeJobEvents, PUSH_FALLBACK_POLL_MS } from './utils/jobEvents'
+import { uploadMultipart, MULTIPART_THRESHOLD_BYTES } from './utils/multipartUpload'
 import './styles/App.css'
 import { JobPage } from './components/JobPage'
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome'
@@ -95,7 +97,27 @@ function UploadPage() {
     }
   }
 
+  const uploadLargeFile = (file: File, batchId?: string) => {
+    setUploadProgress(prev => ({ ...prev, [file.name]: t('upload.uploadingToS3') }))
+    return uploadMultipart(file, {
+      insuranceType,
+      batchId,
+      onProgress: (fraction) => setUploadProgress(prev => ({
+        ...prev,
+        [file.name]: fraction >= 1 ? t('upload.uploadSuccess') : `${t('upload.uploadingToS3')} ${Math.round(fraction * 100)}%`,
+      })),
+    })
+  }
+
   const uploadSingleFile = async (file: File) => {
+    if (file.size >= MULTIPART_THRESHOLD_BYTES) {
+      const jobId = await uploadLargeFile(file)
+      setUploading(false)
+      setFiles([])
+      navigate(`/jobs/${jobId}`)
+      return
+    }
+
     setUploadProgress({ [file.name]: t('upload.gettingUploadUrl') })
 
     const presignedUrlResponse = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/documents/upload`, {
@@ -145,60 +167,99 @@ function UploadPage() {
   }
 
   const uploadMultipleFiles = async (files: File[]) => {
-    // Step 1: Get batch upload URLs
-    setUploadProgress(Object.fromEntries(files.map(f => [f.name, t('upload.gettingUploadUrls')])))
-
-    const batchResponse = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/documents/batch-upload`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        files: files.map(f => ({ filename: f.name })),
-        insuranceType: insuranceType
-      }),
-    })
+    // Large files use multipart uploads and join the batch created for the small ones
+    const largeFiles = files.filter(f => f.size >= MULTIPART_THRESHOLD_BYTES)
+    const smallFiles = files.filter(f => f.size < MULTIPART_THRESHOLD_BYTES)
+    let batchId: string | undefined
+
+    if (smallFiles.length > 0) {
+      const files = smallFiles
+      // Step 1: Get batch upload URLs
+      setUploadProgress(Object.fromEntries(files.map(f => [f.name, t('upload.gettingUploadUrls')])))
+
+      const batchResponse = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/documents/batch-upload`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          files: files.map(f => ({ filename: f.name })),
+          insuranceType: insuranceType
+        }),
+      })
 
-    if (!batchResponse.ok) {
-      if (batchResponse.status === 401) {
-        throw new Error(t('errors.unauthorizedBatchUpload'));
-      } else {
-        const errorData = await batchResponse.json().catch(() => ({ error: t('errors.failedBatchUploadUrls') }));
-        throw new Error(errorData.error || `${t('errors.failedBatchUploadUrls')}: ${batchResponse.statusText}`);
+      if (!batchResponse.ok) {
+        if (batchResponse.status === 401) {
+          throw new Error(t('errors.unauthorizedBatchUpload'));
+        } else {
+          const errorData = await batchResponse.json().catch(() => ({ error: t('errors.failedBatchUploadUrls') }));
+          throw new Error(errorData.error || `${t('errors.failedBatchUploadUrls')}: ${batchResponse.statusText}`);
+        }
       }
-    }
 
-    const { uploadUrls } = await batchResponse.json()
-    if (!uploadUrls || !Array.isArray(uploadUrls)) {
-      throw new Error(t('errors.invalidBatchResponse'));
-    }
+      const batchData = await batchResponse.json()
 
-    // Step 2: Upload all files to S3
-    const uploadPromises = files.map(async (file, index) => {
-      const uploadInfo = uploadUrls.find(u => u.filename === file.name)
-      if (!uploadInfo) {
-        throw new Error(t('errors.noUploadUrlForFile', { filename: file.name }))
-      }
+      const uploadFile = async (file: File, uploadInfo: { uploadUrl: string }) => {
+        setUploadProgress(prev => ({ ...prev, [file.name]: t('upload.uploadingToS3') }))
 
-      setUploadProgress(prev => ({ ...prev, [file.name]: t('upload.uploadingToS3') }))
+        const s3UploadResponse = await fetch(uploadInfo.uploadUrl, {
+          method: 'PUT',
+          headers: {
+            'Content-Type': file.type,
+          },
+          body: file,
+        })
 
-      const s3UploadResponse = await fetch(uploadInfo.uploadUrl, {
-        method: 'PUT',
-        headers: {
-          'Content-Type': file.type,
-        },
-        body: file,
-      })
+        if (!s3UploadResponse.ok) {
+          throw new Error(t('errors.s3UploadFailed', { filename: file.name, error: s3UploadResponse.statusText }))
+        }
 
-      if (!s3UploadResponse.ok) {
-        throw new Error(t('errors.s3UploadFailed', { filename: file.name, error: s3UploadResponse.statusText }))
+        setUploadProgress(prev => ({ ...prev, [file.name]: t('upload.uploadSuccess') }))
       }
 
-      setUploadProgress(prev => ({ ...prev, [file.name]: t('upload.uploadSuccess') }))
-    })
+      // Step 2: Upload all files to S3
+      if (batchData.mode === 'async') {
+        // Large batch: job records are written in the background, so fetch URLs as they become ready
+        const uploadPromises: Promise<void>[] = []
+        let cursor = batchData.cursor || 0
+        let done = false
+        while (!done) {
+          await new Promise(resolve => setTimeout(resolve, 1000))
+          const readyResponse = await apiClient.fetch(
+            `${import.meta.env.VITE_API_URL}/documents/batch-upload/${batchData.batchId}?cursor=${cursor}`
+          )
+          if (!readyResponse.ok) {
+            throw new Error(t('errors.failedBatchUploadUrls'))
+          }
+          const ready = await readyResponse.json()
+          if (ready.status === 'FAILED') {
+            throw new Error(ready.error || t('errors.failedBatchUploadUrls'))
+          }
+          for (const uploadInfo of ready.uploadUrls) {
+            uploadPromises.push(uploadFile(files[uploadInfo.fileIndex], uploadInfo))
+          }
+          cursor = ready.cursor
+          done = ready.done
+        }
+        await Promise.all(uploadPromises)
+      } else {
+        const { uploadUrls } = batchData
+        if (!uploadUrls || !Array.isArray(uploadUrls)) {
+          throw new Error(t('errors.invalidBatchResponse'));
+        }
+        await Promise.all(files.map(async (file, index) => {
+          const uploadInfo = uploadUrls.find((u: any) => u.fileIndex === index) || uploadUrls.find((u: any) => u.filename === file.name)
+          if (!uploadInfo) {
+            throw new Error(t('errors.noUploadUrlForFile', { filename: file.name }))
+          }
+          await uploadFile(file, uploadInfo)
+        }))
+      }
+      batchId = batchData.batchId
+    }
+
+    await Promise.all(largeFiles.map(file => uploadLargeFile(file, batchId)))
 
-    await Promise.all(uploadPromises)
-    
     setUploading(false)
     setFiles([])
     navigate('/jobs')
@@ -477,10 +538,19 @@ interface Job {
   status: 'Complete' | 'In Progress' | 'Failed';
 }
 
+const JOBS_PAGE_SIZE = 50;
+
 // Add the JobsList component
 function JobsList() {
   const { t } = useTranslation()
-  const [jobs, setJobs] = useState<Job[]>([]);
+  // latestJobs is the first page (refreshed by polling); olderJobs holds pages added with "Load more"
+  const [latestJobs, setLatestJobs] = useState<Job[]>([]);
+  const [olderJobs, setOlderJobs] = useState<Job[]>([]);
+  const [nextToken, setNextToken] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const loadedMoreRef = useRef(false);
+  const pushConnectedRef = useRef(false);
+  const lastJobsFetchRef = useRef(0);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [collapsedBatches, setCollapsedBatches] = useState<Set<string>>(new Set());
@@ -503,6 +573,9 @@ function JobsList() {
     }
   };
 
+  const latestIds = new Set(latestJobs.map(job => job.jobId));
+  const jobs = [...latestJobs, ...olderJobs.filter(job => !latestIds.has(job.jobId))];
+
   const filteredJobs = searchQuery
   ? jobs.filter(job =>
       job.originalFilename.toLowerCase().includes(searchQuery.toLowerCase())
@@ -513,13 +586,33 @@ function JobsList() {
   useEffect(() => {
     fetchJobs();
     
-    // Set up polling to refresh job statuses every 5 seconds
+    // Set up polling to refresh job statuses every 5 seconds; while status
+    // pushes are live it only runs as a slow fallback
     const pollInterval = setInterval(() => {
+      if (pushConnectedRef.current && Date.now() - lastJobsFetchRef.current < PUSH_FALLBACK_POLL_MS) return;
       fetchJobs();
     }, 5000);
+
+    // Status pushes collapse into at most one refresh per second
+    let refreshTimer: ReturnType<typeof setTimeout> | null = null;
+    const unsubscribe = subscribeJobEvents(
+      { allJobs: true },
+      () => {
+        if (refreshTimer) return;
+        refreshTimer = setTimeout(() => {
+          refreshTimer = null;
+          fetchJobs();
+        }, 1000);
+      },
+      (connected) => { pushConnectedRef.current = connected; },
+    );
     
-    // Cleanup interval on unmount
-    return () => clearInterval(pollInterval);
+    // Cleanup interval and subscription on unmount
+    return () => {
+      clearInterval(pollInterval);
+      if (refreshTimer) clearTimeout(refreshTimer);
+      unsubscribe();
+    };
   }, []);
 
   const toggleBatch = (batchId: string) => {
@@ -554,9 +647,16 @@ function JobsList() {
     return earliest.toLocaleString();
   };
 
+  const fetchJobsPage = (token?: string | null) => {
+    const params = new URLSearchParams({ limit: String(JOBS_PAGE_SIZE) });
+    if (token) params.set('nextToken', token);
+    return apiClient.fetch(`${import.meta.env.VITE_API_URL}/jobs?${params.toString()}`);
+  };
+
   const fetchJobs = async () => {
+    lastJobsFetchRef.current = Date.now();
     try {
-      const response = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/jobs`);
+      const response = await fetchJobsPage();
 
       if (!response.ok) {
         if (response.status === 401) {
@@ -568,7 +668,11 @@ function JobsList() {
       }
 
       const data = await response.json();
-      setJobs(data.jobs || data);
+      setLatestJobs(data.jobs || data);
+      // Once older pages are loaded, keep their cursor rather than the first page's
+      if (!loadedMoreRef.current) {
+        setNextToken(data.nextToken || null);
+      }
     } catch (err) {
       setError(err instanceof Error ? err.message : t('common.error'));
     } finally {
@@ -576,6 +680,25 @@ function JobsList() {
     }
   };
 
+  const loadMoreJobs = async () => {
+    if (!nextToken || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetchJobsPage(nextToken);
+      if (!response.ok) {
+        throw new Error(t('jobs.fetchError'));
+      }
+      const data = await response.json();
+      loadedMoreRef.current = true;
+      setOlderJobs(prev => [...prev, ...(data.jobs || [])]);
+      setNextToken(data.nextToken || null);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : t('common.error'));
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatDate = (timestamp: string) => {
     const date = new Date(timestamp);
     if (isNaN(date.getTime())) return 'Invalid date';
@@ -735,6 +858,15 @@ function JobsList() {
               ));
             })()}
           </div>
+          {nextToken && (
+            <button
+              onClick={loadMoreJobs}
+              className="refresh-button"
+              disabled={loadingMore}
+            >
+              {loadingMore ? t('jobs.loading') : t('jobs.loadMore')}
+            </button>
+          )}
           </>
         )}
       </div>
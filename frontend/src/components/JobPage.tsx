@@ -5,6 +5,8 @@ import ReactMarkdown from 'react-markdown'
 import remarkGfm from 'remark-gfm'
 import { useTranslation } from 'react-i18next'
 import { apiClient } from '../utils/apiClient'
+import { streamChat } from '../utils/chatStream'
+import { subscribeJobEvents, PUSH_FALLBACK_POLL_MS } from '../utils/jobEvents'
 import { exportToPdf } from '../utils/pdfExport'
 import '../styles/JobPage.css'
 import { useNavigate } from 'react-router-dom'
@@ -320,6 +322,9 @@ export function JobPage({ jobId }: JobPageProps) {
 
   const [isLoadingJobDetails, setIsLoadingJobDetails] = useState(true);
   const pollingIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const jobEtagRef = useRef<string | null>(null);
+  const pushConnectedRef = useRef(false);
+  const lastJobFetchRef = useRef(0);
 
   // Agent Action state - ADDED
   const [agentActionData, setAgentActionData] = useState<AgentActionData | null>(null);
@@ -378,7 +383,13 @@ export function JobPage({ jobId }: JobPageProps) {
     }
   }, [jobId, pdfDownloadUrl]); // Added pdfDownloadUrl to dependencies to prevent infinite loops from re-fetching
 
-  const fetchJobDetailsAndUpdateState = useCallback(async (isPolling = false) => {
+  const fetchJobDetailsAndUpdateState = useCallback(async (isPolling = false, pushed = false) => {
+    // With live status pushes, timer polls only run as a slow fallback
+    if (isPolling && !pushed && pushConnectedRef.current && Date.now() - lastJobFetchRef.current < PUSH_FALLBACK_POLL_MS) {
+      return;
+    }
+    lastJobFetchRef.current = Date.now();
+
     if (!isPolling) {
       setIsLoadingJobDetails(true);
       setCurrentPhase(t('jobPage.loadingJobDetails'));
@@ -388,9 +399,19 @@ export function JobPage({ jobId }: JobPageProps) {
     }
 
     try {
+      // While polling, send the last ETag so an unchanged job costs a 304 with no body
+      const conditionalHeaders: Record<string, string> = isPolling && jobEtagRef.current
+        ? { 'If-None-Match': jobEtagRef.current }
+        : {};
       const response = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/jobs/${jobId}`, {
+        headers: conditionalHeaders,
+        cache: 'no-store',
       });
 
+      if (response.status === 304) {
+        return;
+      }
+
       if (!response.ok) {
         const errorData: { detail?: string, message?: string, error?: string } = await response.json().catch(() => ({}));
         const errorMsg = errorData.detail || errorData.message || errorData.error || `Failed to fetch job details: ${response.status}`;
@@ -398,6 +419,7 @@ export function JobPage({ jobId }: JobPageProps) {
       }
 
       const jobApiData: any = await response.json();
+      jobEtagRef.current = response.headers.get('ETag');
 
       const pageAnalysisTransformed: Record<string, PageData> = {};
 
@@ -716,6 +738,16 @@ export function JobPage({ jobId }: JobPageProps) {
     };
   }, [jobId, fetchJobDetailsAndUpdateState]);
 
+  // Refresh as soon as the pipeline reports a status change for this job
+  useEffect(() => {
+    if (!jobId) return;
+    return subscribeJobEvents(
+      { jobIds: [jobId] },
+      () => fetchJobDetailsAndUpdateState(true, true),
+      (connected) => { pushConnectedRef.current = connected; },
+    );
+  }, [jobId, fetchJobDetailsAndUpdateState]);
+
   // This effect will run once when analysisData is first populated,
   // to fetch the document URL without being in the polling-related effect.
   useEffect(() => {
@@ -1043,18 +1075,36 @@ export function JobPage({ jobId }: JobPageProps) {
     const userMessage: Message = { id: Date.now().toString(), text: newMessage.trim(), sender: 'user', timestamp: new Date()};
     const updatedMessages = [...messages, userMessage];
     setMessages(updatedMessages); setNewMessage(''); setIsTyping(true);
+    const messagesToSend = updatedMessages.filter(msg => msg.id !== '1');
+    const aiMessageId = (Date.now() + 1).toString();
+    const appendAiText = (text: string) => setMessages(prev => prev.some(m => m.id === aiMessageId)
+      ? prev.map(m => m.id === aiMessageId ? { ...m, text: m.text + text } : m)
+      : [...prev, { id: aiMessageId, text, sender: 'ai', timestamp: new Date() }]);
     try {
-      const messagesToSend = updatedMessages.filter(msg => msg.id !== '1');
-      const response = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/chat/${jobId}`, {
-        method: 'POST', headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ messages: messagesToSend })
+      // Stream the answer over the WebSocket API so text shows up as it is generated
+      await streamChat(jobId, messagesToSend, (event) => {
+        if (event.type === 'text' && event.delta) {
+          setIsTyping(false);
+          appendAiText(event.delta);
+        }
       });
-      if (!response.ok) throw new Error('AI chat error');
-      const data = await response.json();
-      const aiMessage: Message = { id: (Date.now() + 1).toString(), text: data.response, sender: 'ai', timestamp: new Date()};
-      setMessages(prev => [...prev, aiMessage]);
-    } catch (err) {
-      setMessages(prev => [...prev, {id: (Date.now() + 1).toString(), text: t('jobPage.chat.error'), sender: 'ai', timestamp: new Date()}]);
+    } catch (streamErr: any) {
+      if (streamErr?.receivedAny) {
+        appendAiText(`\n\n${t('jobPage.chat.error')}`);
+      } else {
+        // Socket unavailable before anything arrived: fall back to the REST endpoint
+        try {
+          const response = await apiClient.fetch(`${import.meta.env.VITE_API_URL}/chat/${jobId}`, {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ messages: messagesToSend })
+          });
+          if (!response.ok) throw new Error('AI chat error');
+          const data = await response.json();
+          appendAiText(data.response);
+        } catch (err) {
+          appendAiText(t('jobPage.chat.error'));
+        }
+      }
     } finally { setIsTyping(false); }
   };
 
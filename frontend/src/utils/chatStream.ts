@@ -0,0 +1,73 @@
+export interface ChatStreamEvent {
+  type: 'start' | 'sources' | 'text' | 'tool_call' | 'tool_result' | 'done' | 'error';
+  requestId?: string;
+  delta?: string;
+  response?: string;
+  error?: string;
+  [key: string]: unknown;
+}
+
+/**
+ * WebSocket URL for streaming chat. Defaults to /ws on the same host as the API
+ * (CloudFront routes it to the WebSocket API); VITE_CHAT_WS_URL overrides it.
+ */
+export function chatWebSocketUrl(): string {
+  if (import.meta.env.VITE_CHAT_WS_URL) {
+    return import.meta.env.VITE_CHAT_WS_URL;
+  }
+  const apiUrl = new URL(import.meta.env.VITE_API_URL || '/api', window.location.href);
+  const protocol = apiUrl.protocol === 'http:' ? 'ws:' : 'wss:';
+  return `${protocol}//${apiUrl.host}/ws`;
+}
+
+/**
+ * Send one chat turn over the WebSocket API and report events as they arrive.
+ * Resolves with the final response text; rejects if the socket fails or the
+ * server reports an error. `receivedAny` on the error tells callers whether it
+ * is still safe to retry over the REST endpoint.
+ */
+export function streamChat(
+  jobId: string,
+  messages: unknown[],
+  onEvent: (event: ChatStreamEvent) => void,
+): Promise<string> {
+  return new Promise((resolve, reject) => {
+    const requestId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    const socket = new WebSocket(chatWebSocketUrl());
+    let receivedAny = false;
+    let settled = false;
+
+    const fail = (message: string) => {
+      if (settled) return;
+      settled = true;
+      socket.close();
+      reject(Object.assign(new Error(message), { receivedAny }));
+    };
+
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ action: 'chat', jobId, messages, requestId }));
+    };
+    socket.onmessage = (msg) => {
+      let event: ChatStreamEvent;
+      try {
+        event = JSON.parse(msg.data);
+      } catch {
+        return;
+      }
+      if (event.requestId && event.requestId !== requestId) return;
+      receivedAny = true;
+      if (event.type === 'error') {
+        fail(event.error || 'AI chat error');
+        return;
+      }
+      onEvent(event);
+      if (event.type === 'done') {
+        settled = true;
+        socket.close();
+        resolve(event.response || '');
+      }
+    };
+    socket.onerror = () => fail('Chat connection error');
+    socket.onclose = () => fail('Chat connection closed');
+  });
+}
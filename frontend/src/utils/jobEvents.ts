@@ -0,0 +1,71 @@
+import { chatWebSocketUrl } from './chatStream';
+
+export interface JobStatusUpdate {
+  jobId: string;
+  batchId?: string | null;
+  status: string;
+  stage?: string | null;
+  stageTimestamp?: string | null;
+  progress?: number | null;
+}
+
+export interface JobEventsSubscription {
+  jobIds?: string[];
+  batchIds?: string[];
+  allJobs?: boolean;
+}
+
+// While pushes are flowing, polling drops to this slow fallback interval
+export const PUSH_FALLBACK_POLL_MS = 60000;
+
+/**
+ * Subscribe to job status pushes over the WebSocket API. Reconnects with
+ * backoff when the socket drops (API Gateway closes idle sockets after 10
+ * minutes) and reports whether pushes are currently live so callers can fall
+ * back to polling. Returns a function that closes the subscription.
+ */
+export function subscribeJobEvents(
+  subscription: JobEventsSubscription,
+  onUpdates: (updates: JobStatusUpdate[]) => void,
+  onConnectionChange?: (connected: boolean) => void,
+): () => void {
+  let socket: WebSocket | null = null;
+  let closed = false;
+  let retryDelay = 1000;
+  let retryTimer: ReturnType<typeof setTimeout> | null = null;
+
+  const connect = () => {
+    socket = new WebSocket(chatWebSocketUrl());
+    socket.onopen = () => {
+      socket?.send(JSON.stringify({ action: 'subscribe', ...subscription }));
+    };
+    socket.onmessage = (msg) => {
+      let event: { type?: string; updates?: JobStatusUpdate[] };
+      try {
+        event = JSON.parse(msg.data);
+      } catch {
+        return;
+      }
+      if (event.type === 'subscribed') {
+        retryDelay = 1000;
+        onConnectionChange?.(true);
+      } else if (event.type === 'job_status' && event.updates) {
+        onUpdates(event.updates);
+      }
+    };
+    socket.onclose = () => {
+      onConnectionChange?.(false);
+      if (closed) return;
+      retryTimer = setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, 30000);
+    };
+  };
+
+  connect();
+
+  return () => {
+    closed = true;
+    if (retryTimer) clearTimeout(retryTimer);
+    socket?.close();
+  };
+}
@@ -0,0 +1,114 @@
+import { apiClient } from './apiClient';
+
+// Files at or above this size go through the multipart upload API
+export const MULTIPART_THRESHOLD_BYTES = 32 * 1024 * 1024;
+
+const PARALLEL_PARTS = 4;
+const PART_URL_BATCH = 20;
+const PART_RETRIES = 3;
+
+interface MultipartOptions {
+  insuranceType: string;
+  batchId?: string;
+  onProgress?: (fraction: number) => void;
+}
+
+interface UploadState {
+  jobId: string;
+  partSize: number;
+  partCount: number;
+  uploadedParts: number[];
+}
+
+const api = (path: string) => `${import.meta.env.VITE_API_URL}/documents/multipart${path}`;
+
+// Interrupted uploads are remembered per file so a retry resumes instead of starting over
+const resumeKey = (file: File) => `multipart:${file.name}:${file.size}:${file.lastModified}`;
+
+async function postJson(url: string, body: unknown) {
+  const response = await apiClient.fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+  const data = await response.json().catch(() => ({}));
+  if (!response.ok) {
+    throw new Error(data.error || `Multipart upload request failed: ${response.status}`);
+  }
+  return data;
+}
+
+async function resumableState(file: File): Promise<UploadState | null> {
+  const jobId = localStorage.getItem(resumeKey(file));
+  if (!jobId) return null;
+  const response = await apiClient.fetch(api(`/${jobId}`));
+  if (!response.ok) return null;
+  const data = await response.json();
+  if (data.status !== 'UPLOAD_PENDING') return null;
+  return {
+    jobId,
+    partSize: data.partSize,
+    partCount: data.partCount,
+    uploadedParts: data.uploadedParts.map((p: { partNumber: number }) => p.partNumber),
+  };
+}
+
+async function startUpload(file: File, options: MultipartOptions): Promise<UploadState> {
+  const data = await postJson(api(''), {
+    filename: file.name,
+    fileSize: file.size,
+    insuranceType: options.insuranceType,
+    batchId: options.batchId,
+  });
+  localStorage.setItem(resumeKey(file), data.jobId);
+  return { jobId: data.jobId, partSize: data.partSize, partCount: data.partCount, uploadedParts: [] };
+}
+
+async function putPart(url: string, blob: Blob) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await fetch(url, { method: 'PUT', body: blob });
+      if (response.ok) return;
+      if (attempt >= PART_RETRIES) throw new Error(`Part upload failed: ${response.status}`);
+    } catch (err) {
+      if (attempt >= PART_RETRIES) throw err;
+    }
+    await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+  }
+}
+
+/**
+ * Upload a large file with S3 multipart upload: parts go up in parallel, a
+ * failed part is retried, and an interrupted upload of the same file resumes
+ * from the parts S3 already has. Processing starts when the upload completes.
+ * Resolves with the job id.
+ */
+export async function uploadMultipart(file: File, options: MultipartOptions): Promise<string> {
+  const state = (await resumableState(file)) || (await startUpload(file, options));
+  const done = new Set(state.uploadedParts);
+  const pending: number[] = [];
+  for (let n = 1; n <= state.partCount; n++) {
+    if (!done.has(n)) pending.push(n);
+  }
+  const report = () => options.onProgress?.(done.size / state.partCount);
+  report();
+
+  while (pending.length > 0) {
+    const group = pending.splice(0, PART_URL_BATCH);
+    const { parts } = await postJson(api(`/${state.jobId}/parts`), { partNumbers: group });
+    const queue = [...parts];
+    const worker = async () => {
+      for (let part = queue.shift(); part; part = queue.shift()) {
+        const start = (part.partNumber - 1) * state.partSize;
+        await putPart(part.uploadUrl, file.slice(start, Math.min(start + state.partSize, file.size)));
+        done.add(part.partNumber);
+        report();
+      }
+    };
+    await Promise.all(Array.from({ length: Math.min(PARALLEL_PARTS, queue.length) }, worker));
+  }
+
+  await postJson(api(`/${state.jobId}/complete`), {});
+  localStorage.removeItem(resumeKey(file));
+  return state.jobId;
+}